@@ -5,6 +5,7 @@
 
 import logging
 import asyncio
+import time
 from typing import Dict, Any, List, Optional, Union
 from dataclasses import dataclass, field
 from datetime import datetime
@@ -14,6 +15,10 @@ from ..gateways.baseGateway import BaseGateway
 from ..gateways.ctptest_gateway import CtptestGateway
 from ..gateways.xtp_gateway import XtpGateway
 from ..gateways.oes_gateway import OesGateway
+from .order_router import (
+    OrderRoutingIndex, RoutingPolicy, SmartOrderRouter, WeightedCostPolicy,
+    FILLED_STATUSES, REJECTED_STATUSES, SUBMITTING_STATUSES, TERMINAL_STATUSES, order_quantity
+)
 
 
 class DomesticGatewayType(Enum):
@@ -46,6 +51,14 @@ class DomesticGatewayConfig:
     query_timeout: int = 10
     max_concurrent_orders: int = 100
     
+    # 路由配置
+    routing_ewma_alpha: float = 0.2  # 延迟/拒单率EWMA平滑系数
+    reject_penalty_ms: float = 1000.0  # 拒单率折算的延迟成本
+    in_flight_penalty_ms: float = 5.0  # 每笔在途订单折算的延迟成本
+    enable_order_splitting: bool = False  # 自动路由时是否拆单到多个网关
+    split_lot_size: int = 100  # 拆单的最小单位（股/手）
+    max_split_venues: int = 3
+    
     # 监控配置
     enable_monitoring: bool = True
     alert_on_disconnect: bool = True
@@ -109,6 +122,11 @@ class DomesticGatewaysAdapter:
             'on_error': []
         }
         
+        # 订单路由
+        self.order_index = OrderRoutingIndex()
+        self.router = SmartOrderRouter()
+        self._parent_order_count = 0
+        
         # 监控数据
         self.performance_metrics: Dict[str, Any] = {}
         self.reconnection_tasks: Dict[str, asyncio.Task] = {}
@@ -128,6 +146,13 @@ class DomesticGatewaysAdapter:
         try:
             self.config = config
             
+            # 路由参数
+            self.router.alpha = config.routing_ewma_alpha
+            self.router.max_in_flight = config.max_concurrent_orders
+            if isinstance(self.router.policy, WeightedCostPolicy):
+                self.router.policy.reject_penalty_ms = config.reject_penalty_ms
+                self.router.policy.in_flight_penalty_ms = config.in_flight_penalty_ms
+            
             # 创建网关实例
             await self._create_gateway_instances()
             
@@ -329,28 +354,98 @@ class DomesticGatewaysAdapter:
                     return None
                 selected_gateway = gateway_name
             else:
+                if self.config and self.config.enable_order_splitting:
+                    allocation = self.router.split(
+                        order_quantity(order_data), self.active_gateways,
+                        self.config.split_lot_size, self.config.max_split_venues
+                    )
+                    if len(allocation) > 1:
+                        return await self._submit_split_order(order_data, allocation)
+                
                 selected_gateway = await self._select_best_gateway_for_order(order_data)
                 if not selected_gateway:
                     self.logger.error("没有可用的网关")
                     return None
             
-            # 提交订单
-            gateway = self.gateways[selected_gateway]
-            order_id = await gateway.submit_order(order_data)
-            
-            if order_id:
-                # 更新统计
-                status = self.gateway_status[selected_gateway]
-                status.orders_count += 1
-                
-                self.logger.info(f"订单提交成功: {order_id} via {selected_gateway}")
-            
-            return order_id
+            return await self._submit_to_gateway(selected_gateway, order_data)
             
         except Exception as e:
             self.logger.error(f"提交订单失败: {e}")
             return None
     
+    async def _submit_to_gateway(self, gateway_name: str, order_data: Dict[str, Any]) -> Optional[str]:
+        """向指定网关报单，记录往返延迟并登记订单索引"""
+        gateway = self.gateways[gateway_name]
+        status = self.gateway_status[gateway_name]
+        
+        self.router.begin_submit(gateway_name)
+        start = time.perf_counter()
+        try:
+            order_id = await gateway.submit_order(order_data)
+        except Exception as e:
+            self.logger.error(f"网关报单异常 {gateway_name}: {e}")
+            order_id = None
+        latency_ms = (time.perf_counter() - start) * 1000
+        
+        self.router.record_submit(gateway_name, latency_ms, bool(order_id))
+        status.avg_latency_ms = self.router.venue(gateway_name).latency_ms
+        
+        if order_id:
+            self.order_index.add(order_id, gateway_name)
+            
+            # 更新统计
+            status.orders_count += 1
+            
+            self.logger.info(f"订单提交成功: {order_id} via {gateway_name}")
+        else:
+            status.failed_orders += 1
+        
+        return order_id
+    
+    async def _submit_split_order(self, order_data: Dict[str, Any],
+                                  allocation: List[tuple]) -> Optional[str]:
+        """
+        拆单提交
+        
+        各子订单并发提交到对应网关，全部成功时返回父订单ID；
+        撤单时按父订单ID撤销全部子订单。
+        部分子订单失败时撤销已报出的子订单并返回None，不以部分数量冒充整单。
+        """
+        quantity_field = 'volume' if 'volume' in order_data else 'quantity'
+        tasks = [
+            self._submit_to_gateway(
+                gateway_name,
+                {**order_data, quantity_field: int(quantity) if float(quantity).is_integer() else quantity}
+            )
+            for gateway_name, quantity in allocation
+        ]
+        results = await asyncio.gather(*tasks)
+        child_ids = [order_id for order_id in results if order_id]
+        
+        if len(child_ids) < len(allocation):
+            placed = sum(quantity for (_, quantity), order_id in zip(allocation, results) if order_id)
+            requested = sum(quantity for _, quantity in allocation)
+            failed = [gateway_name for (gateway_name, _), order_id in zip(allocation, results) if not order_id]
+            self.logger.error(
+                f"拆单提交部分失败: 已报 {placed}/{requested}，失败网关: {', '.join(failed)}，撤销已报子订单"
+            )
+            if child_ids:
+                cancelled = await asyncio.gather(*(self.cancel_order(child_id) for child_id in child_ids))
+                for child_id, success in zip(child_ids, cancelled):
+                    if not success:
+                        self.logger.error(f"撤销拆单子订单失败: {child_id}")
+            return None
+        
+        self._parent_order_count += 1
+        parent_id = f"SOR_{self._parent_order_count:06d}"
+        self.order_index.add_parent(parent_id, child_ids)
+        
+        self.logger.info(
+            f"拆单提交成功: {parent_id} -> "
+            f"{', '.join(f'{gateway_name}:{quantity}' for gateway_name, quantity in allocation)}"
+        )
+        return parent_id
+    
     async def cancel_order(self, order_id: str, 
                           gateway_name: Optional[str] = None) -> bool:
         """
@@ -364,6 +459,12 @@ class DomesticGatewaysAdapter:
             撤销是否成功
         """
         try:
+            # 拆单父订单撤销全部子订单
+            child_ids = self.order_index.children(order_id)
+            if child_ids is not None and not gateway_name:
+                results = await asyncio.gather(*(self.cancel_order(child_id) for child_id in child_ids))
+                return all(results)
+            
             # 查找订单所在网关
             if gateway_name:
                 if gateway_name not in self.active_gateways:
@@ -432,33 +533,26 @@ class DomesticGatewaysAdapter:
         return subscription_results
     
     async def _select_best_gateway_for_order(self, order_data: Dict[str, Any]) -> Optional[str]:
-        """为订单选择最佳网关"""
+        """为订单选择最佳网关：按路由策略对EWMA延迟、拒单率和在途订单数打分"""
         if not self.active_gateways:
             return None
         
-        # 简单策略：选择延迟最低的网关
-        best_gateway = None
-        best_latency = float('inf')
-        
-        for gateway_name in self.active_gateways:
-            status = self.gateway_status[gateway_name]
-            if status.connected and status.avg_latency_ms < best_latency:
-                best_latency = status.avg_latency_ms
-                best_gateway = gateway_name
-        
-        return best_gateway
+        return self.router.select(self.active_gateways)
     
     async def _find_gateway_for_order(self, order_id: str) -> Optional[str]:
         """查找订单所在网关"""
-        # 这里需要根据实际的订单管理机制来实现
-        # 可能需要查询各个网关的订单记录
-        
-        for gateway_name in self.active_gateways:
-            # 实际实现中需要查询网关的订单记录
-            # 这里简化处理
-            pass
-        
-        return self.active_gateways[0] if self.active_gateways else None
+        return self.order_index.get(order_id)
+    
+    def set_routing_policy(self, policy: RoutingPolicy):
+        """替换路由打分策略"""
+        self.router.policy = policy
+    
+    def get_routing_snapshot(self) -> Dict[str, Any]:
+        """获取各网关的路由统计"""
+        return {
+            'venues': self.router.snapshot(),
+            'live_orders': len(self.order_index)
+        }
     
     async def _start_reconnection_monitoring(self):
         """启动重连监控"""
@@ -519,6 +613,10 @@ class DomesticGatewaysAdapter:
             try:
                 await asyncio.sleep(60)  # 每分钟监控一次
                 
+                # 长时间没有终态回报的订单不再计入在途
+                for _, gateway_name in self.order_index.expire(self.config.order_timeout):
+                    self.router.record_complete(gateway_name)
+                
                 for gateway_name, status in self.gateway_status.items():
                     if status.connected:
                         # 更新性能指标
@@ -548,8 +646,12 @@ class DomesticGatewaysAdapter:
     
     async def _update_performance_metrics(self, gateway_name: str, status: GatewayStatus):
         """更新性能指标"""
-        # 实际实现中需要收集各种性能数据
-        pass
+        venue = self.router.venue(gateway_name)
+        self.performance_metrics[gateway_name] = {
+            **venue.to_dict(),
+            'routing_cost': self.router.policy.cost(venue),
+            'updated_at': datetime.now().isoformat()
+        }
     
     async def _check_performance_alerts(self, gateway_name: str, status: GatewayStatus):
         """检查性能告警"""
@@ -611,12 +713,36 @@ class DomesticGatewaysAdapter:
     
     async def _on_order_update(self, order_data: Dict[str, Any]):
         """订单更新回调"""
+        self._track_order_lifecycle(order_data)
+        
         for callback in self.event_callbacks.get('on_order_update', []):
             try:
                 await callback(order_data)
             except Exception as e:
                 self.logger.error(f"订单更新回调执行失败: {e}")
     
+    def _track_order_lifecycle(self, order_data: Dict[str, Any]):
+        """按订单回报维护订单索引和路由统计"""
+        order_id = order_data.get('order_id') or order_data.get('vt_orderid') or order_data.get('orderid')
+        gateway_name = self.order_index.get(order_id) if order_id else None
+        if gateway_name is None:
+            return
+        
+        order_status = str(order_data.get('status', '')).upper()
+        status = self.gateway_status.get(gateway_name)
+        
+        # 每笔订单只在首次非报单中的回报时计入拒单率
+        if order_status not in SUBMITTING_STATUSES and self.order_index.acknowledge(order_id):
+            rejected = order_status in REJECTED_STATUSES
+            self.router.record_outcome(gateway_name, rejected)
+            if rejected and status:
+                status.failed_orders += 1
+        
+        if order_status in TERMINAL_STATUSES and self.order_index.complete(order_id):
+            self.router.record_complete(gateway_name)
+            if status and order_status in FILLED_STATUSES:
+                status.successful_orders += 1
+    
     async def _on_trade_update(self, trade_data: Dict[str, Any]):
         """成交更新回调"""
         for callback in self.event_callbacks.get('on_trade_update', []):
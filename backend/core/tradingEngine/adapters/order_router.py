@@ -0,0 +1,271 @@
+"""
+订单路由
+为DomesticGatewaysAdapter提供订单→网关索引和智能路由：
+- OrderRoutingIndex: 订单ID到网关的O(1)索引，随订单生命周期事件维护
+- VenueStats: 单个网关的实时EWMA延迟、拒单率和在途订单数
+- RoutingPolicy: 可替换的网关打分策略，分数越低越优
+- SmartOrderRouter: 按策略选择网关，可按分数把订单拆分到多个网关
+"""
+
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# 订单状态（兼容本地网关与VnPy的状态取值）
+SUBMITTING_STATUSES = {'PENDING', 'SUBMITTING', '提交中'}
+FILLED_STATUSES = {'FILLED', 'ALLTRADED', '全部成交'}
+CANCELLED_STATUSES = {'CANCELLED', '已撤销'}
+REJECTED_STATUSES = {'REJECTED', '拒单'}
+TERMINAL_STATUSES = FILLED_STATUSES | CANCELLED_STATUSES | REJECTED_STATUSES
+
+
+def order_quantity(order_data: Dict[str, Any]) -> float:
+    """订单数量，兼容 volume / quantity 两种字段"""
+    return float(order_data.get('volume', order_data.get('quantity', 0)) or 0)
+
+
+class OrderRoutingIndex:
+    """
+    订单→网关索引
+
+    - 在途订单保存网关和提交时间
+    - 终态订单移入有界的已完成表，撤单/查询仍可路由
+    - 拆单时登记父订单到子订单的映射
+    """
+
+    def __init__(self, max_completed: int = 100000):
+        self.max_completed = max_completed
+        self._live: Dict[str, Tuple[str, float]] = {}
+        self._completed: "OrderedDict[str, str]" = OrderedDict()
+        self._children: Dict[str, List[str]] = {}
+        # 尚未收到任何回报的订单
+        self._unacknowledged: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def add(self, order_id: str, gateway_name: str, submit_time: Optional[float] = None) -> None:
+        if order_id in self._live:
+            return
+        self._completed.pop(order_id, None)
+        self._live[order_id] = (gateway_name, submit_time if submit_time is not None else time.monotonic())
+        self._unacknowledged.add(order_id)
+
+    def add_parent(self, parent_id: str, child_ids: List[str]) -> None:
+        self._children[parent_id] = list(child_ids)
+
+    def get(self, order_id: str) -> Optional[str]:
+        """订单所在网关"""
+        entry = self._live.get(order_id)
+        if entry is not None:
+            return entry[0]
+        return self._completed.get(order_id)
+
+    def children(self, order_id: str) -> Optional[List[str]]:
+        """拆单父订单的子订单列表，普通订单返回None"""
+        return self._children.get(order_id)
+
+    def is_live(self, order_id: str) -> bool:
+        return order_id in self._live
+
+    def acknowledge(self, order_id: str) -> bool:
+        """登记一次回报，订单的首次回报返回True"""
+        if order_id in self._unacknowledged:
+            self._unacknowledged.discard(order_id)
+            return True
+        return False
+
+    def complete(self, order_id: str) -> Optional[str]:
+        """订单进入终态，返回其网关（不在途时返回None）"""
+        entry = self._live.pop(order_id, None)
+        if entry is None:
+            return None
+        self._unacknowledged.discard(order_id)
+        gateway_name = entry[0]
+        self._completed[order_id] = gateway_name
+        if len(self._completed) > self.max_completed:
+            expired, _ = self._completed.popitem(last=False)
+            self._children.pop(expired, None)
+        return gateway_name
+
+    def expire(self, timeout: float, now: Optional[float] = None) -> List[Tuple[str, str]]:
+        """把超过timeout秒仍无终态回报的订单视为完成，返回[(订单ID, 网关)]"""
+        deadline = (now if now is not None else time.monotonic()) - timeout
+        stale = [
+            (order_id, gateway_name)
+            for order_id, (gateway_name, submit_time) in self._live.items()
+            if submit_time < deadline
+        ]
+        for order_id, _ in stale:
+            self.complete(order_id)
+        return stale
+
+
+@dataclass
+class VenueStats:
+    """网关实时统计（EWMA）"""
+    name: str
+    latency_ms: float = 0.0
+    reject_rate: float = 0.0
+    in_flight: int = 0
+    samples: int = 0
+    submitted: int = 0
+    rejected: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'latency_ms': self.latency_ms,
+            'reject_rate': self.reject_rate,
+            'in_flight': self.in_flight,
+            'samples': self.samples,
+            'submitted': self.submitted,
+            'rejected': self.rejected
+        }
+
+
+class RoutingPolicy(ABC):
+    """
+    路由策略基类
+
+    子类实现cost()即可替换打分方式；allocate()默认按成本倒数分配拆单数量。
+    """
+
+    @abstractmethod
+    def cost(self, stats: VenueStats) -> float:
+        """网关的预期成本，越低越优"""
+        pass
+
+    def allocate(self, quantity: float, venues: List[Tuple[str, float]],
+                 lot_size: float) -> List[Tuple[str, float]]:
+        """
+        按成本倒数比例分配数量，按整手取整，零头归成本最低的网关
+
+        Args:
+            quantity: 总数量
+            venues: [(网关, 成本)]，按成本升序
+            lot_size: 每手数量
+        """
+        weights = [1.0 / max(cost, 1e-6) for _, cost in venues]
+        total_weight = sum(weights)
+        lots = int(quantity // lot_size)
+        allocation = [int(lots * weight / total_weight) for weight in weights]
+        allocation[0] += lots - sum(allocation)
+        result = [(name, n * lot_size) for (name, _), n in zip(venues, allocation) if n]
+        # 不足一手的零头
+        odd = quantity - lots * lot_size
+        if odd > 0:
+            if result and result[0][0] == venues[0][0]:
+                result[0] = (result[0][0], result[0][1] + odd)
+            else:
+                result.insert(0, (venues[0][0], odd))
+        return result
+
+
+class WeightedCostPolicy(RoutingPolicy):
+    """
+    默认策略：以毫秒计的预期成本
+
+    cost = EWMA延迟 + 拒单率 × reject_penalty_ms + 在途订单数 × in_flight_penalty_ms
+    """
+
+    def __init__(self, reject_penalty_ms: float = 1000.0, in_flight_penalty_ms: float = 5.0):
+        self.reject_penalty_ms = reject_penalty_ms
+        self.in_flight_penalty_ms = in_flight_penalty_ms
+
+    def cost(self, stats: VenueStats) -> float:
+        return (
+            stats.latency_ms
+            + stats.reject_rate * self.reject_penalty_ms
+            + stats.in_flight * self.in_flight_penalty_ms
+        )
+
+
+class SmartOrderRouter:
+    """
+    智能订单路由
+
+    Args:
+        policy: 打分策略，默认WeightedCostPolicy
+        alpha: EWMA平滑系数
+        max_in_flight: 单个网关在途订单上限，达到后不再分配
+    """
+
+    def __init__(self, policy: Optional[RoutingPolicy] = None, alpha: float = 0.2,
+                 max_in_flight: int = 100):
+        self.policy = policy or WeightedCostPolicy()
+        self.alpha = alpha
+        self.max_in_flight = max_in_flight
+        self.venues: Dict[str, VenueStats] = {}
+
+    def venue(self, name: str) -> VenueStats:
+        stats = self.venues.get(name)
+        if stats is None:
+            stats = self.venues[name] = VenueStats(name)
+        return stats
+
+    # ==================== 统计更新 ====================
+
+    def begin_submit(self, name: str) -> None:
+        """报单发出前计入在途，并发报单时后续选择能看到这笔负载"""
+        self.venue(name).in_flight += 1
+
+    def record_submit(self, name: str, latency_ms: float, accepted: bool) -> None:
+        """记录一次报单往返延迟；报单失败直接计为拒单"""
+        stats = self.venue(name)
+        stats.latency_ms = latency_ms if not stats.samples else \
+            stats.latency_ms + self.alpha * (latency_ms - stats.latency_ms)
+        stats.samples += 1
+        stats.submitted += 1
+        if not accepted:
+            self.record_complete(name)
+            self.record_outcome(name, rejected=True)
+
+    def record_outcome(self, name: str, rejected: bool) -> None:
+        """每笔订单首次回报时记录一次是否被拒"""
+        stats = self.venue(name)
+        stats.reject_rate += self.alpha * ((1.0 if rejected else 0.0) - stats.reject_rate)
+        if rejected:
+            stats.rejected += 1
+
+    def record_complete(self, name: str) -> None:
+        stats = self.venue(name)
+        if stats.in_flight > 0:
+            stats.in_flight -= 1
+
+    # ==================== 选择与拆单 ====================
+
+    def rank(self, candidates: Iterable[str]) -> List[Tuple[str, float]]:
+        """可用网关按成本升序排列，在途已满的网关被排除"""
+        ranked = []
+        for name in candidates:
+            stats = self.venue(name)
+            if stats.in_flight >= self.max_in_flight:
+                continue
+            cost = self.policy.cost(stats)
+            if math.isfinite(cost):
+                ranked.append((name, cost))
+        ranked.sort(key=lambda item: item[1])
+        return ranked
+
+    def select(self, candidates: Iterable[str]) -> Optional[str]:
+        ranked = self.rank(candidates)
+        return ranked[0][0] if ranked else None
+
+    def split(self, quantity: float, candidates: Iterable[str], lot_size: float = 100,
+              max_venues: int = 3) -> List[Tuple[str, float]]:
+        """把数量分配到成本最低的至多max_venues个网关，返回[(网关, 数量)]"""
+        ranked = self.rank(candidates)[:max(1, max_venues)]
+        if not ranked:
+            return []
+        if len(ranked) == 1 or quantity < 2 * lot_size:
+            return [(ranked[0][0], quantity)]
+        return self.policy.allocate(quantity, ranked, lot_size)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {**stats.to_dict(), 'cost': self.policy.cost(stats)}
+            for name, stats in self.venues.items()
+        }
@@ -2,13 +2,20 @@
 模拟网关 (Simulation Gateway)
 
 提供模拟的交易功能，用于测试和开发。
+订单在本地限价订单簿中按价格优先、时间优先撮合，延迟通过调度事件注入。
 """
 
 import logging
+import random
+import threading
 import time
 import uuid
-from typing import Dict, List, Optional, Any
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Any
 from .baseGateway import BaseGateway
+from .simMatchingEngine import (
+    BUY, SELL, ORDER_LIMIT, ORDER_MARKET, ORDER_TYPES, OrderBook, SimEventScheduler
+)
 
 
 class SimGateway(BaseGateway):
@@ -17,9 +24,9 @@ class SimGateway(BaseGateway):
     
     提供模拟的交易功能，包括：
     - 模拟连接和认证
-    - 模拟订单管理
+    - 模拟订单管理（限价订单簿撮合，支持市价/限价/IOC/FOK和撤单）
     - 模拟仓位管理
-    - 模拟市场数据
+    - 模拟市场数据（报价或L2深度驱动订单簿，可回放历史L2数据）
     """
     
     def __init__(self, gateway_name: str = "SimGateway", main_engine=None):
@@ -35,11 +42,26 @@ class SimGateway(BaseGateway):
         # 模拟配置
         self.simConfig = {
             'simulationMode': True,
-            'delayTime': 0.1,  # 模拟延迟时间（秒）
+            'delayTime': 0.1,  # 模拟延迟时间（秒），下单/撤单经过该延迟后到达订单簿
             'randomErrors': False,  # 是否随机产生错误
-            'errorRate': 0.01  # 错误率
+            'errorRate': 0.01,  # 错误率
+            'priceTick': 0.01,  # 最小价格变动单位，修改后需重置模拟
+            'quoteDepth': 10.0,  # 行情只有买一卖一时，每档视为的挂单量
+            'commissionRate': 0.001,  # 手续费率
+            'virtualClock': False  # 使用虚拟时间，由processEvents()推进
         }
         
+        # 事件调度：所有订单簿操作在同一把锁下执行
+        self._eventLock = threading.RLock()
+        self._eventCondition = threading.Condition(self._eventLock)
+        self.scheduler = SimEventScheduler(time.monotonic)
+        self._dispatcher: Optional[threading.Thread] = None
+        self._dispatcherActive = False
+        
+        # 订单簿
+        self.orderBooks: Dict[str, OrderBook] = {}
+        self.tradeCounter = 0
+        
         # 模拟数据
         self.simOrders: Dict[str, Dict[str, Any]] = {}
         self.simPositions: Dict[str, Dict[str, Any]] = {}
@@ -99,6 +121,11 @@ class SimGateway(BaseGateway):
             }
         }
         
+        # 用初始报价建立订单簿
+        self.orderBooks = {}
+        for symbol in self.simMarketData:
+            self._applyMarketDepth(symbol, self.simMarketData[symbol])
+        
         self.logger.info("模拟数据初始化完成")
     
     def connect(self) -> bool:
@@ -111,8 +138,8 @@ class SimGateway(BaseGateway):
         try:
             self.logger.info("正在连接模拟网关...")
             
-            # 模拟连接延迟
-            time.sleep(self.simConfig['delayTime'])
+            # 启动事件调度线程
+            self._startDispatcher()
             
             # 模拟连接成功
             self._updateConnectionStatus(True, False)
@@ -136,8 +163,7 @@ class SimGateway(BaseGateway):
         try:
             self.logger.info("正在断开模拟网关连接...")
             
-            # 模拟断开延迟
-            time.sleep(self.simConfig['delayTime'])
+            self._stopDispatcher()
             
             # 模拟断开成功
             self._updateConnectionStatus(False, False)
@@ -164,9 +190,6 @@ class SimGateway(BaseGateway):
             
             self.logger.info("正在认证模拟网关...")
             
-            # 模拟认证延迟
-            time.sleep(self.simConfig['delayTime'])
-            
             # 模拟认证成功
             self._updateConnectionStatus(True, True)
             self._triggerEvent('onAuthenticate', {'gateway': self.gatewayName})
@@ -194,34 +217,40 @@ class SimGateway(BaseGateway):
                 self.logger.error("网关未就绪，无法发送订单")
                 return ""
             
-            # 生成订单ID
-            order_id = f"SIM_{self.orderCounter:06d}"
-            self.orderCounter += 1
-            
-            # 创建订单记录
-            order = {
-                'order_id': order_id,
-                'symbol': order_data.get('symbol', ''),
-                'side': order_data.get('side', 'BUY'),
-                'order_type': order_data.get('order_type', 'LIMIT'),
-                'price': order_data.get('price', 0.0),
-                'quantity': order_data.get('quantity', 0.0),
-                'status': 'PENDING',
-                'timestamp': time.time(),
-                'gateway': self.gatewayName
-            }
-            
-            # 保存订单
-            self.simOrders[order_id] = order
+            # 限价单可通过time_in_force指定IOC/FOK
+            order_type = str(order_data.get('order_type', ORDER_LIMIT)).upper()
+            time_in_force = str(order_data.get('time_in_force', '')).upper()
+            if order_type == ORDER_LIMIT and time_in_force in ORDER_TYPES:
+                order_type = time_in_force
             
-            # 模拟订单处理延迟
-            time.sleep(self.simConfig['delayTime'])
-            
-            # 模拟订单状态更新
-            self._simulate_order_update(order_id)
-            
-            # 触发订单事件
-            self._triggerEvent('onOrder', order)
+            with self._eventLock:
+                # 生成订单ID
+                order_id = f"SIM_{self.orderCounter:06d}"
+                self.orderCounter += 1
+                
+                # 创建订单记录
+                order = {
+                    'order_id': order_id,
+                    'symbol': order_data.get('symbol', ''),
+                    'side': order_data.get('side', 'BUY'),
+                    'order_type': order_type,
+                    'price': order_data.get('price', 0.0),
+                    'quantity': order_data.get('quantity', 0.0),
+                    'filled_quantity': 0.0,
+                    'avg_fill_price': 0.0,
+                    'status': 'PENDING',
+                    'timestamp': time.time(),
+                    'gateway': self.gatewayName
+                }
+                
+                # 保存订单
+                self.simOrders[order_id] = order
+                
+                # 触发订单事件
+                self._triggerEvent('onOrder', order.copy())
+                
+                # 经过模拟延迟后到达订单簿
+                self._scheduleEvent(self._onOrderArrival, order_id)
             
             self.logger.info(f"模拟订单发送成功: {order_id}")
             return order_id
@@ -252,21 +281,15 @@ class SimGateway(BaseGateway):
             order = self.simOrders[order_id]
             
             # 检查订单状态
-            if order['status'] in ['FILLED', 'CANCELLED']:
+            if order['status'] in ['FILLED', 'CANCELLED', 'REJECTED']:
                 self.logger.warning(f"订单 {order_id} 状态为 {order['status']}，无法取消")
                 return False
             
-            # 模拟取消延迟
-            time.sleep(self.simConfig['delayTime'])
-            
-            # 更新订单状态
-            order['status'] = 'CANCELLED'
-            order['cancel_time'] = time.time()
-            
-            # 触发订单事件
-            self._triggerEvent('onOrder', order)
+            # 撤单请求经过模拟延迟后到达订单簿，期间订单仍可能成交
+            with self._eventLock:
+                self._scheduleEvent(self._onCancelArrival, order_id)
             
-            self.logger.info(f"模拟订单取消成功: {order_id}")
+            self.logger.info(f"模拟撤单请求已发送: {order_id}")
             return True
             
         except Exception as e:
@@ -391,48 +414,222 @@ class SimGateway(BaseGateway):
             self.logger.error(f"取消订阅模拟市场数据失败: {e}")
             return False
     
-    def _simulate_order_update(self, order_id: str):
-        """模拟订单状态更新"""
+    # ==================== 撮合与事件调度 ====================
+    
+    def _scheduleEvent(self, callback, *args):
+        """按模拟延迟登记事件，延迟为0时立即执行（调用方需持有事件锁）"""
+        delay = self.simConfig['delayTime']
+        if delay <= 0:
+            callback(*args)
+            return
+        self.scheduler.schedule(delay, callback, *args)
+        self._eventCondition.notify()
+    
+    def processEvents(self, until: Optional[float] = None) -> int:
+        """
+        执行到期的模拟事件
+        
+        未启动调度线程或使用虚拟时间时由调用方驱动。
+        
+        Args:
+            until: 执行到该时间（调度器时钟），为空时虚拟时间执行全部事件，真实时间执行已到期事件
+            
+        Returns:
+            int: 执行的事件数量
+        """
+        with self._eventLock:
+            return self.scheduler.runUntil(until)
+    
+    def setVirtualClock(self, enabled: bool) -> bool:
+        """
+        切换虚拟时间/真实时间，只能在没有待执行事件时切换
+        
+        切换到虚拟时间时停止事件调度线程，已连接时切回真实时间重新启动。
+        
+        Args:
+            enabled: 是否使用虚拟时间
+            
+        Returns:
+            bool: 是否切换成功
+        """
+        with self._eventLock:
+            if len(self.scheduler):
+                self.logger.error("存在待执行的模拟事件，无法切换时钟")
+                return False
+            self.simConfig['virtualClock'] = enabled
+            self.scheduler = SimEventScheduler(None if enabled else time.monotonic)
+            if enabled:
+                # 持锁置位，调度线程醒来后不会再执行虚拟时钟上的事件
+                self._dispatcherActive = False
+            self._eventCondition.notify()
+        
+        if enabled:
+            self._stopDispatcher()
+        elif self.isConnected:
+            self._startDispatcher()
+        return True
+    
+    def _startDispatcher(self):
+        """真实时间下启动事件调度线程"""
+        if self.simConfig['virtualClock'] or self._dispatcherActive:
+            return
+        self._dispatcherActive = True
+        self._dispatcher = threading.Thread(target=self._runDispatcher, name=f"{self.gatewayName}-events", daemon=True)
+        self._dispatcher.start()
+    
+    def _stopDispatcher(self):
+        with self._eventLock:
+            self._dispatcherActive = False
+            self._eventCondition.notify()
+        dispatcher, self._dispatcher = self._dispatcher, None
+        if dispatcher is not None and dispatcher is not threading.current_thread():
+            dispatcher.join(timeout=1.0)
+    
+    def _runDispatcher(self):
+        """等待到最近一个事件的到期时间后执行，新事件登记时被唤醒"""
+        with self._eventCondition:
+            while self._dispatcherActive:
+                try:
+                    due_time = self.scheduler.nextDueTime()
+                    if due_time is None:
+                        self._eventCondition.wait()
+                        continue
+                    wait = due_time - self.scheduler.now()
+                    if wait > 0:
+                        self._eventCondition.wait(wait)
+                        continue
+                    self.scheduler.runUntil()
+                except Exception as e:
+                    self.logger.error(f"模拟事件执行失败: {e}")
+    
+    def _getOrderBook(self, symbol: str) -> OrderBook:
+        book = self.orderBooks.get(symbol)
+        if book is None:
+            book = self.orderBooks[symbol] = OrderBook(symbol)
+        return book
+    
+    def _toTicks(self, price: float) -> int:
+        return int(round(price / self.simConfig['priceTick']))
+    
+    def _fromTicks(self, ticks: int) -> float:
+        # 去掉 ticks * priceTick 的浮点尾差
+        return round(ticks * self.simConfig['priceTick'], 10)
+    
+    def _onOrderArrival(self, order_id: str):
+        """订单到达订单簿：校验后撮合，剩余部分按订单类型挂单或作废"""
         try:
-            order = self.simOrders[order_id]
+            order = self.simOrders.get(order_id)
+            # 到达前已被重置
+            if order is None or order['status'] != 'PENDING':
+                return
+            
+            order_type = order['order_type']
+            quantity = float(order['quantity'] or 0)
+            price = float(order['price'] or 0)
+            if (order_type not in ORDER_TYPES or quantity <= 0
+                    or (order_type != ORDER_MARKET and price <= 0)
+                    or (self.simConfig['randomErrors'] and random.random() < self.simConfig['errorRate'])):
+                order['status'] = 'REJECTED'
+                self._triggerEvent('onOrder', order.copy())
+                self.logger.warning(f"模拟订单被拒绝: {order_id}")
+                return
+            
+            book = self._getOrderBook(order['symbol'])
+            side = BUY if order['side'] == 'BUY' else SELL
+            remaining = book.submitOrder(order_id, side, order_type, self._toTicks(price), quantity)
+            
+            if remaining and order_type != ORDER_LIMIT:
+                # 市价/IOC/FOK未成交部分作废
+                order['status'] = 'CANCELLED'
+                order['cancel_time'] = time.time()
+            self._processFills(order['symbol'], book)
+            if remaining == quantity and order['status'] == 'CANCELLED':
+                self._triggerEvent('onOrder', order.copy())
+            
+        except Exception as e:
+            self.logger.error(f"模拟订单撮合失败: {e}")
+    
+    def _onCancelArrival(self, order_id: str):
+        """撤单到达订单簿"""
+        try:
+            order = self.simOrders.get(order_id)
+            if order is None or order['status'] in ['FILLED', 'CANCELLED', 'REJECTED']:
+                return
+            
+            book = self.orderBooks.get(order['symbol'])
+            if book is not None:
+                book.cancelOrder(order_id)
+            
+            order['status'] = 'CANCELLED'
+            order['cancel_time'] = time.time()
+            self._triggerEvent('onOrder', order.copy())
             
-            # 模拟订单成交
-            if order['status'] == 'PENDING':
-                # 随机决定是否成交
-                import random
-                if random.random() < 0.8:  # 80%概率成交
-                    order['status'] = 'FILLED'
-                    order['fill_time'] = time.time()
-                    order['fill_price'] = order['price']
-                    
-                    # 更新仓位
-                    self._update_position(order)
-                    
-                    # 触发成交事件
-                    trade_data = {
-                        'order_id': order_id,
-                        'symbol': order['symbol'],
-                        'side': order['side'],
-                        'price': order['fill_price'],
-                        'quantity': order['quantity'],
-                        'timestamp': order['fill_time'],
-                        'gateway': self.gatewayName
-                    }
-                    self._triggerEvent('onTrade', trade_data)
-                    
-                    # 更新账户
-                    self._update_account(order)
+            self.logger.info(f"模拟订单取消成功: {order_id}")
             
         except Exception as e:
-            self.logger.error(f"模拟订单状态更新失败: {e}")
+            self.logger.error(f"模拟撤单失败: {e}")
+    
+    def _processFills(self, symbol: str, book: OrderBook):
+        """处理订单簿产生的成交：更新订单、仓位、账户并触发事件"""
+        fills = book.takeFills()
+        if not fills:
+            return
+        
+        touched: Dict[str, Dict[str, Any]] = {}
+        fill_time = time.time()
+        for taker_id, maker_id, price_ticks, quantity in fills:
+            price = self._fromTicks(price_ticks)
+            # L2回放的外部挂单不属于本地订单
+            for order_id in (taker_id, maker_id):
+                order = self.simOrders.get(order_id)
+                if order is None:
+                    continue
+                
+                filled = order['filled_quantity'] + quantity
+                order['avg_fill_price'] = (order['avg_fill_price'] * order['filled_quantity'] + price * quantity) / filled
+                order['filled_quantity'] = filled
+                order['fill_time'] = fill_time
+                order['fill_price'] = price
+                touched[order_id] = order
+                
+                self.tradeCounter += 1
+                trade_data = {
+                    'trade_id': f"SIMT_{self.tradeCounter:06d}",
+                    'order_id': order_id,
+                    'symbol': order['symbol'],
+                    'side': order['side'],
+                    'price': price,
+                    'quantity': quantity,
+                    'liquidity': 'TAKER' if order_id == taker_id else 'MAKER',
+                    'timestamp': fill_time,
+                    'gateway': self.gatewayName
+                }
+                
+                # 更新仓位
+                self._update_position(trade_data)
+                
+                # 触发成交事件
+                self._triggerEvent('onTrade', trade_data)
+                
+                # 更新账户
+                self._update_account(trade_data)
+        
+        market_data = self.simMarketData.get(symbol)
+        if market_data is not None:
+            market_data['last_price'] = self._fromTicks(fills[-1][2])
+        
+        for order_id, order in touched.items():
+            if order['status'] != 'CANCELLED':
+                order['status'] = 'PARTIALLY_FILLED' if order_id in book.remaining else 'FILLED'
+            self._triggerEvent('onOrder', order.copy())
     
-    def _update_position(self, order: Dict[str, Any]):
-        """更新仓位"""
+    def _update_position(self, trade: Dict[str, Any]):
+        """按成交更新仓位"""
         try:
-            symbol = order['symbol']
-            side = order['side']
-            quantity = order['quantity']
-            price = order['fill_price']
+            symbol = trade['symbol']
+            side = trade['side']
+            quantity = trade['quantity']
+            price = trade['price']
             
             if symbol not in self.simPositions:
                 self.simPositions[symbol] = {
@@ -483,12 +680,11 @@ class SimGateway(BaseGateway):
         except Exception as e:
             self.logger.error(f"更新仓位失败: {e}")
     
-    def _update_account(self, order: Dict[str, Any]):
-        """更新账户"""
+    def _update_account(self, trade: Dict[str, Any]):
+        """按成交更新账户"""
         try:
-            # 计算手续费（假设为0.1%）
-            commission_rate = 0.001
-            commission = order['quantity'] * order['fill_price'] * commission_rate
+            # 计算手续费
+            commission = trade['quantity'] * trade['price'] * self.simConfig['commissionRate']
             
             # 更新账户余额
             self.simAccount['commission'] += commission
@@ -504,21 +700,114 @@ class SimGateway(BaseGateway):
         """
         更新模拟市场数据
         
+        带 bids/asks（[(价格, 数量), ...]）时按L2深度更新订单簿中的外部挂单，
+        只带 bid_price/ask_price 时按买一卖一更新（数量取 bid_volume/ask_volume 或 quoteDepth），
+        与本地挂单交叉的部分立即撮合。
+        
         Args:
             symbol: 交易品种
             market_data: 市场数据
         """
         try:
-            if symbol in self.simMarketData:
-                self.simMarketData[symbol].update(market_data)
-                self.simMarketData[symbol]['timestamp'] = time.time()
+            with self._eventLock:
+                tick = self.simMarketData.setdefault(symbol, {'symbol': symbol})
+                tick.update(market_data)
+                if 'bids' in market_data or 'asks' in market_data:
+                    if tick.get('bids'):
+                        tick['bid_price'] = tick['bids'][0][0]
+                    if tick.get('asks'):
+                        tick['ask_price'] = tick['asks'][0][0]
+                    self._applyMarketDepth(symbol, tick)
+                elif 'bid_price' in market_data or 'ask_price' in market_data:
+                    # 只带买一卖一的行情取代之前的L2深度
+                    tick.pop('bids', None)
+                    tick.pop('asks', None)
+                    self._applyMarketDepth(symbol, tick)
+                tick['timestamp'] = time.time()
                 
                 # 触发行情事件
-                self._triggerEvent('onTick', self.simMarketData[symbol].copy())
+                self._triggerEvent('onTick', tick.copy())
                 
         except Exception as e:
             self.logger.error(f"更新模拟市场数据失败: {e}")
     
+    def _applyMarketDepth(self, symbol: str, tick: Dict[str, Any]):
+        """把行情中的深度设置为订单簿的外部挂单，并处理与本地挂单的成交"""
+        bids = tick.get('bids')
+        asks = tick.get('asks')
+        if bids is None and asks is None:
+            depth = self.simConfig['quoteDepth']
+            bids = [(tick['bid_price'], tick.get('bid_volume', depth))] if tick.get('bid_price') else []
+            asks = [(tick['ask_price'], tick.get('ask_volume', depth))] if tick.get('ask_price') else []
+        
+        book = self._getOrderBook(symbol)
+        book.applyDepth(
+            [(self._toTicks(price), float(quantity)) for price, quantity in bids or () if quantity > 0],
+            [(self._toTicks(price), float(quantity)) for price, quantity in asks or () if quantity > 0]
+        )
+        self._processFills(symbol, book)
+    
+    def replayL2(self, records: Iterable[Dict[str, Any]], speed: float = 1.0) -> int:
+        """
+        回放L2深度数据
+        
+        每条记录按时间戳相对第一条的间隔（除以speed）登记为调度事件，
+        到期时通过updateMarketData更新订单簿，与下单/撤单事件按时间交错执行。
+        
+        Args:
+            records: 深度记录，包含 symbol、timestamp（秒或datetime）以及 bids/asks 或 bid_price/ask_price
+            speed: 回放倍速
+            
+        Returns:
+            int: 登记的记录数量
+        """
+        try:
+            count = 0
+            with self._eventLock:
+                start = self.scheduler.now()
+                first = None
+                for record in records:
+                    timestamp = record.get('timestamp', 0.0)
+                    if isinstance(timestamp, datetime):
+                        timestamp = timestamp.timestamp()
+                    if first is None:
+                        first = timestamp
+                    market_data = {key: value for key, value in record.items() if key != 'symbol'}
+                    self.scheduler.scheduleAt(
+                        start + (timestamp - first) / speed, self.updateMarketData, record['symbol'], market_data
+                    )
+                    count += 1
+                self._eventCondition.notify()
+            
+            self.logger.info(f"已登记L2回放记录: {count}")
+            return count
+            
+        except Exception as e:
+            self.logger.error(f"登记L2回放失败: {e}")
+            return 0
+    
+    def getOrderBook(self, symbol: str, levels: int = 5) -> Dict[str, Any]:
+        """
+        查询订单簿深度
+        
+        Args:
+            symbol: 交易品种
+            levels: 档数
+            
+        Returns:
+            Dict[str, Any]: {'symbol', 'bids': [(价格, 数量)], 'asks': [(价格, 数量)]}
+        """
+        with self._eventLock:
+            book = self.orderBooks.get(symbol)
+            if book is None:
+                return {'symbol': symbol, 'bids': [], 'asks': []}
+            depth = book.depth(levels)
+            return {
+                'symbol': symbol,
+                'bids': [(self._fromTicks(price), quantity) for price, quantity in depth['bids']],
+                'asks': [(self._fromTicks(price), quantity) for price, quantity in depth['asks']]
+            }
+    
     def getSimulationStatus(self) -> Dict[str, Any]:
         """
         获取模拟状态
@@ -531,6 +820,8 @@ class SimGateway(BaseGateway):
             'isConnected': self.isConnected,
             'isAuthenticated': self.isAuthenticated,
             'orderCount': len(self.simOrders),
+            'restingOrderCount': sum(len(book.orders) for book in self.orderBooks.values()),
+            'pendingEventCount': len(self.scheduler),
             'positionCount': len(self.simPositions),
             'accountBalance': self.simAccount['balance'],
             'simConfig': self.simConfig.copy()
@@ -539,22 +830,25 @@ class SimGateway(BaseGateway):
     def resetSimulation(self):
         """重置模拟数据"""
         try:
-            # 清空订单
-            self.simOrders.clear()
-            
-            # 重置仓位
-            self._init_sim_data()
-            
-            # 重置账户
-            self.simAccount = {
-                'balance': 1000000.0,
-                'available': 1000000.0,
-                'frozen': 0.0,
-                'commission': 0.0
-            }
-            
-            # 重置订单计数器
-            self.orderCounter = 0
+            with self._eventLock:
+                # 丢弃在途事件并清空订单
+                self.scheduler.clear()
+                self.simOrders.clear()
+                
+                # 重置仓位和订单簿
+                self._init_sim_data()
+                
+                # 重置账户
+                self.simAccount = {
+                    'balance': 1000000.0,
+                    'available': 1000000.0,
+                    'frozen': 0.0,
+                    'commission': 0.0
+                }
+                
+                # 重置订单计数器
+                self.orderCounter = 0
+                self.tradeCounter = 0
             
             self.logger.info("模拟数据已重置")
             
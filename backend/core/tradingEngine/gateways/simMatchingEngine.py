@@ -0,0 +1,359 @@
+"""
+模拟撮合引擎 (Simulation Matching Engine)
+
+为模拟网关提供本地限价订单簿撮合：
+- 价格优先、时间优先，每个价位一个FIFO队列
+- 支持市价单、限价单、IOC、FOK以及撤单
+- 延迟通过调度事件注入，不阻塞调用线程
+- 可回放L2深度数据，外部挂单以合成订单的形式参与排队
+
+价格使用整数最小变动单位（tick），由网关负责换算。
+"""
+
+import heapq
+import itertools
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+# 买卖方向
+BUY = 1
+SELL = -1
+
+# 订单类型
+ORDER_LIMIT = 'LIMIT'
+ORDER_MARKET = 'MARKET'
+ORDER_IOC = 'IOC'
+ORDER_FOK = 'FOK'
+ORDER_TYPES = (ORDER_LIMIT, ORDER_MARKET, ORDER_IOC, ORDER_FOK)
+
+
+class PriceLevel:
+    """单个价位：订单ID的FIFO队列 + 挂单总量 + 有效挂单数"""
+
+    __slots__ = ('queue', 'volume', 'count')
+
+    def __init__(self):
+        self.queue: Deque[Any] = deque()
+        self.volume = 0
+        self.count = 0
+
+
+class OrderBook:
+    """
+    单品种限价订单簿
+
+    两侧价位都用升序的键列表维护，最优价位在列表末尾：
+    买方键为价格，卖方键为价格的相反数。撮合时只在末尾弹出，
+    新价位用二分插入。
+
+    挂单只登记 orders（订单ID -> (所在侧, 价格)）和 remaining（订单ID -> 剩余数量），
+    价位队列中只放订单ID。撤单从两个字典删除并更新价位统计，
+    队列中的失效ID在撮合经过时再丢弃，因此订单ID在簿内不能复用。
+
+    成交记录追加到 fills，元素为 (主动方订单ID, 被动方订单ID, 成交价, 成交量)，
+    由调用方通过 takeFills() 取走。
+    """
+
+    def __init__(self, symbol: str = ""):
+        self.symbol = symbol
+        # 下标0为买方，1为卖方
+        self.levels: Tuple[Dict[int, PriceLevel], Dict[int, PriceLevel]] = ({}, {})
+        self.keys: Tuple[List[int], List[int]] = ([], [])
+        self.orders: Dict[Any, Tuple[int, int]] = {}
+        self.remaining: Dict[Any, float] = {}
+        self.fills: List[Tuple[Any, Any, int, float]] = []
+
+        # L2回放：价位键 -> 合成订单ID队列（与订单簿中的排队顺序一致）
+        self.external: Tuple[Dict[int, Deque[int]], Dict[int, Deque[int]]] = ({}, {})
+        self._externalIds = itertools.count(-1, -1)
+
+    # ==================== 撮合 ====================
+
+    def submitOrder(
+        self,
+        orderId: Any,
+        side: int,
+        orderType: str,
+        price: int,
+        quantity: float
+    ) -> float:
+        """
+        提交订单并立即撮合
+
+        Args:
+            orderId: 订单ID，在簿内唯一
+            side: BUY 或 SELL
+            orderType: LIMIT / MARKET / IOC / FOK
+            price: 限价（tick），市价单忽略
+            quantity: 数量
+
+        Returns:
+            float: 未成交数量；限价单的未成交部分已挂入订单簿，其余类型已作废
+        """
+        if side == BUY:
+            own, opp = 0, 1
+            threshold = -price
+        else:
+            own, opp = 1, 0
+            threshold = price
+        if orderType == ORDER_MARKET:
+            threshold = None
+
+        oppKeys = self.keys[opp]
+        oppLevels = self.levels[opp]
+
+        if orderType == ORDER_FOK and not self._canFill(oppKeys, oppLevels, threshold, quantity):
+            return quantity
+
+        remaining = quantity
+        if oppKeys and (threshold is None or oppKeys[-1] >= threshold):
+            orders = self.orders
+            remainingOf = self.remaining
+            fills = self.fills
+            while remaining and oppKeys:
+                key = oppKeys[-1]
+                if threshold is not None and key < threshold:
+                    break
+                makerPrice = -key if opp else key
+                level = oppLevels[key]
+                queue = level.queue
+                while remaining:
+                    makerId = queue[0]
+                    available = remainingOf.get(makerId)
+                    if available is None:
+                        # 已撤销的订单
+                        queue.popleft()
+                        continue
+                    if available <= remaining:
+                        fill = available
+                        queue.popleft()
+                        del remainingOf[makerId]
+                        del orders[makerId]
+                        level.count -= 1
+                    else:
+                        fill = remaining
+                        remainingOf[makerId] = available - remaining
+                    remaining -= fill
+                    level.volume -= fill
+                    fills.append((orderId, makerId, makerPrice, fill))
+                    if not level.count:
+                        break
+                if not level.count:
+                    oppKeys.pop()
+                    del oppLevels[key]
+
+        if remaining and orderType == ORDER_LIMIT:
+            key = -price if own else price
+            ownLevels = self.levels[own]
+            level = ownLevels.get(key)
+            if level is None:
+                level = ownLevels[key] = PriceLevel()
+                insort(self.keys[own], key)
+            level.queue.append(orderId)
+            level.volume += remaining
+            level.count += 1
+            self.orders[orderId] = (own, price)
+            self.remaining[orderId] = remaining
+
+        return remaining
+
+    def _canFill(
+        self,
+        oppKeys: List[int],
+        oppLevels: Dict[int, PriceLevel],
+        threshold: Optional[int],
+        quantity: float
+    ) -> bool:
+        """FOK检查：限价以内的对手盘总量是否足够"""
+        available = 0
+        for key in reversed(oppKeys):
+            if threshold is not None and key < threshold:
+                break
+            available += oppLevels[key].volume
+            if available >= quantity:
+                return True
+        return False
+
+    def cancelOrder(self, orderId: Any) -> float:
+        """撤单，返回撤销的数量（订单不在簿中时为0）"""
+        location = self.orders.pop(orderId, None)
+        if location is None:
+            return 0
+        removed = self.remaining.pop(orderId)
+        side, price = location
+        key = -price if side else price
+        levels = self.levels[side]
+        level = levels[key]
+        level.volume -= removed
+        level.count -= 1
+        if not level.count:
+            del levels[key]
+            keys = self.keys[side]
+            del keys[bisect_left(keys, key)]
+        return removed
+
+    def reduceOrder(self, orderId: Any, quantity: float) -> float:
+        """减少挂单数量且保留排队位置，减到0时等同撤单；返回实际减少的数量"""
+        available = self.remaining.get(orderId)
+        if available is None:
+            return 0
+        if quantity >= available:
+            return self.cancelOrder(orderId)
+        self.remaining[orderId] = available - quantity
+        side, price = self.orders[orderId]
+        self.levels[side][-price if side else price].volume -= quantity
+        return quantity
+
+    def takeFills(self) -> List[Tuple[Any, Any, int, float]]:
+        """取走累计的成交记录"""
+        fills = self.fills
+        self.fills = []
+        return fills
+
+    # ==================== 查询 ====================
+
+    def bestBid(self) -> Optional[int]:
+        keys = self.keys[0]
+        return keys[-1] if keys else None
+
+    def bestAsk(self) -> Optional[int]:
+        keys = self.keys[1]
+        return -keys[-1] if keys else None
+
+    def depth(self, levels: int = 5) -> Dict[str, List[Tuple[int, float]]]:
+        """前N档深度 [(价格, 数量), ...]"""
+        bidLevels, askLevels = self.levels
+        return {
+            'bids': [(key, bidLevels[key].volume) for key in self.keys[0][:-levels - 1:-1]],
+            'asks': [(-key, askLevels[key].volume) for key in self.keys[1][:-levels - 1:-1]]
+        }
+
+    def queueAhead(self, orderId: Any) -> float:
+        """排在指定挂单前面的数量"""
+        location = self.orders.get(orderId)
+        if location is None:
+            return 0
+        side, price = location
+        remainingOf = self.remaining
+        ahead = 0
+        for queuedId in self.levels[side][-price if side else price].queue:
+            if queuedId == orderId:
+                break
+            ahead += remainingOf.get(queuedId, 0)
+        return ahead
+
+    # ==================== L2回放 ====================
+
+    def applyDepth(self, bids: Iterable[Tuple[int, float]], asks: Iterable[Tuple[int, float]]) -> None:
+        """
+        按L2快照设置外部挂单量
+
+        数量减少视为排在前面的挂单成交或撤单，从队首扣减；
+        数量增加视为新挂单，排在已有挂单（包括本地订单）之后，
+        若与本地挂单交叉则先与之撮合。快照中缺失的价位视为清空。
+        """
+        targets = (
+            {price: quantity for price, quantity in bids},
+            {-price: quantity for price, quantity in asks}
+        )
+        # 先撤掉消失的价位，避免旧价位与新价位交叉
+        for side in (0, 1):
+            external, target = self.external[side], targets[side]
+            for key in [key for key in external if key not in target]:
+                self._setExternal(side, key, 0)
+        for side in (0, 1):
+            for key, quantity in targets[side].items():
+                self._setExternal(side, key, quantity)
+
+    def _setExternal(self, side: int, key: int, quantity: float) -> None:
+        external = self.external[side]
+        remainingOf = self.remaining
+        queue = external.get(key)
+        if queue is None:
+            queue = deque()
+        # 丢弃已被本地订单吃掉的合成订单
+        while queue and queue[0] not in remainingOf:
+            queue.popleft()
+        current = 0
+        for orderId in queue:
+            current += remainingOf.get(orderId, 0)
+
+        if quantity < current:
+            excess = current - quantity
+            while excess > 0 and queue:
+                orderId = queue[0]
+                available = remainingOf.get(orderId, 0)
+                if available <= excess:
+                    excess -= available
+                    self.cancelOrder(orderId)
+                    queue.popleft()
+                else:
+                    self.reduceOrder(orderId, excess)
+                    excess = 0
+        elif quantity > current:
+            orderId = next(self._externalIds)
+            price = -key if side else key
+            if self.submitOrder(orderId, SELL if side else BUY, ORDER_LIMIT, price, quantity - current):
+                queue.append(orderId)
+
+        if queue:
+            external[key] = queue
+        else:
+            external.pop(key, None)
+
+
+class SimEventScheduler:
+    """
+    模拟事件调度器
+
+    事件按到期时间排序，同一时间按登记顺序执行。
+    clock为None时使用虚拟时间：runUntil()把时间推进到每个事件的到期时间；
+    否则按clock()给出的真实时间执行已到期的事件。
+    """
+
+    def __init__(self, clock: Optional[Callable[[], float]] = None):
+        self.clock = clock
+        self.currentTime = clock() if clock else 0.0
+        self._events: List[Tuple[float, int, Callable, tuple]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def now(self) -> float:
+        return self.clock() if self.clock else self.currentTime
+
+    def schedule(self, delay: float, callback: Callable, *args) -> float:
+        """delay秒后执行callback(*args)，返回到期时间"""
+        return self.scheduleAt(self.now() + delay, callback, *args)
+
+    def scheduleAt(self, dueTime: float, callback: Callable, *args) -> float:
+        heapq.heappush(self._events, (dueTime, next(self._sequence), callback, args))
+        return dueTime
+
+    def nextDueTime(self) -> Optional[float]:
+        return self._events[0][0] if self._events else None
+
+    def runUntil(self, until: Optional[float] = None) -> int:
+        """
+        执行到期时间不晚于until的事件，返回执行数量
+
+        until为None时：虚拟时间下执行全部事件，真实时间下执行当前已到期的事件
+        """
+        if until is None and self.clock:
+            until = self.clock()
+        events = self._events
+        executed = 0
+        while events and (until is None or events[0][0] <= until):
+            dueTime, _, callback, args = heapq.heappop(events)
+            if dueTime > self.currentTime:
+                self.currentTime = dueTime
+            callback(*args)
+            executed += 1
+        if until is not None and until > self.currentTime and not self.clock:
+            self.currentTime = until
+        return executed
+
+    def clear(self) -> None:
+        self._events.clear()
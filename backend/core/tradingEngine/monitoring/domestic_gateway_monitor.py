@@ -10,10 +10,13 @@ from typing import Dict, Any, List, Optional, Callable
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
-import statistics
 from collections import deque, defaultdict
 
 from ..adapters.domestic_gateways_adapter import GatewayStatus, DomesticGatewayType
+from .streaming_metrics import (
+    GatewayStreamingMetrics, LATENCY_ACK, LATENCY_FILL, LATENCY_CANCEL,
+    EVENT_ORDER, EVENT_TRADE, EVENT_QUOTE, EVENT_CANCEL
+)
 
 
 class AlertLevel(Enum):
@@ -90,6 +93,12 @@ class PerformanceMetrics:
     # 连接指标
     connection_count: int = 0
     disconnection_count: int = 0
+    
+    # 分类延迟指标 (毫秒)
+    p50_latency: float = 0.0
+    fill_p95_latency: float = 0.0
+    cancel_p95_latency: float = 0.0
+    cancels_per_second: float = 0.0
 
 
 class DomesticGatewayMonitor:
@@ -104,8 +113,17 @@ class DomesticGatewayMonitor:
     - 健康状态检查
     """
     
-    def __init__(self, monitor_interval: int = 5):
+    def __init__(
+        self,
+        monitor_interval: int = 5,
+        latency_window: float = 300.0,
+        throughput_window: float = 60.0,
+        heartbeat_timeout: float = 30.0
+    ):
         self.monitor_interval = monitor_interval
+        self.latency_window = latency_window
+        self.throughput_window = throughput_window
+        self.heartbeat_timeout = heartbeat_timeout
         self.logger = logging.getLogger(f"{__name__}.GatewayMonitor")
         
         # 监控状态
@@ -117,9 +135,11 @@ class DomesticGatewayMonitor:
             lambda: deque(maxlen=1000)  # 保留最近1000个数据点
         )
         
-        # 延迟数据存储 (网关名 -> 延迟队列)
-        self.latency_data: Dict[str, deque] = defaultdict(
-            lambda: deque(maxlen=1000)
+        # 流式指标 (网关名 -> 延迟直方图/吞吐量计数/可用率)
+        self.streaming_metrics: Dict[str, GatewayStreamingMetrics] = defaultdict(
+            lambda: GatewayStreamingMetrics(
+                self.latency_window, self.throughput_window, self.heartbeat_timeout
+            )
         )
         
         # 告警规则
@@ -237,15 +257,28 @@ class DomesticGatewayMonitor:
         # 在实际使用时需要注入适配器实例
         pass
     
-    def record_latency(self, gateway_name: str, latency_ms: float):
-        """记录延迟数据"""
-        self.latency_data[gateway_name].append({
-            'timestamp': datetime.now(),
-            'latency': latency_ms
-        })
+    def record_latency(self, gateway_name: str, latency_ms: float, kind: str = LATENCY_ACK):
+        """
+        记录延迟数据
         
-        # 检查延迟告警
-        self._check_latency_alerts(gateway_name, latency_ms)
+        Args:
+            gateway_name: 网关名称
+            latency_ms: 延迟（毫秒）
+            kind: ack(报单回报) / fill(成交) / cancel(撤单回报)
+        """
+        self.streaming_metrics[gateway_name].record_latency(kind, latency_ms)
+        
+        # 检查延迟告警（成交延迟取决于行情而非网关，不参与）
+        if kind != LATENCY_FILL:
+            self._check_latency_alerts(gateway_name, latency_ms)
+    
+    def record_event(self, gateway_name: str, event: str, count: int = 1):
+        """记录吞吐量事件: trade / quote / cancel（订单数由record_order_result计入）"""
+        self.streaming_metrics[gateway_name].record_event(event, count)
+    
+    def record_heartbeat(self, gateway_name: str):
+        """记录网关心跳"""
+        self.streaming_metrics[gateway_name].uptime.heartbeat()
     
     def record_order_result(self, gateway_name: str, success: bool):
         """记录订单结果"""
@@ -258,6 +291,7 @@ class DomesticGatewayMonitor:
             }
         
         self.stats[gateway_name]['total_orders'] += 1
+        self.streaming_metrics[gateway_name].record_event(EVENT_ORDER)
         if success:
             self.stats[gateway_name]['successful_orders'] += 1
         else:
@@ -292,6 +326,12 @@ class DomesticGatewayMonitor:
     
     def record_connection_status(self, gateway_name: str, connected: bool):
         """记录连接状态"""
+        uptime = self.streaming_metrics[gateway_name].uptime
+        if connected:
+            uptime.on_connected()
+        else:
+            uptime.on_disconnected()
+        
         status_value = 1.0 if connected else 0.0
         self._check_metric_alerts(gateway_name, MetricType.CONNECTION_STATUS, status_value)
     
@@ -304,6 +344,10 @@ class DomesticGatewayMonitor:
             # 计算吞吐量
             throughput_stats = self._calculate_throughput_statistics(gateway_name)
             
+            streams = self.streaming_metrics[gateway_name]
+            fill_stats = streams.latency_summary(LATENCY_FILL)
+            cancel_stats = streams.latency_summary(LATENCY_CANCEL)
+            
             # 创建性能指标对象
             metrics = PerformanceMetrics(
                 gateway_name=gateway_name,
@@ -314,10 +358,18 @@ class DomesticGatewayMonitor:
                 p95_latency=latency_stats.get('p95', 0.0),
                 p99_latency=latency_stats.get('p99', 0.0),
                 orders_per_second=throughput_stats.get('orders_per_second', 0.0),
+                trades_per_second=throughput_stats.get('trades_per_second', 0.0),
+                quotes_per_second=throughput_stats.get('quotes_per_second', 0.0),
                 order_success_rate=self._calculate_success_rate(gateway_name),
                 error_rate=self._calculate_error_rate(gateway_name),
                 error_count=status.error_count,
-                connection_uptime=self._calculate_uptime(gateway_name)
+                connection_uptime=self._calculate_uptime(gateway_name),
+                connection_count=streams.uptime.connection_count,
+                disconnection_count=streams.uptime.disconnection_count,
+                p50_latency=latency_stats.get('p50', 0.0),
+                fill_p95_latency=fill_stats['p95'],
+                cancel_p95_latency=cancel_stats['p95'],
+                cancels_per_second=throughput_stats.get('cancels_per_second', 0.0)
             )
             
             # 存储到历史记录
@@ -326,40 +378,20 @@ class DomesticGatewayMonitor:
         except Exception as e:
             self.logger.error(f"更新性能指标失败 {gateway_name}: {e}")
     
-    def _calculate_latency_statistics(self, gateway_name: str) -> Dict[str, float]:
-        """计算延迟统计"""
-        latency_queue = self.latency_data[gateway_name]
-        
-        if not latency_queue:
-            return {'avg': 0.0, 'min': 0.0, 'max': 0.0, 'p95': 0.0, 'p99': 0.0}
-        
-        # 获取最近5分钟的数据
-        cutoff_time = datetime.now() - timedelta(minutes=5)
-        recent_latencies = [
-            item['latency'] for item in latency_queue
-            if item['timestamp'] >= cutoff_time
-        ]
-        
-        if not recent_latencies:
-            return {'avg': 0.0, 'min': 0.0, 'max': 0.0, 'p95': 0.0, 'p99': 0.0}
-        
-        recent_latencies.sort()
-        
-        return {
-            'avg': statistics.mean(recent_latencies),
-            'min': min(recent_latencies),
-            'max': max(recent_latencies),
-            'p95': self._percentile(recent_latencies, 0.95),
-            'p99': self._percentile(recent_latencies, 0.99)
-        }
+    def _calculate_latency_statistics(self, gateway_name: str, kind: str = LATENCY_ACK) -> Dict[str, float]:
+        """计算最近latency_window秒的延迟统计（直方图读取，不排序）"""
+        return self.streaming_metrics[gateway_name].latency_summary(kind)
     
     def _calculate_throughput_statistics(self, gateway_name: str) -> Dict[str, float]:
-        """计算吞吐量统计"""
-        # 简化实现，实际需要基于时间窗口计算
+        """计算最近throughput_window秒的吞吐量统计"""
+        rates = self.streaming_metrics[gateway_name].rates(
+            (EVENT_ORDER, EVENT_TRADE, EVENT_QUOTE, EVENT_CANCEL)
+        )
         return {
-            'orders_per_second': 0.0,
-            'trades_per_second': 0.0,
-            'quotes_per_second': 0.0
+            'orders_per_second': rates[EVENT_ORDER],
+            'trades_per_second': rates[EVENT_TRADE],
+            'quotes_per_second': rates[EVENT_QUOTE],
+            'cancels_per_second': rates[EVENT_CANCEL]
         }
     
     def _calculate_success_rate(self, gateway_name: str) -> float:
@@ -391,20 +423,8 @@ class DomesticGatewayMonitor:
         return len(recent_errors) * 2.0  # 假设每个错误代表2%的错误率
     
     def _calculate_uptime(self, gateway_name: str) -> float:
-        """计算连接正常运行时间百分比"""
-        # 简化实现，实际需要基于连接状态历史
-        return 99.5
-    
-    def _percentile(self, data: List[float], percentile: float) -> float:
-        """计算百分位数"""
-        if not data:
-            return 0.0
-        
-        index = int(len(data) * percentile)
-        if index >= len(data):
-            index = len(data) - 1
-        
-        return data[index]
+        """计算连接正常运行时间百分比（基于连接事件和心跳）"""
+        return self.streaming_metrics[gateway_name].uptime.availability()
     
     def _check_latency_alerts(self, gateway_name: str, latency_ms: float):
         """检查延迟告警"""
@@ -580,6 +600,13 @@ class DomesticGatewayMonitor:
         # 添加延迟统计
         latency_stats = self._calculate_latency_statistics(gateway_name)
         stats['latency_statistics'] = latency_stats
+        streams = self.streaming_metrics[gateway_name]
+        stats['latency_by_kind'] = {
+            kind: streams.latency_summary(kind) for kind in streams.latency
+        }
+        stats['throughput'] = self._calculate_throughput_statistics(gateway_name)
+        stats['available'] = streams.uptime.is_available()
+        stats['heartbeat_age'] = streams.uptime.heartbeat_age()
         
         return stats
     
@@ -599,12 +626,13 @@ class DomesticGatewayMonitor:
                 self.stats[gateway_name] = {}
             if gateway_name in self.metrics_history:
                 self.metrics_history[gateway_name].clear()
-            if gateway_name in self.latency_data:
-                self.latency_data[gateway_name].clear()
+            if gateway_name in self.streaming_metrics:
+                self.streaming_metrics[gateway_name].clear()
         else:
             self.stats.clear()
             self.metrics_history.clear()
-            self.latency_data.clear()
+            for streams in self.streaming_metrics.values():
+                streams.clear()
         
         self.logger.info(f"统计数据重置: {gateway_name or '全部'}")
 
@@ -0,0 +1,193 @@
+"""
+网关流式指标
+为DomesticGatewayMonitor提供逐事件O(1)记录、按桶数读取的统计结构：
+- 延迟直方图与吞吐量计数使用shared.metrics中的RollingHistogram/RollingCounter
+- UptimeTracker: 由连接事件和心跳推算的可用率
+- GatewayStreamingMetrics: 单个网关的上述指标集合
+"""
+
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from shared.metrics.histogram import LatencyHistogram, RollingCounter, RollingHistogram
+
+# 延迟类型
+LATENCY_ACK = 'ack'          # 报单到首次回报
+LATENCY_FILL = 'fill'        # 报单到成交
+LATENCY_CANCEL = 'cancel'    # 撤单到撤单回报
+LATENCY_KINDS = (LATENCY_ACK, LATENCY_FILL, LATENCY_CANCEL)
+
+# 吞吐量事件类型
+EVENT_ORDER = 'order'
+EVENT_TRADE = 'trade'
+EVENT_QUOTE = 'quote'
+EVENT_CANCEL = 'cancel'
+EVENT_KINDS = (EVENT_ORDER, EVENT_TRADE, EVENT_QUOTE, EVENT_CANCEL)
+
+# 延迟以毫秒记录，直方图覆盖1µs ~ 1h
+_LATENCY_MIN_MS = 1e-3
+_LATENCY_MAX_MS = 3600e3
+_LATENCY_SLOTS = 10
+SUMMARY_PERCENTILES = (0.5, 0.95, 0.99)
+
+
+class UptimeTracker:
+    """
+    连接可用率
+
+    从第一次连接事件开始累计可用/不可用时长：
+    - 断开期间计为不可用
+    - 连接期间收到过心跳时，距最近一次心跳超过heartbeat_timeout的部分计为不可用
+    - 断开状态下收到心跳视为已重新连接
+
+    Args:
+        heartbeat_timeout: 心跳超时（秒）
+        clock: 时间函数，默认time.monotonic
+    """
+
+    def __init__(self, heartbeat_timeout: float = 30.0,
+                 clock: Optional[Callable[[], float]] = None):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.clock = clock or time.monotonic
+        self.connected = False
+        self.up_seconds = 0.0
+        self.down_seconds = 0.0
+        self.connection_count = 0
+        self.disconnection_count = 0
+        self.last_heartbeat: Optional[float] = None
+        self._mark: Optional[float] = None  # 已累计到的时间点
+
+    def _split(self, now: float):
+        """自_mark至now的(可用, 不可用)时长"""
+        if self._mark is None or now <= self._mark:
+            return 0.0, 0.0
+        elapsed = now - self._mark
+        if not self.connected:
+            return 0.0, elapsed
+        if self.last_heartbeat is None:
+            return elapsed, 0.0
+        up = min(max(self.last_heartbeat + self.heartbeat_timeout - self._mark, 0.0), elapsed)
+        return up, elapsed - up
+
+    def _advance(self, now: float) -> None:
+        up, down = self._split(now)
+        self.up_seconds += up
+        self.down_seconds += down
+        if self._mark is None or now > self._mark:
+            self._mark = now
+
+    def on_connected(self, now: Optional[float] = None) -> None:
+        now = self.clock() if now is None else now
+        self._advance(now)
+        if not self.connected:
+            self.connected = True
+            self.connection_count += 1
+        if self.last_heartbeat is not None:
+            # 已启用心跳检测时，连接本身算一次心跳
+            self.last_heartbeat = now
+
+    def on_disconnected(self, now: Optional[float] = None) -> None:
+        now = self.clock() if now is None else now
+        self._advance(now)
+        if self.connected:
+            self.connected = False
+            self.disconnection_count += 1
+
+    def heartbeat(self, now: Optional[float] = None) -> None:
+        now = self.clock() if now is None else now
+        if not self.connected:
+            self.on_connected(now)
+        else:
+            self._advance(now)
+        self.last_heartbeat = now
+
+    def is_available(self, now: Optional[float] = None) -> bool:
+        if not self.connected:
+            return False
+        if self.last_heartbeat is None:
+            return True
+        now = self.clock() if now is None else now
+        return now - self.last_heartbeat <= self.heartbeat_timeout
+
+    def heartbeat_age(self, now: Optional[float] = None) -> Optional[float]:
+        """距最近一次心跳的秒数，未收到过心跳时为None"""
+        if self.last_heartbeat is None:
+            return None
+        return (self.clock() if now is None else now) - self.last_heartbeat
+
+    def availability(self, now: Optional[float] = None) -> float:
+        """可用率百分比，尚无连接事件时为100"""
+        up, down = self._split(self.clock() if now is None else now)
+        up += self.up_seconds
+        down += self.down_seconds
+        total = up + down
+        return up / total * 100 if total > 0 else 100.0
+
+
+class GatewayStreamingMetrics:
+    """
+    单个网关的流式指标：各类延迟直方图、各类事件吞吐量和可用率
+
+    时间统一取自clock（默认time.monotonic）：延迟窗口切成10个时间槽，
+    吞吐量按秒分槽；读取合并窗口内的槽。
+    """
+
+    def __init__(
+        self,
+        latency_window: float = 300.0,
+        throughput_window: float = 60.0,
+        heartbeat_timeout: float = 30.0,
+        clock: Optional[Callable[[], float]] = None
+    ):
+        self.latency_window = latency_window
+        self.throughput_window = throughput_window
+        self.clock = clock or time.monotonic
+        self._template = LatencyHistogram(_LATENCY_MIN_MS, _LATENCY_MAX_MS)
+        self.latency: Dict[str, RollingHistogram] = {kind: self._new_histogram() for kind in LATENCY_KINDS}
+        self.throughput: Dict[str, RollingCounter] = {kind: self._new_counter() for kind in EVENT_KINDS}
+        self.uptime = UptimeTracker(heartbeat_timeout, clock=self.clock)
+
+    def _new_histogram(self) -> RollingHistogram:
+        return RollingHistogram(_LATENCY_SLOTS, self.latency_window / _LATENCY_SLOTS, self._template)
+
+    def _new_counter(self) -> RollingCounter:
+        return RollingCounter(max(1, int(round(self.throughput_window))), 1, fields=("events",))
+
+    def record_latency(self, kind: str, latency_ms: float, now: Optional[float] = None) -> None:
+        histogram = self.latency.get(kind)
+        if histogram is None:
+            histogram = self.latency[kind] = self._new_histogram()
+        histogram.record(max(float(latency_ms), 0.0), self.clock() if now is None else now)
+
+    def record_event(self, kind: str, count: int = 1, now: Optional[float] = None) -> None:
+        counter = self.throughput.get(kind)
+        if counter is None:
+            counter = self.throughput[kind] = self._new_counter()
+        counter.increment("events", count, self.clock() if now is None else now)
+
+    def latency_summary(self, kind: str = LATENCY_ACK, now: Optional[float] = None) -> Dict[str, float]:
+        """窗口内的样本数、均值、最小/最大值和p50/p95/p99（毫秒）"""
+        histogram = self.latency.get(kind)
+        if histogram is None:
+            return self._template.copy_empty().summary(SUMMARY_PERCENTILES)
+        snapshot = histogram.snapshot(self.latency_window, self.clock() if now is None else now)
+        return snapshot.summary(SUMMARY_PERCENTILES)
+
+    def rates(self, kinds: Optional[Iterable[str]] = None, now: Optional[float] = None) -> Dict[str, float]:
+        """各类事件的每秒速率"""
+        now = self.clock() if now is None else now
+        rates = {}
+        for kind in (kinds if kinds is not None else self.throughput):
+            counter = self.throughput.get(kind)
+            if counter is None:
+                rates[kind] = 0.0
+            else:
+                rates[kind] = counter.sum("events", counter.slots, now) / counter.retention_seconds
+        return rates
+
+    def clear(self) -> None:
+        for histogram in self.latency.values():
+            histogram.reset()
+        for counter in self.throughput.values():
+            counter.reset()
+        self.uptime = UptimeTracker(self.uptime.heartbeat_timeout, clock=self.clock)
@@ -0,0 +1,350 @@
+"""
+策略进程隔离
+
+为StrategyIsolationLevel.PROCESS提供跨进程通道和子进程入口：
+- SharedMemoryRing: 共享内存广播环，单写者多读者，每条记录带序号和目标进程位掩码，
+  行情只序列化、写入一次，各策略进程按自己的游标读取，落后超过一圈时跳过并计数
+- SPSCQueue: 共享内存单生产者单消费者字节队列，策略进程发出的订单和统计经此回传，
+  读写两端各自只修改自己的位置计数，不加锁
+- run_strategy_process: 子进程入口，在独立事件循环中运行策略
+
+读写顺序依赖先写数据、后发布序号/位置，并在读取后复核序号（seqlock），
+适用于x86等保证存储顺序的平台。
+"""
+
+import asyncio
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional, Tuple
+
+# 单个广播环最多支持的进程数（位掩码宽度）
+MAX_RING_READERS = 64
+
+_RING_HEADER = 64
+_RING_SLOT_HEADER = struct.Struct("<QQI")  # 序号+1, 目标掩码, 负载长度
+_U64 = struct.Struct("<Q")
+_U32 = struct.Struct("<I")
+
+_QUEUE_HEADER = 128  # 读位置和写位置分处不同缓存行
+_QUEUE_TAIL_OFFSET = 64
+_QUEUE_WRAP = 0xFFFFFFFF
+
+# 子进程回传的消息类型
+MESSAGE_ORDER = "order"
+MESSAGE_STATS = "stats"
+
+
+class SharedMemoryRing:
+    """
+    共享内存广播环
+
+    Args:
+        slots: 槽位数
+        slot_size: 每个槽位字节数（含20字节槽头），超过的记录被拒绝
+        name: 附加到已有共享内存时的名称，为None时新建
+    """
+
+    def __init__(self, slots: int = 4096, slot_size: int = 2048, name: Optional[str] = None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_RING_HEADER + slots * slot_size)
+            self.owner = True
+            struct.pack_into("<QII", self.shm.buf, 0, 0, slots, slot_size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            _, slots, slot_size = struct.unpack_from("<QII", self.shm.buf, 0)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_payload = slot_size - _RING_SLOT_HEADER.size
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def sequence(self) -> int:
+        """下一条记录的序号"""
+        return _U64.unpack_from(self.shm.buf, 0)[0]
+
+    def publish(self, mask: int, payload: bytes) -> int:
+        """写入一条记录，返回其序号"""
+        length = len(payload)
+        if length > self.max_payload:
+            raise ValueError(f"记录长度 {length} 超过槽位容量 {self.max_payload}")
+        buf = self.shm.buf
+        with self._lock:
+            sequence = _U64.unpack_from(buf, 0)[0]
+            offset = _RING_HEADER + (sequence % self.slots) * self.slot_size
+            # 先作废槽位，写完数据后再发布序号
+            _U64.pack_into(buf, offset, 0)
+            _U64.pack_into(buf, offset + 8, mask)
+            _U32.pack_into(buf, offset + 16, length)
+            start = offset + _RING_SLOT_HEADER.size
+            buf[start:start + length] = payload
+            _U64.pack_into(buf, offset, sequence + 1)
+            _U64.pack_into(buf, 0, sequence + 1)
+        return sequence
+
+    def reader(self, slot_index: int, start: Optional[int] = None) -> "RingReader":
+        return RingReader(self, slot_index, self.sequence if start is None else start)
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class RingReader:
+    """广播环的读游标，只返回掩码包含自身位的记录"""
+
+    def __init__(self, ring: SharedMemoryRing, slot_index: int, start: int):
+        self.ring = ring
+        self.bit = 1 << slot_index
+        self.cursor = start
+        self.lost = 0  # 被覆盖而未读到的记录数
+
+    def poll(self) -> Optional[bytes]:
+        """读取下一条发给本进程的记录，没有时返回None"""
+        ring = self.ring
+        buf = ring.shm.buf
+        while True:
+            head = _U64.unpack_from(buf, 0)[0]
+            cursor = self.cursor
+            if cursor >= head:
+                return None
+            if head - cursor > ring.slots:
+                self._skip_to(head - ring.slots)
+                continue
+            offset = _RING_HEADER + (cursor % ring.slots) * ring.slot_size
+            published, mask, length = _RING_SLOT_HEADER.unpack_from(buf, offset)
+            if published != cursor + 1:
+                # 槽位已被下一圈覆盖或正在写入
+                self._skip_to(max(cursor + 1, _U64.unpack_from(buf, 0)[0] - ring.slots + 1))
+                continue
+            if not mask & self.bit:
+                self.cursor = cursor + 1
+                continue
+            start = offset + _RING_SLOT_HEADER.size
+            payload = bytes(buf[start:start + length])
+            if _U64.unpack_from(buf, offset)[0] != cursor + 1:
+                # 读取期间被覆盖
+                self._skip_to(cursor + 1)
+                continue
+            self.cursor = cursor + 1
+            return payload
+
+    def _skip_to(self, sequence: int) -> None:
+        self.lost += sequence - self.cursor
+        self.cursor = sequence
+
+
+class SPSCQueue:
+    """
+    共享内存单生产者单消费者队列
+
+    记录格式为 [长度u32][负载]，放不下时写入回绕标记从头开始。
+    生产者只推进写位置，消费者只推进读位置。
+
+    Args:
+        capacity: 数据区字节数
+        name: 附加到已有共享内存时的名称，为None时新建
+    """
+
+    def __init__(self, capacity: int = 1 << 20, name: Optional[str] = None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_QUEUE_HEADER + capacity)
+            self.owner = True
+            self.shm.buf[:_QUEUE_HEADER] = bytes(_QUEUE_HEADER)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            capacity = self.shm.size - _QUEUE_HEADER
+        self.capacity = capacity
+        self.max_payload = capacity // 2 - _U32.size
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def _positions(self) -> Tuple[int, int]:
+        buf = self.shm.buf
+        return _U64.unpack_from(buf, 0)[0], _U64.unpack_from(buf, _QUEUE_TAIL_OFFSET)[0]
+
+    def __len__(self) -> int:
+        head, tail = self._positions()
+        return tail - head
+
+    def push(self, payload: bytes) -> bool:
+        """写入一条记录，空间不足时返回False"""
+        length = len(payload)
+        if length > self.max_payload:
+            raise ValueError(f"记录长度 {length} 超过队列容量 {self.max_payload}")
+        buf = self.shm.buf
+        head, tail = self._positions()
+        need = _U32.size + length
+        offset = tail % self.capacity
+        contiguous = self.capacity - offset
+        padding = contiguous if contiguous < need else 0
+        if self.capacity - (tail - head) < padding + need:
+            return False
+        if padding:
+            if padding >= _U32.size:
+                _U32.pack_into(buf, _QUEUE_HEADER + offset, _QUEUE_WRAP)
+            offset = 0
+        start = _QUEUE_HEADER + offset
+        _U32.pack_into(buf, start, length)
+        buf[start + _U32.size:start + need] = payload
+        _U64.pack_into(buf, _QUEUE_TAIL_OFFSET, tail + padding + need)
+        return True
+
+    def pop(self) -> Optional[bytes]:
+        """读取一条记录，队列为空时返回None"""
+        buf = self.shm.buf
+        head, tail = self._positions()
+        while head < tail:
+            offset = head % self.capacity
+            contiguous = self.capacity - offset
+            if contiguous < _U32.size:
+                head += contiguous
+                continue
+            start = _QUEUE_HEADER + offset
+            length = _U32.unpack_from(buf, start)[0]
+            if length == _QUEUE_WRAP:
+                head += contiguous
+                continue
+            payload = bytes(buf[start + _U32.size:start + _U32.size + length])
+            _U64.pack_into(buf, 0, head + _U32.size + length)
+            return payload
+        _U64.pack_into(buf, 0, head)
+        return None
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class Backoff:
+    """轮询退避：先让出若干次，再逐步加长休眠"""
+
+    def __init__(self, spins: int = 100, max_delay: float = 0.002):
+        self.spins = spins
+        self.max_delay = max_delay
+        self.idle = 0
+
+    def reset(self) -> None:
+        self.idle = 0
+
+    def delay(self) -> float:
+        self.idle += 1
+        if self.idle <= self.spins:
+            return 0
+        return min(self.max_delay, 0.0001 * (self.idle - self.spins))
+
+
+def run_strategy_process(config, ring_name: str, slot_index: int, start_sequence: int,
+                         queue_name: str, stop_event, stats_interval: float = 1.0) -> None:
+    """策略子进程入口"""
+    logger = logging.getLogger(f"container.{config.strategy_id}")
+    if config.cpu_affinity and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, config.cpu_affinity)
+        except OSError as e:
+            logger.error(f"设置CPU亲和性失败: {e}")
+
+    ring = SharedMemoryRing(name=ring_name)
+    queue = SPSCQueue(name=queue_name)
+    try:
+        asyncio.run(_serve_strategy(config, ring.reader(slot_index, start_sequence), queue,
+                                    stop_event, stats_interval, logger))
+    finally:
+        ring.close()
+        queue.close()
+
+
+async def _serve_strategy(config, reader: RingReader, queue: SPSCQueue, stop_event,
+                          stats_interval: float, logger: logging.Logger) -> None:
+    # 延迟导入，避免与strategyEngine循环引用
+    from .strategyEngine import StrategyContainer, StrategyState
+
+    container = StrategyContainer(config)
+    if not await container.load_strategy():
+        raise RuntimeError(f"策略加载失败: {config.strategy_id}")
+    strategy = container.strategy_instance
+    stats = container.stats
+    stats['orders_dropped'] = 0
+
+    def send(message: Tuple[str, Any], timeout: float = 1.0) -> bool:
+        payload = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+        deadline = time.monotonic() + timeout
+        while not queue.push(payload):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.0005)
+        return True
+
+    def send_order(order_data: Any) -> None:
+        if not send((MESSAGE_ORDER, order_data)):
+            stats['orders_dropped'] += 1
+            logger.error("订单回传队列已满，丢弃订单")
+
+    strategy.order_sender = send_order
+    await strategy.on_start()
+    strategy.state = container.state = StrategyState.RUNNING
+
+    backoff = Backoff()
+    next_report = time.monotonic() + stats_interval
+    while not stop_event.is_set():
+        payload = reader.poll()
+        if payload is None:
+            await asyncio.sleep(backoff.delay())
+        else:
+            backoff.reset()
+            try:
+                await container._process_event(pickle.loads(payload))
+                stats['processed_events'] += 1
+            except Exception as e:
+                logger.error(f"处理事件异常: {e}")
+                stats['errors'] += 1
+            if backoff.idle == 0 and stats['processed_events'] % 256 == 0:
+                # 持续有数据时也定期让出事件循环，供策略自身的任务运行
+                await asyncio.sleep(0)
+
+        if time.monotonic() >= next_report:
+            next_report = time.monotonic() + stats_interval
+            send((MESSAGE_STATS, {**stats, 'lost_events': reader.lost}), timeout=0)
+
+    await strategy.on_stop()
+    send((MESSAGE_STATS, {**stats, 'lost_events': reader.lost}), timeout=0)
+
+
+def drain_queue(queue: SPSCQueue, handler: Callable[[str, Any], None], stop: threading.Event,
+                logger: logging.Logger) -> None:
+    """父进程读取子进程回传消息，直到stop置位且队列读空"""
+    backoff = Backoff(max_delay=0.005)
+    while True:
+        payload = queue.pop()
+        if payload is None:
+            if stop.is_set():
+                return
+            time.sleep(backoff.delay())
+            continue
+        backoff.reset()
+        try:
+            kind, data = pickle.loads(payload)
+            handler(kind, data)
+        except Exception as e:
+            logger.error(f"处理策略进程消息失败: {e}")
+
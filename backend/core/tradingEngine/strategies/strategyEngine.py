@@ -13,10 +13,22 @@ from enum import Enum
 from abc import ABC, abstractmethod
 import time
 import threading
+import multiprocessing
+import pickle
 from pathlib import Path
 import importlib.util
 import sys
 
+try:
+    import psutil
+except ImportError:  # 缺少psutil时不做CPU/内存限制，只保留崩溃重启
+    psutil = None
+
+from .processIsolation import (
+    MAX_RING_READERS, MESSAGE_ORDER, MESSAGE_STATS,
+    SharedMemoryRing, SPSCQueue, drain_queue, run_strategy_process
+)
+
 
 class StrategyState(Enum):
     """策略状态"""
@@ -46,12 +58,13 @@ class StrategyConfig:
     strategy_module: str
     isolation_level: StrategyIsolationLevel = StrategyIsolationLevel.THREAD
     max_memory_mb: int = 512
-    max_cpu_percent: float = 50.0
+    max_cpu_percent: Optional[float] = None  # 进程隔离时的CPU上限（%），None表示不限制
     timeout_seconds: int = 300
     auto_restart: bool = True
     restart_count: int = 0
     max_restart_count: int = 3
     config_data: Dict[str, Any] = None
+    cpu_affinity: Optional[List[int]] = None  # 进程隔离时绑定的CPU核
     
     def __post_init__(self):
         if self.config_data is None:
@@ -81,6 +94,9 @@ class BaseStrategy(ABC):
         self.on_order_callback: Optional[Callable] = None
         self.on_trade_callback: Optional[Callable] = None
         
+        # 订单发送，由所在容器设置
+        self.order_sender: Optional[Callable[[Any], None]] = None
+        
         # 性能统计
         self.performance_stats: Dict[str, Any] = {}
         
@@ -122,6 +138,14 @@ class BaseStrategy(ABC):
         """成交数据处理"""
         pass
     
+    def send_order(self, order_data: Any) -> bool:
+        """发送订单，由容器转交引擎的订单处理器（进程隔离时经共享内存队列回传）"""
+        if self.order_sender is None:
+            self.logger.error("策略未运行在容器中，无法发送订单")
+            return False
+        self.order_sender(order_data)
+        return True
+    
     def get_state(self) -> StrategyState:
         """获取策略状态"""
         return self.state
@@ -166,22 +190,57 @@ class StrategyContainer:
         self.event_loop: Optional[asyncio.AbstractEventLoop] = None
         self.stop_event = threading.Event()
         
+        # 进程隔离：子进程、行情广播环及其槽位、订单回传队列
+        self.process: Optional[multiprocessing.Process] = None
+        self.market_ring: Optional[SharedMemoryRing] = None
+        self.ring_slot = 0
+        self.order_queue: Optional[SPSCQueue] = None
+        self.order_drainer: Optional[threading.Thread] = None
+        self._owns_ring = False
+        self._process_stop = None
+        self._drain_stop = threading.Event()
+        self._ps_process = None
+        
         # 资源监控
         self.resource_monitor: Optional[threading.Thread] = None
+        self.monitor_interval = 1.0
+        self._cpu_throttle = 0.0  # 每个监控周期内暂停子进程的比例
         self.memory_usage_mb = 0
         self.cpu_usage_percent = 0.0
         
         # 事件队列
         self.event_queue = asyncio.Queue()
         
+        # 订单回调 (strategy_id, order_data)，由引擎设置
+        self.order_callback: Optional[Callable[[str, Any], None]] = None
+        
         # 统计信息
         self.stats = {
             'processed_events': 0,
             'errors': 0,
             'restarts': 0,
-            'uptime_seconds': 0
+            'uptime_seconds': 0,
+            'orders': 0,
+            'orders_dropped': 0,
+            'lost_events': 0,
+            'events_dropped': 0,  # 超过广播环槽位容量而未发送的事件
+            'cpu_throttled': 0
         }
     
+    @property
+    def is_process_isolated(self) -> bool:
+        return self.config.isolation_level == StrategyIsolationLevel.PROCESS
+    
+    @property
+    def ring_mask(self) -> int:
+        return 1 << self.ring_slot
+    
+    def attach_ring(self, ring: SharedMemoryRing, slot: int):
+        """使用引擎共享的行情广播环（进程隔离）"""
+        self.market_ring = ring
+        self.ring_slot = slot
+        self._owns_ring = False
+    
     async def load_strategy(self) -> bool:
         """加载策略"""
         try:
@@ -198,6 +257,7 @@ class StrategyContainer:
                 self.config.strategy_id,
                 self.config
             )
+            self.strategy_instance.order_sender = self._emit_order
             
             self.state = StrategyState.LOADED
             self.logger.info(f"策略加载成功: {self.config.strategy_name}")
@@ -291,10 +351,142 @@ class StrategyContainer:
         self.execution_thread.start()
     
     async def _start_process_isolated(self):
-        """进程隔离启动（暂未实现）"""
-        # TODO: 实现进程隔离
-        self.logger.warning("进程隔离暂未实现，使用线程隔离")
-        await self._start_thread_isolated()
+        """进程隔离启动：行情经共享内存广播环下发，订单经SPSC队列回传"""
+        if self.market_ring is None:
+            self.market_ring = SharedMemoryRing()
+            self.ring_slot = 0
+            self._owns_ring = True
+        if self.order_queue is None:
+            self.order_queue = SPSCQueue()
+        
+        self._drain_stop.clear()
+        self.order_drainer = threading.Thread(
+            target=drain_queue,
+            args=(self.order_queue, self._on_process_message, self._drain_stop, self.logger),
+            daemon=True
+        )
+        self.order_drainer.start()
+        self._spawn_process()
+        if self.strategy_instance:
+            self.strategy_instance.state = StrategyState.RUNNING
+    
+    def _spawn_process(self):
+        """启动策略子进程，从广播环当前位置开始读取"""
+        context = multiprocessing.get_context('spawn')
+        self._process_stop = context.Event()
+        self.process = context.Process(
+            target=run_strategy_process,
+            args=(self.config, self.market_ring.name, self.ring_slot, self.market_ring.sequence,
+                  self.order_queue.name, self._process_stop),
+            name=f"strategy-{self.config.strategy_id}",
+            daemon=True
+        )
+        self.process.start()
+        self._cpu_throttle = 0.0
+        self._ps_process = psutil.Process(self.process.pid) if psutil else None
+        self.logger.info(f"策略进程已启动: pid={self.process.pid}")
+    
+    def _on_process_message(self, kind: str, data: Any):
+        """处理子进程回传的订单和统计"""
+        if kind == MESSAGE_ORDER:
+            self._emit_order(data)
+        elif kind == MESSAGE_STATS:
+            for key in ('processed_events', 'errors', 'orders_dropped', 'lost_events'):
+                if key in data:
+                    self.stats[key] = data[key]
+    
+    def _emit_order(self, order_data: Any):
+        """转交策略发出的订单"""
+        self.stats['orders'] += 1
+        if self.order_callback:
+            self.order_callback(self.config.strategy_id, order_data)
+        else:
+            self.logger.warning("未设置订单回调，订单被忽略")
+    
+    def _check_process(self):
+        """检查子进程存活和资源占用，崩溃或内存超限时重启，设置了CPU上限且超限时按比例暂停"""
+        process = self.process
+        if process is None or self.state != StrategyState.RUNNING:
+            return
+        
+        if not process.is_alive():
+            self._restart_process(f"策略进程异常退出: exitcode={process.exitcode}")
+            return
+        
+        if self._ps_process is None:
+            return
+        try:
+            self.memory_usage_mb = self._ps_process.memory_info().rss / (1024 * 1024)
+            self.cpu_usage_percent = self._ps_process.cpu_percent(None)
+        except psutil.Error:
+            return
+        
+        if self.memory_usage_mb > self.config.max_memory_mb:
+            process.kill()
+            process.join(timeout=5.0)
+            self._restart_process(
+                f"策略进程内存 {self.memory_usage_mb:.0f}MB 超过限制 {self.config.max_memory_mb}MB"
+            )
+            return
+        
+        limit = self.config.max_cpu_percent
+        if limit is None:
+            return
+        
+        # 按不受限时的需求计算每个周期的暂停比例，使平均占用回到限制以内
+        demand = self.cpu_usage_percent / (1 - self._cpu_throttle)
+        self._cpu_throttle = min(0.9, 1 - limit / demand) if demand > limit else 0.0
+        if self._cpu_throttle:
+            self.stats['cpu_throttled'] += 1
+            try:
+                self._ps_process.suspend()
+                time.sleep(self.monitor_interval * self._cpu_throttle)
+            finally:
+                self._ps_process.resume()
+    
+    def _restart_process(self, reason: str):
+        """按auto_restart和max_restart_count重启子进程"""
+        if self.config.auto_restart and self.config.restart_count < self.config.max_restart_count:
+            self.config.restart_count += 1
+            self.stats['restarts'] += 1
+            self.logger.warning(
+                f"{reason}，重启策略进程 ({self.config.restart_count}/{self.config.max_restart_count})"
+            )
+            self._spawn_process()
+        else:
+            self.logger.error(f"{reason}，不再重启")
+            self.state = StrategyState.ERROR
+            if self.strategy_instance:
+                self.strategy_instance.state = StrategyState.ERROR
+            self._release_process_resources()
+    
+    def _stop_process_isolated(self):
+        """通知子进程停止并回收共享内存"""
+        if self._process_stop is not None:
+            self._process_stop.set()
+        if self.process is not None:
+            self.process.join(timeout=10.0)
+            if self.process.is_alive():
+                self.logger.warning("策略进程未能在超时时间内停止，强制结束")
+                self.process.kill()
+                self.process.join(timeout=5.0)
+        if self.strategy_instance:
+            self.strategy_instance.state = StrategyState.STOPPED
+        self._release_process_resources()
+    
+    def _release_process_resources(self):
+        self.process = None
+        self._ps_process = None
+        self._drain_stop.set()
+        if self.order_drainer and self.order_drainer is not threading.current_thread():
+            self.order_drainer.join(timeout=5.0)
+        self.order_drainer = None
+        if self.order_queue is not None:
+            self.order_queue.close()
+            self.order_queue = None
+        if self._owns_ring and self.market_ring is not None:
+            self.market_ring.close()
+            self.market_ring = None
     
     async def _start_no_isolation(self):
         """无隔离启动"""
@@ -361,13 +553,11 @@ class StrategyContainer:
     async def _start_resource_monitor(self):
         """启动资源监控"""
         def monitor_target():
-            while not self.stop_event.is_set():
+            while not self.stop_event.wait(self.monitor_interval * (1 - self._cpu_throttle)):
                 try:
-                    # TODO: 实现实际的资源监控
-                    # 监控内存使用量
-                    # 监控CPU使用率
-                    # 检查是否超过限制
-                    time.sleep(5)
+                    # 进程隔离时可以单独度量和限制子进程，线程隔离共享宿主进程资源
+                    if self.is_process_isolated:
+                        self._check_process()
                 except Exception as e:
                     self.logger.error(f"资源监控异常: {e}")
         
@@ -397,6 +587,10 @@ class StrategyContainer:
             if self.resource_monitor and self.resource_monitor.is_alive():
                 self.resource_monitor.join(timeout=5.0)
             
+            # 停止策略子进程，等待退出最长15秒，放到线程池中执行以免阻塞事件循环
+            if self.is_process_isolated:
+                await asyncio.get_running_loop().run_in_executor(None, self._stop_process_isolated)
+            
             self.state = StrategyState.STOPPED
             self.stop_time = time.time()
             
@@ -415,11 +609,23 @@ class StrategyContainer:
     async def send_event(self, event_type: str, event_data: Any):
         """发送事件到策略"""
         try:
-            await self.event_queue.put({
+            event = {
                 'type': event_type,
                 'data': event_data,
                 'timestamp': time.time()
-            })
+            }
+            if self.is_process_isolated and self.market_ring is not None:
+                payload = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+                if len(payload) > self.market_ring.max_payload:
+                    self.stats['events_dropped'] += 1
+                    self.logger.error(
+                        f"事件 {event_type} 序列化后 {len(payload)} 字节，超过广播环槽位容量 "
+                        f"{self.market_ring.max_payload}，已丢弃"
+                    )
+                    return
+                self.market_ring.publish(self.ring_mask, payload)
+            else:
+                await self.event_queue.put(event)
         except Exception as e:
             self.logger.error(f"发送事件失败: {e}")
     
@@ -431,6 +637,7 @@ class StrategyContainer:
             'strategy_name': self.config.strategy_name,
             'state': self.state.value,
             'isolation_level': self.config.isolation_level.value,
+            'pid': self.process.pid if self.process else None,
             'start_time': self.start_time,
             'stop_time': self.stop_time,
             'uptime_seconds': time.time() - self.start_time if self.start_time else 0,
@@ -446,9 +653,14 @@ class IndependentStrategyEngine:
     独立策略引擎
     
     管理多个策略容器，提供策略的独立运行环境
+    
+    Args:
+        main_engine: 主引擎
+        ring_slots: 进程隔离策略共享的行情广播环槽位数
+        ring_slot_size: 广播环每个槽位的字节数，单条事件序列化后不能超过
     """
     
-    def __init__(self, main_engine=None):
+    def __init__(self, main_engine=None, ring_slots: int = 4096, ring_slot_size: int = 2048):
         self.main_engine = main_engine
         self.logger = logging.getLogger(__name__)
         
@@ -459,17 +671,29 @@ class IndependentStrategyEngine:
         # 引擎状态
         self.is_active = False
         self.start_time: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         
         # 事件分发
         self.event_subscribers: Dict[str, List[str]] = {}  # event_type -> strategy_ids
         
+        # 进程隔离：共享行情广播环，每个进程策略占用一个槽位
+        self.ring_slots = ring_slots
+        self.ring_slot_size = ring_slot_size
+        self.market_ring: Optional[SharedMemoryRing] = None
+        self.ring_assignments: Dict[str, int] = {}  # strategy_id -> 槽位
+        
+        # 订单处理器 (strategy_id, order_data)
+        self.order_handlers: List[Callable] = []
+        
         # 统计信息
         self.stats = {
             'total_strategies': 0,
             'running_strategies': 0,
             'stopped_strategies': 0,
             'error_strategies': 0,
-            'total_events_processed': 0
+            'total_events_processed': 0,
+            'events_dropped': 0,
+            'orders_received': 0
         }
     
     async def start(self) -> bool:
@@ -483,6 +707,7 @@ class IndependentStrategyEngine:
             
             self.is_active = True
             self.start_time = time.time()
+            self._loop = asyncio.get_running_loop()
             
             self.logger.info("独立策略引擎启动成功")
             return True
@@ -505,6 +730,10 @@ class IndependentStrategyEngine:
                 await container.stop()
                 self.logger.info(f"策略容器已停止: {strategy_id}")
             
+            if self.market_ring is not None:
+                self.market_ring.close()
+                self.market_ring = None
+            
             self.is_active = False
             self.logger.info("独立策略引擎已停止")
             return True
@@ -520,13 +749,26 @@ class IndependentStrategyEngine:
                 self.logger.warning(f"策略已存在: {config.strategy_id}")
                 return False
             
+            # 进程隔离的策略分配广播环槽位
+            slot = None
+            if config.isolation_level == StrategyIsolationLevel.PROCESS:
+                used = set(self.ring_assignments.values())
+                slot = next((i for i in range(MAX_RING_READERS) if i not in used), None)
+                if slot is None:
+                    self.logger.error(f"进程隔离策略数量超过上限 {MAX_RING_READERS}")
+                    return False
+            
             # 创建策略容器
             container = StrategyContainer(config)
+            container.order_callback = self._on_strategy_order
             
             # 加载策略
             if not await container.load_strategy():
                 return False
             
+            if slot is not None:
+                self.ring_assignments[config.strategy_id] = slot
+            
             # 注册容器
             self.strategy_containers[config.strategy_id] = container
             self.strategy_configs[config.strategy_id] = config
@@ -556,6 +798,7 @@ class IndependentStrategyEngine:
             # 移除容器
             del self.strategy_containers[strategy_id]
             del self.strategy_configs[strategy_id]
+            self.ring_assignments.pop(strategy_id, None)
             
             # 清理事件订阅
             for event_type, subscribers in self.event_subscribers.items():
@@ -580,6 +823,8 @@ class IndependentStrategyEngine:
                 return False
             
             container = self.strategy_containers[strategy_id]
+            if strategy_id in self.ring_assignments:
+                container.attach_ring(self._ensure_market_ring(), self.ring_assignments[strategy_id])
             result = await container.start()
             
             # 更新统计
@@ -610,22 +855,71 @@ class IndependentStrategyEngine:
             self.logger.error(f"停止策略失败: {e}")
             return False
     
+    def _ensure_market_ring(self) -> SharedMemoryRing:
+        if self.market_ring is None:
+            self.market_ring = SharedMemoryRing(self.ring_slots, self.ring_slot_size)
+        return self.market_ring
+    
     async def broadcast_event(self, event_type: str, event_data: Any):
-        """广播事件到所有订阅的策略"""
+        """
+        广播事件到所有订阅的策略
+        
+        进程隔离的订阅者合并为一个位掩码，事件只序列化并写入广播环一次。
+        """
         try:
             subscribers = self.event_subscribers.get(event_type, [])
             
+            mask = 0
+            ring_containers = []
             for strategy_id in subscribers:
                 if strategy_id in self.strategy_containers:
                     container = self.strategy_containers[strategy_id]
                     if container.state == StrategyState.RUNNING:
-                        await container.send_event(event_type, event_data)
+                        if container.is_process_isolated and container.market_ring is self.market_ring:
+                            mask |= container.ring_mask
+                            ring_containers.append(container)
+                        else:
+                            await container.send_event(event_type, event_data)
+            
+            if mask:
+                event = {'type': event_type, 'data': event_data, 'timestamp': time.time()}
+                payload = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+                if len(payload) > self.market_ring.max_payload:
+                    # 放不进槽位的事件不发送，按接收方计为丢弃
+                    self.stats['events_dropped'] += len(ring_containers)
+                    for container in ring_containers:
+                        container.stats['events_dropped'] += 1
+                    self.logger.error(
+                        f"事件 {event_type} 序列化后 {len(payload)} 字节，超过广播环槽位容量 "
+                        f"{self.market_ring.max_payload}，已丢弃"
+                    )
+                else:
+                    self.market_ring.publish(mask, payload)
             
             self.stats['total_events_processed'] += len(subscribers)
             
         except Exception as e:
             self.logger.error(f"广播事件失败: {e}")
     
+    def add_order_handler(self, handler: Callable):
+        """注册订单处理器 handler(strategy_id, order_data)，可以是协程函数"""
+        self.order_handlers.append(handler)
+    
+    def _on_strategy_order(self, strategy_id: str, order_data: Any):
+        """策略发出订单，可能在容器线程或订单回传线程中调用"""
+        self.stats['orders_received'] += 1
+        for handler in self.order_handlers:
+            try:
+                result = handler(strategy_id, order_data)
+                if asyncio.iscoroutine(result):
+                    if self._loop is not None and self._loop.is_running():
+                        asyncio.run_coroutine_threadsafe(result, self._loop)
+                    else:
+                        result.close()
+                        self.logger.error("引擎事件循环未运行，无法执行订单处理器")
+            except Exception as e:
+                self.logger.error(f"订单处理器异常 {strategy_id}: {e}")
+    
     def subscribe_event(self, strategy_id: str, event_type: str):
         """订阅事件"""
         if event_type not in self.event_subscribers:
@@ -684,6 +978,7 @@ class IndependentStrategyEngine:
             'uptime_seconds': time.time() - self.start_time if self.start_time else 0,
             'stats': self.stats.copy(),
             'strategies': list(self.strategy_containers.keys()),
+            'market_ring_sequence': self.market_ring.sequence if self.market_ring else 0,
             'event_subscribers': {
                 event_type: len(subscribers)
                 for event_type, subscribers in self.event_subscribers.items()
@@ -50,6 +50,9 @@ class RegistryConfig:
     redis_url: str = "redis://localhost:6379/0"
     service_ttl: int = 30  # 服务TTL(秒)
     refresh_interval: int = 10  # 刷新间隔(秒)
+    reconcile_interval: int = 30  # 全量对账间隔(秒)
+    keyspace_notifications: bool = True  # 通过键空间通知增量更新本地快照
+    scan_count: int = 500  # 对账时SCAN每批数量
 
 
 @dataclass  
@@ -59,6 +62,31 @@ class MonitoringConfig:
     metrics_path: str = "/metrics"
     detailed_logging: bool = True
     slow_request_threshold: float = 1.0  # 慢请求阈值(秒)
+    redis_url: Optional[str] = None
+
+    # 直方图与时间窗口
+    histogram_growth: float = 1.04  # 分桶增长因子(相对误差约4%)
+    histogram_window_minutes: int = 60  # 窗口分位数保留时长(分钟)
+    max_tracked_routes: int = 500  # 单独统计的路由上限，超出归入 "__other__"
+    minute_retention: int = 24 * 60  # 分钟统计保留槽数
+    hour_retention: int = 30 * 24  # 小时统计保留槽数
+
+    # 批量持久化
+    persist_interval: float = 10.0  # 快照持久化间隔(秒)
+    snapshot_stream_maxlen: int = 10000
+
+
+@dataclass
+class ProxyConfig:
+    """反向代理配置"""
+    streaming_enabled: bool = True
+    buffer_threshold: int = 64 * 1024  # 已知长度不超过该值的请求/响应体整体缓冲(字节)
+    chunk_size: int = 64 * 1024  # 流式透传块大小(字节)
+    http2: bool = True  # 安装h2时启用
+    max_connections_per_upstream: int = 100
+    max_keepalive_per_upstream: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
 
 
 @dataclass
@@ -84,6 +112,7 @@ class GatewayConfig:
     registry: RegistryConfig = field(default_factory=RegistryConfig)
     monitoring: MonitoringConfig = field(default_factory=MonitoringConfig)
     cors: CORSConfig = field(default_factory=CORSConfig)
+    proxy: ProxyConfig = field(default_factory=ProxyConfig)
     
     # 服务配置
     services: Dict[str, Dict[str, Any]] = field(default_factory=lambda: {
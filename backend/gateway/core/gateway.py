@@ -22,6 +22,7 @@ from ..middleware.load_balancer_middleware import LoadBalancerMiddleware
 from ..routing.service_router import ServiceRouter
 from ..discovery.service_registry import ServiceRegistry
 from ..monitoring.metrics_collector import MetricsCollector
+from .proxy import StreamingProxy
 
 logger = logging.getLogger(__name__)
 
@@ -52,14 +53,20 @@ class APIGateway:
         self.service_registry = ServiceRegistry(config.registry)
         self.service_router = ServiceRouter(self.service_registry)
         self.auth_middleware = GatewayAuthMiddleware(config.auth)
+        self.service_router.set_permission_rules(self.auth_middleware.PERMISSION_RULES)
         self.rate_limiter = RateLimitMiddleware(config.rate_limit)
         self.load_balancer = LoadBalancerMiddleware(config.load_balancer)
         self.metrics_collector = MetricsCollector(config.monitoring)
         
-        # HTTP客户端池
-        self.http_client = httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0),
-            limits=httpx.Limits(max_keepalive_connections=100, max_connections=200)
+        # 反向代理（按上游实例划分连接池）
+        self.proxy = StreamingProxy(
+            config.proxy,
+            request_timeout=config.request_timeout,
+            metrics=self.metrics_collector.proxy
+        )
+        # 实例下线时释放其连接池
+        self.service_registry.add_instance_down_listener(
+            lambda service: self.proxy.pool.discard(service.url)
         )
         
         self._setup_middleware()
@@ -85,6 +92,9 @@ class APIGateway:
                 # 1. 指标收集开始
                 self.metrics_collector.record_request_start(request)
                 
+                # 路由解析：服务、重写路径与权限一次查出
+                request.state.route_match = self.service_router.resolve(request.url.path)
+                
                 # 2. 限流检查
                 await self.rate_limiter.check_rate_limit(request)
                 
@@ -161,12 +171,17 @@ class APIGateway:
         """路由请求到后端服务"""
         try:
             # 1. 确定目标服务
-            service_name = self.service_router.get_service_name(request.url.path)
+            route_match = getattr(request.state, 'route_match', None)
+            if route_match is None:
+                route_match = self.service_router.resolve(request.url.path)
+            service_name = route_match.service_name
             if not service_name:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="未找到对应的服务"
                 )
+            request.state.service_name = service_name
+            request.state.route = route_match.rule.pattern.pattern
             
             # 2. 负载均衡选择实例
             service_instance = await self.load_balancer.select_instance(
@@ -180,17 +195,13 @@ class APIGateway:
             
             # 3. 构建目标URL
             target_url = f"http://{service_instance.host}:{service_instance.port}"
-            full_url = f"{target_url}{request.url.path}"
-            if request.url.query:
-                full_url += f"?{request.url.query}"
             
             # 4. 转发请求
-            headers = dict(request.headers)
-            headers.update({
+            headers = {
                 "X-Forwarded-For": request.client.host,
                 "X-Forwarded-Proto": request.url.scheme,
                 "X-Gateway-Request-ID": str(id(request)),
-            })
+            }
             
             # 添加用户上下文到请求头
             if hasattr(request.state, 'user_context') and request.state.user_context:
@@ -200,38 +211,21 @@ class APIGateway:
                     "X-User-Roles": ",".join(user_context.roles),
                 })
             
-            # 读取请求体
-            body = await request.body() if request.method in ["POST", "PUT", "PATCH"] else None
-            
-            # 发送请求
-            response = await self.http_client.request(
-                method=request.method,
-                url=full_url,
-                headers=headers,
-                content=body,
-                timeout=30.0
-            )
+            # 5. 流式转发并返回响应
+            return await self.proxy.forward(request, target_url, headers)
             
-            # 5. 返回响应
-            return Response(
-                content=response.content,
-                status_code=response.status_code,
-                headers=dict(response.headers),
-                media_type=response.headers.get("content-type")
+        except httpx.TimeoutException:
+            logger.error("请求超时")
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="后端服务响应超时"
             )
-            
         except httpx.RequestError as e:
             logger.error(f"请求转发失败: {e}")
             raise HTTPException(
                 status_code=status.HTTP_502_BAD_GATEWAY,
                 detail="后端服务请求失败"
             )
-        except httpx.TimeoutException:
-            logger.error("请求超时")
-            raise HTTPException(
-                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
-                detail="后端服务响应超时"
-            )
     
     async def start(self):
         """启动网关"""
@@ -250,7 +244,7 @@ class APIGateway:
         """停止网关"""
         logger.info("停止API网关...")
         
-        await self.http_client.aclose()
+        await self.proxy.close()
         await self.service_registry.close()
         await self.metrics_collector.close()
         
@@ -0,0 +1,198 @@
+"""
+流式反向代理
+===========
+
+将请求转发到后端实例：
+- 小于缓冲阈值的请求/响应体整体转发，其余按块流式透传
+- 每个上游实例独立的连接池，支持HTTP/2时自动启用
+- 统计在途字节数
+"""
+
+import importlib.util
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from fastapi import Request
+from starlette.responses import Response, StreamingResponse
+
+from ..config.gateway_config import ProxyConfig
+from ..monitoring.metrics_collector import ProxyMetrics
+
+logger = logging.getLogger(__name__)
+
+# httpx的HTTP/2支持依赖h2
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 逐跳头部，不得转发
+HOP_BY_HOP_HEADERS = frozenset({
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailers", b"transfer-encoding", b"upgrade", b"host",
+})
+
+
+def _filter_headers(raw_headers: Iterable[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """过滤逐跳头部，保持原始字节形式"""
+    return [
+        (name, value) for name, value in raw_headers
+        if name.lower() not in HOP_BY_HOP_HEADERS
+    ]
+
+
+class UpstreamClientPool:
+    """按上游实例划分的HTTP客户端池"""
+
+    def __init__(self, config: ProxyConfig, request_timeout: float):
+        self.config = config
+        self.request_timeout = request_timeout
+        self.http2 = config.http2 and HTTP2_AVAILABLE
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+        if config.http2 and not HTTP2_AVAILABLE:
+            logger.info("未安装h2，上游连接使用HTTP/1.1")
+
+    def get_client(self, base_url: str) -> httpx.AsyncClient:
+        """获取（或创建）上游实例对应的客户端"""
+        client = self._clients.get(base_url)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                http2=self.http2,
+                timeout=httpx.Timeout(self.request_timeout, connect=self.config.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.config.max_connections_per_upstream,
+                    max_keepalive_connections=self.config.max_keepalive_per_upstream,
+                    keepalive_expiry=self.config.keepalive_expiry
+                )
+            )
+            self._clients[base_url] = client
+        return client
+
+    async def discard(self, base_url: str):
+        """移除已下线实例的连接池"""
+        client = self._clients.pop(base_url, None)
+        if client:
+            await client.aclose()
+
+    async def close(self):
+        """关闭所有连接池"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """连接池统计"""
+        return {"upstreams": len(self._clients), "http2": self.http2}
+
+
+class StreamingProxy:
+    """流式反向代理"""
+
+    def __init__(self, config: ProxyConfig, request_timeout: float,
+                 metrics: Optional[ProxyMetrics] = None):
+        self.config = config
+        self.pool = UpstreamClientPool(config, request_timeout)
+        self.metrics = metrics or ProxyMetrics()
+
+    def _should_buffer(self, content_length: Optional[str]) -> bool:
+        """已知长度且不超过阈值时整体缓冲"""
+        if not self.config.streaming_enabled:
+            return True
+        if content_length is None:
+            return False
+        try:
+            return int(content_length) <= self.config.buffer_threshold
+        except ValueError:
+            return False
+
+    async def _stream_request_body(self, request: Request):
+        """逐块读取客户端请求体并计入在途字节"""
+        pending = 0
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    pending = len(chunk)
+                    self.metrics.add_in_flight(pending)
+                    self.metrics.bytes_received += pending
+                    yield chunk
+                    self.metrics.release_in_flight(pending)
+                    pending = 0
+        finally:
+            if pending:
+                self.metrics.release_in_flight(pending)
+
+    async def forward(self, request: Request, base_url: str,
+                      extra_headers: Dict[str, str]) -> Response:
+        """转发请求到上游实例"""
+        client = self.pool.get_client(base_url)
+
+        headers = _filter_headers(request.headers.raw)
+        headers.extend(
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in extra_headers.items()
+        )
+
+        # 请求体
+        content = None
+        if request.method in ("POST", "PUT", "PATCH"):
+            if self._should_buffer(request.headers.get("content-length")):
+                content = await request.body()
+                self.metrics.bytes_received += len(content)
+            else:
+                content = self._stream_request_body(request)
+
+        upstream_request = client.build_request(
+            method=request.method,
+            url=request.url.path,
+            params=request.url.query or None,
+            headers=headers,
+            content=content
+        )
+        upstream_response = await client.send(upstream_request, stream=True)
+
+        response_headers = _filter_headers(upstream_response.headers.raw)
+
+        # 响应体：小响应整体读取，其余流式透传
+        if self._should_buffer(upstream_response.headers.get("content-length")):
+            try:
+                body = b"".join([chunk async for chunk in upstream_response.aiter_raw()])
+            finally:
+                await upstream_response.aclose()
+            self.metrics.bytes_sent += len(body)
+            response = Response(content=body, status_code=upstream_response.status_code)
+            response.raw_headers = response_headers
+            return response
+
+        response = StreamingResponse(
+            self._stream_response_body(upstream_response),
+            status_code=upstream_response.status_code
+        )
+        response.raw_headers = response_headers
+        return response
+
+    async def _stream_response_body(self, upstream_response: httpx.Response):
+        """按块透传上游响应（不解压，Content-Encoding原样保留）"""
+        pending = 0
+        self.metrics.active_streams += 1
+        try:
+            async for chunk in upstream_response.aiter_raw(self.config.chunk_size):
+                pending = len(chunk)
+                self.metrics.add_in_flight(pending)
+                yield chunk
+                self.metrics.release_in_flight(pending)
+                self.metrics.bytes_sent += pending
+                pending = 0
+        except httpx.HTTPError as e:
+            # 响应头已发出，只能中断连接
+            self.metrics.stream_errors += 1
+            logger.error(f"上游响应流中断: {e}")
+        finally:
+            # 客户端断开时生成器被关闭，同样在此释放上游连接
+            if pending:
+                self.metrics.release_in_flight(pending)
+            self.metrics.active_streams -= 1
+            await upstream_response.aclose()
+
+    async def close(self):
+        """关闭代理"""
+        await self.pool.close()
@@ -3,14 +3,17 @@
 =============
 
 基于Redis的服务注册与发现机制
+
+查询走本地带版本号的快照，请求路径上不访问Redis；快照通过键空间通知增量更新，
+并定期以SCAN+pipeline全量对账。
 """
 
 import json
 import time
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Any, Iterable
+from dataclasses import dataclass, asdict, field, replace
 import redis.asyncio as redis
 from enum import Enum
 
@@ -79,6 +82,73 @@ class ServiceInfo:
         if 'status' in data:
             data['status'] = ServiceStatus(data['status'])
         return cls(**data)
+    
+    def to_redis_mapping(self) -> Dict[str, Any]:
+        """转换为Redis哈希字段（嵌套结构序列化为JSON）"""
+        data = self.to_dict()
+        data['metadata'] = json.dumps(self.metadata)
+        data['tags'] = json.dumps(self.tags)
+        return data
+    
+    @classmethod
+    def from_redis_mapping(cls, data: Dict[str, str]) -> "ServiceInfo":
+        """从Redis哈希字段创建（字段值均为字符串）"""
+        data = dict(data)
+        for key in ('metadata', 'tags'):
+            if isinstance(data.get(key), str):
+                data[key] = json.loads(data[key] or "null")
+        for key in ('port', 'weight'):
+            if key in data:
+                data[key] = int(data[key])
+        for key in ('last_heartbeat', 'register_time'):
+            if key in data:
+                data[key] = float(data[key])
+        return cls.from_dict(data)
+
+
+@dataclass
+class RegistrySnapshot:
+    """注册中心本地快照
+
+    ``instances`` 按 service_id 索引，``by_name`` 按服务名索引实例，
+    ``heartbeats`` 记录最近一次心跳时间；任何变更都会递增 ``version``。
+    """
+    version: int = 0
+    instances: Dict[str, ServiceInfo] = field(default_factory=dict)
+    by_name: Dict[str, Dict[str, ServiceInfo]] = field(default_factory=dict)
+    heartbeats: Dict[str, float] = field(default_factory=dict)
+    
+    def put(self, service: ServiceInfo, heartbeat: Optional[float] = None):
+        """写入或替换实例"""
+        service_id = service.service_id
+        self.instances[service_id] = service
+        self.by_name.setdefault(service.name, {})[service_id] = service
+        if heartbeat is not None:
+            self.heartbeats[service_id] = heartbeat
+        self.version += 1
+    
+    def remove(self, service_id: str) -> Optional[ServiceInfo]:
+        """移除实例，返回被移除的实例"""
+        service = self.instances.pop(service_id, None)
+        self.heartbeats.pop(service_id, None)
+        if service:
+            instances = self.by_name.get(service.name)
+            if instances is not None:
+                instances.pop(service_id, None)
+                if not instances:
+                    del self.by_name[service.name]
+        self.version += 1
+        return service
+    
+    def touch(self, service_id: str, heartbeat: Optional[float]):
+        """更新心跳时间（None表示心跳键已过期）"""
+        if heartbeat is None:
+            self.heartbeats.pop(service_id, None)
+        else:
+            self.heartbeats[service_id] = heartbeat
+        self.version += 1
+
+
 
 
 class ServiceRegistry:
@@ -93,9 +163,17 @@ class ServiceRegistry:
         self.service_prefix = "redfire:services"
         self.heartbeat_prefix = "redfire:heartbeat"
         
+        # 本地快照
+        self.snapshot = RegistrySnapshot()
+        
         # 健康检查任务
         self._heartbeat_task: Optional[asyncio.Task] = None
         self._cleanup_task: Optional[asyncio.Task] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._pubsub = None
+        
+        # 实例下线（注销、过期或标记为不健康）回调
+        self._instance_down_listeners: List[Callable[[ServiceInfo], Any]] = []
     
     async def initialize(self):
         """初始化注册中心"""
@@ -115,34 +193,67 @@ class ServiceRegistry:
             logger.error(f"Redis连接失败: {e}")
             raise
         
+        # 首次全量加载快照
+        await self.reconcile()
+        
         # 启动后台任务
+        if self.config.keyspace_notifications:
+            self._watch_task = asyncio.create_task(self._watch_loop())
         self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
         self._cleanup_task = asyncio.create_task(self._cleanup_loop())
         
         logger.info("服务注册中心初始化完成")
     
+    def add_instance_down_listener(self, callback: Callable[[ServiceInfo], Any]):
+        """注册实例下线回调，回调可以是协程函数"""
+        self._instance_down_listeners.append(callback)
+    
+    def _notify_instance_down(self, service: Optional[ServiceInfo]):
+        """通知实例下线"""
+        if service is None:
+            return
+        for callback in self._instance_down_listeners:
+            try:
+                result = callback(service)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                logger.error(f"实例下线回调失败 {service.service_id}: {e}")
+    
+    def _remove_from_snapshot(self, service_id: str):
+        """从快照移除实例并通知"""
+        self._notify_instance_down(self.snapshot.remove(service_id))
+    
+    def _service_key(self, service_id: str) -> str:
+        return f"{self.service_prefix}:{service_id}"
+    
+    def _heartbeat_key(self, service_id: str) -> str:
+        return f"{self.heartbeat_prefix}:{service_id}"
+    
     async def register_service(self, service: ServiceInfo) -> bool:
         """注册服务"""
         try:
-            service_key = f"{self.service_prefix}:{service.service_id}"
-            heartbeat_key = f"{self.heartbeat_prefix}:{service.service_id}"
+            service_key = self._service_key(service.service_id)
+            heartbeat_key = self._heartbeat_key(service.service_id)
             
             # 更新心跳时间
-            service.last_heartbeat = time.time()
-            
-            # 存储服务信息
-            await self.redis.hset(service_key, mapping=service.to_dict())
-            await self.redis.expire(service_key, self.config.service_ttl * 2)
+            now = time.time()
+            service.last_heartbeat = now
             
-            # 设置心跳
-            await self.redis.set(heartbeat_key, time.time(), ex=self.config.service_ttl)
+            # 存储服务信息并设置心跳（一次往返）
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(service_key, mapping=service.to_redis_mapping())
+            pipe.expire(service_key, self.config.service_ttl * 2)
+            pipe.set(heartbeat_key, now, ex=self.config.service_ttl)
+            await pipe.execute()
             
             # 缓存到本地
             self.local_services[service.service_id] = service
+            self.snapshot.put(service, heartbeat=now)
             
             logger.info(f"服务注册成功: {service.service_id}")
             return True
-            
+        
         except Exception as e:
             logger.error(f"服务注册失败 {service.service_id}: {e}")
             return False
@@ -151,178 +262,303 @@ class ServiceRegistry:
         """注销服务"""
         try:
             if host and port:
-                service_id = f"{service_name}:{host}:{port}"
-                await self._remove_service(service_id)
+                await self._remove_services([f"{service_name}:{host}:{port}"])
             else:
                 # 注销所有同名服务
-                services = await self.discover_services(service_name)
-                for service in services:
-                    await self._remove_service(service.service_id)
+                await self._remove_services(list(self.snapshot.by_name.get(service_name, {})))
             
             logger.info(f"服务注销成功: {service_name}")
             return True
-            
+        
         except Exception as e:
             logger.error(f"服务注销失败 {service_name}: {e}")
             return False
     
     async def _remove_service(self, service_id: str):
         """移除服务"""
-        service_key = f"{self.service_prefix}:{service_id}"
-        heartbeat_key = f"{self.heartbeat_prefix}:{service_id}"
+        await self._remove_services([service_id])
+    
+    async def _remove_services(self, service_ids: Iterable[str]):
+        """批量移除服务"""
+        service_ids = list(service_ids)
+        if not service_ids:
+            return
         
-        await self.redis.delete(service_key)
-        await self.redis.delete(heartbeat_key)
+        keys = []
+        for service_id in service_ids:
+            keys.append(self._service_key(service_id))
+            keys.append(self._heartbeat_key(service_id))
+        await self.redis.delete(*keys)
         
-        if service_id in self.local_services:
-            del self.local_services[service_id]
+        for service_id in service_ids:
+            self.local_services.pop(service_id, None)
+            self._remove_from_snapshot(service_id)
+    
+    def _is_alive(self, service_id: str, now: Optional[float] = None) -> bool:
+        """根据快照中的心跳判断服务是否存活"""
+        heartbeat = self.snapshot.heartbeats.get(service_id)
+        if heartbeat is None:
+            return False
+        return ((now or time.time()) - heartbeat) < self.config.service_ttl
+    
+    def get_instances(self, service_name: str) -> List[ServiceInfo]:
+        """从本地快照读取服务实例（O(1)查找，不访问Redis）"""
+        instances = self.snapshot.by_name.get(service_name)
+        if not instances:
+            return []
+        
+        now = time.time()
+        services = []
+        for service_id, service in instances.items():
+            if service.status == ServiceStatus.HEALTHY and not self._is_alive(service_id, now):
+                # 服务心跳超时，标记为不健康（不修改快照本身）
+                service = replace(service, status=ServiceStatus.UNHEALTHY)
+            services.append(service)
+        return services
     
     async def discover_services(self, service_name: str) -> List[ServiceInfo]:
         """发现服务实例"""
-        try:
-            pattern = f"{self.service_prefix}:{service_name}:*"
-            service_keys = await self.redis.keys(pattern)
-            
-            services = []
-            for key in service_keys:
-                service_data = await self.redis.hgetall(key)
-                if service_data:
-                    try:
-                        service = ServiceInfo.from_dict(service_data)
-                        
-                        # 检查心跳
-                        if await self._is_service_alive(service.service_id):
-                            services.append(service)
-                        else:
-                            # 服务心跳超时，标记为不健康
-                            service.status = ServiceStatus.UNHEALTHY
-                            services.append(service)
-                    except Exception as e:
-                        logger.warning(f"解析服务信息失败 {key}: {e}")
-            
-            return services
-            
-        except Exception as e:
-            logger.error(f"发现服务失败 {service_name}: {e}")
-            return []
+        return self.get_instances(service_name)
     
     async def get_healthy_services(self) -> Dict[str, List[ServiceInfo]]:
         """获取所有健康的服务"""
-        try:
-            pattern = f"{self.service_prefix}:*"
-            service_keys = await self.redis.keys(pattern)
-            
-            services_by_name: Dict[str, List[ServiceInfo]] = {}
-            
-            for key in service_keys:
-                service_data = await self.redis.hgetall(key)
-                if service_data:
-                    try:
-                        service = ServiceInfo.from_dict(service_data)
-                        
-                        # 只返回健康的服务
-                        if (service.status == ServiceStatus.HEALTHY and 
-                            await self._is_service_alive(service.service_id)):
-                            
-                            if service.name not in services_by_name:
-                                services_by_name[service.name] = []
-                            services_by_name[service.name].append(service)
-                            
-                    except Exception as e:
-                        logger.warning(f"解析服务信息失败 {key}: {e}")
-            
-            return services_by_name
-            
-        except Exception as e:
-            logger.error(f"获取健康服务失败: {e}")
-            return {}
+        now = time.time()
+        services_by_name: Dict[str, List[ServiceInfo]] = {}
+        
+        for name, instances in self.snapshot.by_name.items():
+            healthy = [
+                service for service_id, service in instances.items()
+                if service.status == ServiceStatus.HEALTHY and self._is_alive(service_id, now)
+            ]
+            if healthy:
+                services_by_name[name] = healthy
+        
+        return services_by_name
     
     async def update_service_status(self, service_id: str, status: ServiceStatus):
         """更新服务状态"""
         try:
-            service_key = f"{self.service_prefix}:{service_id}"
+            service_key = self._service_key(service_id)
             await self.redis.hset(service_key, "status", status.value)
             
+            service = self.snapshot.instances.get(service_id)
+            previous = service.status if service else None
+            
             if service_id in self.local_services:
                 self.local_services[service_id].status = status
+            if service:
+                service.status = status
+                self.snapshot.version += 1
+                if previous == ServiceStatus.HEALTHY and status != ServiceStatus.HEALTHY:
+                    self._notify_instance_down(service)
             
             logger.debug(f"更新服务状态: {service_id} -> {status.value}")
-            
+        
         except Exception as e:
             logger.error(f"更新服务状态失败 {service_id}: {e}")
     
     async def heartbeat(self, service_id: str) -> bool:
         """发送心跳"""
+        return await self.heartbeat_many([service_id])
+    
+    async def heartbeat_many(self, service_ids: Iterable[str]) -> bool:
+        """通过一个pipeline为多个服务发送心跳"""
+        service_ids = list(service_ids)
+        if not service_ids:
+            return True
+        
         try:
-            heartbeat_key = f"{self.heartbeat_prefix}:{service_id}"
-            service_key = f"{self.service_prefix}:{service_id}"
-            
-            # 更新心跳时间
             now = time.time()
-            await self.redis.set(heartbeat_key, now, ex=self.config.service_ttl)
-            await self.redis.hset(service_key, "last_heartbeat", now)
+            pipe = self.redis.pipeline(transaction=False)
+            for service_id in service_ids:
+                service_key = self._service_key(service_id)
+                pipe.set(self._heartbeat_key(service_id), now, ex=self.config.service_ttl)
+                pipe.hset(service_key, "last_heartbeat", now)
+                pipe.expire(service_key, self.config.service_ttl * 2)
+            await pipe.execute()
             
             # 更新本地缓存
-            if service_id in self.local_services:
-                self.local_services[service_id].last_heartbeat = now
+            for service_id in service_ids:
+                if service_id in self.local_services:
+                    self.local_services[service_id].last_heartbeat = now
+                self.snapshot.touch(service_id, now)
             
             return True
-            
+        
         except Exception as e:
-            logger.error(f"心跳发送失败 {service_id}: {e}")
+            logger.error(f"心跳发送失败 {service_ids}: {e}")
             return False
     
     async def _is_service_alive(self, service_id: str) -> bool:
         """检查服务是否存活"""
-        try:
-            heartbeat_key = f"{self.heartbeat_prefix}:{service_id}"
-            heartbeat_time = await self.redis.get(heartbeat_key)
-            
-            if not heartbeat_time:
-                return False
-            
-            now = time.time()
-            return (now - float(heartbeat_time)) < self.config.service_ttl
-            
-        except Exception:
-            return False
+        return self._is_alive(service_id)
     
     async def perform_health_checks(self):
         """执行健康检查"""
-        for service_id, service in self.local_services.items():
-            if not await self._is_service_alive(service_id):
+        for service_id, service in list(self.local_services.items()):
+            if service.status == ServiceStatus.HEALTHY and not self._is_alive(service_id):
                 logger.warning(f"服务心跳超时: {service_id}")
                 await self.update_service_status(service_id, ServiceStatus.UNHEALTHY)
     
+    async def _scan_service_ids(self) -> List[str]:
+        """SCAN遍历注册键（不阻塞Redis）"""
+        prefix_length = len(self.service_prefix) + 1
+        service_ids = []
+        async for key in self.redis.scan_iter(
+            match=f"{self.service_prefix}:*", count=self.config.scan_count
+        ):
+            service_ids.append(key[prefix_length:])
+        return service_ids
+    
+    async def _fetch_services(self, service_ids: List[str]) -> List[tuple]:
+        """一个pipeline读取实例信息和心跳"""
+        pipe = self.redis.pipeline(transaction=False)
+        for service_id in service_ids:
+            pipe.hgetall(self._service_key(service_id))
+            pipe.get(self._heartbeat_key(service_id))
+        results = await pipe.execute()
+        
+        fetched = []
+        for index, service_id in enumerate(service_ids):
+            service_data, heartbeat = results[index * 2], results[index * 2 + 1]
+            service = None
+            if service_data:
+                try:
+                    service = ServiceInfo.from_redis_mapping(service_data)
+                except Exception as e:
+                    logger.warning(f"解析服务信息失败 {service_id}: {e}")
+            fetched.append((service_id, service, float(heartbeat) if heartbeat else None))
+        return fetched
+    
+    async def reconcile(self):
+        """全量对账：重建本地快照"""
+        service_ids = await self._scan_service_ids()
+        fetched = await self._fetch_services(service_ids) if service_ids else []
+        
+        snapshot = RegistrySnapshot(version=self.snapshot.version)
+        for service_id, service, heartbeat in fetched:
+            if service is not None:
+                snapshot.put(service, heartbeat=heartbeat)
+        
+        # 本进程注册的服务以本地状态为准
+        for service_id, service in self.local_services.items():
+            if service_id not in snapshot.instances:
+                snapshot.put(service, heartbeat=self.snapshot.heartbeats.get(service_id))
+        
+        snapshot.version += 1
+        previous = self.snapshot
+        self.snapshot = snapshot
+        
+        for service_id, service in previous.instances.items():
+            if service_id not in snapshot.instances:
+                self._notify_instance_down(service)
+        logger.debug(f"注册中心快照已对账: {len(snapshot.instances)} 个实例, 版本 {snapshot.version}")
+    
+    async def _refresh_service(self, service_id: str):
+        """按键空间事件刷新单个实例"""
+        (_, service, heartbeat), = await self._fetch_services([service_id])
+        if service is None:
+            if service_id not in self.local_services:
+                self._remove_from_snapshot(service_id)
+        else:
+            self.snapshot.put(service, heartbeat=heartbeat)
+    
+    async def _enable_keyspace_notifications(self) -> bool:
+        """开启键空间通知（无权限时退化为定期对账）"""
+        try:
+            current = (await self.redis.config_get("notify-keyspace-events")).get(
+                "notify-keyspace-events", ""
+            )
+            flags = set(current)
+            if "K" not in flags or not ("A" in flags or set("hgx$") <= flags):
+                await self.redis.config_set(
+                    "notify-keyspace-events", "".join(sorted(flags | set("Khgx$")))
+                )
+            return True
+        except Exception as e:
+            logger.warning(f"无法开启键空间通知，仅依赖定期对账: {e}")
+            return False
+    
+    async def _watch_loop(self):
+        """监听注册键变更，增量更新快照"""
+        if not await self._enable_keyspace_notifications():
+            return
+        
+        db = self.redis.connection_pool.connection_kwargs.get("db", 0)
+        channel_prefix = f"__keyspace@{db}__:"
+        service_channel = f"{channel_prefix}{self.service_prefix}:"
+        heartbeat_channel = f"{channel_prefix}{self.heartbeat_prefix}:"
+        
+        while True:
+            try:
+                self._pubsub = self.redis.pubsub()
+                await self._pubsub.psubscribe(f"{service_channel}*", f"{heartbeat_channel}*")
+                
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    
+                    channel, event = message["channel"], message["data"]
+                    if channel.startswith(heartbeat_channel):
+                        service_id = channel[len(heartbeat_channel):]
+                        if event == "set":
+                            self.snapshot.touch(service_id, time.time())
+                        elif event in ("del", "expired"):
+                            self.snapshot.touch(service_id, None)
+                    elif channel.startswith(service_channel):
+                        service_id = channel[len(service_channel):]
+                        if event in ("del", "expired"):
+                            if service_id not in self.local_services:
+                                self._remove_from_snapshot(service_id)
+                        elif event == "hset":
+                            await self._refresh_service(service_id)
+            
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"注册中心监听错误: {e}")
+                await asyncio.sleep(5)
+            finally:
+                if self._pubsub is not None:
+                    try:
+                        await self._pubsub.close()
+                    except Exception:
+                        pass
+                    self._pubsub = None
+    
     async def _heartbeat_loop(self):
         """心跳循环"""
         while True:
             try:
-                for service_id in list(self.local_services.keys()):
-                    await self.heartbeat(service_id)
+                await self.heartbeat_many(self.local_services.keys())
                 
                 await asyncio.sleep(self.config.refresh_interval)
-                
+            
+            except asyncio.CancelledError:
+                break
             except Exception as e:
                 logger.error(f"心跳循环错误: {e}")
                 await asyncio.sleep(5)
     
     async def _cleanup_loop(self):
-        """清理循环"""
+        """对账与清理循环"""
         while True:
             try:
-                # 清理过期的服务
-                pattern = f"{self.service_prefix}:*"
-                service_keys = await self.redis.keys(pattern)
-                
-                for key in service_keys:
-                    service_id = key.split(":", 2)[2]
-                    if not await self._is_service_alive(service_id):
-                        await self._remove_service(service_id)
-                        logger.info(f"清理过期服务: {service_id}")
-                
-                await asyncio.sleep(60)  # 每分钟清理一次
+                await asyncio.sleep(self.config.reconcile_interval)
+                await self.reconcile()
                 
+                # 清理过期的服务
+                now = time.time()
+                expired = [
+                    service_id for service_id in self.snapshot.instances
+                    if service_id not in self.local_services and not self._is_alive(service_id, now)
+                ]
+                if expired:
+                    await self._remove_services(expired)
+                    logger.info(f"清理过期服务: {expired}")
+            
+            except asyncio.CancelledError:
+                break
             except Exception as e:
                 logger.error(f"清理循环错误: {e}")
                 await asyncio.sleep(10)
@@ -333,6 +569,7 @@ class ServiceRegistry:
             services_by_name = await self.get_healthy_services()
             
             stats = {
+                "snapshot_version": self.snapshot.version,
                 "total_services": len(services_by_name),
                 "total_instances": sum(len(instances) for instances in services_by_name.values()),
                 "services": {}
@@ -354,7 +591,7 @@ class ServiceRegistry:
                 }
             
             return stats
-            
+        
         except Exception as e:
             logger.error(f"获取注册中心统计失败: {e}")
             return {}
@@ -364,14 +601,13 @@ class ServiceRegistry:
         logger.info("关闭服务注册中心...")
         
         # 停止后台任务
-        if self._heartbeat_task:
-            self._heartbeat_task.cancel()
-        if self._cleanup_task:
-            self._cleanup_task.cancel()
+        for task in (self._heartbeat_task, self._cleanup_task, self._watch_task):
+            if task:
+                task.cancel()
         
         # 注销所有本地服务
-        for service_id in list(self.local_services.keys()):
-            await self._remove_service(service_id)
+        if self.local_services:
+            await self._remove_services(list(self.local_services.keys()))
         
         # 关闭Redis连接
         if self.redis:
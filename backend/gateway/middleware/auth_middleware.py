@@ -13,6 +13,7 @@ from fastapi import HTTPException, status, Request
 import redis.asyncio as redis
 
 from ..config.gateway_config import AuthConfig
+from ..routing.service_router import CompiledRouteTable, RouteMatch
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +38,30 @@ class UserContext:
 class GatewayAuthMiddleware:
     """网关认证中间件"""
     
+    # 权限映射规则：路径前缀 -> {HTTP方法: 权限}
+    PERMISSION_RULES: Dict[str, Dict[str, str]] = {
+        "/api/v1/users": {
+            "GET": "user:read",
+            "POST": "user:create",
+            "PUT": "user:update",
+            "DELETE": "user:delete"
+        },
+        "/api/v1/strategies": {
+            "GET": "strategy:read",
+            "POST": "strategy:create",
+            "PUT": "strategy:update",
+            "DELETE": "strategy:delete"
+        },
+        "/api/v1/data": {
+            "GET": "data:read",
+            "POST": "data:write"
+        },
+        "/api/v1/vnpy": {
+            "GET": "trading:read",
+            "POST": "trading:execute"
+        }
+    }
+    
     def __init__(self, config: AuthConfig):
         self.config = config
         self.redis_client: Optional[redis.Redis] = None
@@ -44,6 +69,9 @@ class GatewayAuthMiddleware:
         # 权限缓存
         self._permission_cache: Dict[str, List[str]] = {}
         
+        # 未接入路由器时使用的独立权限表（构建一次）
+        self._permission_table = CompiledRouteTable([], self.PERMISSION_RULES)
+        
     async def initialize(self):
         """初始化中间件"""
         if self.config.cache_enabled:
@@ -75,7 +103,9 @@ class GatewayAuthMiddleware:
             user_context = await self._build_user_context(payload)
             
             # 检查路径权限
-            required_permission = self._get_required_permission(path, request.method)
+            required_permission = self._get_required_permission(
+                path, request.method, getattr(request.state, 'route_match', None)
+            )
             if required_permission and not user_context.has_permission(required_permission):
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
@@ -209,37 +239,15 @@ class GatewayAuthMiddleware:
         
         return permissions
     
-    def _get_required_permission(self, path: str, method: str) -> Optional[str]:
-        """获取路径所需权限"""
-        # 权限映射规则
-        permission_rules = {
-            "/api/v1/users": {
-                "GET": "user:read",
-                "POST": "user:create",
-                "PUT": "user:update",
-                "DELETE": "user:delete"
-            },
-            "/api/v1/strategies": {
-                "GET": "strategy:read",
-                "POST": "strategy:create",
-                "PUT": "strategy:update",
-                "DELETE": "strategy:delete"
-            },
-            "/api/v1/data": {
-                "GET": "data:read",
-                "POST": "data:write"
-            },
-            "/api/v1/vnpy": {
-                "GET": "trading:read",
-                "POST": "trading:execute"
-            }
-        }
-        
-        for prefix, methods in permission_rules.items():
-            if path.startswith(prefix):
-                return methods.get(method.upper())
-        
-        return None
+    def _get_required_permission(self, path: str, method: str,
+                                 route_match: Optional[RouteMatch] = None) -> Optional[str]:
+        """获取路径所需权限
+
+        优先使用路由器已解析的 RouteMatch，避免对同一路径重复查找。
+        """
+        if route_match is None:
+            route_match = self._permission_table.match(path)
+        return route_match.required_permission(method)
     
     def _mock_get_user_roles(self, user_id: str) -> List[str]:
         """模拟获取用户角色"""
@@ -10,11 +10,17 @@ import logging
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass, field
 from collections import defaultdict, deque
+from functools import partial
 import asyncio
 from fastapi import Request, Response
 import redis.asyncio as redis
 import json
 
+from shared.metrics.histogram import (
+    DEFAULT_PERCENTILES, LatencyHistogram, RollingCounter, RollingHistogram,
+    percentile_label
+)
+
 from ..config.gateway_config import MonitoringConfig
 
 logger = logging.getLogger(__name__)
@@ -40,10 +46,22 @@ class ServiceMetrics:
     total_requests: int = 0
     successful_requests: int = 0
     failed_requests: int = 0
-    total_response_time: float = 0.0
-    min_response_time: float = float('inf')
-    max_response_time: float = 0.0
-    response_times: deque = field(default_factory=lambda: deque(maxlen=1000))
+    histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    
+    @property
+    def total_response_time(self) -> float:
+        """累计响应时间"""
+        return self.histogram.total
+    
+    @property
+    def min_response_time(self) -> float:
+        """最小响应时间"""
+        return self.histogram.min
+    
+    @property
+    def max_response_time(self) -> float:
+        """最大响应时间"""
+        return self.histogram.max
     
     @property
     def success_rate(self) -> float:
@@ -55,35 +73,102 @@ class ServiceMetrics:
     @property
     def average_response_time(self) -> float:
         """平均响应时间"""
-        if self.total_requests == 0:
-            return 0.0
-        return self.total_response_time / self.total_requests
+        return self.histogram.mean
     
     @property
     def p95_response_time(self) -> float:
         """95%分位响应时间"""
-        if not self.response_times:
-            return 0.0
-        sorted_times = sorted(self.response_times)
-        index = int(len(sorted_times) * 0.95)
-        return sorted_times[min(index, len(sorted_times) - 1)]
+        return self.histogram.percentile(0.95)
+    
+    def record(self, response_time: float, success: bool):
+        """记录一次请求，O(1)"""
+        self.total_requests += 1
+        if success:
+            self.successful_requests += 1
+        else:
+            self.failed_requests += 1
+        self.histogram.record(response_time)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """导出统计"""
+        stats = {
+            "total_requests": self.total_requests,
+            "success_rate": self.success_rate,
+            "average_response_time": self.average_response_time,
+            "min_response_time": self.min_response_time if self.total_requests else 0,
+            "max_response_time": self.max_response_time,
+        }
+        for q, value in self.histogram.percentiles(DEFAULT_PERCENTILES).items():
+            stats[f"{percentile_label(q)}_response_time"] = value
+        return stats
+
+
+@dataclass
+class ProxyMetrics:
+    """反向代理流量指标"""
+    bytes_in_flight: int = 0
+    peak_bytes_in_flight: int = 0
+    bytes_received: int = 0
+    bytes_sent: int = 0
+    active_streams: int = 0
+    stream_errors: int = 0
+    
+    def add_in_flight(self, size: int):
+        """块进入网关"""
+        self.bytes_in_flight += size
+        if self.bytes_in_flight > self.peak_bytes_in_flight:
+            self.peak_bytes_in_flight = self.bytes_in_flight
+    
+    def release_in_flight(self, size: int):
+        """块已交付下游"""
+        self.bytes_in_flight -= size
+    
+    def to_dict(self) -> Dict[str, int]:
+        """导出统计"""
+        return {
+            "bytes_in_flight": self.bytes_in_flight,
+            "peak_bytes_in_flight": self.peak_bytes_in_flight,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "active_streams": self.active_streams,
+            "stream_errors": self.stream_errors
+        }
 
 
 class MetricsCollector:
-    """指标收集器"""
+    """指标收集器
+    
+    请求路径上只做O(1)的内存更新：直方图计数、滚动窗口计数。
+    Redis持久化由后台任务按 ``persist_interval`` 批量写入聚合快照。
+    """
+    
+    OTHER_ROUTE = "__other__"
     
     def __init__(self, config: MonitoringConfig):
         self.config = config
         self.redis: Optional[redis.Redis] = None
         
+        self._histogram_template = LatencyHistogram(
+            growth=getattr(config, 'histogram_growth', 1.04)
+        )
+        window_minutes = getattr(config, 'histogram_window_minutes', 60)
+        
         # 内存指标
-        self.service_metrics: Dict[str, ServiceMetrics] = defaultdict(lambda: ServiceMetrics(""))
+        self.service_metrics: Dict[str, ServiceMetrics] = {}
+        self.route_metrics: Dict[str, ServiceMetrics] = {}
+        self.service_windows: Dict[str, RollingHistogram] = defaultdict(
+            partial(RollingHistogram, window_minutes, 60, self._histogram_template)
+        )
+        self.gateway_window = RollingHistogram(window_minutes, 60, self._histogram_template)
         self.recent_requests: deque = deque(maxlen=10000)  # 最近1万个请求
         self.error_counts: Dict[str, int] = defaultdict(int)
+        self.total_requests = 0
+        self.total_errors = 0
+        self.proxy = ProxyMetrics()
         
-        # 时间窗口统计
-        self.minute_stats = defaultdict(lambda: {"requests": 0, "errors": 0})
-        self.hour_stats = defaultdict(lambda: {"requests": 0, "errors": 0})
+        # 时间窗口统计（固定槽位，保留期有界）
+        self.minute_stats = RollingCounter(getattr(config, 'minute_retention', 24 * 60), 60)
+        self.hour_stats = RollingCounter(getattr(config, 'hour_retention', 30 * 24), 3600)
         
         # 启动时间
         self.start_time = time.time()
@@ -97,13 +182,14 @@ class MetricsCollector:
             logger.info("初始化指标收集器...")
             
             # 连接Redis（可选）
-            if hasattr(self.config, 'redis_url') and self.config.redis_url:
+            if getattr(self.config, 'redis_url', None):
                 try:
                     self.redis = redis.from_url(self.config.redis_url, decode_responses=True)
                     await self.redis.ping()
                     logger.info("指标收集器Redis连接成功")
                 except Exception as e:
                     logger.warning(f"指标收集器Redis连接失败: {e}")
+                    self.redis = None
             
             # 启动统计任务
             self._stats_task = asyncio.create_task(self._stats_aggregation_loop())
@@ -135,7 +221,7 @@ class MetricsCollector:
         )
         
         # 记录到内存
-        self._record_request_metrics(metrics)
+        self._record_request_metrics(metrics, getattr(request.state, 'route', None))
         
         # 记录慢请求
         if process_time > self.config.slow_request_threshold:
@@ -143,10 +229,6 @@ class MetricsCollector:
                 f"慢请求: {request.method} {request.url.path} "
                 f"耗时 {process_time:.3f}s"
             )
-        
-        # 异步持久化到Redis
-        if self.redis:
-            asyncio.create_task(self._persist_metrics(metrics))
     
     def record_request_error(self, request: Request, error: Exception):
         """记录请求错误"""
@@ -170,163 +252,129 @@ class MetricsCollector:
             error_type=error_type
         )
         
-        self._record_request_metrics(metrics)
-        
-        if self.redis:
-            asyncio.create_task(self._persist_metrics(metrics))
+        self._record_request_metrics(metrics, getattr(request.state, 'route', None))
+    
+    def _new_service_metrics(self, name: str) -> ServiceMetrics:
+        return ServiceMetrics(name, histogram=self._histogram_template.copy_empty())
     
-    def _record_request_metrics(self, metrics: RequestMetrics):
+    def _route_key(self, metrics: RequestMetrics, route: Optional[str]) -> str:
+        """路由统计键，超出上限的新路由归入 OTHER_ROUTE"""
+        key = f"{metrics.method} {route or metrics.path}"
+        if key in self.route_metrics:
+            return key
+        if len(self.route_metrics) >= getattr(self.config, 'max_tracked_routes', 500):
+            return self.OTHER_ROUTE
+        return key
+    
+    def _record_request_metrics(self, metrics: RequestMetrics, route: Optional[str] = None):
         """记录请求指标到内存"""
         # 添加到最近请求
         self.recent_requests.append(metrics)
         
+        success = metrics.status_code < 400
+        self.total_requests += 1
+        if not success:
+            self.total_errors += 1
+        
+        self.gateway_window.record(metrics.response_time, metrics.timestamp)
+        
         # 更新服务指标
         if metrics.service_name:
-            service_metrics = self.service_metrics[metrics.service_name]
-            service_metrics.name = metrics.service_name
-            service_metrics.total_requests += 1
-            service_metrics.total_response_time += metrics.response_time
-            service_metrics.response_times.append(metrics.response_time)
-            
-            if metrics.status_code < 400:
-                service_metrics.successful_requests += 1
-            else:
-                service_metrics.failed_requests += 1
-            
-            # 更新响应时间范围
-            service_metrics.min_response_time = min(
-                service_metrics.min_response_time, 
-                metrics.response_time
-            )
-            service_metrics.max_response_time = max(
-                service_metrics.max_response_time,
-                metrics.response_time
+            service_metrics = self.service_metrics.get(metrics.service_name)
+            if service_metrics is None:
+                service_metrics = self._new_service_metrics(metrics.service_name)
+                self.service_metrics[metrics.service_name] = service_metrics
+            service_metrics.record(metrics.response_time, success)
+            self.service_windows[metrics.service_name].record(
+                metrics.response_time, metrics.timestamp
             )
         
-        # 更新时间窗口统计
-        now = time.time()
-        minute_key = int(now // 60)
-        hour_key = int(now // 3600)
+        # 更新路由指标
+        route_key = self._route_key(metrics, route)
+        route_metrics = self.route_metrics.get(route_key)
+        if route_metrics is None:
+            route_metrics = self._new_service_metrics(route_key)
+            self.route_metrics[route_key] = route_metrics
+        route_metrics.record(metrics.response_time, success)
         
-        self.minute_stats[minute_key]["requests"] += 1
-        self.hour_stats[hour_key]["requests"] += 1
+        # 更新时间窗口统计
+        self.minute_stats.increment("requests", now=metrics.timestamp)
+        self.hour_stats.increment("requests", now=metrics.timestamp)
         
-        if metrics.status_code >= 400:
-            self.minute_stats[minute_key]["errors"] += 1
-            self.hour_stats[hour_key]["errors"] += 1
-    
-    async def _persist_metrics(self, metrics: RequestMetrics):
-        """持久化指标到Redis"""
-        try:
-            if not self.redis:
-                return
-            
-            # 存储到Redis Stream
-            stream_name = "redfire:metrics:requests"
-            data = {
-                "timestamp": metrics.timestamp,
-                "method": metrics.method,
-                "path": metrics.path,
-                "status_code": metrics.status_code,
-                "response_time": metrics.response_time,
-                "service_name": metrics.service_name or "",
-                "user_id": metrics.user_id or "",
-                "error_type": metrics.error_type or ""
-            }
-            
-            await self.redis.xadd(stream_name, data, maxlen=100000)  # 保留最近10万条记录
-            
-        except Exception as e:
-            logger.error(f"持久化指标失败: {e}")
+        if not success:
+            self.minute_stats.increment("errors", now=metrics.timestamp)
+            self.hour_stats.increment("errors", now=metrics.timestamp)
     
     async def get_metrics(self) -> Dict[str, Any]:
         """获取当前指标"""
         now = time.time()
         uptime = now - self.start_time
         
-        # 基础指标
-        total_requests = sum(len(self.minute_stats.get(minute, {}).get("requests", 0)) for minute in self.minute_stats)
-        total_errors = sum(self.error_counts.values())
-        
         # 服务指标
-        services_stats = {}
-        for service_name, metrics in self.service_metrics.items():
-            services_stats[service_name] = {
-                "total_requests": metrics.total_requests,
-                "success_rate": metrics.success_rate,
-                "average_response_time": metrics.average_response_time,
-                "p95_response_time": metrics.p95_response_time,
-                "min_response_time": metrics.min_response_time if metrics.min_response_time != float('inf') else 0,
-                "max_response_time": metrics.max_response_time
-            }
-        
-        # 最近请求统计
-        recent_minute = int(now // 60)
-        recent_hour = int(now // 3600)
+        services_stats = {
+            service_name: metrics.to_dict()
+            for service_name, metrics in self.service_metrics.items()
+        }
         
         return {
             "gateway": {
                 "uptime_seconds": uptime,
-                "total_requests": len(self.recent_requests),
-                "total_errors": total_errors,
-                "requests_per_minute": self.minute_stats.get(recent_minute, {}).get("requests", 0),
-                "requests_per_hour": sum(
-                    self.minute_stats.get(recent_minute - i, {}).get("requests", 0)
-                    for i in range(60)
-                ),
-                "error_rate": (total_errors / len(self.recent_requests) * 100) if self.recent_requests else 0
+                "total_requests": self.total_requests,
+                "total_errors": self.total_errors,
+                "requests_per_minute": self.minute_stats.get("requests", now=now),
+                "requests_per_hour": self.minute_stats.sum("requests", 60, now=now),
+                "error_rate": (self.total_errors / self.total_requests * 100) if self.total_requests else 0,
+                "response_time_stats": self.gateway_window.snapshot(60, now).summary()
             },
             "services": services_stats,
+            "proxy": self.proxy.to_dict(),
             "errors": dict(self.error_counts),
             "timestamp": now
         }
     
-    async def get_detailed_metrics(self, service_name: Optional[str] = None, 
+    async def get_route_metrics(self) -> Dict[str, Any]:
+        """获取按路由统计的指标"""
+        return {
+            route_key: metrics.to_dict()
+            for route_key, metrics in self.route_metrics.items()
+        }
+    
+    async def get_detailed_metrics(self, service_name: Optional[str] = None,
                                  time_range: int = 3600) -> Dict[str, Any]:
         """获取详细指标"""
         now = time.time()
         start_time = now - time_range
         
-        # 过滤指定时间范围的请求
-        filtered_requests = [
-            req for req in self.recent_requests 
-            if req.timestamp >= start_time and (not service_name or req.service_name == service_name)
-        ]
+        # 响应时间分析（窗口直方图，无需排序）
+        if service_name:
+            window = self.service_windows.get(service_name)
+            histogram = window.snapshot(time_range, now) if window else None
+        else:
+            histogram = self.gateway_window.snapshot(time_range, now)
         
-        if not filtered_requests:
+        if not histogram or histogram.count == 0:
             return {"message": "没有找到符合条件的请求"}
         
-        # 计算详细统计
+        # 状态码/路径分布取自最近请求样本
         status_codes = defaultdict(int)
-        response_times = []
         paths = defaultdict(int)
         methods = defaultdict(int)
         errors = defaultdict(int)
         
-        for req in filtered_requests:
+        for req in self.recent_requests:
+            if req.timestamp < start_time or (service_name and req.service_name != service_name):
+                continue
             status_codes[req.status_code] += 1
-            response_times.append(req.response_time)
             paths[req.path] += 1
             methods[req.method] += 1
             
             if req.error_type:
                 errors[req.error_type] += 1
         
-        # 响应时间分析
-        response_times.sort()
-        total_requests = len(filtered_requests)
-        
         return {
             "time_range_seconds": time_range,
-            "total_requests": total_requests,
-            "response_time_stats": {
-                "min": min(response_times) if response_times else 0,
-                "max": max(response_times) if response_times else 0,
-                "avg": sum(response_times) / len(response_times) if response_times else 0,
-                "p50": response_times[int(len(response_times) * 0.5)] if response_times else 0,
-                "p95": response_times[int(len(response_times) * 0.95)] if response_times else 0,
-                "p99": response_times[int(len(response_times) * 0.99)] if response_times else 0
-            },
+            "total_requests": histogram.count,
+            "response_time_stats": histogram.summary((0.5, 0.95, 0.99, 0.999)),
             "status_codes": dict(status_codes),
             "top_paths": dict(sorted(paths.items(), key=lambda x: x[1], reverse=True)[:10]),
             "methods": dict(methods),
@@ -334,59 +382,66 @@ class MetricsCollector:
         }
     
     async def _stats_aggregation_loop(self):
-        """统计聚合循环"""
+        """统计聚合循环：按固定间隔批量持久化快照"""
+        interval = getattr(self.config, 'persist_interval', 10.0)
         while True:
             try:
+                await asyncio.sleep(interval)
                 await self._aggregate_stats()
-                await asyncio.sleep(60)  # 每分钟聚合一次
-                
+            
+            except asyncio.CancelledError:
+                break
             except Exception as e:
                 logger.error(f"统计聚合错误: {e}")
                 await asyncio.sleep(10)
     
     async def _aggregate_stats(self):
-        """聚合统计数据"""
-        now = time.time()
-        current_minute = int(now // 60)
-        current_hour = int(now // 3600)
-        
-        # 清理过期的分钟统计（保留24小时）
-        cutoff_minute = current_minute - (24 * 60)
-        expired_minutes = [k for k in self.minute_stats.keys() if k < cutoff_minute]
-        for minute in expired_minutes:
-            del self.minute_stats[minute]
-        
-        # 清理过期的小时统计（保留30天）
-        cutoff_hour = current_hour - (30 * 24)
-        expired_hours = [k for k in self.hour_stats.keys() if k < cutoff_hour]
-        for hour in expired_hours:
-            del self.hour_stats[hour]
+        """聚合统计数据
         
+        时间窗口为固定槽位的环形结构，过期数据在写入时自动覆盖，无需清理。
+        """
         # 如果启用Redis，聚合数据到Redis
         if self.redis:
             await self._aggregate_to_redis()
     
     async def _aggregate_to_redis(self):
-        """聚合数据到Redis"""
+        """聚合数据到Redis：一次pipeline写入全部快照"""
         try:
-            # 将当前指标快照存储到Redis
             metrics = await self.get_metrics()
-            await self.redis.set(
-                "redfire:metrics:current",
-                json.dumps(metrics),
-                ex=300  # 5分钟过期
-            )
+            routes = await self.get_route_metrics()
+            snapshot = json.dumps(metrics)
             
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set("redfire:metrics:current", snapshot, ex=300)  # 5分钟过期
+            if routes:
+                pipe.hset(
+                    "redfire:metrics:routes",
+                    mapping={route_key: json.dumps(stats) for route_key, stats in routes.items()}
+                )
+                pipe.expire("redfire:metrics:routes", 300)
+            pipe.xadd(
+                "redfire:metrics:snapshots",
+                {"timestamp": metrics["timestamp"], "snapshot": snapshot},
+                maxlen=getattr(self.config, 'snapshot_stream_maxlen', 10000),
+                approximate=True
+            )
+            await pipe.execute()
+        
         except Exception as e:
             logger.error(f"Redis聚合失败: {e}")
     
     async def reset_metrics(self):
         """重置指标"""
         self.service_metrics.clear()
+        self.route_metrics.clear()
+        self.service_windows.clear()
+        self.gateway_window.reset()
         self.recent_requests.clear()
         self.error_counts.clear()
-        self.minute_stats.clear()
-        self.hour_stats.clear()
+        self.total_requests = 0
+        self.total_errors = 0
+        self.minute_stats.reset()
+        self.hour_stats.reset()
         self.start_time = time.time()
         
         logger.info("指标已重置")
@@ -396,7 +451,9 @@ class MetricsCollector:
         if self._stats_task:
             self._stats_task.cancel()
         
+        # 关闭前写入最后一次快照
         if self.redis:
+            await self._aggregate_to_redis()
             await self.redis.close()
         
         logger.info("指标收集器已关闭")
@@ -7,8 +7,9 @@
 
 import re
 import logging
-from typing import Dict, List, Optional, Pattern
-from dataclasses import dataclass
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+from dataclasses import dataclass, field
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,8 @@ class RouteRule:
     path_rewrite: Optional[str] = None
     strip_prefix: bool = True
     priority: int = 0
+    literal_prefix: Optional[str] = None  # 纯前缀规则的字面前缀
+    exact: bool = False  # 字面量且以 $ 结尾
     
     def matches(self, path: str) -> bool:
         """检查路径是否匹配"""
@@ -40,12 +43,197 @@ class RouteRule:
         return path
 
 
+_REGEX_META = set(".^$*+?{}[]\\|()")
+
+
+def _parse_literal_pattern(pattern: str) -> Tuple[Optional[str], bool]:
+    """识别等价于字面前缀（或精确匹配）的模式
+
+    ``re.match`` 只锚定开头，所以 ``/api/v1/users/.*`` 与 ``/api/v1/users/``
+    都等价于 startswith；``/health$`` 等价于相等比较。
+    返回 (字面量, 是否精确匹配)，不是纯字面模式时返回 (None, False)。
+    """
+    body = pattern[1:] if pattern.startswith("^") else pattern
+    exact = False
+    if body.endswith(".*"):
+        body = body[:-2]
+    elif body.endswith("$") and not body.endswith("\\$"):
+        body = body[:-1]
+        exact = True
+
+    if any(ch in _REGEX_META for ch in body):
+        return None, False
+    return body, exact
+
+
+class _TrieNode:
+    __slots__ = ("children", "prefix_entry", "exact_entry")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.prefix_entry: Optional[Tuple[Tuple[int, int], Any]] = None
+        self.exact_entry: Optional[Tuple[Tuple[int, int], Any]] = None
+
+
+class PrefixTrie:
+    """字符级前缀树
+
+    每个条目带排序键，查找时沿路径收集所有命中条目并返回排序键最小者，
+    与"按优先级依次尝试、先注册者优先"的线性扫描语义一致。
+    查找代价只与路径长度相关，与规则数量无关。
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+
+    def insert(self, literal: str, sort_key: Tuple[int, int], value: Any, exact: bool = False):
+        """插入字面前缀"""
+        node = self._root
+        for ch in literal:
+            child = node.children.get(ch)
+            if child is None:
+                child = _TrieNode()
+                node.children[ch] = child
+            node = child
+
+        attr = "exact_entry" if exact else "prefix_entry"
+        current = getattr(node, attr)
+        if current is None or sort_key < current[0]:
+            setattr(node, attr, (sort_key, value))
+
+    def lookup(self, path: str) -> Optional[Tuple[Tuple[int, int], Any]]:
+        """返回命中的 (排序键, 值)"""
+        best = None
+        node = self._root
+        if node.prefix_entry is not None:
+            best = node.prefix_entry
+
+        for ch in path:
+            node = node.children.get(ch)
+            if node is None:
+                return best
+            entry = node.prefix_entry
+            if entry is not None and (best is None or entry[0] < best[0]):
+                best = entry
+
+        entry = node.exact_entry
+        if entry is not None and (best is None or entry[0] < best[0]):
+            best = entry
+        return best
+
+
+@dataclass(frozen=True)
+class RouteMatch:
+    """一次路由解析的结果：路由规则、重写路径与权限映射"""
+    rule: Optional[RouteRule]
+    rewritten_path: str
+    permissions: Dict[str, str] = field(default_factory=dict)
+    
+    @property
+    def service_name(self) -> Optional[str]:
+        """目标服务名"""
+        return self.rule.service_name if self.rule else None
+    
+    def required_permission(self, method: str) -> Optional[str]:
+        """指定HTTP方法所需权限"""
+        return self.permissions.get(method.upper())
+
+
+_DEFAULT_FLAGS = re.compile("").flags
+
+
+def _can_combine(pattern: Pattern[str]) -> bool:
+    """模式能否安全地嵌入合并正则
+
+    带捕获分组的模式（命名分组会重名、数字反向引用会错位）和带内联全局标志
+    （如 ``(?i)``）的模式单独匹配。
+    """
+    return pattern.groups == 0 and pattern.flags == _DEFAULT_FLAGS
+
+
+class CompiledRouteTable:
+    """编译后的路由表
+
+    纯前缀规则进入前缀树；无分组、无标志的正则规则按优先级合并为一个带命名分组的
+    交替正则，由 ``lastgroup`` 得到命中的规则；其余正则规则逐条匹配。
+    各路候选按 (优先级, 注册顺序) 取胜者。
+    """
+
+    def __init__(self, routes: List[RouteRule], permission_rules: Dict[str, Dict[str, str]]):
+        self._trie = PrefixTrie()
+        self._regex_rules: List[RouteRule] = []
+        self._regex_keys: List[Tuple[int, int]] = []
+        self._combined: Optional[Pattern[str]] = None
+        self._standalone: List[Tuple[Tuple[int, int], RouteRule]] = []
+
+        alternatives = []
+        for order, route in enumerate(routes):
+            sort_key = (-route.priority, order)
+            if route.literal_prefix is not None:
+                self._trie.insert(route.literal_prefix, sort_key, route, exact=route.exact)
+            elif _can_combine(route.pattern):
+                alternatives.append(f"(?P<r{len(self._regex_rules)}>{route.pattern.pattern})")
+                self._regex_rules.append(route)
+                self._regex_keys.append(sort_key)
+            else:
+                self._standalone.append((sort_key, route))
+
+        if alternatives:
+            try:
+                self._combined = re.compile("|".join(alternatives))
+            except re.error as e:
+                # 兜底：合并失败时全部退回逐条匹配，不影响已接受的规则
+                logger.warning(f"合并路由正则失败，改为逐条匹配: {e}")
+                self._standalone.extend(zip(self._regex_keys, self._regex_rules))
+                self._standalone.sort(key=lambda item: item[0])
+                self._regex_rules = []
+                self._regex_keys = []
+
+        self._permissions = PrefixTrie()
+        for order, (prefix, methods) in enumerate(permission_rules.items()):
+            self._permissions.insert(prefix, (0, order), {m.upper(): p for m, p in methods.items()})
+
+    def match(self, path: str) -> RouteMatch:
+        """解析路径"""
+        best = self._trie.lookup(path)
+
+        if self._combined is not None:
+            regex_match = self._combined.match(path)
+            if regex_match is not None:
+                index = int(regex_match.lastgroup[1:])
+                sort_key = self._regex_keys[index]
+                if best is None or sort_key < best[0]:
+                    best = (sort_key, self._regex_rules[index])
+
+        for sort_key, route in self._standalone:
+            if best is not None and best[0] < sort_key:
+                break
+            if route.pattern.match(path):
+                best = (sort_key, route)
+                break
+
+        rule = best[1] if best else None
+        permissions = self._permissions.lookup(path)
+
+        return RouteMatch(
+            rule=rule,
+            rewritten_path=rule.rewrite_path(path) if rule else path,
+            permissions=permissions[1] if permissions else {}
+        )
+
+
 class ServiceRouter:
     """服务路由器"""
     
-    def __init__(self, service_registry=None):
+    def __init__(self, service_registry=None, cache_size: int = 4096):
         self.service_registry = service_registry
         self.routes: List[RouteRule] = []
+        self.permission_rules: Dict[str, Dict[str, str]] = {}
+        
+        # 编译后的路由表与最近解析路径的LRU缓存
+        self.cache_size = cache_size
+        self._compiled: Optional[CompiledRouteTable] = None
+        self._resolve_cache: "OrderedDict[str, RouteMatch]" = OrderedDict()
         
         # 添加默认路由规则
         self._setup_default_routes()
@@ -86,12 +274,15 @@ class ServiceRouter:
         """添加路由规则"""
         try:
             compiled_pattern = re.compile(pattern)
+            literal_prefix, exact = _parse_literal_pattern(pattern)
             route = RouteRule(
                 pattern=compiled_pattern,
                 service_name=service_name,
                 path_rewrite=path_rewrite,
                 strip_prefix=strip_prefix,
-                priority=priority
+                priority=priority,
+                literal_prefix=literal_prefix,
+                exact=exact
             )
             
             # 按优先级插入
@@ -105,6 +296,7 @@ class ServiceRouter:
             if not inserted:
                 self.routes.append(route)
             
+            self._invalidate()
             logger.info(f"添加路由规则: {pattern} -> {service_name}")
             
         except re.error as e:
@@ -113,33 +305,58 @@ class ServiceRouter:
     def remove_route(self, pattern: str):
         """移除路由规则"""
         self.routes = [r for r in self.routes if r.pattern.pattern != pattern]
+        self._invalidate()
         logger.info(f"移除路由规则: {pattern}")
     
+    def set_permission_rules(self, permission_rules: Dict[str, Dict[str, str]]):
+        """设置路径前缀 -> {HTTP方法: 权限} 映射，随路由一并解析"""
+        self.permission_rules = dict(permission_rules)
+        self._invalidate()
+    
+    def _invalidate(self):
+        """路由变更后丢弃编译结果和缓存"""
+        self._compiled = None
+        self._resolve_cache.clear()
+    
+    def compile(self) -> CompiledRouteTable:
+        """编译路由表"""
+        if self._compiled is None:
+            self._compiled = CompiledRouteTable(self.routes, self.permission_rules)
+        return self._compiled
+    
+    def resolve(self, path: str) -> RouteMatch:
+        """一次查找得到路由规则、重写路径和权限"""
+        cache = self._resolve_cache
+        route_match = cache.get(path)
+        if route_match is not None:
+            cache.move_to_end(path)
+            return route_match
+        
+        route_match = self.compile().match(path)
+        cache[path] = route_match
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return route_match
+    
     def get_service_name(self, path: str) -> Optional[str]:
         """根据路径获取服务名"""
-        for route in self.routes:
-            if route.matches(path):
-                logger.debug(f"路径 {path} 匹配服务 {route.service_name}")
-                return route.service_name
+        service_name = self.resolve(path).service_name
+        if service_name:
+            logger.debug(f"路径 {path} 匹配服务 {service_name}")
+            return service_name
         
         logger.warning(f"路径 {path} 没有匹配的服务")
         return None
     
     def get_route_info(self, path: str) -> Optional[RouteRule]:
         """获取路由信息"""
-        for route in self.routes:
-            if route.matches(path):
-                return route
-        return None
+        return self.resolve(path).rule
     
     def rewrite_path(self, path: str) -> str:
         """重写路径"""
-        route = self.get_route_info(path)
-        if route:
-            return route.rewrite_path(path)
-        return path
+        return self.resolve(path).rewritten_path
     
-    def list_routes(self) -> List[Dict[str, any]]:
+    def list_routes(self) -> List[Dict[str, Any]]:
         """列出所有路由规则"""
         return [
             {
@@ -0,0 +1,473 @@
+"""
+指标计算引擎
+为IndicatorManagerService提供列式K线存储与带缓存的向量化指标计算：
+- BarSeries按列保存单品种K线，新K线原地追加，最后一根K线更新时只改写该行
+- IndicatorFrame缓存EMA、滚动均值等中间结果，相同参数的指标共用一份，
+  K线追加后只重算受影响的尾部
+- 所有算子沿最后一维计算，同一套代码既可处理单品种(1-D)也可处理多品种矩阵(2-D)
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from ..entities.bar_data_entity import BarData
+
+
+# ==================== 向量化算子 ====================
+
+def rolling_window(x: np.ndarray, window: int, how: str) -> np.ndarray:
+    """
+    滚动窗口统计（mean/std/min/max），前window-1个位置为NaN，
+    窗口内含NaN时结果为NaN；std为样本标准差，与pandas一致
+    """
+    out = np.full(x.shape, np.nan)
+    if window < 1 or x.shape[-1] < window:
+        return out
+
+    if how == "mean" and not np.isnan(x).any():
+        cumsum = np.cumsum(x, axis=-1)
+        total = cumsum[..., window - 1:].copy()
+        total[..., 1:] -= cumsum[..., :-window]
+        out[..., window - 1:] = total / window
+    else:
+        # 只读窗口视图，比sliding_window_view少做参数检查，适合频繁的小尾部计算
+        view = as_strided(
+            x, shape=x.shape[:-1] + (x.shape[-1] - window + 1, window),
+            strides=x.strides + (x.strides[-1],), writeable=False
+        )
+        if how == "std":
+            out[..., window - 1:] = view.std(axis=-1, ddof=1)
+        else:
+            out[..., window - 1:] = getattr(view, how)(axis=-1)
+    return out
+
+
+def ewm_state(
+    x: np.ndarray,
+    alpha: float,
+    num0: Optional[np.ndarray] = None,
+    den0: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    指数加权累计量，EMA = num / den，与pandas ewm(adjust=True)口径一致
+
+    num_t = x_t + (1-alpha) * num_{t-1}，den_t = 1 + (1-alpha) * den_{t-1}，
+    NaN不计入但照常衰减。递推按块展开为cumsum，块长保证放大系数不超过1e12。
+    num0/den0为起点前一位置的累计量，用于增量续算。
+    """
+    decay = 1.0 - alpha
+    valid = ~np.isnan(x)
+    values = np.where(valid, x, 0.0)
+    weights = valid.astype(np.float64)
+
+    if decay <= 0.0:
+        return values, weights
+
+    carry_num = np.zeros(x.shape[:-1]) if num0 is None else np.asarray(num0, dtype=np.float64)
+    carry_den = np.zeros(x.shape[:-1]) if den0 is None else np.asarray(den0, dtype=np.float64)
+
+    num = np.empty_like(values)
+    den = np.empty_like(weights)
+    block = max(1, int(12.0 / -np.log10(decay)))
+    length = x.shape[-1]
+    for start in range(0, length, block):
+        end = min(start + block, length)
+        steps = np.arange(end - start)
+        grow = decay ** -steps
+        shrink = decay ** steps
+        num[..., start:end] = shrink * (decay * carry_num[..., None] + np.cumsum(values[..., start:end] * grow, axis=-1))
+        den[..., start:end] = shrink * (decay * carry_den[..., None] + np.cumsum(weights[..., start:end] * grow, axis=-1))
+        carry_num = num[..., end - 1]
+        carry_den = den[..., end - 1]
+
+    return num, den
+
+
+def _splice(old: np.ndarray, start: int, tail: np.ndarray) -> np.ndarray:
+    """保留old的前start列，拼接新计算的尾部"""
+    return np.concatenate([old[..., :start], tail], axis=-1)
+
+
+# ==================== 列式K线 ====================
+
+class BarSeries:
+    """
+    单品种列式K线
+
+    sync()按首尾时间判断调用方传入的是否为同一序列的延续：
+    是则只写入新增K线（及被更新的最后一根），否则整体重建。
+    每次变更记录起始行号，供缓存判断哪些前缀仍然有效。
+    """
+
+    FIELDS = ("open", "high", "low", "close", "volume")
+
+    def __init__(self, capacity: int = 256):
+        self.length = 0
+        self.version = 0
+        self._columns = {name: np.empty(capacity) for name in self.FIELDS}
+        self._datetimes = np.empty(capacity, dtype=object)
+        # (版本号, 该版本改动的起始行)
+        self._changes: Deque[Tuple[int, int]] = deque(maxlen=64)
+
+    def _reserve(self, length: int) -> None:
+        capacity = self._datetimes.shape[0]
+        if length <= capacity:
+            return
+        while capacity < length:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity)
+            grown[:self.length] = column[:self.length]
+            self._columns[name] = grown
+        datetimes = np.empty(capacity, dtype=object)
+        datetimes[:self.length] = self._datetimes[:self.length]
+        self._datetimes = datetimes
+
+    def _row_equals(self, row: int, bar: BarData) -> bool:
+        columns = self._columns
+        return (
+            columns["open"][row] == float(bar.open_price)
+            and columns["high"][row] == float(bar.high_price)
+            and columns["low"][row] == float(bar.low_price)
+            and columns["close"][row] == float(bar.close_price)
+            and columns["volume"][row] == float(bar.volume)
+        )
+
+    def sync(self, bars: Sequence[BarData]) -> int:
+        """
+        与调用方的K线列表同步
+
+        Returns:
+            首个发生变化的行号（无变化时等于length）
+        """
+        length = self.length
+        start = 0
+        if (
+            length
+            and len(bars) >= length
+            and bars[0].datetime == self._datetimes[0]
+            and bars[length - 1].datetime == self._datetimes[length - 1]
+        ):
+            start = length if self._row_equals(length - 1, bars[length - 1]) else length - 1
+
+        new_length = len(bars)
+        if start == length == new_length:
+            return start
+
+        self._reserve(new_length)
+        rows = bars[start:]
+        columns = self._columns
+        columns["open"][start:new_length] = [float(bar.open_price) for bar in rows]
+        columns["high"][start:new_length] = [float(bar.high_price) for bar in rows]
+        columns["low"][start:new_length] = [float(bar.low_price) for bar in rows]
+        columns["close"][start:new_length] = [float(bar.close_price) for bar in rows]
+        columns["volume"][start:new_length] = [float(bar.volume) for bar in rows]
+        self._datetimes[start:new_length] = [bar.datetime for bar in rows]
+
+        self.length = new_length
+        self.version += 1
+        self._changes.append((self.version, start))
+        return start
+
+    def column(self, name: str) -> np.ndarray:
+        return self._columns[name][:self.length]
+
+    @property
+    def datetimes(self) -> np.ndarray:
+        return self._datetimes[:self.length]
+
+    def stable_prefix(self, version: int) -> int:
+        """自version以来未被改动的前缀行数"""
+        if version == self.version:
+            return self.length
+        if not self._changes or self._changes[0][0] > version + 1:
+            # 变更日志已截断，无法确认
+            return 0
+        prefix = self.length
+        for changed_version, start in reversed(self._changes):
+            if changed_version <= version:
+                break
+            prefix = min(prefix, start)
+        return prefix
+
+
+# ==================== 带缓存的指标帧 ====================
+
+@dataclass
+class _MemoEntry:
+    version: int
+    arrays: Tuple[np.ndarray, ...]  # arrays[0]为结果，其余为续算状态
+
+
+Node = Hashable
+
+# 矩阵帧中从各品种缓存带入、尚未补算的中间结果
+_GATHERED = -1
+
+
+class InsufficientHistory(Exception):
+    """尾部矩阵帧保留的历史不足以续算某个算子"""
+
+
+class IndicatorFrame:
+    """
+    指标计算帧
+
+    绑定BarSeries时缓存跨调用保留并按K线变更增量续算；
+    由stack()构造的多品种矩阵帧在单次批量计算内共享中间结果，结果经scatter()写回各品种。
+    算子返回节点键，通过value()取得数组，键相同的中间结果只计算一次。
+    """
+
+    def __init__(self, series: Optional[BarSeries] = None, columns: Optional[Dict[str, np.ndarray]] = None):
+        self.series = series
+        self._columns = columns
+        self._memo: Dict[Node, _MemoEntry] = {}
+        self._touched: Set[Node] = set()
+        # 矩阵帧：时间轴起点在原序列中的行号，以及带入结果的有效长度
+        self._base = 0
+        self._start = 0
+
+    @classmethod
+    def stack(cls, frames: List["IndicatorFrame"], start: int = 0, history: int = 0) -> "IndicatorFrame":
+        """
+        将等长的多个单品种帧堆叠为 品种×时间 的矩阵帧
+
+        start>0时各品种前start行的中间结果均已缓存：矩阵只取start-history之后的尾部，
+        并带入缓存结果，只补算start之后的部分。
+        """
+        base = max(0, start - history) if start else 0
+        columns = {
+            name: np.vstack([frame.series.column(name)[base:] for frame in frames])
+            for name in BarSeries.FIELDS
+        }
+        matrix = cls(columns=columns)
+        matrix._base = base
+        matrix._start = start - base
+
+        if start:
+            for node in frames[0]._memo:
+                entries = [frame._memo.get(node) for frame in frames]
+                if any(entry is None or entry.arrays[0].shape[-1] < start for entry in entries):
+                    continue
+                matrix._memo[node] = _MemoEntry(_GATHERED, tuple(
+                    np.vstack([entry.arrays[i][base:start] for entry in entries])
+                    for i in range(len(entries[0].arrays))
+                ))
+        return matrix
+
+    @property
+    def length(self) -> int:
+        if self.series is not None:
+            return self.series.length
+        return self._columns["close"].shape[-1]
+
+    @property
+    def version(self) -> int:
+        return self.series.version if self.series is not None else 0
+
+    @property
+    def datetimes(self) -> np.ndarray:
+        return self.series.datetimes
+
+    def value(self, node: Node) -> np.ndarray:
+        """取节点数组：字符串为原始K线列，其余为缓存的中间结果"""
+        if isinstance(node, str):
+            return self.series.column(node) if self.series is not None else self._columns[node]
+        return self._memo[node].arrays[0]
+
+    # ---------- 缓存管理 ----------
+
+    def begin_pass(self) -> None:
+        self._touched = set()
+
+    def prune(self) -> None:
+        """丢弃本轮计算未用到的中间结果"""
+        for node in [node for node in self._memo if node not in self._touched]:
+            del self._memo[node]
+
+    def stable_start(self) -> int:
+        """所有缓存结果仍然有效的前缀行数，0表示需要全量计算"""
+        if not self._memo:
+            return 0
+        return min(
+            min(self.series.stable_prefix(entry.version), entry.arrays[0].shape[-1])
+            for entry in self._memo.values()
+        )
+
+    def scatter(self, frames: List["IndicatorFrame"]) -> None:
+        """将矩阵帧本轮计算的中间结果按行拆分，拼回各单品种帧的缓存"""
+        base = self._base
+        for row, frame in enumerate(frames):
+            version = frame.version
+            for node in self._touched:
+                arrays = tuple(array[row] for array in self._memo[node].arrays)
+                if base:
+                    old = frame._memo[node].arrays
+                    arrays = tuple(np.concatenate([prefix[:base], tail]) for prefix, tail in zip(old, arrays))
+                else:
+                    arrays = tuple(array.copy() for array in arrays)
+                frame._memo[node] = _MemoEntry(version, arrays)
+
+    def _full(self) -> None:
+        """即将从头计算：尾部矩阵帧缺少前面的历史，只能放弃"""
+        if self._base:
+            raise InsufficientHistory()
+
+    def _cached(self, node: Node, compute: Callable[[int, Optional[_MemoEntry]], Tuple[np.ndarray, ...]]) -> Node:
+        """compute(start, entry)：start之前的结果仍有效，只需补算尾部"""
+        self._touched.add(node)
+        length = self.length
+        entry = self._memo.get(node)
+        start = 0
+        if entry is not None:
+            cached_length = entry.arrays[0].shape[-1]
+            if self.series is not None:
+                start = min(self.series.stable_prefix(entry.version), cached_length, length)
+            elif entry.version == _GATHERED:
+                start = self._start
+            else:
+                start = cached_length
+            if start == length == cached_length:
+                entry.version = self.version
+                return node
+            if start == 0:
+                entry = None
+
+        if entry is None:
+            self._full()
+
+        self._memo[node] = _MemoEntry(self.version, compute(start, entry))
+        return node
+
+    # ---------- 算子 ----------
+
+    def rolling(self, source: Node, window: int, how: str = "mean") -> Node:
+        """滚动窗口统计"""
+        x = self.value(source)
+
+        def compute(start: int, entry: Optional[_MemoEntry]) -> Tuple[np.ndarray, ...]:
+            if entry is None or start < window:
+                self._full()
+                return (rolling_window(x, window, how),)
+            tail = rolling_window(x[..., start - window + 1:], window, how)[..., window - 1:]
+            return (_splice(entry.arrays[0], start, tail),)
+
+        return self._cached(("rolling", how, source, window), compute)
+
+    def ewm(self, source: Node, alpha: float) -> Node:
+        """指数加权均值"""
+        x = self.value(source)
+
+        def compute(start: int, entry: Optional[_MemoEntry]) -> Tuple[np.ndarray, ...]:
+            if entry is None:
+                num, den = ewm_state(x, alpha)
+            else:
+                _, old_num, old_den = entry.arrays
+                tail_num, tail_den = ewm_state(
+                    x[..., start:], alpha, old_num[..., start - 1], old_den[..., start - 1]
+                )
+                num = _splice(old_num, start, tail_num)
+                den = _splice(old_den, start, tail_den)
+            mean = np.full(num.shape, np.nan)
+            np.divide(num, den, out=mean, where=den > 0)
+            return mean, num, den
+
+        return self._cached(("ewm", source, alpha), compute)
+
+    def ema(self, source: Node, span: float) -> Node:
+        return self.ewm(source, 2.0 / (span + 1.0))
+
+    def apply(self, name: Hashable, sources: Tuple[Node, ...], func: Callable[..., np.ndarray], lookback: int = 0) -> Node:
+        """
+        逐元素派生序列，name需包含影响结果的全部参数
+        lookback为计算每个位置所需的前序元素个数（如差分为1）
+        除零等浮点告警由调用方统一用np.errstate屏蔽
+        """
+        inputs = [self.value(source) for source in sources]
+
+        def compute(start: int, entry: Optional[_MemoEntry]) -> Tuple[np.ndarray, ...]:
+            if entry is None or start <= lookback:
+                self._full()
+                return (func(*inputs),)
+            tail = func(*(x[..., start - lookback:] for x in inputs))[..., lookback:]
+            return (_splice(entry.arrays[0], start, tail),)
+
+        return self._cached(("apply", name, sources), compute)
+
+
+# ==================== 指标定义 ====================
+
+def _diff(x: np.ndarray) -> np.ndarray:
+    out = np.full(x.shape, np.nan)
+    out[..., 1:] = np.diff(x, axis=-1)
+    return out
+
+
+def compute_sma(frame: IndicatorFrame, params: Dict[str, Any]) -> Dict[str, Node]:
+    return {"values": frame.rolling(params.get("price_type", "close"), params.get("period", 20))}
+
+
+def compute_ema(frame: IndicatorFrame, params: Dict[str, Any]) -> Dict[str, Node]:
+    return {"values": frame.ema(params.get("price_type", "close"), params.get("period", 12))}
+
+
+def compute_macd(frame: IndicatorFrame, params: Dict[str, Any]) -> Dict[str, Node]:
+    fast_period = params.get("fast_period", 12)
+    slow_period = params.get("slow_period", 26)
+    signal_period = params.get("signal_period", 9)
+    price_type = params.get("price_type", "close")
+
+    # 快慢线EMA与同参数的EMA指标共用缓存
+    ema_fast = frame.ema(price_type, fast_period)
+    ema_slow = frame.ema(price_type, slow_period)
+    macd_line = frame.apply("sub", (ema_fast, ema_slow), np.subtract)
+    signal_line = frame.ema(macd_line, signal_period)
+    histogram = frame.apply("sub", (macd_line, signal_line), np.subtract)
+    return {"macd": macd_line, "signal": signal_line, "histogram": histogram}
+
+
+def compute_rsi(frame: IndicatorFrame, params: Dict[str, Any]) -> Dict[str, Node]:
+    period = params.get("period", 14)
+    price_type = params.get("price_type", "close")
+
+    delta = frame.apply("diff", (price_type,), _diff, lookback=1)
+    gain = frame.apply("gain", (delta,), lambda d: np.where(d > 0, d, 0.0))
+    loss = frame.apply("loss", (delta,), lambda d: np.where(d < 0, -d, 0.0))
+    avg_gain = frame.rolling(gain, period)
+    avg_loss = frame.rolling(loss, period)
+    rsi = frame.apply("rsi", (avg_gain, avg_loss), lambda g, l: 100 - 100 / (1 + g / l))
+    return {"values": rsi}
+
+
+def compute_bollinger_bands(frame: IndicatorFrame, params: Dict[str, Any]) -> Dict[str, Node]:
+    period = params.get("period", 20)
+    std_dev = params.get("std_dev", 2)
+    price_type = params.get("price_type", "close")
+
+    middle = frame.rolling(price_type, period)
+    std = frame.rolling(price_type, period, "std")
+    upper = frame.apply(("band", std_dev), (middle, std), lambda m, s: m + s * std_dev)
+    lower = frame.apply(("band", -std_dev), (middle, std), lambda m, s: m - s * std_dev)
+    return {"upper": upper, "middle": middle, "lower": lower}
+
+
+def compute_kdj(frame: IndicatorFrame, params: Dict[str, Any]) -> Dict[str, Node]:
+    period = params.get("period", 9)
+    k_period = params.get("k_period", 3)
+    d_period = params.get("d_period", 3)
+
+    low_min = frame.rolling("low", period, "min")
+    high_max = frame.rolling("high", period, "max")
+    rsv = frame.apply("rsv", ("close", low_min, high_max), lambda c, lo, hi: (c - lo) / (hi - lo) * 100)
+    k_values = frame.ewm(rsv, 1 / k_period)
+    d_values = frame.ewm(k_values, 1 / d_period)
+    j_values = frame.apply("kdj_j", (k_values, d_values), lambda k, d: 3 * k - 2 * d)
+    return {"k": k_values, "d": d_values, "j": j_values}
+
+
+def compute_volume(frame: IndicatorFrame, params: Dict[str, Any]) -> Dict[str, Node]:
+    return {"volume": "volume", "volume_ma": frame.rolling("volume", params.get("ma_period", 20))}
@@ -3,15 +3,19 @@
 """
 
 import logging
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
-import pandas as pd
 import numpy as np
 
 from ..entities.bar_data_entity import BarData
-from ..entities.indicator_entity import Indicator
+from ..entities.indicator_entity import Indicator, IndicatorStatus
 from ..value_objects.indicator_type import IndicatorType
+from .indicator_engine import (
+    BarSeries, IndicatorFrame, InsufficientHistory, Node,
+    compute_sma, compute_ema, compute_macd, compute_rsi,
+    compute_bollinger_bands, compute_kdj, compute_volume
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,13 +34,29 @@ class IndicatorManagerService:
     """
     指标管理器领域服务
     
-    负责管理和计算各种技术指标
+    负责管理和计算各种技术指标。每个品种的K线按列保存并增量同步，
+    指标的中间结果（EMA、滚动均值等）按参数缓存，品种内各指标共用。
     """
     
+    # 指标类型 -> (计算函数, 结果格式化方法名)
+    _CALCULATORS = {
+        IndicatorType.SMA: (compute_sma, "_format_sma"),
+        IndicatorType.MA: (compute_sma, "_format_sma"),
+        IndicatorType.EMA: (compute_ema, "_format_ema"),
+        IndicatorType.MACD: (compute_macd, "_format_macd"),
+        IndicatorType.RSI: (compute_rsi, "_format_rsi"),
+        IndicatorType.BOLL: (compute_bollinger_bands, "_format_bollinger_bands"),
+        IndicatorType.KDJ: (compute_kdj, "_format_kdj"),
+        IndicatorType.VOL: (compute_volume, "_format_volume"),
+    }
+    
     def __init__(self):
         self.symbol_indicators: Dict[str, List[Indicator]] = {}
         self.calculation_cache: Dict[str, IndicatorCalculationResult] = {}
         
+        # 品种 -> 绑定列式K线的指标计算帧
+        self._frames: Dict[str, IndicatorFrame] = {}
+        
     def add_indicator(
         self, 
         symbol: str, 
@@ -119,25 +139,100 @@ class IndicatorManagerService:
         if not bars:
             return {}
         
-        # 转换为DataFrame
-        df = self._bars_to_dataframe(bars)
+        frame = self._sync_frame(symbol, bars)
+        frame.begin_pass()
         
         results = {}
-        for indicator in self.symbol_indicators[symbol]:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for indicator in self.symbol_indicators[symbol]:
+                try:
+                    if self._is_active(indicator):
+                        calculation_result = self._calculate_indicator(indicator, frame)
+                        results[indicator.name] = calculation_result.values
+                        
+                        # 更新缓存
+                        cache_key = f"{symbol}_{indicator.name}"
+                        self.calculation_cache[cache_key] = calculation_result
+                        
+                except Exception as e:
+                    logger.error(f"计算指标 {indicator.name} 失败: {e}")
+                    results[indicator.name] = {"error": str(e)}
+        
+        # 只保留当前指标用到的中间结果
+        frame.prune()
+        return results
+    
+    def calculate_batch(self, bars_by_symbol: Dict[str, List[BarData]]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量计算多个品种的所有指标
+        
+        品种按（K线数量, 缓存有效前缀, 指标配置）分组，每组堆叠成 品种×时间 矩阵一次算完：
+        全量计算的组使用完整序列，增量组只取尾部并带入已缓存的中间结果。
+        结果写回各品种缓存后逐品种输出。
+        
+        Args:
+            bars_by_symbol: 品种 -> K线数据
+            
+        Returns:
+            Dict[str, Dict[str, Any]]: 品种 -> 指标计算结果
+        """
+        groups: Dict[Tuple[int, int, Tuple], List[IndicatorFrame]] = {}
+        group_symbol: Dict[Tuple[int, int, Tuple], str] = {}
+        for symbol, bars in bars_by_symbol.items():
+            if symbol not in self.symbol_indicators or not bars:
+                continue
+            
+            frame = self._sync_frame(symbol, bars)
+            start = frame.stable_start()
+            if start >= frame.length:
+                continue
+            
+            specs = tuple(
+                (indicator.indicator_type, repr(sorted(indicator.parameters.items())))
+                for indicator in self.symbol_indicators[symbol]
+                if self._is_active(indicator)
+            )
+            key = (frame.length, start, specs)
+            groups.setdefault(key, []).append(frame)
+            group_symbol.setdefault(key, symbol)
+        
+        for key, frames in groups.items():
+            if len(frames) < 2 or not key[2]:
+                continue
+            
+            indicators = [
+                indicator for indicator in self.symbol_indicators[group_symbol[key]]
+                if self._is_active(indicator)
+            ]
             try:
-                if indicator.is_active():
-                    calculation_result = self._calculate_indicator(indicator, df)
-                    results[indicator.name] = calculation_result.values
-                    
-                    # 更新缓存
-                    cache_key = f"{symbol}_{indicator.name}"
-                    self.calculation_cache[cache_key] = calculation_result
-                    
+                matrix = IndicatorFrame.stack(frames, key[1], self._history_rows(indicators))
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    for indicator in indicators:
+                        calculator = self._CALCULATORS.get(indicator.indicator_type)
+                        if calculator:
+                            calculator[0](matrix, indicator.parameters)
+                matrix.scatter(frames)
+                
+            except InsufficientHistory:
+                # 尾部历史不够时由逐品种计算补算
+                pass
             except Exception as e:
-                logger.error(f"计算指标 {indicator.name} 失败: {e}")
-                results[indicator.name] = {"error": str(e)}
+                # 矩阵预计算失败不影响逐品种计算
+                logger.error(f"批量预计算指标失败: {e}")
         
-        return results
+        return {
+            symbol: self.calculate_all(symbol, bars)
+            for symbol, bars in bars_by_symbol.items()
+        }
+    
+    @staticmethod
+    def _history_rows(indicators: List[Indicator]) -> int:
+        """增量矩阵需要保留的历史行数：不少于各指标的最大周期参数"""
+        periods = [
+            value for indicator in indicators for value in indicator.parameters.values()
+            if isinstance(value, int) and not isinstance(value, bool)
+        ]
+        return max(periods + [64]) + 1
     
     def calculate_single(
         self, 
@@ -171,8 +266,9 @@ class IndicatorManagerService:
                 error="K线数据为空"
             )
         
-        df = self._bars_to_dataframe(bars)
-        return self._calculate_indicator(indicator, df)
+        frame = self._sync_frame(symbol, bars)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._calculate_indicator(indicator, frame)
     
     def get_indicators(self, symbol: str) -> List[Indicator]:
         """获取指定品种的所有指标"""
@@ -193,59 +289,43 @@ class IndicatorManagerService:
         
         return None
     
-    def _bars_to_dataframe(self, bars: List[BarData]) -> pd.DataFrame:
-        """将K线数据转换为DataFrame"""
-        data = []
-        for bar in bars:
-            data.append({
-                'datetime': bar.datetime,
-                'open': float(bar.open_price),
-                'high': float(bar.high_price),
-                'low': float(bar.low_price),
-                'close': float(bar.close_price),
-                'volume': float(bar.volume)
-            })
-        
-        df = pd.DataFrame(data)
-        df.set_index('datetime', inplace=True)
-        return df
+    def _sync_frame(self, symbol: str, bars: List[BarData]) -> IndicatorFrame:
+        """将K线同步到品种的列式存储，返回其计算帧"""
+        frame = self._frames.get(symbol)
+        if frame is None:
+            frame = IndicatorFrame(BarSeries())
+            self._frames[symbol] = frame
+        
+        frame.series.sync(bars)
+        return frame
+    
+    @staticmethod
+    def _is_active(indicator: Indicator) -> bool:
+        return indicator.status != IndicatorStatus.INACTIVE
     
     def _calculate_indicator(
         self, 
         indicator: Indicator, 
-        df: pd.DataFrame
+        frame: IndicatorFrame
     ) -> IndicatorCalculationResult:
         """
         计算指标值
         
         Args:
             indicator: 指标实例
-            df: 价格数据DataFrame
+            frame: 品种的指标计算帧
             
         Returns:
             IndicatorCalculationResult: 计算结果
         """
         try:
-            indicator_type = indicator.indicator_type
-            parameters = indicator.parameters
+            calculator = self._CALCULATORS.get(indicator.indicator_type)
+            if calculator is None:
+                raise ValueError(f"不支持的指标类型: {indicator.indicator_type}")
             
-            # 根据指标类型计算
-            if indicator_type == IndicatorType.SMA:
-                values = self._calculate_sma(df, parameters)
-            elif indicator_type == IndicatorType.EMA:
-                values = self._calculate_ema(df, parameters)
-            elif indicator_type == IndicatorType.MACD:
-                values = self._calculate_macd(df, parameters)
-            elif indicator_type == IndicatorType.RSI:
-                values = self._calculate_rsi(df, parameters)
-            elif indicator_type == IndicatorType.BOLLINGER_BANDS:
-                values = self._calculate_bollinger_bands(df, parameters)
-            elif indicator_type == IndicatorType.KDJ:
-                values = self._calculate_kdj(df, parameters)
-            elif indicator_type == IndicatorType.VOLUME:
-                values = self._calculate_volume(df, parameters)
-            else:
-                raise ValueError(f"不支持的指标类型: {indicator_type}")
+            compute, formatter = calculator
+            nodes = compute(frame, indicator.parameters)
+            values = getattr(self, formatter)(frame, nodes, indicator.parameters)
             
             return IndicatorCalculationResult(
                 indicator_id=indicator.indicator_id,
@@ -261,159 +341,105 @@ class IndicatorManagerService:
                 error=str(e)
             )
     
-    def _calculate_sma(self, df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
-        """计算简单移动平均线"""
-        period = params.get('period', 20)
-        price_type = params.get('price_type', 'close')
-        
-        sma_values = df[price_type].rolling(window=period).mean()
+    @staticmethod
+    def _valid(frame: IndicatorFrame, node: Node) -> Tuple[np.ndarray, np.ndarray]:
+        """返回节点数组及其非NaN掩码"""
+        values = frame.value(node)
+        return values, ~np.isnan(values)
+    
+    def _dropna(self, frame: IndicatorFrame, node: Node) -> Tuple[List[float], List[datetime]]:
+        """去掉NaN后的值和对应时间"""
+        values, mask = self._valid(frame, node)
+        return values[mask].tolist(), frame.datetimes[mask].tolist()
+    
+    def _format_sma(self, frame: IndicatorFrame, nodes: Dict[str, Node], params: Dict[str, Any]) -> Dict[str, Any]:
+        """简单移动平均线"""
+        values, timestamps = self._dropna(frame, nodes['values'])
         
         return {
-            'values': sma_values.dropna().tolist(),
-            'timestamps': sma_values.dropna().index.tolist(),
-            'period': period,
-            'price_type': price_type
+            'values': values,
+            'timestamps': timestamps,
+            'period': params.get('period', 20),
+            'price_type': params.get('price_type', 'close')
         }
     
-    def _calculate_ema(self, df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
-        """计算指数移动平均线"""
-        period = params.get('period', 12)
-        price_type = params.get('price_type', 'close')
-        
-        ema_values = df[price_type].ewm(span=period).mean()
+    def _format_ema(self, frame: IndicatorFrame, nodes: Dict[str, Node], params: Dict[str, Any]) -> Dict[str, Any]:
+        """指数移动平均线"""
+        values, timestamps = self._dropna(frame, nodes['values'])
         
         return {
-            'values': ema_values.dropna().tolist(),
-            'timestamps': ema_values.dropna().index.tolist(),
-            'period': period,
-            'price_type': price_type
+            'values': values,
+            'timestamps': timestamps,
+            'period': params.get('period', 12),
+            'price_type': params.get('price_type', 'close')
         }
     
-    def _calculate_macd(self, df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
-        """计算MACD指标"""
-        fast_period = params.get('fast_period', 12)
-        slow_period = params.get('slow_period', 26)
-        signal_period = params.get('signal_period', 9)
-        price_type = params.get('price_type', 'close')
-        
-        prices = df[price_type]
-        
-        # 计算快线和慢线EMA
-        ema_fast = prices.ewm(span=fast_period).mean()
-        ema_slow = prices.ewm(span=slow_period).mean()
-        
-        # MACD线 = 快线EMA - 慢线EMA
-        macd_line = ema_fast - ema_slow
-        
-        # 信号线 = MACD线的EMA
-        signal_line = macd_line.ewm(span=signal_period).mean()
-        
-        # 柱状图 = MACD线 - 信号线
-        histogram = macd_line - signal_line
+    def _format_macd(self, frame: IndicatorFrame, nodes: Dict[str, Node], params: Dict[str, Any]) -> Dict[str, Any]:
+        """MACD指标"""
+        macd, timestamps = self._dropna(frame, nodes['macd'])
+        signal, _ = self._dropna(frame, nodes['signal'])
+        histogram, _ = self._dropna(frame, nodes['histogram'])
         
         return {
-            'macd': macd_line.dropna().tolist(),
-            'signal': signal_line.dropna().tolist(),
-            'histogram': histogram.dropna().tolist(),
-            'timestamps': macd_line.dropna().index.tolist(),
-            'fast_period': fast_period,
-            'slow_period': slow_period,
-            'signal_period': signal_period
+            'macd': macd,
+            'signal': signal,
+            'histogram': histogram,
+            'timestamps': timestamps,
+            'fast_period': params.get('fast_period', 12),
+            'slow_period': params.get('slow_period', 26),
+            'signal_period': params.get('signal_period', 9)
         }
     
-    def _calculate_rsi(self, df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
-        """计算RSI指标"""
-        period = params.get('period', 14)
-        price_type = params.get('price_type', 'close')
-        
-        prices = df[price_type]
-        delta = prices.diff()
-        
-        gain = delta.where(delta > 0, 0)
-        loss = -delta.where(delta < 0, 0)
-        
-        avg_gain = gain.rolling(window=period).mean()
-        avg_loss = loss.rolling(window=period).mean()
-        
-        rs = avg_gain / avg_loss
-        rsi = 100 - (100 / (1 + rs))
+    def _format_rsi(self, frame: IndicatorFrame, nodes: Dict[str, Node], params: Dict[str, Any]) -> Dict[str, Any]:
+        """RSI指标"""
+        values, timestamps = self._dropna(frame, nodes['values'])
         
         return {
-            'values': rsi.dropna().tolist(),
-            'timestamps': rsi.dropna().index.tolist(),
-            'period': period,
+            'values': values,
+            'timestamps': timestamps,
+            'period': params.get('period', 14),
             'overbought_level': 70,
             'oversold_level': 30
         }
     
-    def _calculate_bollinger_bands(self, df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
-        """计算布林带指标"""
-        period = params.get('period', 20)
-        std_dev = params.get('std_dev', 2)
-        price_type = params.get('price_type', 'close')
-        
-        prices = df[price_type]
-        
-        # 中轨线（移动平均）
-        middle_band = prices.rolling(window=period).mean()
-        
-        # 标准差
-        std = prices.rolling(window=period).std()
-        
-        # 上轨线和下轨线
-        upper_band = middle_band + (std * std_dev)
-        lower_band = middle_band - (std * std_dev)
+    def _format_bollinger_bands(self, frame: IndicatorFrame, nodes: Dict[str, Node], params: Dict[str, Any]) -> Dict[str, Any]:
+        """布林带指标"""
+        upper, _ = self._dropna(frame, nodes['upper'])
+        middle, timestamps = self._dropna(frame, nodes['middle'])
+        lower, _ = self._dropna(frame, nodes['lower'])
         
         return {
-            'upper': upper_band.dropna().tolist(),
-            'middle': middle_band.dropna().tolist(),
-            'lower': lower_band.dropna().tolist(),
-            'timestamps': middle_band.dropna().index.tolist(),
-            'period': period,
-            'std_dev': std_dev
+            'upper': upper,
+            'middle': middle,
+            'lower': lower,
+            'timestamps': timestamps,
+            'period': params.get('period', 20),
+            'std_dev': params.get('std_dev', 2)
         }
     
-    def _calculate_kdj(self, df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
-        """计算KDJ指标"""
-        period = params.get('period', 9)
-        k_period = params.get('k_period', 3)
-        d_period = params.get('d_period', 3)
-        
-        # 计算RSV (Raw Stochastic Value)
-        low_min = df['low'].rolling(window=period).min()
-        high_max = df['high'].rolling(window=period).max()
-        rsv = (df['close'] - low_min) / (high_max - low_min) * 100
-        
-        # 计算K值
-        k_values = rsv.ewm(alpha=1/k_period).mean()
-        
-        # 计算D值
-        d_values = k_values.ewm(alpha=1/d_period).mean()
-        
-        # 计算J值
-        j_values = 3 * k_values - 2 * d_values
+    def _format_kdj(self, frame: IndicatorFrame, nodes: Dict[str, Node], params: Dict[str, Any]) -> Dict[str, Any]:
+        """KDJ指标"""
+        k_values, timestamps = self._dropna(frame, nodes['k'])
+        d_values, _ = self._dropna(frame, nodes['d'])
+        j_values, _ = self._dropna(frame, nodes['j'])
         
         return {
-            'k': k_values.dropna().tolist(),
-            'd': d_values.dropna().tolist(),
-            'j': j_values.dropna().tolist(),
-            'timestamps': k_values.dropna().index.tolist(),
-            'period': period,
-            'k_period': k_period,
-            'd_period': d_period
+            'k': k_values,
+            'd': d_values,
+            'j': j_values,
+            'timestamps': timestamps,
+            'period': params.get('period', 9),
+            'k_period': params.get('k_period', 3),
+            'd_period': params.get('d_period', 3)
         }
     
-    def _calculate_volume(self, df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
-        """计算成交量相关指标"""
-        volume_type = params.get('volume_type', 'volume')
-        ma_period = params.get('ma_period', 20)
-        
-        volume = df['volume']
-        volume_ma = volume.rolling(window=ma_period).mean()
+    def _format_volume(self, frame: IndicatorFrame, nodes: Dict[str, Node], params: Dict[str, Any]) -> Dict[str, Any]:
+        """成交量相关指标"""
+        volume_ma, _ = self._dropna(frame, nodes['volume_ma'])
         
         return {
-            'volume': volume.tolist(),
-            'volume_ma': volume_ma.dropna().tolist(),
-            'timestamps': volume.index.tolist(),
-            'ma_period': ma_period
+            'volume': frame.value(nodes['volume']).tolist(),
+            'volume_ma': volume_ma,
+            'timestamps': frame.datetimes.tolist(),
+            'ma_period': params.get('ma_period', 20)
         }
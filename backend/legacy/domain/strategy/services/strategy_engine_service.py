@@ -3,7 +3,6 @@
 提供策略引擎管理、VnPy集成、网关管理等功能
 """
 
-import json
 import logging
 import asyncio
 from pathlib import Path
@@ -15,6 +14,7 @@ from ..entities.strategy_config import StrategyConfig
 from ..entities.strategy_instance import StrategyInstance
 from ..entities.gateway_entity import TradingGateway, GatewayStatus, GatewayType
 from ..entities.contract_entity import TradingContract, ContractType, Exchange
+from .strategy_store import JournaledRecordStore
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +32,12 @@ class StrategyEngineService:
         self._gateways_cache: Dict[str, TradingGateway] = {}
         self._contracts_cache: Dict[str, TradingContract] = {}
         
+        # 持久化：快照 + 追加日志，后台批量落盘
+        self._config_store = JournaledRecordStore(self.storage_path, "strategy_configs", "strategy_name")
+        self._instance_store = JournaledRecordStore(self.storage_path, "strategy_instances", "instance_id")
+        self._configs_loaded = False
+        self._instances_loaded = False
+        
         # 引擎状态
         self._engine_status = {
             "engine_id": str(uuid.uuid4()),
@@ -121,6 +127,9 @@ class StrategyEngineService:
             # 关闭VnPy引擎
             await self._shutdown_vnpy_engine()
             
+            # 落盘尚未写入的配置和实例并停止后台落盘任务
+            await self.close_storage()
+            
             # 更新状态
             self._engine_status["status"] = "stopped"
             self._engine_status["is_healthy"] = False
@@ -701,17 +710,13 @@ class StrategyEngineService:
     # ==================== 原有方法保持不变 ====================
     
     async def save_strategy_config(self, config: StrategyConfig) -> None:
-        """保存策略配置"""
+        """保存策略配置（写入内存并登记，后台批量落盘）"""
         try:
+            await self._load_strategy_configs()
+            
             # 更新缓存
             self._configs_cache[config.strategy_name] = config
-            
-            # 保存到文件
-            config_file = self.storage_path / "strategy_configs.json"
-            configs_data = [config.to_dict() for config in self._configs_cache.values()]
-            
-            with open(config_file, 'w', encoding='utf-8') as f:
-                json.dump(configs_data, f, indent=2, ensure_ascii=False)
+            self._config_store.put(config.strategy_name, config.to_dict())
             
             logger.info(f"策略配置保存成功: {config.strategy_name}")
             
@@ -721,11 +726,6 @@ class StrategyEngineService:
     
     async def get_strategy_config(self, strategy_name: str) -> Optional[StrategyConfig]:
         """获取策略配置"""
-        # 首先从缓存获取
-        if strategy_name in self._configs_cache:
-            return self._configs_cache[strategy_name]
-        
-        # 如果缓存中没有，尝试从文件加载
         await self._load_strategy_configs()
         return self._configs_cache.get(strategy_name)
     
@@ -737,15 +737,11 @@ class StrategyEngineService:
     async def delete_strategy_config(self, strategy_name: str) -> bool:
         """删除策略配置"""
         try:
+            await self._load_strategy_configs()
+            
             if strategy_name in self._configs_cache:
                 del self._configs_cache[strategy_name]
-                
-                # 保存到文件
-                config_file = self.storage_path / "strategy_configs.json"
-                configs_data = [config.to_dict() for config in self._configs_cache.values()]
-                
-                with open(config_file, 'w', encoding='utf-8') as f:
-                    json.dump(configs_data, f, indent=2, ensure_ascii=False)
+                self._config_store.delete(strategy_name)
                 
                 logger.info(f"策略配置删除成功: {strategy_name}")
                 return True
@@ -757,17 +753,13 @@ class StrategyEngineService:
             raise
     
     async def save_strategy_instance(self, instance: StrategyInstance) -> None:
-        """保存策略实例"""
+        """保存策略实例（写入内存并登记，后台批量落盘）"""
         try:
+            await self._load_strategy_instances()
+            
             # 更新缓存
             self._instances_cache[instance.instance_id] = instance
-            
-            # 保存到文件
-            instances_file = self.storage_path / "strategy_instances.json"
-            instances_data = [instance.to_dict() for instance in self._instances_cache.values()]
-            
-            with open(instances_file, 'w', encoding='utf-8') as f:
-                json.dump(instances_data, f, indent=2, ensure_ascii=False)
+            self._instance_store.put(instance.instance_id, instance.to_dict())
             
             logger.debug(f"策略实例保存成功: {instance.instance_id}")
             
@@ -777,11 +769,6 @@ class StrategyEngineService:
     
     async def get_strategy_instance(self, instance_id: str) -> Optional[StrategyInstance]:
         """获取策略实例"""
-        # 首先从缓存获取
-        if instance_id in self._instances_cache:
-            return self._instances_cache[instance_id]
-        
-        # 如果缓存中没有，尝试从文件加载
         await self._load_strategy_instances()
         return self._instances_cache.get(instance_id)
     
@@ -793,15 +780,11 @@ class StrategyEngineService:
     async def delete_strategy_instance(self, instance_id: str) -> bool:
         """删除策略实例"""
         try:
+            await self._load_strategy_instances()
+            
             if instance_id in self._instances_cache:
                 del self._instances_cache[instance_id]
-                
-                # 保存到文件
-                instances_file = self.storage_path / "strategy_instances.json"
-                instances_data = [instance.to_dict() for instance in self._instances_cache.values()]
-                
-                with open(instances_file, 'w', encoding='utf-8') as f:
-                    json.dump(instances_data, f, indent=2, ensure_ascii=False)
+                self._instance_store.delete(instance_id)
                 
                 logger.info(f"策略实例删除成功: {instance_id}")
                 return True
@@ -812,38 +795,58 @@ class StrategyEngineService:
             logger.error(f"策略实例删除失败: {e}")
             raise
     
+    async def flush_storage(self) -> None:
+        """将尚未落盘的配置和实例写入磁盘"""
+        try:
+            await self._config_store.flush()
+            await self._instance_store.flush()
+            
+        except Exception as e:
+            logger.error(f"策略数据落盘失败: {e}")
+            raise
+    
+    async def close_storage(self) -> None:
+        """落盘剩余变更并关闭存储"""
+        try:
+            await self._config_store.close()
+            await self._instance_store.close()
+            
+        except Exception as e:
+            logger.error(f"策略存储关闭失败: {e}")
+            raise
+    
     async def _load_strategy_configs(self) -> None:
-        """加载策略配置"""
-        config_file = self.storage_path / "strategy_configs.json"
-        if config_file.exists():
-            try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    configs_data = json.load(f)
-                
-                self._configs_cache.clear()
-                for config_data in configs_data:
-                    config = StrategyConfig.from_dict(config_data)
-                    self._configs_cache[config.strategy_name] = config
-                
-                logger.info(f"加载了 {len(self._configs_cache)} 个策略配置")
-                
-            except Exception as e:
-                logger.error(f"策略配置加载失败: {e}")
+        """加载策略配置（仅首次访问时读取磁盘）"""
+        if self._configs_loaded:
+            return
+        
+        try:
+            records = await self._config_store.load()
+            for strategy_name, config_data in records.items():
+                if strategy_name not in self._configs_cache:
+                    self._configs_cache[strategy_name] = StrategyConfig.from_dict(config_data)
+            
+            self._configs_loaded = True
+            logger.info(f"加载了 {len(self._configs_cache)} 个策略配置")
+            
+        except Exception as e:
+            logger.error(f"策略配置加载失败: {e}")
+            raise
     
     async def _load_strategy_instances(self) -> None:
-        """加载策略实例"""
-        instances_file = self.storage_path / "strategy_instances.json"
-        if instances_file.exists():
-            try:
-                with open(instances_file, 'r', encoding='utf-8') as f:
-                    instances_data = json.load(f)
-                
-                self._instances_cache.clear()
-                for instance_data in instances_data:
-                    instance = StrategyInstance.from_dict(instance_data)
-                    self._instances_cache[instance.instance_id] = instance
-                
-                logger.info(f"加载了 {len(self._instances_cache)} 个策略实例")
-                
-            except Exception as e:
-                logger.error(f"策略实例加载失败: {e}")
+        """加载策略实例（仅首次访问时读取磁盘）"""
+        if self._instances_loaded:
+            return
+        
+        try:
+            records = await self._instance_store.load()
+            for instance_id, instance_data in records.items():
+                if instance_id not in self._instances_cache:
+                    self._instances_cache[instance_id] = StrategyInstance.from_dict(instance_data)
+            
+            self._instances_loaded = True
+            logger.info(f"加载了 {len(self._instances_cache)} 个策略实例")
+            
+        except Exception as e:
+            logger.error(f"策略实例加载失败: {e}")
+            raise
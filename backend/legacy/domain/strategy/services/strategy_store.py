@@ -0,0 +1,207 @@
+"""
+策略记录存储
+提供快照 + 追加日志的JSON记录存储，供StrategyEngineService持久化配置与实例
+"""
+
+import json
+import logging
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 待写入的删除标记
+_DELETED = object()
+
+
+class JournaledRecordStore:
+    """
+    快照 + 追加日志的记录存储
+
+    - 快照 <name>.json 写临时文件后原子替换，内容为 {"generation": 代数, "records": 记录列表}，
+      兼容读取旧版的纯记录列表（视为第0代）
+    - 每次保存/删除只在内存登记，后台任务批量追加到 <name>.journal（JSON Lines），
+      每行带所基于的快照代数
+    - 日志条数超过阈值时写下一代快照并清空日志；替换快照后、清空日志前崩溃时，
+      残留日志的代数低于快照，加载时跳过，不会以旧变更覆盖新快照
+    - 所有文件I/O在线程池中执行，读取只访问内存
+    """
+
+    def __init__(
+        self,
+        storage_path: Path,
+        name: str,
+        key_field: str,
+        flush_interval: float = 0.5,
+        compact_threshold: int = 10000,
+        fsync: bool = False
+    ):
+        self.snapshot_file = Path(storage_path) / f"{name}.json"
+        self.journal_file = Path(storage_path) / f"{name}.journal"
+        self.key_field = key_field
+        self.flush_interval = flush_interval
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+
+        self._records: Dict[str, Dict[str, Any]] = {}
+        # 尚未落盘的变更，同一键只保留最后一次
+        self._pending: Dict[str, Any] = {}
+        self._journal_entries = 0
+        self._generation = 0
+        self._loaded = False
+
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    # ==================== 加载 ====================
+
+    async def load(self) -> Dict[str, Dict[str, Any]]:
+        """加载快照并重放日志（只执行一次），返回记录字典"""
+        if not self._loaded:
+            records, journal_entries, generation = await asyncio.to_thread(self._read_from_disk)
+            # 加载前已登记的变更优先
+            for key, data in records.items():
+                if self._pending.get(key) is not _DELETED:
+                    self._records.setdefault(key, data)
+            self._journal_entries = journal_entries
+            self._generation = generation
+            self._loaded = True
+        return self._records
+
+    def _read_from_disk(self) -> tuple:
+        records: Dict[str, Dict[str, Any]] = {}
+        generation = 0
+        if self.snapshot_file.exists():
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            if isinstance(snapshot, dict):
+                generation = snapshot["generation"]
+                snapshot = snapshot["records"]
+            for data in snapshot:
+                records[data[self.key_field]] = data
+
+        journal_entries = 0
+        if self.journal_file.exists():
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时写了一半的最后一行
+                        logger.warning(f"跳过损坏的日志行: {self.journal_file}")
+                        break
+                    if entry.get("gen", 0) < generation:
+                        # 已被快照包含的旧日志
+                        continue
+                    if entry["op"] == "put":
+                        records[entry["key"]] = entry["data"]
+                    else:
+                        records.pop(entry["key"], None)
+                    journal_entries += 1
+
+        return records, journal_entries, generation
+
+    # ==================== 写入 ====================
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        """登记一条记录，由后台任务批量落盘"""
+        self._records[key] = data
+        self._pending[key] = data
+        self._schedule_flush()
+
+    def delete(self, key: str) -> bool:
+        """登记删除"""
+        existed = self._records.pop(key, None) is not None
+        self._pending[key] = _DELETED
+        self._schedule_flush()
+        return existed
+
+    def values(self) -> List[Dict[str, Any]]:
+        return list(self._records.values())
+
+    def _schedule_flush(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+        self._wakeup.set()
+
+    async def _flush_loop(self) -> None:
+        """后台批量落盘：被唤醒后等待flush_interval聚合更多变更，失败时退避重试"""
+        retry_delay = 0.0
+        while True:
+            try:
+                await self._wakeup.wait()
+                await asyncio.sleep(max(self.flush_interval, retry_delay))
+                self._wakeup.clear()
+                await self.flush()
+                retry_delay = 0.0
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"记录落盘失败: {self.snapshot_file.name}: {e}")
+                # 变更已放回待写入，保持唤醒以便重试，不等下一次put
+                retry_delay = min(max(retry_delay * 2, self.flush_interval, 0.1), 30.0)
+                self._wakeup.set()
+
+    async def flush(self) -> None:
+        """将待写入变更落盘"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            # 未加载过磁盘数据时先合并，避免快照丢失已有记录
+            await self.load()
+
+            pending, self._pending = self._pending, {}
+            try:
+                if self._journal_entries + len(pending) > max(self.compact_threshold, len(self._records)):
+                    # 快照与本批变更在同一时刻取得，日志中的记录都不晚于快照
+                    await asyncio.to_thread(self._write_snapshot, self.values(), self._generation + 1)
+                    self._generation += 1
+                    self._journal_entries = 0
+                else:
+                    lines = [
+                        json.dumps(
+                            {"op": "delete", "key": key, "gen": self._generation} if data is _DELETED
+                            else {"op": "put", "key": key, "data": data, "gen": self._generation},
+                            ensure_ascii=False
+                        )
+                        for key, data in pending.items()
+                    ]
+                    await asyncio.to_thread(self._append_journal, lines)
+                    self._journal_entries += len(lines)
+            except BaseException:
+                # 失败或被取消的变更放回，下一轮重试（期间的新变更优先）
+                for key, data in pending.items():
+                    self._pending.setdefault(key, data)
+                raise
+
+    def _append_journal(self, lines: List[str]) -> None:
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _write_snapshot(self, records: List[Dict[str, Any]], generation: int) -> None:
+        tmp_file = self.snapshot_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"generation": generation, "records": records}, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        # 快照已包含全部日志内容，此处崩溃时残留日志按代数跳过
+        with open(self.journal_file, 'w', encoding='utf-8'):
+            pass
+
+    async def close(self) -> None:
+        """落盘剩余变更并停止后台任务"""
+        if self._flusher is not None:
+            # 持锁取消，后台任务不会停在文件写入中途
+            async with self._flush_lock:
+                self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
@@ -5,10 +5,13 @@ Advanced Risk Management Service
 高级风险管理服务，提供VaR计算、压力测试、实时监控、自动控制等功能。
 """
 
+import asyncio
 import logging
 import math
 import numpy as np
-from typing import Dict, List, Optional, Any, Tuple
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from decimal import Decimal
 from dataclasses import dataclass, field
@@ -19,6 +22,8 @@ from ..entities.account_entity import Account
 from ..entities.order_entity import Order
 from ..entities.trade_entity import Trade
 from ..enums import Direction, OrderStatus, PositionStatus
+from .portfolio_risk_engine import PortfolioExposure, PortfolioRiskEngine
+from shared.risk.ewma_covariance import EwmaCovarianceEstimator
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +41,7 @@ class VaRMethod(Enum):
     HISTORICAL = "HISTORICAL"
     PARAMETRIC = "PARAMETRIC"
     MONTE_CARLO = "MONTE_CARLO"
+    EWMA = "EWMA"
 
 
 @dataclass
@@ -135,10 +141,18 @@ class RiskAlert:
 class AdvancedRiskService:
     """高级风险管理服务"""
     
-    def __init__(self):
-        self._price_history: Dict[str, List[Tuple[datetime, Decimal]]] = {}
-        self._correlation_matrix: Dict[str, Dict[str, float]] = {}
-        self._volatilities: Dict[str, float] = {}
+    def __init__(self, mc_chunk_bytes: int = 32 * 1024 * 1024, max_history_length: int = 1000,
+                 ewma_decay: float = 0.94, universe_capacity: int = 1024,
+                 price_interval: float = 86400.0):
+        self._price_history: Dict[str, Deque[Tuple[datetime, float]]] = {}
+        self._max_history_length = max_history_length
+        # 价格历史的周期长度（秒），同一周期内的价格只保留最新一个（即周期收盘价）
+        self._price_interval = price_interval
+        self._risk_engine = PortfolioRiskEngine(chunk_bytes=mc_chunk_bytes)
+        # 在线EWMA协方差，每个价格点增量更新，监控只读快照
+        self._covariance = EwmaCovarianceEstimator(
+            decay=ewma_decay, capacity=universe_capacity, sample_interval=price_interval
+        )
         self._stress_scenarios: Dict[str, StressTestScenario] = {}
         self._var_results: List[VaRResult] = []
         self._stress_results: List[StressTestResult] = []
@@ -152,8 +166,93 @@ class AdvancedRiskService:
             "max_single_position_ratio": Decimal("0.2"),  # 单一持仓不超过20%
             "max_sector_concentration": Decimal("0.4"),  # 行业集中度不超过40%
             "max_correlation_exposure": Decimal("0.6"),  # 相关性敞口不超过60%
+            "correlation_threshold": Decimal("0.7"),  # 视为高度相关的相关系数
         }
     
+    # ==================== 价格历史 ====================
+    
+    def record_price(self, symbol: str, price: Decimal, timestamp: Optional[datetime] = None) -> None:
+        """记录一个价格点，与上一点同周期时覆盖上一点，使历史保持每周期一个收盘价"""
+        history = self._price_history.get(symbol)
+        if history is None:
+            history = deque(maxlen=self._max_history_length)
+            self._price_history[symbol] = history
+        timestamp = timestamp or datetime.now()
+        if history and self._same_period(history[-1][0], timestamp):
+            history[-1] = (timestamp, float(price))
+        else:
+            history.append((timestamp, float(price)))
+        self._covariance.observe(symbol, float(price), timestamp)
+    
+    def _same_period(self, first: datetime, second: datetime) -> bool:
+        if self._price_interval <= 0:
+            return first == second
+        return first.timestamp() // self._price_interval == second.timestamp() // self._price_interval
+    
+    def on_market_data(self, market_data: Dict[str, Decimal], timestamp: Optional[datetime] = None) -> None:
+        """行情快照写入价格历史和EWMA协方差，同一快照共用一个时间戳"""
+        timestamp = timestamp or datetime.now()
+        for symbol, price in market_data.items():
+            if price:
+                self.record_price(symbol, price, timestamp)
+    
+    def update_price_history(self, symbol: str, history: List[Tuple[datetime, Decimal]]) -> None:
+        """整体替换某个合约的价格历史"""
+        self._price_history[symbol] = deque(
+            ((ts, float(price)) for ts, price in sorted(history, key=lambda item: item[0])),
+            maxlen=self._max_history_length
+        )
+    
+    def _build_returns_matrix(self, symbols: List[str], lookback_days: int) -> Optional[np.ndarray]:
+        """按尾部对齐各合约价格历史，生成 (T, N) 收益率矩阵；任一合约缺少数据时返回None"""
+        histories = [self._price_history.get(symbol) for symbol in symbols]
+        if not histories or any(not history for history in histories):
+            return None
+        
+        length = min(min(len(history) for history in histories), lookback_days + 1)
+        if length < 2:
+            return None
+        
+        prices = np.empty((length, len(symbols)), dtype=np.float64)
+        for column, history in enumerate(histories):
+            prices[:, column] = [price for _, price in islice(history, len(history) - length, None)]
+        return self._risk_engine.returns_from_prices(prices)
+    
+    def _portfolio_inputs(
+        self,
+        positions: List[Position],
+        lookback_days: int
+    ) -> Tuple[PortfolioExposure, np.ndarray]:
+        """构建组合敞口和对应的收益率矩阵"""
+        exposure = self._latest_exposure(positions)
+        returns = self._build_returns_matrix(exposure.symbols, lookback_days)
+        
+        if returns is None or returns.shape[0] < 30:
+            # 价格历史不足时退回模拟收益率（平均0.1%，标准差2%）
+            logger.debug("价格历史不足，使用模拟收益率")
+            returns = self._risk_engine.synthetic_returns(lookback_days, len(exposure.symbols))
+        
+        return exposure, returns
+    
+    def _latest_exposure(self, positions: List[Position]) -> PortfolioExposure:
+        """按最新价格构建组合敞口"""
+        latest_prices = {
+            symbol: history[-1][1]
+            for symbol, history in self._price_history.items()
+            if history
+        }
+        return self._risk_engine.build_exposure(positions, latest_prices)
+    
+    @staticmethod
+    def _active_portfolio_value(positions: List[Position]) -> Decimal:
+        """活跃持仓总价值"""
+        return sum(
+            (pos.total_volume * pos.long_avg_price
+             for pos in positions
+             if pos.status == PositionStatus.ACTIVE),
+            Decimal("0")
+        )
+    
     # ==================== VaR计算 ====================
     
     async def calculate_historical_var(
@@ -166,11 +265,7 @@ class AdvancedRiskService:
         """计算历史模拟VaR"""
         try:
             # 获取投资组合价值
-            portfolio_value = sum(
-                pos.total_volume * pos.long_avg_price 
-                for pos in positions 
-                if pos.status == PositionStatus.ACTIVE
-            )
+            portfolio_value = self._active_portfolio_value(positions)
             
             if portfolio_value == 0:
                 return VaRResult(
@@ -181,12 +276,10 @@ class AdvancedRiskService:
                     portfolio_value=portfolio_value
                 )
             
-            # 计算历史收益率
-            historical_returns = await self._calculate_portfolio_returns(
-                positions, lookback_days
-            )
+            # 组合历史损益 = 收益率矩阵 @ 敞口向量
+            exposure, returns = self._portfolio_inputs(positions, lookback_days)
             
-            if len(historical_returns) < 30:  # 需要足够的历史数据
+            if returns.shape[0] < 30:  # 需要足够的历史数据
                 logger.warning("历史数据不足，无法计算准确的VaR")
                 return VaRResult(
                     var_value=Decimal("0"),
@@ -196,32 +289,21 @@ class AdvancedRiskService:
                     portfolio_value=portfolio_value
                 )
             
-            # 排序并找到分位数
-            sorted_returns = sorted(historical_returns)
-            percentile_index = int((1 - confidence_level) * len(sorted_returns))
-            var_return = sorted_returns[percentile_index]
-            
-            # 计算VaR值
-            var_value = abs(portfolio_value * Decimal(str(var_return)) * Decimal(str(math.sqrt(time_horizon))))
-            
-            # 计算期望损失 (CVaR)
-            tail_returns = sorted_returns[:percentile_index + 1]
-            expected_shortfall = None
-            if tail_returns:
-                avg_tail_return = sum(tail_returns) / len(tail_returns)
-                expected_shortfall = abs(portfolio_value * Decimal(str(avg_tail_return)) * Decimal(str(math.sqrt(time_horizon))))
+            var, expected_shortfall = self._risk_engine.historical_var(
+                exposure, returns, confidence_level, time_horizon
+            )
             
             result = VaRResult(
-                var_value=var_value,
+                var_value=Decimal(str(round(var, 2))),
                 confidence_level=confidence_level,
                 time_horizon=time_horizon,
                 method=VaRMethod.HISTORICAL,
                 portfolio_value=portfolio_value,
-                expected_shortfall=expected_shortfall
+                expected_shortfall=Decimal(str(round(expected_shortfall, 2)))
             )
             
             self._var_results.append(result)
-            logger.info(f"历史模拟VaR计算完成: {float(var_value):.2f}")
+            logger.info(f"历史模拟VaR计算完成: {var:.2f}")
             
             return result
             
@@ -239,16 +321,13 @@ class AdvancedRiskService:
         self,
         positions: List[Position],
         confidence_level: float = 0.95,
-        time_horizon: int = 1
+        time_horizon: int = 1,
+        lookback_days: int = 252
     ) -> VaRResult:
         """计算参数VaR（假设正态分布）"""
         try:
             # 获取投资组合价值
-            portfolio_value = sum(
-                pos.total_volume * pos.long_avg_price 
-                for pos in positions 
-                if pos.status == PositionStatus.ACTIVE
-            )
+            portfolio_value = self._active_portfolio_value(positions)
             
             if portfolio_value == 0:
                 return VaRResult(
@@ -259,18 +338,18 @@ class AdvancedRiskService:
                     portfolio_value=portfolio_value
                 )
             
-            # 计算投资组合的预期收益率和标准差
-            expected_return, portfolio_std = await self._calculate_portfolio_stats(positions)
+            # 组合损益的均值和标准差 sqrt(wᵀΣw)
+            exposure, returns = self._portfolio_inputs(positions, lookback_days)
+            expected_pnl, pnl_std = self._risk_engine.parametric_stats(exposure, returns)
             
             # 计算Z分数
             z_score = self._get_z_score(confidence_level)
             
             # 计算VaR
-            var_return = expected_return - (z_score * portfolio_std)
-            var_value = abs(portfolio_value * Decimal(str(var_return)) * Decimal(str(math.sqrt(time_horizon))))
+            var = abs(expected_pnl - z_score * pnl_std) * math.sqrt(time_horizon)
             
             result = VaRResult(
-                var_value=var_value,
+                var_value=Decimal(str(round(var, 2))),
                 confidence_level=confidence_level,
                 time_horizon=time_horizon,
                 method=VaRMethod.PARAMETRIC,
@@ -278,7 +357,7 @@ class AdvancedRiskService:
             )
             
             self._var_results.append(result)
-            logger.info(f"参数VaR计算完成: {float(var_value):.2f}")
+            logger.info(f"参数VaR计算完成: {var:.2f}")
             
             return result
             
@@ -292,23 +371,59 @@ class AdvancedRiskService:
                 portfolio_value=Decimal("0")
             )
     
+    async def calculate_ewma_var(
+        self,
+        positions: List[Position],
+        confidence_level: float = 0.95,
+        time_horizon: int = 1
+    ) -> VaRResult:
+        """基于在线EWMA协方差快照的参数VaR，只读取持仓品种的子矩阵"""
+        try:
+            portfolio_value = self._active_portfolio_value(positions)
+            exposure = self._latest_exposure(positions)
+            
+            var = 0.0
+            if not exposure.is_empty:
+                pnl_std = self._covariance.portfolio_std(exposure.symbols, exposure.exposures)
+                var = self._get_z_score(confidence_level) * pnl_std * math.sqrt(time_horizon)
+            
+            result = VaRResult(
+                var_value=Decimal(str(round(var, 2))),
+                confidence_level=confidence_level,
+                time_horizon=time_horizon,
+                method=VaRMethod.EWMA,
+                portfolio_value=portfolio_value
+            )
+            
+            self._var_results.append(result)
+            logger.info(f"EWMA VaR计算完成: {var:.2f}")
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"EWMA VaR计算失败: {e}")
+            return VaRResult(
+                var_value=Decimal("0"),
+                confidence_level=confidence_level,
+                time_horizon=time_horizon,
+                method=VaRMethod.EWMA,
+                portfolio_value=Decimal("0")
+            )
+    
     async def calculate_monte_carlo_var(
         self,
         positions: List[Position],
         confidence_level: float = 0.95,
         time_horizon: int = 1,
-        simulations: int = 10000
+        simulations: int = 10000,
+        lookback_days: int = 252
     ) -> VaRResult:
         """计算蒙特卡洛VaR"""
         try:
             # 获取投资组合价值
-            portfolio_value = sum(
-                pos.total_volume * pos.long_avg_price 
-                for pos in positions 
-                if pos.status == PositionStatus.ACTIVE
-            )
+            portfolio_value = self._active_portfolio_value(positions)
             
-            if portfolio_value == 0:
+            if portfolio_value == 0 or simulations <= 0:
                 return VaRResult(
                     var_value=Decimal("0"),
                     confidence_level=confidence_level,
@@ -317,45 +432,24 @@ class AdvancedRiskService:
                     portfolio_value=portfolio_value
                 )
             
-            # 模拟投资组合收益率
-            simulated_returns = await self._monte_carlo_simulation(
-                positions, simulations, time_horizon
+            # 相关蒙特卡洛模拟，计算量大时放到线程中执行，避免阻塞事件循环
+            exposure, returns = self._portfolio_inputs(positions, lookback_days)
+            var, expected_shortfall = await asyncio.to_thread(
+                self._risk_engine.monte_carlo_var,
+                exposure, returns, confidence_level, time_horizon, simulations
             )
             
-            if not simulated_returns:
-                return VaRResult(
-                    var_value=Decimal("0"),
-                    confidence_level=confidence_level,
-                    time_horizon=time_horizon,
-                    method=VaRMethod.MONTE_CARLO,
-                    portfolio_value=portfolio_value
-                )
-            
-            # 计算VaR
-            sorted_returns = sorted(simulated_returns)
-            percentile_index = int((1 - confidence_level) * len(sorted_returns))
-            var_return = sorted_returns[percentile_index]
-            
-            var_value = abs(portfolio_value * Decimal(str(var_return)))
-            
-            # 计算期望损失
-            tail_returns = sorted_returns[:percentile_index + 1]
-            expected_shortfall = None
-            if tail_returns:
-                avg_tail_return = sum(tail_returns) / len(tail_returns)
-                expected_shortfall = abs(portfolio_value * Decimal(str(avg_tail_return)))
-            
             result = VaRResult(
-                var_value=var_value,
+                var_value=Decimal(str(round(var, 2))),
                 confidence_level=confidence_level,
                 time_horizon=time_horizon,
                 method=VaRMethod.MONTE_CARLO,
                 portfolio_value=portfolio_value,
-                expected_shortfall=expected_shortfall
+                expected_shortfall=Decimal(str(round(expected_shortfall, 2)))
             )
             
             self._var_results.append(result)
-            logger.info(f"蒙特卡洛VaR计算完成: {float(var_value):.2f}")
+            logger.info(f"蒙特卡洛VaR计算完成: {var:.2f}")
             
             return result
             
@@ -369,68 +463,6 @@ class AdvancedRiskService:
                 portfolio_value=Decimal("0")
             )
     
-    async def _calculate_portfolio_returns(
-        self,
-        positions: List[Position],
-        lookback_days: int
-    ) -> List[float]:
-        """计算投资组合历史收益率"""
-        try:
-            # 这里简化处理，实际应该从价格历史数据计算
-            # 模拟一些历史收益率数据
-            returns = []
-            for i in range(lookback_days):
-                # 生成模拟的日收益率
-                daily_return = np.random.normal(0.001, 0.02)  # 平均0.1%，标准差2%
-                returns.append(daily_return)
-            
-            return returns
-            
-        except Exception as e:
-            logger.error(f"投资组合收益率计算失败: {e}")
-            return []
-    
-    async def _calculate_portfolio_stats(
-        self,
-        positions: List[Position]
-    ) -> Tuple[float, float]:
-        """计算投资组合统计特征"""
-        try:
-            # 简化计算，实际应该考虑相关性矩阵
-            expected_return = 0.001  # 日预期收益率0.1%
-            portfolio_std = 0.02  # 日标准差2%
-            
-            return expected_return, portfolio_std
-            
-        except Exception as e:
-            logger.error(f"投资组合统计计算失败: {e}")
-            return 0.0, 0.0
-    
-    async def _monte_carlo_simulation(
-        self,
-        positions: List[Position],
-        simulations: int,
-        time_horizon: int
-    ) -> List[float]:
-        """蒙特卡洛模拟"""
-        try:
-            returns = []
-            
-            for _ in range(simulations):
-                # 模拟时间区间内的收益率
-                cumulative_return = 0
-                for _ in range(time_horizon):
-                    daily_return = np.random.normal(0.001, 0.02)
-                    cumulative_return += daily_return
-                
-                returns.append(cumulative_return)
-            
-            return returns
-            
-        except Exception as e:
-            logger.error(f"蒙特卡洛模拟失败: {e}")
-            return []
-    
     def _get_z_score(self, confidence_level: float) -> float:
         """获取正态分布Z分数"""
         z_scores = {
@@ -583,6 +615,9 @@ class AdvancedRiskService:
             if not self._monitoring_enabled:
                 return []
             
+            # 行情先进入价格历史，VaR使用真实收益率而非模拟收益率
+            self.on_market_data(market_data)
+            
             alerts = []
             
             # VaR监控
@@ -619,8 +654,12 @@ class AdvancedRiskService:
         alerts = []
         
         try:
-            # 计算当前VaR
-            var_result = await self.calculate_historical_var(positions)
+            # 计算当前VaR：协方差估计已覆盖全部持仓品种时读快照，否则退回历史模拟
+            symbols = {pos.symbol for pos in positions if pos.status == PositionStatus.ACTIVE}
+            if symbols and self._covariance.ready(list(symbols)):
+                var_result = await self.calculate_ewma_var(positions)
+            else:
+                var_result = await self.calculate_historical_var(positions)
             
             # 检查VaR限额
             max_var_ratio = self._default_limits["max_var_ratio"]
@@ -747,19 +786,32 @@ class AdvancedRiskService:
         alerts = []
         
         try:
-            # 简化的相关性风险检查
-            # 实际应该计算持仓之间的相关性
-            active_positions = [pos for pos in positions if pos.status == PositionStatus.ACTIVE]
+            # 按持仓方向调整后的相关系数超过阈值的持仓视为同一风险来源，
+            # 任一持仓的同源敞口占总敞口比例超过限额时告警
+            exposure = self._latest_exposure(positions)
+            if len(exposure.symbols) < 2 or exposure.gross_value <= 0:
+                return alerts
+            
+            weights = exposure.exposures
+            signed_corr = self._covariance.correlation(exposure.symbols) * np.outer(np.sign(weights), np.sign(weights))
+            threshold = float(self._default_limits["correlation_threshold"])
+            correlated_exposure = (signed_corr >= threshold) @ np.abs(weights)
+            ratios = correlated_exposure / exposure.gross_value
             
-            if len(active_positions) > 10:  # 持仓过于分散可能导致相关性风险
+            worst = int(ratios.argmax())
+            max_ratio = self._default_limits["max_correlation_exposure"]
+            if ratios[worst] > float(max_ratio):
+                cluster = signed_corr[worst] >= threshold
                 alert = RiskAlert(
                     alert_id=f"CORRELATION_RISK_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
                     alert_type="CORRELATION_RISK",
                     severity=RiskLevel.MEDIUM,
-                    message=f"持仓数量过多，可能存在相关性风险: {len(active_positions)} 个持仓",
+                    message=f"相关性敞口过高: {exposure.symbols[worst]} 同源敞口 {float(ratios[worst] * 100):.2f}%",
                     details={
-                        "position_count": len(active_positions),
-                        "symbols": [pos.symbol for pos in active_positions]
+                        "symbol": exposure.symbols[worst],
+                        "correlated_symbols": [sym for sym, hit in zip(exposure.symbols, cluster) if hit],
+                        "correlation_exposure_ratio": float(ratios[worst]),
+                        "limit_ratio": float(max_ratio)
                     }
                 )
                 alerts.append(alert)
@@ -1004,6 +1056,21 @@ class AdvancedRiskService:
             logger.error(f"获取风险告警失败: {e}")
             return []
     
+    async def get_correlation_snapshot(self, symbols: Optional[List[str]] = None) -> Dict[str, Any]:
+        """获取EWMA相关系数矩阵与波动率快照"""
+        try:
+            symbols = symbols or self._covariance.symbols
+            return {
+                "symbols": symbols,
+                "correlation": self._covariance.correlation(symbols).tolist(),
+                "volatility": self._covariance.volatility(symbols).tolist(),
+                "periods": self._covariance.periods
+            }
+            
+        except Exception as e:
+            logger.error(f"获取相关性快照失败: {e}")
+            return {}
+    
     async def get_risk_summary(self) -> Dict[str, Any]:
         """获取风险摘要"""
         try:
@@ -1018,6 +1085,8 @@ class AdvancedRiskService:
             return {
                 "monitoring_enabled": self._monitoring_enabled,
                 "latest_var": latest_var.to_dict() if latest_var else None,
+                "covariance_universe": len(self._covariance),
+                "covariance_periods": self._covariance.periods,
                 "total_stress_scenarios": len(self._stress_scenarios),
                 "total_stress_results": len(self._stress_results),
                 "unresolved_alerts": len(unresolved_alerts),
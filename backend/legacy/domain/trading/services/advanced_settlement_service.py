@@ -16,6 +16,10 @@ from collections import defaultdict
 from enum import Enum
 
 from .settlement_service import SettlementService, SettlementRecord, DailyReport
+from .settlement_executor import (
+    SettlementCheckpoint, SettlementExecutor, SettlementParams, SettlementShard,
+    ShardBuilder, UserSettlementResult, settle_shard
+)
 from ..entities.position_entity import Position
 from ..entities.account_entity import Account
 from ..entities.order_entity import Order
@@ -153,7 +157,7 @@ class SettlementSummary:
 class AdvancedSettlementService(SettlementService):
     """高级结算服务"""
     
-    def __init__(self):
+    def __init__(self, checkpoint_dir: Optional[str] = None, max_workers: Optional[int] = None):
         super().__init__()
         
         # 高级功能存储
@@ -162,10 +166,16 @@ class AdvancedSettlementService(SettlementService):
         self._settlement_summaries: Dict[str, SettlementSummary] = {}
         
         # 批处理配置
-        self._batch_size = 50  # 批处理大小
-        self._max_concurrent_settlements = 10  # 最大并发结算数
+        self._batch_size = 1000  # 每个进程分片的用户数
+        self._max_concurrent_settlements = 10  # 同时在进程池中计算的分片数
         self._settlement_timeout = 300  # 结算超时时间（秒）
         
+        # 进程池执行器与检查点目录（None时检查点仅保存在内存中，不可跨进程续跑）
+        self._executor = SettlementExecutor(max_workers, max_in_flight=self._max_concurrent_settlements)
+        self._checkpoint_dir = checkpoint_dir
+        self._checkpoints: Dict[str, SettlementCheckpoint] = {}
+        self._active_batches = 0  # 最后一个批次结束时释放进程池
+        
         # 风险监控配置
         self._risk_thresholds = {
             "max_daily_loss": Decimal("-50000"),  # 最大日亏损
@@ -203,6 +213,11 @@ class AdvancedSettlementService(SettlementService):
             
             self._settlement_batches[batch_id] = batch
             
+            # 立即写入检查点，批次在首个分片完成前崩溃也可续跑
+            checkpoint = SettlementCheckpoint(batch_id, settlement_date, user_ids, self._checkpoint_dir)
+            checkpoint.save()
+            self._checkpoints[batch_id] = checkpoint
+            
             logger.info(f"创建结算批次: {batch_id}, 用户数: {len(user_ids)}")
             
             return batch_id
@@ -211,62 +226,80 @@ class AdvancedSettlementService(SettlementService):
             logger.error(f"创建结算批次失败: {e}")
             raise
     
-    async def process_settlement_batch(self, batch_id: str) -> Dict[str, Any]:
-        """处理结算批次"""
+    async def process_settlement_batch(self, batch_id: str, resume: bool = False) -> Dict[str, Any]:
+        """
+        处理结算批次
+        
+        用户按分片在进程池中结算，结果按分片流式汇总并写入检查点；
+        resume=True时从检查点继续处理未完成或中断的批次，已成功的用户不再重复结算。
+        """
+        self._active_batches += 1
         try:
-            if batch_id not in self._settlement_batches:
-                raise ValueError(f"结算批次不存在: {batch_id}")
-            
-            batch = self._settlement_batches[batch_id]
+            batch = self._settlement_batches.get(batch_id)
+            checkpoint = self._checkpoints.get(batch_id)
+            
+            if resume and checkpoint is None:
+                checkpoint = SettlementCheckpoint.load(batch_id, self._checkpoint_dir)
+            
+            if batch is None:
+                if not (resume and checkpoint):
+                    raise ValueError(f"结算批次不存在: {batch_id}")
+                # 进程重启后由检查点恢复批次
+                batch = SettlementBatch(
+                    batch_id=batch_id,
+                    settlement_date=checkpoint.settlement_date,
+                    user_ids=checkpoint.user_ids,
+                    total_users=len(checkpoint.user_ids)
+                )
+                self._settlement_batches[batch_id] = batch
             
-            if batch.status != SettlementStatus.PENDING:
+            allowed = [SettlementStatus.PENDING]
+            if resume:
+                allowed += [SettlementStatus.PROCESSING, SettlementStatus.FAILED, SettlementStatus.COMPLETED]
+            if batch.status not in allowed:
                 raise ValueError(f"批次状态不允许处理: {batch.status}")
             
+            if checkpoint is None:
+                checkpoint = SettlementCheckpoint(
+                    batch_id, batch.settlement_date, batch.user_ids, self._checkpoint_dir
+                )
+            self._checkpoints[batch_id] = checkpoint
+            
             # 更新批次状态
             batch.status = SettlementStatus.PROCESSING
             batch.start_time = datetime.now()
+            batch.end_time = None
+            batch.error_message = None
             
-            logger.info(f"开始处理结算批次: {batch_id}")
-            
-            # 分批处理用户
-            user_batches = [
-                batch.user_ids[i:i + self._batch_size]
-                for i in range(0, len(batch.user_ids), self._batch_size)
-            ]
-            
-            # 并发处理批次
-            semaphore = asyncio.Semaphore(self._max_concurrent_settlements)
-            
-            async def process_user_batch(user_batch: List[str]):
-                async with semaphore:
-                    return await self._process_user_batch(batch.settlement_date, user_batch, batch_id)
+            pending_users = checkpoint.pending()
+            logger.info(f"开始处理结算批次: {batch_id}, 待结算用户: {len(pending_users)}")
             
-            # 执行批处理
-            results = await asyncio.gather(
-                *[process_user_batch(user_batch) for user_batch in user_batches],
-                return_exceptions=True
-            )
-            
-            # 汇总结果
-            total_processed = 0
-            failed_users = []
+            # 分片在进程池中计算，完成一个汇总一个
+            accounts: Dict[int, Dict[str, Account]] = {}
+            shards = self._iter_settlement_shards(batch.settlement_date, pending_users, accounts)
             
-            for result in results:
-                if isinstance(result, Exception):
-                    logger.error(f"批处理异常: {result}")
-                    failed_users.extend(batch.user_ids)  # 假设整批失败
-                else:
-                    total_processed += result["processed"]
-                    failed_users.extend(result["failed"])
+            async for shard, results in self._executor.run(shards, self._settlement_params()):
+                if batch.status == SettlementStatus.CANCELLED:
+                    break
+                
+                completed, failed = self._apply_shard_results(
+                    batch, shard, results, accounts.pop(shard.shard_id, {})
+                )
+                checkpoint.record(completed, failed)
+                checkpoint.save()
+                
+                batch.processed_users = len(checkpoint.completed)
+                batch.failed_users = list(checkpoint.failed)
             
-            # 更新批次状态
-            batch.processed_users = total_processed
-            batch.failed_users = failed_users
+            batch.processed_users = len(checkpoint.completed)
+            batch.failed_users = list(checkpoint.failed)
             batch.end_time = datetime.now()
             
-            if failed_users:
-                batch.status = SettlementStatus.FAILED if total_processed == 0 else SettlementStatus.COMPLETED
-                batch.error_message = f"部分用户处理失败: {len(failed_users)} 个"
+            if batch.status == SettlementStatus.CANCELLED:
+                logger.info(f"结算批次已取消，可从检查点续跑: {batch_id}")
+            elif batch.failed_users:
+                batch.status = SettlementStatus.FAILED if batch.processed_users == 0 else SettlementStatus.COMPLETED
+                batch.error_message = f"部分用户处理失败: {len(batch.failed_users)} 个"
             else:
                 batch.status = SettlementStatus.COMPLETED
             
@@ -281,7 +314,7 @@ class AdvancedSettlementService(SettlementService):
                 "processed_users": batch.processed_users,
                 "failed_users": len(batch.failed_users),
                 "duration_seconds": duration,
-                "throughput": batch.processed_users / duration if duration > 0 else 0
+                "throughput": len(pending_users) / duration if duration > 0 else 0
             }
             
         except Exception as e:
@@ -294,6 +327,93 @@ class AdvancedSettlementService(SettlementService):
             
             logger.error(f"处理结算批次失败: {e}")
             raise
+        
+        finally:
+            self._active_batches -= 1
+            if self._active_batches == 0:
+                # 批次之间不保留空闲子进程，下一批次按需重建进程池
+                await asyncio.to_thread(self._executor.shutdown)
+    
+    async def close(self) -> None:
+        """关闭结算服务，释放进程池"""
+        await asyncio.to_thread(self._executor.shutdown)
+    
+    async def resume_settlement_batch(self, batch_id: str) -> Dict[str, Any]:
+        """从检查点续跑结算批次"""
+        return await self.process_settlement_batch(batch_id, resume=True)
+    
+    async def _iter_settlement_shards(
+        self,
+        settlement_date: date,
+        user_ids: List[str],
+        accounts: Dict[int, Dict[str, Account]]
+    ):
+        """收集用户数据并按分片产出列式结算数据"""
+        for shard_id, start in enumerate(range(0, len(user_ids), self._batch_size)):
+            builder = self._new_shard_builder()
+            shard_accounts: Dict[str, Account] = {}
+            
+            for user_id in user_ids[start:start + self._batch_size]:
+                try:
+                    trades = await self._get_user_trades(user_id, settlement_date)
+                    positions = await self._get_user_positions(user_id, settlement_date)
+                    account = await self._get_user_account(user_id)
+                except Exception as e:
+                    logger.error(f"获取用户结算数据失败: {user_id}, {e}")
+                    builder.input_errors[user_id] = str(e)
+                    continue
+                
+                builder.add_user(user_id, trades, positions, account)
+                shard_accounts[user_id] = account
+            
+            accounts[shard_id] = shard_accounts
+            yield builder.build(shard_id)
+    
+    def _new_shard_builder(self) -> ShardBuilder:
+        """创建分片构建器，费率和保证金比例按品种在主进程中解析"""
+        return ShardBuilder(
+            product_of=self._get_product_type,
+            commission_rate_of=lambda symbol: self._commission_rates.get(
+                self._get_product_type(symbol), Decimal("0.0003")
+            ),
+            margin_ratio_of=self._get_margin_ratio
+        )
+    
+    def _settlement_params(self) -> SettlementParams:
+        """传入子进程的结算参数"""
+        return SettlementParams(
+            stamp_tax_rate=float(self._fee_rates.get("stamp_tax", Decimal("0"))),
+            transfer_fee_rate=float(self._fee_rates.get("transfer_fee", Decimal("0"))),
+            max_daily_loss=float(self._risk_thresholds["max_daily_loss"]),
+            max_position_concentration=self._risk_thresholds["max_position_concentration"],
+            max_leverage=self._risk_thresholds["max_leverage"],
+            min_margin_ratio=self._risk_thresholds["min_margin_ratio"]
+        )
+    
+    def _apply_shard_results(
+        self,
+        batch: SettlementBatch,
+        shard: SettlementShard,
+        results: List[UserSettlementResult],
+        accounts: Dict[str, Account]
+    ) -> Tuple[List[str], Dict[str, str]]:
+        """保存分片内各用户的结算记录，返回(成功用户, 失败用户->原因)"""
+        completed = []
+        failed = dict(shard.input_errors)
+        
+        for result in results:
+            if result.failed:
+                logger.error(f"用户结算失败: {result.user_id}, {result.error}")
+                failed[result.user_id] = result.error
+                continue
+            
+            record = self._build_advanced_record(result, batch.settlement_date)
+            record.batch_id = batch.batch_id
+            # 已入账的用户（检查点保存前崩溃后续跑）不再重复更新账户
+            self._store_settlement_result(record, accounts.get(result.user_id))
+            completed.append(result.user_id)
+        
+        return completed, failed
     
     async def get_batch_status(self, batch_id: str) -> Dict[str, Any]:
         """获取批次状态"""
@@ -341,42 +461,23 @@ class AdvancedSettlementService(SettlementService):
     ) -> AdvancedSettlementRecord:
         """高级日终结算"""
         try:
-            # 执行基础结算
-            basic_record = await self.daily_settlement(user_id, settlement_date)
-            
             # 获取详细交易数据
             trades = await self._get_user_trades(user_id, settlement_date)
             positions = await self._get_user_positions(user_id, settlement_date)
             account = await self._get_user_account(user_id)
             
-            # 创建高级结算记录
-            advanced_record = AdvancedSettlementRecord(
-                settlement_id=basic_record.settlement_id,
-                user_id=user_id,
-                settlement_date=settlement_date,
-                total_pnl=basic_record.total_pnl,
-                realized_pnl=basic_record.realized_pnl,
-                unrealized_pnl=basic_record.unrealized_pnl,
-                commission=basic_record.commission,
-                fees=basic_record.fees,
-                margin_used=basic_record.margin_used,
-                available_funds=basic_record.available_funds
-            )
-            
-            # 按产品分类计算
-            await self._calculate_product_breakdown(advanced_record, trades, positions)
+            # 单用户与批量结算使用同一套列式计算，在当前进程中执行
+            builder = self._new_shard_builder()
+            builder.add_user(user_id, trades, positions, account)
+            result = settle_shard(builder.build(0), self._settlement_params())[0]
+            if result.failed:
+                raise ValueError(result.error)
             
-            # 计算持仓汇总
-            advanced_record.position_summary = await self._calculate_position_summary(positions)
-            
-            # 风险分析
-            if include_risk_analysis:
-                advanced_record.risk_metrics = await self._calculate_risk_metrics(
-                    user_id, positions, account, trades
-                )
+            advanced_record = self._build_advanced_record(result, settlement_date)
+            if not include_risk_analysis:
+                advanced_record.risk_metrics = {}
             
-            # 保存高级记录
-            self._advanced_records[advanced_record.settlement_id] = advanced_record
+            self._store_settlement_result(advanced_record, account)
             
             logger.info(f"高级日终结算完成: {user_id}, {settlement_date}")
             
@@ -386,180 +487,71 @@ class AdvancedSettlementService(SettlementService):
             logger.error(f"高级日终结算失败: {e}")
             raise
     
-    async def _calculate_product_breakdown(
-        self,
-        record: AdvancedSettlementRecord,
-        trades: List[Trade],
-        positions: List[Position]
-    ):
-        """计算产品分类明细"""
-        try:
-            # 按产品类型分组
-            for trade in trades:
-                product_type = self._get_product_type(trade.symbol)
-                
-                # 计算盈亏
-                if product_type not in record.pnl_by_product:
-                    record.pnl_by_product[product_type] = Decimal("0")
-                    record.commission_by_product[product_type] = Decimal("0")
-                    record.fees_by_product[product_type] = Decimal("0")
-                    record.trade_count_by_product[product_type] = 0
-                
-                # 累计数据
-                record.pnl_by_product[product_type] += trade.total_amount
-                record.commission_by_product[product_type] += trade.commission
-                record.fees_by_product[product_type] += trade.fee
-                record.trade_count_by_product[product_type] += 1
-            
-            # 计算总计
-            record.total_commission = sum(record.commission_by_product.values())
-            record.total_fees = sum(record.fees_by_product.values())
-            
-        except Exception as e:
-            logger.error(f"计算产品分类明细失败: {e}")
-            raise
+    @staticmethod
+    def _to_decimal(value: float) -> Decimal:
+        """结算结果转换为两位小数的Decimal"""
+        return Decimal(repr(value)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
     
-    async def _calculate_position_summary(self, positions: List[Position]) -> Dict[str, Any]:
-        """计算持仓汇总"""
-        try:
-            summary = {
-                "total_positions": len(positions),
-                "long_positions": 0,
-                "short_positions": 0,
-                "total_market_value": Decimal("0"),
-                "total_unrealized_pnl": Decimal("0"),
-                "largest_position": None,
-                "product_distribution": defaultdict(int),
-                "concentration_risk": {}
-            }
-            
-            market_values = []
-            
-            for position in positions:
-                if position.direction == Direction.LONG:
-                    summary["long_positions"] += 1
-                else:
-                    summary["short_positions"] += 1
-                
-                market_value = position.volume * position.avg_price
-                summary["total_market_value"] += market_value
-                summary["total_unrealized_pnl"] += position.unrealized_pnl
-                
-                market_values.append((position.symbol, float(market_value)))
-                
-                # 产品分布
-                product_type = self._get_product_type(position.symbol)
-                summary["product_distribution"][product_type] += 1
-            
-            # 找出最大持仓
-            if market_values:
-                largest = max(market_values, key=lambda x: x[1])
-                summary["largest_position"] = {
-                    "symbol": largest[0],
-                    "market_value": largest[1]
-                }
-                
-                # 计算集中度风险
-                total_value = float(summary["total_market_value"])
-                if total_value > 0:
-                    concentration = largest[1] / total_value
-                    summary["concentration_risk"] = {
-                        "largest_position_ratio": concentration,
-                        "is_concentrated": concentration > self._risk_thresholds["max_position_concentration"]
-                    }
-            
-            # 转换为可序列化格式
-            summary["total_market_value"] = float(summary["total_market_value"])
-            summary["total_unrealized_pnl"] = float(summary["total_unrealized_pnl"])
-            summary["product_distribution"] = dict(summary["product_distribution"])
-            
-            return summary
-            
-        except Exception as e:
-            logger.error(f"计算持仓汇总失败: {e}")
-            return {}
+    def _build_advanced_record(
+        self,
+        result: UserSettlementResult,
+        settlement_date: date
+    ) -> AdvancedSettlementRecord:
+        """由列式计算结果生成高级结算记录"""
+        to_decimal = self._to_decimal
+        realized_pnl = to_decimal(result.realized_pnl)
+        unrealized_pnl = to_decimal(result.unrealized_pnl)
+        
+        record = AdvancedSettlementRecord(
+            settlement_id=f"STL_{settlement_date.strftime('%Y%m%d')}_{result.user_id}",
+            user_id=result.user_id,
+            settlement_date=settlement_date,
+            total_pnl=realized_pnl + unrealized_pnl,
+            realized_pnl=realized_pnl,
+            unrealized_pnl=unrealized_pnl,
+            commission=to_decimal(result.commission),
+            fees=to_decimal(result.fees),
+            margin_used=to_decimal(result.margin_used),
+            available_funds=to_decimal(result.available_funds),
+            position_summary=result.position_summary,
+            risk_metrics=result.risk_metrics
+        )
+        
+        # 按产品分类明细
+        for product_type, breakdown in result.product_breakdown.items():
+            record.pnl_by_product[product_type] = to_decimal(breakdown["pnl"])
+            record.commission_by_product[product_type] = to_decimal(breakdown["commission"])
+            record.fees_by_product[product_type] = to_decimal(breakdown["fees"])
+            record.trade_count_by_product[product_type] = breakdown["trade_count"]
+        
+        record.total_commission = sum(record.commission_by_product.values(), Decimal("0"))
+        record.total_fees = sum(record.fees_by_product.values(), Decimal("0"))
+        
+        return record
     
-    async def _calculate_risk_metrics(
+    def _store_settlement_result(
         self,
-        user_id: str,
-        positions: List[Position],
-        account: Account,
-        trades: List[Trade]
-    ) -> Dict[str, Any]:
-        """计算风险指标"""
-        try:
-            risk_metrics = {
-                "leverage_ratio": 0.0,
-                "margin_ratio": 0.0,
-                "concentration_risk": 0.0,
-                "daily_var": 0.0,
-                "max_drawdown": 0.0,
-                "volatility": 0.0,
-                "risk_alerts": []
-            }
-            
-            # 计算杠杆比例
-            total_market_value = sum(pos.volume * pos.avg_price for pos in positions)
-            if account.balance > 0:
-                risk_metrics["leverage_ratio"] = float(total_market_value / account.balance)
-            
-            # 计算保证金比例
-            if account.balance > 0:
-                risk_metrics["margin_ratio"] = float(account.available / account.balance)
-            
-            # 计算集中度风险
-            if total_market_value > 0:
-                max_position_value = max((pos.volume * pos.avg_price for pos in positions), default=Decimal("0"))
-                risk_metrics["concentration_risk"] = float(max_position_value / total_market_value)
-            
-            # 计算每日VaR（简化版）
-            daily_pnls = [float(trade.total_amount) for trade in trades]
-            if len(daily_pnls) > 1:
-                import statistics
-                risk_metrics["volatility"] = statistics.stdev(daily_pnls)
-                # 简化的VaR计算（95%置信度）
-                risk_metrics["daily_var"] = statistics.quantile(daily_pnls, 0.05) if len(daily_pnls) >= 20 else min(daily_pnls, default=0)
-            
-            # 生成风险告警
-            alerts = []
-            
-            if risk_metrics["leverage_ratio"] > self._risk_thresholds["max_leverage"]:
-                alerts.append({
-                    "type": "HIGH_LEVERAGE",
-                    "message": f"杠杆比例过高: {risk_metrics['leverage_ratio']:.2f}",
-                    "severity": "HIGH"
-                })
-            
-            if risk_metrics["margin_ratio"] < self._risk_thresholds["min_margin_ratio"]:
-                alerts.append({
-                    "type": "LOW_MARGIN",
-                    "message": f"保证金比例过低: {risk_metrics['margin_ratio']:.2%}",
-                    "severity": "CRITICAL"
-                })
-            
-            if risk_metrics["concentration_risk"] > self._risk_thresholds["max_position_concentration"]:
-                alerts.append({
-                    "type": "CONCENTRATION_RISK",
-                    "message": f"持仓集中度过高: {risk_metrics['concentration_risk']:.2%}",
-                    "severity": "MEDIUM"
-                })
-            
-            # 检查每日亏损
-            daily_pnl = sum(float(trade.total_amount) for trade in trades)
-            if daily_pnl < float(self._risk_thresholds["max_daily_loss"]):
-                alerts.append({
-                    "type": "DAILY_LOSS_LIMIT",
-                    "message": f"日亏损超过限额: {daily_pnl:.2f}",
-                    "severity": "CRITICAL"
-                })
-            
-            risk_metrics["risk_alerts"] = alerts
-            
-            return risk_metrics
-            
-        except Exception as e:
-            logger.error(f"计算风险指标失败: {e}")
-            return {}
+        record: AdvancedSettlementRecord,
+        account: Optional[Account]
+    ) -> bool:
+        """
+        保存结算记录并更新账户资金
+        
+        同一批次的同一结算记录只入账一次，返回是否实际入账。
+        """
+        existing = self._advanced_records.get(record.settlement_id)
+        if existing is not None and record.batch_id is not None and existing.batch_id == record.batch_id:
+            logger.info(f"结算记录已入账，跳过: {record.settlement_id}, 批次: {record.batch_id}")
+            return False
+        
+        if account is not None:
+            account.balance += record.realized_pnl - record.commission - record.fees
+            account.margin = record.margin_used
+            account.available = record.available_funds
+        
+        self._advanced_records[record.settlement_id] = record
+        self._settlement_records.setdefault(record.user_id, []).append(record)
+        return True
     
     # ==================== 高级报告生成 ====================
     
@@ -798,40 +790,6 @@ class AdvancedSettlementService(SettlementService):
         
         return active_users
     
-    async def _process_user_batch(
-        self,
-        settlement_date: date,
-        user_ids: List[str],
-        batch_id: str
-    ) -> Dict[str, Any]:
-        """处理用户批次"""
-        try:
-            processed = 0
-            failed = []
-            
-            for user_id in user_ids:
-                try:
-                    # 执行高级结算
-                    record = await self.advanced_daily_settlement(user_id, settlement_date)
-                    record.batch_id = batch_id
-                    processed += 1
-                    
-                except Exception as e:
-                    logger.error(f"用户结算失败: {user_id}, {e}")
-                    failed.append(user_id)
-            
-            return {
-                "processed": processed,
-                "failed": failed
-            }
-            
-        except Exception as e:
-            logger.error(f"处理用户批次失败: {e}")
-            return {
-                "processed": 0,
-                "failed": user_ids
-            }
-    
     async def _get_user_trades(self, user_id: str, settlement_date: date) -> List[Trade]:
         """获取用户交易记录"""
         # 模拟数据，实际应该从数据库查询
@@ -848,8 +806,7 @@ class AdvancedSettlementService(SettlementService):
                 volume=100,
                 price=Decimal("150.50"),
                 trade_time=datetime.now(),
-                commission=Decimal("5.00"),
-                fee=Decimal("1.00")
+                commission=Decimal("5.00")
             )
         ]
         return trades
@@ -862,10 +819,8 @@ class AdvancedSettlementService(SettlementService):
                 position_id="pos_001",
                 user_id=user_id,
                 symbol="AAPL",
-                direction=Direction.LONG,
-                volume=100,
-                avg_price=Decimal("150.00"),
-                current_price=Decimal("152.00"),
+                long_volume=100,
+                long_avg_price=Decimal("150.00"),
                 unrealized_pnl=Decimal("200.00")
             )
         ]
@@ -30,6 +30,13 @@ class OrderManagementService:
         self._contracts: Dict[str, Contract] = {}
         self._accounts: Dict[str, Account] = {}
         
+        # 二级索引（order_id -> Order，dict保持插入顺序），在创建和状态变更时增量维护
+        self._orders_by_user: Dict[str, Dict[str, Order]] = {}
+        self._orders_by_symbol: Dict[str, Dict[str, Order]] = {}
+        self._orders_by_status: Dict[OrderStatus, Dict[str, Order]] = {}
+        self._active_orders: Dict[str, Order] = {}
+        self._active_orders_by_user: Dict[str, Dict[str, Order]] = {}
+        
         # 统计信息
         self._statistics = {
             "total_orders": 0,
@@ -101,6 +108,7 @@ class OrderManagementService:
             
             # 保存订单
             self._orders[order.order_id] = order
+            self._index_order(order)
             self._update_statistics(order, "create")
             
             logger.info(f"创建订单成功: {order.order_id}, {symbol}, {direction.value}, {volume}")
@@ -216,7 +224,9 @@ class OrderManagementService:
             return False
         
         # 提交订单
+        old_status = order.status
         if order.submit():
+            self._reindex_status(order, old_status)
             self._update_statistics(order, "submit")
             logger.info(f"订单提交成功: {order_id}")
             return True
@@ -237,7 +247,9 @@ class OrderManagementService:
             return False
         
         # 撤销订单
+        old_status = order.status
         if order.cancel():
+            self._reindex_status(order, old_status)
             self._update_statistics(order, "cancel")
             logger.info(f"订单撤销成功: {order_id}")
             return True
@@ -253,7 +265,9 @@ class OrderManagementService:
         order = self._orders[order_id]
         
         # 拒绝订单
+        old_status = order.status
         if order.reject(reason):
+            self._reindex_status(order, old_status)
             self._update_statistics(order, "reject")
             logger.info(f"订单拒绝成功: {order_id}, 原因: {reason}")
             return True
@@ -269,23 +283,22 @@ class OrderManagementService:
     
     async def get_orders_by_user(self, user_id: str) -> List[Order]:
         """获取用户的订单"""
-        return [order for order in self._orders.values() if order.user_id == user_id]
+        return list(self._orders_by_user.get(user_id, {}).values())
     
     async def get_orders_by_symbol(self, symbol: str) -> List[Order]:
         """获取指定品种的订单"""
-        return [order for order in self._orders.values() if order.symbol == symbol]
+        return list(self._orders_by_symbol.get(symbol, {}).values())
     
     async def get_active_orders(self, user_id: str = "") -> List[Order]:
         """获取活跃订单"""
         if user_id:
-            return [order for order in self._orders.values() 
-                   if order.user_id == user_id and order.is_active()]
+            return list(self._active_orders_by_user.get(user_id, {}).values())
         else:
-            return [order for order in self._orders.values() if order.is_active()]
+            return list(self._active_orders.values())
     
     async def get_orders_by_status(self, status: OrderStatus) -> List[Order]:
         """根据状态获取订单"""
-        return [order for order in self._orders.values() if order.status == status]
+        return list(self._orders_by_status.get(status, {}).values())
     
     # ==================== 订单更新 ====================
     
@@ -307,8 +320,9 @@ class OrderManagementService:
             order.remark = remark
             order.update_time = datetime.now()
         
-        # 更新统计
+        # 更新索引和统计
         if old_status != order.status:
+            self._reindex_status(order, old_status)
             self._update_statistics(order, "status_change")
         
         return True
@@ -321,7 +335,10 @@ class OrderManagementService:
         order = self._orders[order_id]
         
         # 更新成交信息
+        old_status = order.status
         if order.update_trade(trade_volume, trade_price):
+            if old_status != order.status:
+                self._reindex_status(order, old_status)
             self._update_statistics(order, "trade")
             logger.info(f"订单成交更新: {order_id}, 数量: {trade_volume}, 价格: {trade_price}")
             return True
@@ -350,6 +367,48 @@ class OrderManagementService:
         """获取账户"""
         return self._accounts.get(account_id)
     
+    # ==================== 订单索引 ====================
+    
+    def _index_order(self, order: Order) -> None:
+        """新订单加入各二级索引"""
+        order_id = order.order_id
+        self._orders_by_user.setdefault(order.user_id, {})[order_id] = order
+        self._orders_by_symbol.setdefault(order.symbol, {})[order_id] = order
+        self._orders_by_status.setdefault(order.status, {})[order_id] = order
+        if order.is_active():
+            self._add_active(order)
+    
+    def _reindex_status(self, order: Order, old_status: OrderStatus) -> None:
+        """订单状态变更后迁移状态索引和活跃集合"""
+        order_id = order.order_id
+        old_bucket = self._orders_by_status.get(old_status)
+        if old_bucket is not None:
+            old_bucket.pop(order_id, None)
+            if not old_bucket:
+                del self._orders_by_status[old_status]
+        self._orders_by_status.setdefault(order.status, {})[order_id] = order
+        
+        if order.is_active():
+            self._add_active(order)
+        else:
+            self._remove_active(order)
+        self._statistics["active_orders"] = len(self._active_orders)
+    
+    def _add_active(self, order: Order) -> None:
+        """加入活跃集合"""
+        self._active_orders[order.order_id] = order
+        self._active_orders_by_user.setdefault(order.user_id, {})[order.order_id] = order
+    
+    def _remove_active(self, order: Order) -> None:
+        """移出活跃集合"""
+        if self._active_orders.pop(order.order_id, None) is None:
+            return
+        user_orders = self._active_orders_by_user.get(order.user_id)
+        if user_orders is not None:
+            user_orders.pop(order.order_id, None)
+            if not user_orders:
+                del self._active_orders_by_user[order.user_id]
+    
     # ==================== 统计信息 ====================
     
     def _update_statistics(self, order: Order, action: str) -> None:
@@ -360,24 +419,18 @@ class OrderManagementService:
             if order.price:
                 self._statistics["total_amount"] += order.get_total_amount()
         
-        elif action == "submit":
-            self._statistics["active_orders"] += 1
-        
         elif action == "cancel":
             self._statistics["cancelled_orders"] += 1
-            self._statistics["active_orders"] -= 1
         
         elif action == "reject":
             self._statistics["rejected_orders"] += 1
         
-        elif action == "trade":
-            # 成交后更新统计
-            pass
-        
         elif action == "status_change":
-            # 状态变更后更新统计
-            if order.status == OrderStatus.ALLTRADED:
-                self._statistics["active_orders"] -= 1
+            # 外部推送的撤单/拒单同样计入
+            if order.status == OrderStatus.CANCELLED:
+                self._statistics["cancelled_orders"] += 1
+            elif order.status == OrderStatus.REJECTED:
+                self._statistics["rejected_orders"] += 1
     
     async def get_order_statistics(self) -> Dict[str, Any]:
         """获取订单统计信息"""
@@ -396,5 +449,6 @@ class OrderManagementService:
     
     async def reset_daily_statistics(self) -> None:
         """重置每日统计信息"""
-        self._statistics["active_orders"] = 0
+        # 活跃订单数由活跃索引维护，日切时与索引保持一致
+        self._statistics["active_orders"] = len(self._active_orders)
         logger.info("每日订单统计已重置")
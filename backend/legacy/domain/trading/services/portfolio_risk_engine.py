@@ -0,0 +1,181 @@
+"""
+Portfolio Risk Engine
+=====================
+
+向量化的组合风险计算引擎，为AdvancedRiskService提供VaR/ES计算：
+- 由持仓和价格历史矩阵构建按持仓加权的组合收益
+- Cholesky相关蒙特卡洛，批量生成正态随机数，按字节预算分块控制内存
+- 基于np.partition的分位数与尾部期望，不做全量排序
+
+内部全部使用float64数组，Decimal转换只在服务层的结果边界进行。
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..entities.position_entity import Position
+from ..enums import PositionStatus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PortfolioExposure:
+    """组合敞口：按symbol对齐的带符号名义金额"""
+    symbols: List[str]
+    exposures: np.ndarray  # shape (N,), 净持仓 × 最新价格
+    gross_value: float
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.symbols) == 0
+
+
+class PortfolioRiskEngine:
+    """
+    组合风险引擎
+
+    Args:
+        chunk_bytes: 蒙特卡洛单批随机数矩阵 (路径数 × N) 的内存上限，每批路径数随品种数缩放
+        seed: 随机种子，便于复现
+        dtype: 随机数精度，float32可将内存和生成时间减半
+    """
+
+    def __init__(self, chunk_bytes: int = 32 * 1024 * 1024, seed: Optional[int] = None,
+                 dtype=np.float64):
+        self.chunk_bytes = chunk_bytes
+        self.dtype = dtype
+        self._rng = np.random.default_rng(seed)
+
+    def chunk_paths(self, n_assets: int) -> int:
+        """单批路径数：使 chunk × N 的随机数矩阵不超过字节预算"""
+        row_bytes = max(1, n_assets) * np.dtype(self.dtype).itemsize
+        return max(1, self.chunk_bytes // row_bytes)
+
+    # ==================== 输入构建 ====================
+
+    @staticmethod
+    def build_exposure(positions: Sequence[Position],
+                       prices: Optional[Dict[str, float]] = None) -> PortfolioExposure:
+        """按symbol汇总活跃持仓的带符号名义敞口"""
+        prices = prices or {}
+        net: Dict[str, float] = {}
+        gross = 0.0
+
+        for pos in positions:
+            if pos.status != PositionStatus.ACTIVE or pos.total_volume == 0:
+                continue
+            price = prices.get(pos.symbol)
+            if price is None:
+                price = float(pos.long_avg_price if pos.long_volume >= pos.short_volume else pos.short_avg_price)
+            net[pos.symbol] = net.get(pos.symbol, 0.0) + pos.net_volume * price
+            gross += pos.total_volume * price
+
+        symbols = list(net.keys())
+        return PortfolioExposure(
+            symbols=symbols,
+            exposures=np.fromiter((net[s] for s in symbols), dtype=np.float64, count=len(symbols)),
+            gross_value=gross
+        )
+
+    @staticmethod
+    def returns_from_prices(price_matrix: np.ndarray) -> np.ndarray:
+        """价格矩阵 (T+1, N) -> 简单收益率矩阵 (T, N)"""
+        prices = np.asarray(price_matrix, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = prices[1:] / prices[:-1] - 1.0
+        returns[~np.isfinite(returns)] = 0.0
+        return returns
+
+    def synthetic_returns(self, periods: int, n_assets: int,
+                          mean: float = 0.001, std: float = 0.02) -> np.ndarray:
+        """无价格历史时的模拟日收益率矩阵 (periods, N)"""
+        return self._rng.normal(mean, std, size=(periods, n_assets))
+
+    # ==================== 分位数 ====================
+
+    @staticmethod
+    def tail_metrics(pnl: np.ndarray, confidence_level: float) -> Tuple[float, float]:
+        """
+        损益样本 -> (VaR, ES)，均以正数表示损失
+
+        使用np.partition在O(n)内定位分位点，ES为分位点及以下样本的均值。
+        """
+        n = pnl.shape[0]
+        if n == 0:
+            return 0.0, 0.0
+
+        k = min(int((1 - confidence_level) * n), n - 1)
+        partitioned = np.partition(pnl, k)
+        var = -float(partitioned[k])
+        es = -float(partitioned[:k + 1].mean())
+        return max(var, 0.0), max(es, 0.0)
+
+    # ==================== VaR ====================
+
+    def historical_var(self, exposure: PortfolioExposure, returns: np.ndarray,
+                       confidence_level: float, time_horizon: int = 1) -> Tuple[float, float]:
+        """历史模拟：组合损益 = 收益率矩阵 @ 敞口向量"""
+        pnl = returns @ exposure.exposures
+        scale = np.sqrt(time_horizon)
+        var, es = self.tail_metrics(pnl, confidence_level)
+        return var * scale, es * scale
+
+    @staticmethod
+    def parametric_stats(exposure: PortfolioExposure, returns: np.ndarray) -> Tuple[float, float]:
+        """组合日损益的均值和标准差（考虑协方差）"""
+        w = exposure.exposures
+        mean = float(returns.mean(axis=0) @ w)
+        cov = np.atleast_2d(np.cov(returns, rowvar=False))
+        variance = float(w @ cov @ w)
+        return mean, float(np.sqrt(max(variance, 0.0)))
+
+    @staticmethod
+    def cholesky(cov: np.ndarray) -> np.ndarray:
+        """协方差矩阵的Cholesky分解，非正定时对特征值截断后重试"""
+        cov = np.atleast_2d(np.asarray(cov, dtype=np.float64))
+        try:
+            return np.linalg.cholesky(cov)
+        except np.linalg.LinAlgError:
+            eigenvalues, eigenvectors = np.linalg.eigh((cov + cov.T) / 2)
+            eigenvalues = np.clip(eigenvalues, 1e-12, None)
+            repaired = (eigenvectors * eigenvalues) @ eigenvectors.T
+            return np.linalg.cholesky(repaired)
+
+    def simulate_pnl(self, exposure: PortfolioExposure, mean: np.ndarray, cov: np.ndarray,
+                     paths: int, time_horizon: int = 1) -> np.ndarray:
+        """
+        相关蒙特卡洛：R = μh + √h · Z Lᵀ，组合损益 = R @ w
+
+        线性组合下 (Z Lᵀ) w = Z (Lᵀ w)，先把敞口投影到因子空间，
+        每批只需一次 (chunk × N) 正态抽样和一次矩阵-向量乘法。
+        """
+        w = exposure.exposures
+        lower = self.cholesky(cov)
+        loadings = (lower.T @ w) * np.sqrt(time_horizon)
+        drift = float(np.asarray(mean, dtype=np.float64) @ w) * time_horizon
+
+        n_assets = w.shape[0]
+        loadings = loadings.astype(self.dtype, copy=False)
+        pnl = np.empty(paths, dtype=np.float64)
+
+        chunk = self.chunk_paths(n_assets)
+        for start in range(0, paths, chunk):
+            stop = min(start + chunk, paths)
+            shocks = self._rng.standard_normal((stop - start, n_assets), dtype=self.dtype)
+            pnl[start:stop] = shocks @ loadings
+
+        pnl += drift
+        return pnl
+
+    def monte_carlo_var(self, exposure: PortfolioExposure, returns: np.ndarray,
+                        confidence_level: float, time_horizon: int = 1,
+                        paths: int = 10000) -> Tuple[float, float]:
+        """由历史收益率估计均值/协方差后做相关蒙特卡洛VaR"""
+        mean = returns.mean(axis=0)
+        cov = np.cov(returns, rowvar=False)
+        pnl = self.simulate_pnl(exposure, mean, cov, paths, time_horizon)
+        return self.tail_metrics(pnl, confidence_level)
@@ -0,0 +1,251 @@
+"""
+Position Book
+=============
+
+列式持仓簿，为PositionManagementService提供批量盯市：
+- 每个持仓占一行，数量、均价、乘数等按列存放在NumPy数组中
+- symbol映射到价格槽位，一次行情快照只更新槽位价格
+- 未实现盈亏、敞口、集中度均为整列向量运算
+- 盈亏与Position实体口径一致（价差 × 数量，不乘合约乘数）；
+  敞口为名义价值，乘以合约乘数
+
+内部使用float64，Decimal转换只在报表边界进行。
+"""
+
+import logging
+from decimal import Decimal
+from typing import Any, Dict, List, Mapping, Optional
+
+import numpy as np
+
+from ..entities.position_entity import Position
+from ..enums import PositionStatus
+
+logger = logging.getLogger(__name__)
+
+
+class PositionBook:
+    """
+    列式持仓簿
+
+    Args:
+        capacity: 初始行数，不足时按倍数扩容
+    """
+
+    _ROW_COLUMNS = (
+        "long_volume", "short_volume", "long_avg_price", "short_avg_price",
+        "realized_pnl", "multiplier", "unrealized_pnl"
+    )
+
+    def __init__(self, capacity: int = 1024):
+        self._capacity = 0
+        self._size = 0
+
+        self._rows: Dict[str, int] = {}
+        self._keys: List[str] = []
+
+        # symbol -> 价格槽位
+        self._slots: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._prices = np.full(16, np.nan)
+
+        self.long_volume = np.zeros(0)
+        self.short_volume = np.zeros(0)
+        self.long_avg_price = np.zeros(0)
+        self.short_avg_price = np.zeros(0)
+        self.realized_pnl = np.zeros(0)
+        self.multiplier = np.zeros(0)
+        self.unrealized_pnl = np.zeros(0)
+        self.price_slot = np.zeros(0, dtype=np.int32)
+        self.active = np.zeros(0, dtype=bool)
+        # 盯市后尚未回写到Position对象的行
+        self.dirty = np.zeros(0, dtype=bool)
+
+        self._grow(capacity)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, position_key: str) -> bool:
+        return position_key in self._rows
+
+    # ==================== 存储管理 ====================
+
+    def _grow(self, capacity: int) -> None:
+        """扩容所有列"""
+        size = self._size
+        for name in self._ROW_COLUMNS:
+            column = np.zeros(capacity)
+            column[:size] = getattr(self, name)[:size]
+            setattr(self, name, column)
+
+        for name, dtype in (("price_slot", np.int32), ("active", bool), ("dirty", bool)):
+            column = np.zeros(capacity, dtype=dtype)
+            column[:size] = getattr(self, name)[:size]
+            setattr(self, name, column)
+
+        self._capacity = capacity
+
+    def _slot_for(self, symbol: str) -> int:
+        """获取（或分配）symbol的价格槽位"""
+        slot = self._slots.get(symbol)
+        if slot is None:
+            slot = len(self._symbols)
+            self._slots[symbol] = slot
+            self._symbols.append(symbol)
+            if slot >= self._prices.shape[0]:
+                prices = np.full(self._prices.shape[0] * 2, np.nan)
+                prices[:slot] = self._prices[:slot]
+                self._prices = prices
+        return slot
+
+    # ==================== 行维护 ====================
+
+    def upsert(self, position_key: str, position: Position, multiplier: float = 1.0) -> None:
+        """写入（或覆盖）一个持仓行，成交、平仓等低频事件时调用"""
+        row = self._rows.get(position_key)
+        if row is None:
+            if self._size == self._capacity:
+                self._grow(self._capacity * 2)
+            row = self._size
+            self._size += 1
+            self._rows[position_key] = row
+            self._keys.append(position_key)
+            self.price_slot[row] = self._slot_for(position.symbol)
+
+        self.long_volume[row] = position.long_volume
+        self.short_volume[row] = position.short_volume
+        self.long_avg_price[row] = float(position.long_avg_price)
+        self.short_avg_price[row] = float(position.short_avg_price)
+        self.realized_pnl[row] = float(position.realized_pnl)
+        self.multiplier[row] = multiplier
+        self.active[row] = position.status == PositionStatus.ACTIVE
+
+        # 已有行情时立即按最新价重估该行
+        price = self._prices[self.price_slot[row]]
+        if self.active[row] and not np.isnan(price):
+            self.unrealized_pnl[row] = self._row_pnl(row, price)
+            self.dirty[row] = True
+        elif not self.active[row]:
+            self.unrealized_pnl[row] = 0.0
+            self.dirty[row] = False
+
+    def _row_pnl(self, row: int, price: float) -> float:
+        """单行未实现盈亏，与Position.calculate_pnl口径一致（按净方向计，不乘合约乘数）"""
+        long_volume = self.long_volume[row]
+        short_volume = self.short_volume[row]
+        if long_volume > short_volume:
+            pnl = (price - self.long_avg_price[row]) * long_volume
+        elif short_volume > long_volume:
+            pnl = (self.short_avg_price[row] - price) * short_volume
+        else:
+            pnl = 0.0
+        return float(pnl)
+
+    # ==================== 盯市 ====================
+
+    def mark(self, market_data: Mapping[str, Any]) -> int:
+        """
+        按行情快照批量重估未实现盈亏
+
+        Returns:
+            被重估的持仓行数
+        """
+        updated_slots = []
+        for symbol, price in market_data.items():
+            slot = self._slots.get(symbol)
+            if slot is not None and price is not None:
+                self._prices[slot] = float(price)
+                updated_slots.append(slot)
+
+        if not updated_slots or self._size == 0:
+            return 0
+
+        size = self._size
+        slot_updated = np.zeros(len(self._symbols), dtype=bool)
+        slot_updated[updated_slots] = True
+        mask = self.active[:size] & slot_updated[self.price_slot[:size]]
+
+        prices = self._prices[self.price_slot[:size]]
+        long_volume = self.long_volume[:size]
+        short_volume = self.short_volume[:size]
+        long_pnl = (prices - self.long_avg_price[:size]) * long_volume
+        short_pnl = (self.short_avg_price[:size] - prices) * short_volume
+        pnl = np.where(
+            long_volume > short_volume, long_pnl,
+            np.where(short_volume > long_volume, short_pnl, 0.0)
+        )
+
+        np.copyto(self.unrealized_pnl[:size], pnl, where=mask)
+        self.dirty[:size] |= mask
+        return int(mask.sum())
+
+    def sync(self, position_key: str, position: Position) -> None:
+        """将盯市结果回写到Position对象（报表边界的Decimal转换）"""
+        row = self._rows.get(position_key)
+        if row is None or not self.dirty[row]:
+            return
+
+        position.unrealized_pnl = Decimal(str(round(float(self.unrealized_pnl[row]), 6)))
+        position.total_pnl = position.unrealized_pnl + position.realized_pnl
+        position.daily_pnl = position.total_pnl
+        self.dirty[row] = False
+
+    def last_price(self, symbol: str) -> Optional[float]:
+        """symbol最近一次盯市价格"""
+        slot = self._slots.get(symbol)
+        if slot is None or np.isnan(self._prices[slot]):
+            return None
+        return float(self._prices[slot])
+
+    # ==================== 汇总 ====================
+
+    def total_unrealized_pnl(self) -> float:
+        """活跃持仓未实现盈亏合计"""
+        size = self._size
+        return float(self.unrealized_pnl[:size][self.active[:size]].sum())
+
+    def exposure_summary(self) -> Dict[str, Any]:
+        """
+        按最新价计算敞口与集中度
+
+        未取得行情的symbol按持仓均价估值。
+        """
+        size = self._size
+        if size == 0:
+            return {"gross_exposure": 0.0, "net_exposure": 0.0, "max_concentration": 0.0, "by_symbol": {}}
+
+        active = self.active[:size]
+        long_volume = np.where(active, self.long_volume[:size], 0.0)
+        short_volume = np.where(active, self.short_volume[:size], 0.0)
+        slots = self.price_slot[:size]
+        prices = self._prices[slots]
+        multiplier = self.multiplier[:size]
+
+        long_price = np.where(np.isnan(prices), self.long_avg_price[:size], prices)
+        short_price = np.where(np.isnan(prices), self.short_avg_price[:size], prices)
+        long_value = long_volume * long_price * multiplier
+        short_value = short_volume * short_price * multiplier
+
+        n_symbols = len(self._symbols)
+        symbol_gross = np.bincount(slots, weights=long_value + short_value, minlength=n_symbols)
+        symbol_net = np.bincount(slots, weights=long_value - short_value, minlength=n_symbols)
+
+        gross = float(symbol_gross.sum())
+        net = float(symbol_net.sum())
+        concentration = symbol_gross / gross if gross > 0 else np.zeros(n_symbols)
+
+        held = np.flatnonzero(symbol_gross)
+        return {
+            "gross_exposure": gross,
+            "net_exposure": net,
+            "max_concentration": float(concentration.max()) if held.size else 0.0,
+            "by_symbol": {
+                self._symbols[slot]: {
+                    "gross": float(symbol_gross[slot]),
+                    "net": float(symbol_net[slot]),
+                    "concentration": float(concentration[slot])
+                }
+                for slot in held
+            }
+        }
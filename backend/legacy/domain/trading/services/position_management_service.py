@@ -6,7 +6,7 @@ Position Management Service
 """
 
 import logging
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
 from decimal import Decimal
 
@@ -15,6 +15,7 @@ from ..entities.trade_entity import Trade
 from ..entities.contract_entity import Contract
 from ..enums import Direction, Offset, PositionStatus
 from ..constants import DEFAULT_MAX_POSITION_RATIO
+from .position_book import PositionBook
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +27,17 @@ class PositionManagementService:
         self._positions: Dict[str, Position] = {}
         self._contracts: Dict[str, Contract] = {}
         
+        # 二级索引（position_key -> Position），在创建和状态变更时增量维护
+        self._positions_by_user: Dict[str, Dict[str, Position]] = {}
+        self._positions_by_symbol: Dict[str, Dict[str, Position]] = {}
+        self._positions_by_status: Dict[PositionStatus, Dict[str, Position]] = {}
+        
+        # 每个活跃持仓对汇总统计的贡献 (多头量, 空头量, 已实现盈亏)
+        self._contributions: Dict[str, Tuple[int, int, Decimal]] = {}
+        
+        # 列式持仓簿，负责批量盯市；未实现盈亏在读取时回写到Position
+        self._book = PositionBook()
+        
         # 统计信息
         self._statistics = {
             "total_positions": 0,
@@ -65,6 +77,7 @@ class PositionManagementService:
             )
             
             self._positions[position_key] = position
+            self._index_position(position_key, position)
             self._update_statistics(position, "create")
             
             logger.info(f"创建持仓成功: {position_key}")
@@ -146,46 +159,47 @@ class PositionManagementService:
     async def get_position(self, symbol: str, exchange: str, user_id: str) -> Optional[Position]:
         """获取持仓"""
         position_key = self._get_position_key(symbol, exchange, user_id)
-        return self._positions.get(position_key)
+        position = self._positions.get(position_key)
+        if position is not None:
+            self._book.sync(position_key, position)
+        return position
     
     async def get_positions_by_user(self, user_id: str) -> List[Position]:
         """获取用户的持仓"""
-        return [pos for pos in self._positions.values() if pos.user_id == user_id]
+        return self._synced(self._positions_by_user.get(user_id, {}))
     
     async def get_positions_by_symbol(self, symbol: str) -> List[Position]:
         """获取指定品种的持仓"""
-        return [pos for pos in self._positions.values() if pos.symbol == symbol]
+        return self._synced(self._positions_by_symbol.get(symbol, {}))
     
     async def get_active_positions(self, user_id: str = "") -> List[Position]:
         """获取活跃持仓"""
         if user_id:
-            return [pos for pos in self._positions.values() 
-                   if pos.user_id == user_id and pos.status == PositionStatus.ACTIVE]
+            # 单个用户的持仓数量有限，在用户索引内过滤
+            return [pos for pos in self._synced(self._positions_by_user.get(user_id, {}))
+                   if pos.status == PositionStatus.ACTIVE]
         else:
-            return [pos for pos in self._positions.values() if pos.status == PositionStatus.ACTIVE]
+            return self._synced(self._positions_by_status.get(PositionStatus.ACTIVE, {}))
     
     async def get_positions_by_status(self, status: PositionStatus) -> List[Position]:
         """根据状态获取持仓"""
-        return [pos for pos in self._positions.values() if pos.status == status]
+        return self._synced(self._positions_by_status.get(status, {}))
+    
+    def _synced(self, positions: Dict[str, Position]) -> List[Position]:
+        """返回前将盯市结果回写到查询结果中的持仓"""
+        for position_key, position in positions.items():
+            self._book.sync(position_key, position)
+        return list(positions.values())
     
     # ==================== 持仓计算 ====================
     
     async def calculate_all_positions_pnl(self, market_data: Dict[str, Decimal]) -> None:
         """计算所有持仓的盈亏"""
         try:
-            for position in self._positions.values():
-                if position.status != PositionStatus.ACTIVE:
-                    continue
-                
-                # 获取当前市场价格
-                current_price = market_data.get(position.symbol)
-                if current_price is not None:
-                    position.calculate_pnl(current_price)
-            
-            # 更新统计
-            self._update_total_statistics()
+            # 整列向量化盯市，Position对象在被查询时才回写
+            marked = self._book.mark(market_data)
             
-            logger.info("所有持仓盈亏计算完成")
+            logger.debug(f"所有持仓盈亏计算完成: {marked}个持仓")
             
         except Exception as e:
             logger.error(f"持仓盈亏计算失败: {e}")
@@ -203,7 +217,9 @@ class PositionManagementService:
             if not position:
                 return None
             
-            position.calculate_pnl(current_price)
+            # 价格对同品种持仓同样有效，按品种盯市后回写该持仓
+            self._book.mark({symbol: current_price})
+            self._book.sync(self._get_position_key(symbol, exchange, user_id), position)
             return position.unrealized_pnl
             
         except Exception as e:
@@ -360,61 +376,86 @@ class PositionManagementService:
         contract_key = f"{symbol}.{exchange}"
         return self._contracts.get(contract_key)
     
+    def _get_multiplier(self, position: Position) -> float:
+        """合约乘数，未登记合约时按1计"""
+        contract = self._contracts.get(f"{position.symbol}.{position.exchange}")
+        return float(contract.size) if contract else 1.0
+    
     # ==================== 工具方法 ====================
     
     def _get_position_key(self, symbol: str, exchange: str, user_id: str) -> str:
         """获取持仓键"""
         return f"{symbol}.{exchange}.{user_id}"
     
+    def _index_position(self, position_key: str, position: Position) -> None:
+        """新持仓加入各二级索引"""
+        self._positions_by_user.setdefault(position.user_id, {})[position_key] = position
+        self._positions_by_symbol.setdefault(position.symbol, {})[position_key] = position
+        self._positions_by_status.setdefault(position.status, {})[position_key] = position
+    
+    def _reindex_status(self, position_key: str, position: Position, old_status: PositionStatus) -> None:
+        """持仓状态变更后迁移状态索引"""
+        old_bucket = self._positions_by_status.get(old_status)
+        if old_bucket is not None:
+            old_bucket.pop(position_key, None)
+            if not old_bucket:
+                del self._positions_by_status[old_status]
+        self._positions_by_status.setdefault(position.status, {})[position_key] = position
+    
     def _update_statistics(self, position: Position, action: str) -> None:
         """更新统计信息"""
+        position_key = self._get_position_key(position.symbol, position.exchange, position.user_id)
+        
         if action == "create":
             self._statistics["total_positions"] += 1
-            self._statistics["active_positions"] += 1
-        
-        elif action == "update":
-            # 更新持仓统计
-            self._update_total_statistics()
         
         elif action == "close":
-            self._statistics["active_positions"] -= 1
+            self._reindex_status(position_key, position, PositionStatus.ACTIVE)
+        
+        self._statistics["active_positions"] = len(
+            self._positions_by_status.get(PositionStatus.ACTIVE, {})
+        )
+        self._refresh_contribution(position_key, position)
+        self._book.upsert(position_key, position, self._get_multiplier(position))
     
-    def _update_total_statistics(self) -> None:
-        """更新总统计信息"""
-        try:
-            total_long_volume = 0
-            total_short_volume = 0
-            total_position_value = Decimal("0")
-            total_unrealized_pnl = Decimal("0")
-            total_realized_pnl = Decimal("0")
-            
-            for position in self._positions.values():
-                if position.status == PositionStatus.ACTIVE:
-                    total_long_volume += position.long_volume
-                    total_short_volume += position.short_volume
-                    total_position_value += position.total_volume
-                    total_unrealized_pnl += position.unrealized_pnl
-                    total_realized_pnl += position.realized_pnl
-            
-            self._statistics.update({
-                "total_long_volume": total_long_volume,
-                "total_short_volume": total_short_volume,
-                "total_position_value": total_position_value,
-                "total_unrealized_pnl": total_unrealized_pnl,
-                "total_realized_pnl": total_realized_pnl
-            })
-            
-        except Exception as e:
-            logger.error(f"统计信息更新失败: {e}")
+    def _refresh_contribution(self, position_key: str, position: Position) -> None:
+        """以差量方式更新单个持仓对汇总统计的贡献"""
+        if position.status == PositionStatus.ACTIVE:
+            current = (
+                position.long_volume,
+                position.short_volume,
+                position.realized_pnl
+            )
+        else:
+            current = (0, 0, Decimal("0"))
+        
+        previous = self._contributions.get(position_key, (0, 0, Decimal("0")))
+        if current == previous:
+            return
+        
+        statistics = self._statistics
+        long_delta = current[0] - previous[0]
+        short_delta = current[1] - previous[1]
+        statistics["total_long_volume"] += long_delta
+        statistics["total_short_volume"] += short_delta
+        statistics["total_position_value"] += long_delta + short_delta
+        statistics["total_realized_pnl"] += current[2] - previous[2]
+        
+        if position.status == PositionStatus.ACTIVE:
+            self._contributions[position_key] = current
+        else:
+            self._contributions.pop(position_key, None)
     
     # ==================== 统计信息 ====================
     
     async def get_position_statistics(self) -> Dict[str, Any]:
         """获取持仓统计信息"""
+        total_unrealized_pnl = self._book.total_unrealized_pnl()
+        self._statistics["total_unrealized_pnl"] = Decimal(str(round(total_unrealized_pnl, 6)))
         return {
             **self._statistics,
             "total_position_value": float(self._statistics["total_position_value"]),
-            "total_unrealized_pnl": float(self._statistics["total_unrealized_pnl"]),
+            "total_unrealized_pnl": total_unrealized_pnl,
             "total_realized_pnl": float(self._statistics["total_realized_pnl"]),
             "net_position_volume": (
                 self._statistics["total_long_volume"] - self._statistics["total_short_volume"]
@@ -425,6 +466,10 @@ class PositionManagementService:
             )
         }
     
+    async def get_exposure_summary(self) -> Dict[str, Any]:
+        """获取按最新价计算的敞口和品种集中度"""
+        return self._book.exposure_summary()
+    
     async def get_user_position_summary(self, user_id: str) -> Dict[str, Any]:
         """获取用户持仓摘要"""
         try:
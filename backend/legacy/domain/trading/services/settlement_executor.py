@@ -0,0 +1,571 @@
+"""
+Settlement Executor
+===================
+
+日终结算执行器，为AdvancedSettlementService提供批量结算：
+- 按用户分片，将成交、持仓、账户打包为列式数组
+- 分片在进程池中计算，按用户分组的汇总全部使用bincount等向量运算
+- 分片结果逐个流式返回，单个用户失败只影响该用户
+- 每完成一个分片写入检查点，进程崩溃后可从检查点续跑；
+  结算结果按(批次, 用户)幂等保存，检查点落后于结果时续跑不会重复入账
+"""
+
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..entities.account_entity import Account
+from ..entities.position_entity import Position
+from ..entities.trade_entity import Trade
+from ..enums import Direction, Offset, PositionStatus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SettlementParams:
+    """结算参数（传入子进程，只含基本类型）"""
+    stamp_tax_rate: float = 0.001
+    transfer_fee_rate: float = 0.00002
+    max_daily_loss: float = -50000.0
+    max_position_concentration: float = 0.3
+    max_leverage: float = 10.0
+    min_margin_ratio: float = 0.15
+
+
+@dataclass
+class SettlementShard:
+    """一个分片内所有用户的列式结算数据，成交和持仓按用户连续存放"""
+    shard_id: int
+    user_ids: List[str]
+
+    # 品种表
+    symbols: List[str]
+    products: List[str]
+    symbol_product: np.ndarray  # 品种 -> 产品类型下标
+    commission_rate: np.ndarray  # 品种 -> 手续费率
+    margin_ratio: np.ndarray  # 品种 -> 保证金比例
+
+    # 成交列
+    trade_user: np.ndarray
+    trade_symbol: np.ndarray
+    trade_amount: np.ndarray
+    trade_commission: np.ndarray  # 成交记录上的手续费
+    trade_is_close: np.ndarray
+    trade_is_short: np.ndarray
+
+    # 持仓列
+    position_user: np.ndarray
+    position_symbol: np.ndarray
+    position_long: np.ndarray
+    position_short: np.ndarray
+    position_price: np.ndarray  # 主方向持仓均价
+    position_unrealized: np.ndarray
+    position_active: np.ndarray
+
+    # 账户列
+    balance: np.ndarray
+    available: np.ndarray
+
+    # 收集数据阶段已失败的用户
+    input_errors: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class UserSettlementResult:
+    """单个用户的结算结果（float，由服务层转换为Decimal）"""
+    user_id: str
+    realized_pnl: float = 0.0
+    unrealized_pnl: float = 0.0
+    commission: float = 0.0
+    fees: float = 0.0
+    margin_used: float = 0.0
+    balance: float = 0.0
+    available_funds: float = 0.0
+    product_breakdown: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    position_summary: Dict[str, Any] = field(default_factory=dict)
+    risk_metrics: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+
+class ShardBuilder:
+    """将用户的成交、持仓、账户追加为列式分片"""
+
+    def __init__(
+        self,
+        product_of: Callable[[str], str],
+        commission_rate_of: Callable[[str], float],
+        margin_ratio_of: Callable[[str], float]
+    ):
+        self._product_of = product_of
+        self._commission_rate_of = commission_rate_of
+        self._margin_ratio_of = margin_ratio_of
+
+        self.user_ids: List[str] = []
+        self.input_errors: Dict[str, str] = {}
+
+        self._symbols: Dict[str, int] = {}
+        self._products: Dict[str, int] = {}
+        self._symbol_product: List[int] = []
+        self._commission_rate: List[float] = []
+        self._margin_ratio: List[float] = []
+
+        self._trades: Dict[str, list] = {name: [] for name in (
+            "user", "symbol", "amount", "commission", "is_close", "is_short"
+        )}
+        self._positions: Dict[str, list] = {name: [] for name in (
+            "user", "symbol", "long", "short", "price", "unrealized", "active"
+        )}
+        self._balance: List[float] = []
+        self._available: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def _symbol_index(self, symbol: str) -> int:
+        index = self._symbols.get(symbol)
+        if index is None:
+            product = self._product_of(symbol)
+            product_index = self._products.setdefault(product, len(self._products))
+            index = len(self._symbols)
+            self._symbols[symbol] = index
+            self._symbol_product.append(product_index)
+            self._commission_rate.append(float(self._commission_rate_of(symbol)))
+            self._margin_ratio.append(float(self._margin_ratio_of(symbol)))
+        return index
+
+    def add_user(self, user_id: str, trades: List[Trade], positions: List[Position], account: Account) -> None:
+        """追加一个用户"""
+        user = len(self.user_ids)
+        self.user_ids.append(user_id)
+
+        columns = self._trades
+        for trade in trades:
+            columns["user"].append(user)
+            columns["symbol"].append(self._symbol_index(trade.symbol))
+            columns["amount"].append(float(trade.get_amount()))
+            columns["commission"].append(float(trade.commission))
+            columns["is_close"].append(trade.offset != Offset.OPEN)
+            columns["is_short"].append(trade.direction == Direction.SHORT)
+
+        columns = self._positions
+        for position in positions:
+            columns["user"].append(user)
+            columns["symbol"].append(self._symbol_index(position.symbol))
+            columns["long"].append(position.long_volume)
+            columns["short"].append(position.short_volume)
+            columns["price"].append(float(
+                position.long_avg_price if position.long_volume >= position.short_volume
+                else position.short_avg_price
+            ))
+            columns["unrealized"].append(float(position.unrealized_pnl))
+            columns["active"].append(position.status == PositionStatus.ACTIVE)
+
+        self._balance.append(float(account.balance))
+        self._available.append(float(account.available))
+
+    def build(self, shard_id: int) -> SettlementShard:
+        """生成分片"""
+        trades = self._trades
+        positions = self._positions
+        return SettlementShard(
+            shard_id=shard_id,
+            user_ids=list(self.user_ids),
+            symbols=list(self._symbols),
+            products=list(self._products),
+            symbol_product=np.array(self._symbol_product, dtype=np.int64),
+            commission_rate=np.array(self._commission_rate, dtype=np.float64),
+            margin_ratio=np.array(self._margin_ratio, dtype=np.float64),
+            trade_user=np.array(trades["user"], dtype=np.int64),
+            trade_symbol=np.array(trades["symbol"], dtype=np.int64),
+            trade_amount=np.array(trades["amount"], dtype=np.float64),
+            trade_commission=np.array(trades["commission"], dtype=np.float64),
+            trade_is_close=np.array(trades["is_close"], dtype=bool),
+            trade_is_short=np.array(trades["is_short"], dtype=bool),
+            position_user=np.array(positions["user"], dtype=np.int64),
+            position_symbol=np.array(positions["symbol"], dtype=np.int64),
+            position_long=np.array(positions["long"], dtype=np.float64),
+            position_short=np.array(positions["short"], dtype=np.float64),
+            position_price=np.array(positions["price"], dtype=np.float64),
+            position_unrealized=np.array(positions["unrealized"], dtype=np.float64),
+            position_active=np.array(positions["active"], dtype=bool),
+            balance=np.array(self._balance, dtype=np.float64),
+            available=np.array(self._available, dtype=np.float64),
+            input_errors=dict(self.input_errors)
+        )
+
+
+def settle_shard(shard: SettlementShard, params: SettlementParams) -> List[UserSettlementResult]:
+    """
+    计算一个分片（在子进程中执行）
+
+    按用户、按(用户, 产品)分组的汇总均由bincount完成，
+    只有需要逐用户排序的波动率和VaR按成交偏移切片计算。
+    """
+    n_users = len(shard.user_ids)
+    n_products = max(len(shard.products), 1)
+
+    def by_user(index: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        return np.bincount(index, weights=weights, minlength=n_users).astype(np.float64)
+
+    def by_user_product(index: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        return np.bincount(
+            index, weights=weights, minlength=n_users * n_products
+        ).astype(np.float64).reshape(n_users, n_products)
+
+    # ---------- 成交 ----------
+    trade_user = shard.trade_user
+    amount = shard.trade_amount
+    trade_product = shard.symbol_product[shard.trade_symbol]
+    fee = amount * (params.transfer_fee_rate + params.stamp_tax_rate * shard.trade_is_short)
+
+    realized = by_user(trade_user, amount * shard.trade_is_close)
+    commission = by_user(trade_user, amount * shard.commission_rate[shard.trade_symbol])
+    fees = by_user(trade_user, fee)
+    turnover = by_user(trade_user, amount)
+
+    user_product = trade_user * n_products + trade_product
+    product_amount = by_user_product(user_product, amount)
+    product_commission = by_user_product(user_product, shard.trade_commission)
+    product_fees = by_user_product(user_product, fee)
+    product_count = by_user_product(user_product)
+
+    # 成交按用户连续存放，取每个用户的切片偏移
+    trade_offsets = np.searchsorted(trade_user, np.arange(n_users + 1))
+
+    # ---------- 持仓 ----------
+    position_user = shard.position_user
+    active = shard.position_active
+    volume = shard.position_long + shard.position_short
+    market_value = volume * shard.position_price
+    is_long = shard.position_long >= shard.position_short
+
+    margin = by_user(position_user, market_value * shard.margin_ratio[shard.position_symbol] * active)
+    unrealized = by_user(position_user, shard.position_unrealized * active)
+    total_market_value = by_user(position_user, market_value)
+    position_count = by_user(position_user)
+    long_count = by_user(position_user, is_long)
+    position_product = shard.symbol_product[shard.position_symbol]
+    product_distribution = by_user_product(position_user * n_products + position_product)
+
+    # 每个用户市值最大的持仓
+    order = np.lexsort((-market_value, position_user))
+    users_with_positions, first = np.unique(position_user[order], return_index=True)
+    largest_row = np.full(n_users, -1, dtype=np.int64)
+    largest_row[users_with_positions] = order[first]
+    if market_value.size:
+        largest_value = np.where(largest_row >= 0, market_value[np.maximum(largest_row, 0)], 0.0)
+    else:
+        largest_value = np.zeros(n_users)
+
+    # ---------- 账户 ----------
+    balance = shard.balance
+    new_balance = balance + realized - commission - fees
+    available_funds = new_balance - margin
+    positive = balance > 0
+    safe_balance = np.where(positive, balance, 1.0)
+    leverage = np.where(positive, total_market_value / safe_balance, 0.0)
+    margin_ratio = np.where(positive, shard.available / safe_balance, 0.0)
+    has_value = total_market_value > 0
+    concentration = np.where(has_value, largest_value / np.where(has_value, total_market_value, 1.0), 0.0)
+
+    results = []
+    for user, user_id in enumerate(shard.user_ids):
+        try:
+            results.append(UserSettlementResult(
+                user_id=user_id,
+                realized_pnl=float(realized[user]),
+                unrealized_pnl=float(unrealized[user]),
+                commission=float(commission[user]),
+                fees=float(fees[user]),
+                margin_used=float(margin[user]),
+                balance=float(new_balance[user]),
+                available_funds=float(available_funds[user]),
+                product_breakdown={
+                    shard.products[product]: {
+                        "pnl": float(product_amount[user, product]),
+                        "commission": float(product_commission[user, product]),
+                        "fees": float(product_fees[user, product]),
+                        "trade_count": int(product_count[user, product])
+                    }
+                    for product in np.flatnonzero(product_count[user])
+                },
+                position_summary=_position_summary(
+                    shard, params, user,
+                    int(position_count[user]), int(long_count[user]),
+                    float(total_market_value[user]), float(unrealized[user]),
+                    int(largest_row[user]), float(largest_value[user]),
+                    product_distribution[user]
+                ),
+                risk_metrics=_risk_metrics(
+                    params,
+                    amount[trade_offsets[user]:trade_offsets[user + 1]],
+                    float(leverage[user]), float(margin_ratio[user]),
+                    float(concentration[user]), float(turnover[user])
+                )
+            ))
+        except Exception as e:
+            results.append(UserSettlementResult(user_id=user_id, error=str(e)))
+
+    return results
+
+
+def _position_summary(
+    shard: SettlementShard,
+    params: SettlementParams,
+    user: int,
+    position_count: int,
+    long_count: int,
+    total_market_value: float,
+    total_unrealized_pnl: float,
+    largest_row: int,
+    largest_value: float,
+    product_distribution: np.ndarray
+) -> Dict[str, Any]:
+    """持仓汇总"""
+    summary = {
+        "total_positions": position_count,
+        "long_positions": long_count,
+        "short_positions": position_count - long_count,
+        "total_market_value": total_market_value,
+        "total_unrealized_pnl": total_unrealized_pnl,
+        "largest_position": None,
+        "product_distribution": {
+            shard.products[product]: int(product_distribution[product])
+            for product in np.flatnonzero(product_distribution)
+        },
+        "concentration_risk": {}
+    }
+
+    if largest_row >= 0:
+        summary["largest_position"] = {
+            "symbol": shard.symbols[shard.position_symbol[largest_row]],
+            "market_value": largest_value
+        }
+        if total_market_value > 0:
+            ratio = largest_value / total_market_value
+            summary["concentration_risk"] = {
+                "largest_position_ratio": ratio,
+                "is_concentrated": ratio > params.max_position_concentration
+            }
+
+    return summary
+
+
+def _risk_metrics(
+    params: SettlementParams,
+    trade_amounts: np.ndarray,
+    leverage: float,
+    margin_ratio: float,
+    concentration: float,
+    daily_pnl: float
+) -> Dict[str, Any]:
+    """风险指标与告警"""
+    risk_metrics = {
+        "leverage_ratio": leverage,
+        "margin_ratio": margin_ratio,
+        "concentration_risk": concentration,
+        "daily_var": 0.0,
+        "max_drawdown": 0.0,
+        "volatility": 0.0,
+        "risk_alerts": []
+    }
+
+    if trade_amounts.size > 1:
+        risk_metrics["volatility"] = float(trade_amounts.std(ddof=1))
+        # 简化的VaR计算（95%置信度）
+        risk_metrics["daily_var"] = float(
+            np.quantile(trade_amounts, 0.05) if trade_amounts.size >= 20 else trade_amounts.min()
+        )
+
+    alerts = []
+
+    if leverage > params.max_leverage:
+        alerts.append({
+            "type": "HIGH_LEVERAGE",
+            "message": f"杠杆比例过高: {leverage:.2f}",
+            "severity": "HIGH"
+        })
+
+    if margin_ratio < params.min_margin_ratio:
+        alerts.append({
+            "type": "LOW_MARGIN",
+            "message": f"保证金比例过低: {margin_ratio:.2%}",
+            "severity": "CRITICAL"
+        })
+
+    if concentration > params.max_position_concentration:
+        alerts.append({
+            "type": "CONCENTRATION_RISK",
+            "message": f"持仓集中度过高: {concentration:.2%}",
+            "severity": "MEDIUM"
+        })
+
+    if daily_pnl < params.max_daily_loss:
+        alerts.append({
+            "type": "DAILY_LOSS_LIMIT",
+            "message": f"日亏损超过限额: {daily_pnl:.2f}",
+            "severity": "CRITICAL"
+        })
+
+    risk_metrics["risk_alerts"] = alerts
+    return risk_metrics
+
+
+class SettlementCheckpoint:
+    """
+    结算批次检查点
+
+    记录批次的用户列表和已完成/失败的用户；指定目录时以JSON文件持久化，
+    写入先落临时文件再原子替换，崩溃时不会留下半个检查点。
+    """
+
+    def __init__(
+        self,
+        batch_id: str,
+        settlement_date: date,
+        user_ids: List[str],
+        directory: Optional[str] = None
+    ):
+        self.batch_id = batch_id
+        self.settlement_date = settlement_date
+        self.user_ids = user_ids
+        self.directory = directory
+        self.completed: Set[str] = set()
+        self.failed: Dict[str, str] = {}
+
+    @property
+    def path(self) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, f"{self.batch_id}.json")
+
+    def pending(self) -> List[str]:
+        """尚未成功结算的用户（失败用户续跑时重试）"""
+        return [user_id for user_id in self.user_ids if user_id not in self.completed]
+
+    def record(self, completed: List[str], failed: Dict[str, str]) -> None:
+        """登记一个分片的结果"""
+        self.completed.update(completed)
+        for user_id in completed:
+            self.failed.pop(user_id, None)
+        self.failed.update(failed)
+
+    def save(self) -> None:
+        """持久化检查点"""
+        path = self.path
+        if path is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "batch_id": self.batch_id,
+                "settlement_date": self.settlement_date.isoformat(),
+                "user_ids": self.user_ids,
+                "completed": sorted(self.completed),
+                "failed": self.failed
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, batch_id: str, directory: Optional[str]) -> Optional["SettlementCheckpoint"]:
+        """读取检查点，不存在时返回None"""
+        if not directory:
+            return None
+
+        path = os.path.join(directory, f"{batch_id}.json")
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        checkpoint = cls(
+            batch_id=data["batch_id"],
+            settlement_date=date.fromisoformat(data["settlement_date"]),
+            user_ids=data["user_ids"],
+            directory=directory
+        )
+        checkpoint.completed = set(data.get("completed", []))
+        checkpoint.failed = dict(data.get("failed", {}))
+        return checkpoint
+
+
+class SettlementExecutor:
+    """
+    进程池结算执行器
+
+    Args:
+        max_workers: 进程数，None为CPU核数，0表示在线程中执行（不启动子进程）
+        max_in_flight: 同时提交的分片数上限，限制内存中待处理的分片
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_in_flight: int = 4):
+        self.max_workers = max_workers
+        self.max_in_flight = max(1, max_in_flight)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_workers == 0:
+            return None
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def run(
+        self,
+        shards: AsyncIterator[SettlementShard],
+        params: SettlementParams
+    ) -> AsyncIterator[Tuple[SettlementShard, List[UserSettlementResult]]]:
+        """提交分片并按完成顺序流式返回结果"""
+        loop = asyncio.get_running_loop()
+        in_flight: Dict[asyncio.Future, SettlementShard] = {}
+
+        async for shard in shards:
+            future = loop.run_in_executor(self._get_pool(), settle_shard, shard, params)
+            in_flight[future] = shard
+
+            if len(in_flight) >= self.max_in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield self._collect(in_flight.pop(future), future)
+
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield self._collect(in_flight.pop(future), future)
+
+    def _collect(
+        self,
+        shard: SettlementShard,
+        future: asyncio.Future
+    ) -> Tuple[SettlementShard, List[UserSettlementResult]]:
+        """取分片结果，分片整体异常时只将该分片的用户标记为失败"""
+        try:
+            return shard, future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # 子进程崩溃后进程池不可再用，后续分片使用新的进程池
+                self._pool = None
+            logger.error(f"结算分片失败: {shard.shard_id}, {e}")
+            return shard, [UserSettlementResult(user_id=user_id, error=str(e)) for user_id in shard.user_ids]
+
+    def shutdown(self) -> None:
+        """关闭进程池，之后提交的分片会使用新的进程池"""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
@@ -10,14 +10,15 @@ import logging
 import time
 import json
 import pickle
-import hashlib
-from typing import Any, Dict, List, Optional, Union, Tuple
+import heapq
+from typing import Any, Dict, List, Optional, Set, Union, Tuple
 from datetime import datetime, timedelta
 from collections import OrderedDict
 from dataclasses import dataclass, field
 from enum import Enum
 import asyncio
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import redis
@@ -26,6 +27,8 @@ try:
 except ImportError:
     REDIS_AVAILABLE = False
 
+from .segment_log import SegmentLogStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -54,9 +57,12 @@ class CacheItem:
     access_count: int = 0
     ttl: Optional[int] = None  # 秒
     size: int = 0
+    expire_at: Optional[float] = None  # time.monotonic()时间戳
     
     def __post_init__(self):
-        """计算缓存项大小"""
+        """计算缓存项大小和过期时间"""
+        if self.ttl is not None and self.expire_at is None:
+            self.expire_at = time.monotonic() + self.ttl
         try:
             if isinstance(self.value, (str, bytes)):
                 self.size = len(self.value)
@@ -68,9 +74,9 @@ class CacheItem:
     
     def is_expired(self) -> bool:
         """检查是否过期"""
-        if self.ttl is None:
+        if self.expire_at is None:
             return False
-        return (datetime.now() - self.create_time).total_seconds() > self.ttl
+        return time.monotonic() >= self.expire_at
     
     def touch(self) -> None:
         """更新访问信息"""
@@ -108,7 +114,15 @@ class CacheStats:
 
 
 class L1MemoryCache:
-    """L1内存缓存"""
+    """
+    L1内存缓存
+    
+    所有操作均为O(1)（TTL清理为均摊O(log n)）：
+    - 内存占用随插入/删除增量维护
+    - LRU/FIFO依赖OrderedDict顺序，LFU使用频率桶
+    - 过期时间放入最小堆，写入时惰性清理已过期项
+    - 临界区内没有await，锁只保护同步代码段，跨线程调用同样安全
+    """
     
     def __init__(
         self,
@@ -123,31 +137,22 @@ class L1MemoryCache:
         self.default_ttl = default_ttl
         
         self._cache: OrderedDict[str, CacheItem] = OrderedDict()
-        self._lock = threading.RLock()
+        self._lock = threading.Lock()
         self._stats = CacheStats()
+        self._memory = 0
+        
+        # LFU频率桶：访问次数 -> 该频率下的键（按进入顺序）
+        self._freq_buckets: Dict[int, OrderedDict] = {}
+        self._min_freq = 0
+        
+        # 过期堆 (expire_at, seq, key, item)，item不再是当前值时视为已失效
+        self._expiry_heap: List[Tuple[float, int, str, CacheItem]] = []
+        self._expiry_seq = 0
     
     async def get(self, key: str) -> Optional[Any]:
         """获取缓存值"""
         with self._lock:
-            item = self._cache.get(key)
-            if item is None:
-                self._stats.misses += 1
-                return None
-            
-            if item.is_expired():
-                del self._cache[key]
-                self._stats.misses += 1
-                self._stats.evictions += 1
-                return None
-            
-            item.touch()
-            
-            # 更新LRU顺序
-            if self.eviction_policy == EvictionPolicy.LRU:
-                self._cache.move_to_end(key)
-            
-            self._stats.hits += 1
-            return item.value
+            return self._get(key, time.monotonic())
     
     async def set(
         self,
@@ -157,88 +162,185 @@ class L1MemoryCache:
     ) -> bool:
         """设置缓存值"""
         try:
+            item = CacheItem(key=key, value=value, ttl=ttl or self.default_ttl)
             with self._lock:
-                ttl = ttl or self.default_ttl
-                item = CacheItem(key=key, value=value, ttl=ttl)
-                
-                # 检查是否需要淘汰
-                await self._ensure_capacity(item.size)
-                
-                self._cache[key] = item
-                
-                # 更新统计
-                self._stats.item_count = len(self._cache)
-                self._stats.size = sum(item.size for item in self._cache.values())
-                
-                return True
+                return self._set(item, time.monotonic())
                 
         except Exception as e:
             logger.error(f"L1缓存设置失败: {e}")
             return False
     
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """批量获取，只返回命中的键"""
+        result = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                value = self._get(key, now)
+                if value is not None:
+                    result[key] = value
+        return result
+    
+    async def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """批量设置"""
+        try:
+            ttl = ttl or self.default_ttl
+            cache_items = [CacheItem(key=key, value=value, ttl=ttl) for key, value in items.items()]
+            with self._lock:
+                now = time.monotonic()
+                return all([self._set(item, now) for item in cache_items])
+                
+        except Exception as e:
+            logger.error(f"L1缓存批量设置失败: {e}")
+            return False
+    
     async def delete(self, key: str) -> bool:
         """删除缓存值"""
         with self._lock:
-            if key in self._cache:
-                del self._cache[key]
-                self._stats.item_count = len(self._cache)
-                self._stats.size = sum(item.size for item in self._cache.values())
-                return True
-            return False
+            return self._remove(key) is not None
     
     async def clear(self) -> None:
         """清空缓存"""
         with self._lock:
             self._cache.clear()
+            self._freq_buckets.clear()
+            self._expiry_heap.clear()
+            self._min_freq = 0
+            self._memory = 0
             self._stats = CacheStats()
     
-    async def _ensure_capacity(self, new_item_size: int) -> None:
-        """确保缓存容量"""
-        # 检查数量限制
-        while len(self._cache) >= self.max_size:
-            await self._evict_one()
+    # ==================== 同步内部操作（调用方持有锁） ====================
+    
+    def _get(self, key: str, now: float) -> Optional[Any]:
+        item = self._cache.get(key)
+        if item is None:
+            self._stats.misses += 1
+            return None
+        
+        if item.expire_at is not None and item.expire_at <= now:
+            self._remove(key)
+            self._stats.misses += 1
+            self._stats.evictions += 1
+            return None
         
-        # 检查内存限制
-        current_size = sum(item.size for item in self._cache.values())
-        while current_size + new_item_size > self.max_memory and self._cache:
-            await self._evict_one()
-            current_size = sum(item.size for item in self._cache.values())
+        if self.eviction_policy == EvictionPolicy.LFU:
+            self._bump_frequency(key, item.access_count + 1)
+        elif self.eviction_policy in (EvictionPolicy.LRU, EvictionPolicy.TTL):
+            self._cache.move_to_end(key)
+        
+        item.touch()
+        self._stats.hits += 1
+        return item.value
     
-    async def _evict_one(self) -> None:
+    def _set(self, item: CacheItem, now: float) -> bool:
+        if item.size > self.max_memory:
+            logger.warning(f"L1缓存项过大，跳过: {item.key}, {item.size}字节")
+            return False
+        
+        self._remove(item.key)
+        self._purge_expired(now)
+        
+        # 检查数量和内存限制
+        while self._cache and (
+            len(self._cache) >= self.max_size or
+            self._memory + item.size > self.max_memory
+        ):
+            self._evict_one(now)
+        
+        self._cache[item.key] = item
+        self._memory += item.size
+        
+        if self.eviction_policy == EvictionPolicy.LFU:
+            self._freq_buckets.setdefault(1, OrderedDict())[item.key] = None
+            self._min_freq = 1
+        
+        if item.expire_at is not None:
+            self._expiry_seq += 1
+            heapq.heappush(self._expiry_heap, (item.expire_at, self._expiry_seq, item.key, item))
+        
+        self._stats.item_count = len(self._cache)
+        self._stats.size = self._memory
+        return True
+    
+    def _remove(self, key: str) -> Optional[CacheItem]:
+        """移除缓存项并同步各索引，过期堆中的旧条目惰性清理"""
+        item = self._cache.pop(key, None)
+        if item is None:
+            return None
+        
+        self._memory -= item.size
+        
+        if self.eviction_policy == EvictionPolicy.LFU:
+            frequency = item.access_count + 1
+            bucket = self._freq_buckets.get(frequency)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self._freq_buckets[frequency]
+        
+        self._stats.item_count = len(self._cache)
+        self._stats.size = self._memory
+        return item
+    
+    def _bump_frequency(self, key: str, frequency: int) -> None:
+        """LFU访问计数+1，移动到下一个频率桶"""
+        bucket = self._freq_buckets.get(frequency)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._freq_buckets[frequency]
+                if self._min_freq == frequency:
+                    self._min_freq = frequency + 1
+        self._freq_buckets.setdefault(frequency + 1, OrderedDict())[key] = None
+    
+    def _purge_expired(self, now: float) -> None:
+        """弹出堆顶所有已过期条目"""
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, _, key, item = heapq.heappop(heap)
+            if self._cache.get(key) is item:
+                self._remove(key)
+                self._stats.evictions += 1
+        
+        # 覆盖写入和删除留下的失效条目过多时重建堆
+        if len(heap) > 2 * len(self._cache) + 1024:
+            self._expiry_heap = [entry for entry in heap if self._cache.get(entry[2]) is entry[3]]
+            heapq.heapify(self._expiry_heap)
+    
+    def _evict_one(self, now: float) -> None:
         """淘汰一个缓存项"""
         if not self._cache:
             return
         
-        if self.eviction_policy == EvictionPolicy.LRU:
-            # 移除最少使用的（最早的）
-            key, _ = self._cache.popitem(last=False)
-        elif self.eviction_policy == EvictionPolicy.LFU:
-            # 移除使用频率最低的
-            min_item = min(self._cache.values(), key=lambda x: x.access_count)
-            key = min_item.key
-            del self._cache[key]
+        key = None
+        if self.eviction_policy == EvictionPolicy.LFU:
+            # 移除使用频率最低的（同频率下最早进入的）
+            bucket = self._freq_buckets.get(self._min_freq)
+            if bucket is None and self._freq_buckets:
+                self._min_freq = min(self._freq_buckets)
+                bucket = self._freq_buckets[self._min_freq]
+            if bucket:
+                key = next(iter(bucket))
         elif self.eviction_policy == EvictionPolicy.TTL:
-            # 移除最早过期的
-            expired_items = [
-                (k, v) for k, v in self._cache.items() if v.is_expired()
-            ]
-            if expired_items:
-                key = expired_items[0][0]
-                del self._cache[key]
-            else:
-                # 如果没有过期项，使用LRU
-                key, _ = self._cache.popitem(last=False)
-        elif self.eviction_policy == EvictionPolicy.FIFO:
-            # 移除最早添加的
-            key, _ = self._cache.popitem(last=False)
+            # 移除最早过期的，没有设置TTL的项按LRU处理
+            heap = self._expiry_heap
+            while heap and self._cache.get(heap[0][2]) is not heap[0][3]:
+                heapq.heappop(heap)
+            if heap:
+                key = heapq.heappop(heap)[2]
+        
+        if key is None:
+            # LRU / FIFO：移除最早的
+            key = next(iter(self._cache))
         
+        self._remove(key)
         self._stats.evictions += 1
     
     def get_stats(self) -> CacheStats:
         """获取统计信息"""
         with self._lock:
             self._stats.item_count = len(self._cache)
-            self._stats.size = sum(item.size for item in self._cache.values())
+            self._stats.size = self._memory
             return self._stats
 
 
@@ -370,6 +472,53 @@ class L2RedisCache:
             logger.error(f"Redis设置失败: {e}")
             return False
     
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """批量获取（一次MGET），只返回命中的键"""
+        if not self._redis or not keys:
+            self._stats.misses += len(keys)
+            return {}
+        
+        try:
+            values = await self._redis.mget([self._get_full_key(key) for key in keys])
+            
+            result = {}
+            for key, value in zip(keys, values):
+                if value is not None:
+                    result[key] = self._deserialize(value)
+            
+            self._stats.hits += len(result)
+            self._stats.misses += len(keys) - len(result)
+            return result
+            
+        except Exception as e:
+            logger.error(f"Redis批量获取失败: {e}")
+            self._stats.misses += len(keys)
+            return {}
+    
+    async def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """批量设置（一次pipeline往返）"""
+        if not self._redis:
+            return False
+        if not items:
+            return True
+        
+        try:
+            ttl = ttl or self.default_ttl
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    full_key = self._get_full_key(key)
+                    if ttl:
+                        pipe.setex(full_key, ttl, self._serialize(value))
+                    else:
+                        pipe.set(full_key, self._serialize(value))
+                await pipe.execute()
+            
+            return True
+            
+        except Exception as e:
+            logger.error(f"Redis批量设置失败: {e}")
+            return False
+    
     async def delete(self, key: str) -> bool:
         """删除缓存值"""
         if not self._redis:
@@ -425,58 +574,102 @@ class L2RedisCache:
 
 
 class L3PersistentCache:
-    """L3持久化缓存"""
+    """
+    L3持久化缓存
+
+    基于追加写段日志(SegmentLogStore)：键值写入少量大段文件而非每键一个文件，
+    内存索引定位记录；所有磁盘I/O和序列化在专用线程池中执行，不阻塞事件循环；
+    后台任务定期压缩垃圾比例高的段。
+    """
     
     def __init__(
         self,
         cache_dir: str = "cache",
         max_files: int = 10000,
-        default_ttl: Optional[int] = 86400  # 24小时
+        default_ttl: Optional[int] = 86400,  # 24小时
+        segment_size: int = 64 * 1024 * 1024,
+        mmap_threshold: int = 64 * 1024,
+        compaction_interval: float = 300.0,
+        compaction_ratio: float = 0.5,
+        io_workers: int = 4
     ):
         self.cache_dir = cache_dir
+        # 兼容旧配置：max_files现为键数量上限
         self.max_files = max_files
         self.default_ttl = default_ttl
+        self.segment_size = segment_size
+        self.mmap_threshold = mmap_threshold
+        self.compaction_interval = compaction_interval
+        self.compaction_ratio = compaction_ratio
         
         self._stats = CacheStats()
-        self._ensure_cache_dir()
+        self._store: Optional[SegmentLogStore] = None
+        self.io_workers = io_workers
+        self._executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="l3-cache-io")
+        self._open_lock = asyncio.Lock()
+        self._compaction_task: Optional[asyncio.Task] = None
     
-    def _ensure_cache_dir(self) -> None:
-        """确保缓存目录存在"""
-        import os
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir, exist_ok=True)
+    async def _run_io(self, func, *args):
+        """在I/O线程池中执行阻塞调用"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
     
-    def _get_file_path(self, key: str) -> str:
-        """获取文件路径"""
-        import os
-        # 使用MD5哈希避免文件名过长或包含特殊字符
-        hash_key = hashlib.md5(key.encode()).hexdigest()
-        return os.path.join(self.cache_dir, f"{hash_key}.cache")
+    async def open(self) -> None:
+        """打开存储（扫描段文件重建索引）并启动后台压缩"""
+        if self._store is not None:
+            return
+        async with self._open_lock:
+            if self._store is not None:
+                return
+            self._store = await self._run_io(
+                SegmentLogStore, self.cache_dir, self.segment_size, self.mmap_threshold, self.max_files
+            )
+            if self.compaction_interval and self.compaction_interval > 0:
+                self._compaction_task = asyncio.create_task(self._compaction_loop())
+    
+    async def _compaction_loop(self) -> None:
+        """定期压缩段文件"""
+        while True:
+            try:
+                await asyncio.sleep(self.compaction_interval)
+                await self.compact()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"L3缓存压缩失败: {e}")
+    
+    async def compact(self) -> int:
+        """压缩垃圾比例超过阈值的段，返回回收字节数"""
+        await self.open()
+        return await self._run_io(self._store.compact, self.compaction_ratio)
+    
+    def _load(self, key: str) -> Optional[Any]:
+        data = self._store.get(key)
+        return None if data is None else pickle.loads(data)
+    
+    def _dump(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        self._store.put(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ttl)
+    
+    def _load_many(self, keys: List[str]) -> Dict[str, Any]:
+        return {key: pickle.loads(data) for key, data in self._store.get_many(keys).items()}
+    
+    def _dump_many(self, items: Dict[str, Any], ttl: Optional[int]) -> None:
+        self._store.put_many(
+            {key: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) for key, value in items.items()},
+            ttl
+        )
     
     async def get(self, key: str) -> Optional[Any]:
         """获取缓存值"""
         try:
-            import os
-            file_path = self._get_file_path(key)
+            await self.open()
+            value = await self._run_io(self._load, key)
             
-            if not os.path.exists(file_path):
+            if value is None:
                 self._stats.misses += 1
-                return None
-            
-            # 检查TTL
-            if self.default_ttl:
-                file_mtime = os.path.getmtime(file_path)
-                if time.time() - file_mtime > self.default_ttl:
-                    os.remove(file_path)
-                    self._stats.misses += 1
-                    self._stats.evictions += 1
-                    return None
-            
-            with open(file_path, 'rb') as f:
-                data = pickle.load(f)
-            
-            self._stats.hits += 1
-            return data
+            else:
+                self._stats.hits += 1
+            return value
             
         except Exception as e:
             logger.error(f"L3缓存获取失败: {e}")
@@ -491,32 +684,59 @@ class L3PersistentCache:
     ) -> bool:
         """设置缓存值"""
         try:
-            import os
-            
-            # 检查文件数量限制
-            await self._ensure_file_capacity()
-            
-            file_path = self._get_file_path(key)
+            await self.open()
+            await self._run_io(self._dump, key, value, ttl or self.default_ttl)
+            return True
             
-            with open(file_path, 'wb') as f:
-                pickle.dump(value, f)
+        except Exception as e:
+            logger.error(f"L3缓存设置失败: {e}")
+            return False
+    
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """批量获取，按I/O线程数分片并行读取，只返回命中的键"""
+        if not keys:
+            return {}
+        
+        try:
+            await self.open()
+            chunk_size = max(1, -(-len(keys) // self.io_workers))
+            chunks = await asyncio.gather(*(
+                self._run_io(self._load_many, keys[i:i + chunk_size])
+                for i in range(0, len(keys), chunk_size)
+            ))
+            
+            result = {}
+            for chunk in chunks:
+                result.update(chunk)
+            
+            self._stats.hits += len(result)
+            self._stats.misses += len(keys) - len(result)
+            return result
             
+        except Exception as e:
+            logger.error(f"L3缓存批量获取失败: {e}")
+            self._stats.misses += len(keys)
+            return {}
+    
+    async def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """批量设置，一次线程切换、一次加锁写入"""
+        if not items:
+            return True
+        
+        try:
+            await self.open()
+            await self._run_io(self._dump_many, items, ttl or self.default_ttl)
             return True
             
         except Exception as e:
-            logger.error(f"L3缓存设置失败: {e}")
+            logger.error(f"L3缓存批量设置失败: {e}")
             return False
     
     async def delete(self, key: str) -> bool:
         """删除缓存值"""
         try:
-            import os
-            file_path = self._get_file_path(key)
-            
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                return True
-            return False
+            await self.open()
+            return await self._run_io(self._store.delete, key)
             
         except Exception as e:
             logger.error(f"L3缓存删除失败: {e}")
@@ -525,51 +745,31 @@ class L3PersistentCache:
     async def clear(self) -> None:
         """清空缓存"""
         try:
-            import os
-            import glob
-            
-            cache_files = glob.glob(os.path.join(self.cache_dir, "*.cache"))
-            for file_path in cache_files:
-                os.remove(file_path)
+            await self.open()
+            await self._run_io(self._store.clear)
             
         except Exception as e:
             logger.error(f"L3缓存清空失败: {e}")
     
-    async def _ensure_file_capacity(self) -> None:
-        """确保文件容量"""
+    async def close(self) -> None:
+        """停止后台压缩并关闭段文件"""
         try:
-            import os
-            import glob
-            
-            cache_files = glob.glob(os.path.join(self.cache_dir, "*.cache"))
-            
-            if len(cache_files) >= self.max_files:
-                # 按修改时间排序，删除最旧的文件
-                cache_files.sort(key=lambda x: os.path.getmtime(x))
-                files_to_remove = cache_files[:len(cache_files) - self.max_files + 100]
-                
-                for file_path in files_to_remove:
-                    os.remove(file_path)
-                    self._stats.evictions += 1
+            if self._compaction_task:
+                self._compaction_task.cancel()
+                self._compaction_task = None
+            if self._store is not None:
+                await self._run_io(self._store.close)
+                self._store = None
             
         except Exception as e:
-            logger.error(f"L3缓存容量管理失败: {e}")
+            logger.error(f"L3缓存关闭失败: {e}")
     
     def get_stats(self) -> CacheStats:
         """获取统计信息"""
-        try:
-            import os
-            import glob
-            
-            cache_files = glob.glob(os.path.join(self.cache_dir, "*.cache"))
-            
-            self._stats.item_count = len(cache_files)
-            self._stats.size = sum(
-                os.path.getsize(f) for f in cache_files if os.path.exists(f)
-            )
-            
-        except Exception as e:
-            logger.error(f"L3缓存统计失败: {e}")
+        if self._store is not None:
+            self._stats.item_count = len(self._store)
+            self._stats.size = self._store.live_bytes
+            self._stats.evictions = self._store.evicted
         
         return self._stats
 
@@ -600,6 +800,10 @@ class MultiLevelCache:
         
         self._enabled_levels = [CacheLevel.L1_MEMORY, CacheLevel.L2_REDIS, CacheLevel.L3_PERSISTENT]
         self._warmup_keys: List[str] = []
+        
+        # 单飞：正在从下层加载的键 -> 结果future
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._write_back_tasks: Set[asyncio.Task] = set()
     
     async def initialize(self) -> None:
         """初始化缓存系统"""
@@ -610,6 +814,8 @@ class MultiLevelCache:
                 logger.warning("L2 Redis缓存不可用")
                 self._enabled_levels.remove(CacheLevel.L2_REDIS)
             
+            await self.l3_cache.open()
+            
             logger.info(f"多级缓存系统初始化完成，启用级别: {[level.value for level in self._enabled_levels]}")
             
         except Exception as e:
@@ -625,32 +831,105 @@ class MultiLevelCache:
                 if value is not None:
                     return value
             
-            # L2缓存
-            if CacheLevel.L2_REDIS in self._enabled_levels:
-                value = await self.l2_cache.get(key)
-                if value is not None:
-                    # 回写到L1
-                    if CacheLevel.L1_MEMORY in self._enabled_levels:
-                        await self.l1_cache.set(key, value)
-                    return value
-            
-            # L3缓存
-            if CacheLevel.L3_PERSISTENT in self._enabled_levels:
-                value = await self.l3_cache.get(key)
-                if value is not None:
-                    # 回写到L1和L2
-                    if CacheLevel.L1_MEMORY in self._enabled_levels:
-                        await self.l1_cache.set(key, value)
-                    if CacheLevel.L2_REDIS in self._enabled_levels:
-                        await self.l2_cache.set(key, value)
-                    return value
-            
-            return None
+            loaded = await self._load_shared([key])
+            return loaded.get(key)
             
         except Exception as e:
             logger.error(f"多级缓存获取失败: {e}")
             return None
     
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        批量获取，每一级只做一次批量查询（L1加锁一次、L2一次MGET、L3并行分片读取）
+        
+        Returns:
+            命中的键值，未命中的键不出现在结果中
+        """
+        try:
+            keys = list(dict.fromkeys(keys))
+            result: Dict[str, Any] = {}
+            
+            if CacheLevel.L1_MEMORY in self._enabled_levels:
+                result = await self.l1_cache.get_many(keys)
+            
+            missing = [key for key in keys if key not in result]
+            if missing:
+                result.update(await self._load_shared(missing))
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"多级缓存批量获取失败: {e}")
+            return {}
+    
+    async def _load_shared(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        单飞加载：同一键同一时刻只有一个协程穿透到L2/L3，
+        其余并发调用等待其结果
+        """
+        loop = asyncio.get_running_loop()
+        owned: List[str] = []
+        waiting: Dict[str, asyncio.Future] = {}
+        for key in keys:
+            future = self._inflight.get(key)
+            if future is None:
+                self._inflight[key] = loop.create_future()
+                owned.append(key)
+            else:
+                waiting[key] = future
+        
+        result: Dict[str, Any] = {}
+        if owned:
+            loaded: Dict[str, Any] = {}
+            try:
+                loaded = await self._load_lower(owned)
+                result.update(loaded)
+            finally:
+                # 加载失败或被取消时等待方视为未命中
+                for key in owned:
+                    future = self._inflight.pop(key)
+                    if not future.done():
+                        future.set_result(loaded.get(key))
+        
+        if waiting:
+            # shield：某个等待方被取消时不影响共享的future
+            values = await asyncio.gather(*(asyncio.shield(future) for future in waiting.values()))
+            for key, value in zip(waiting, values):
+                if value is not None:
+                    result[key] = value
+        
+        return result
+    
+    async def _load_lower(self, keys: List[str]) -> Dict[str, Any]:
+        """从L2、L3批量加载，命中值回写到上层"""
+        found: Dict[str, Any] = {}
+        remaining = keys
+        
+        # L2缓存
+        if CacheLevel.L2_REDIS in self._enabled_levels:
+            found.update(await self.l2_cache.get_many(remaining))
+            remaining = [key for key in remaining if key not in found]
+        
+        # L3缓存
+        l3_hits: Dict[str, Any] = {}
+        if remaining and CacheLevel.L3_PERSISTENT in self._enabled_levels:
+            l3_hits = await self.l3_cache.get_many(remaining)
+            found.update(l3_hits)
+        
+        # 回写：L1为内存操作直接写入，L2回写放到后台任务，不阻塞本次读取
+        if found and CacheLevel.L1_MEMORY in self._enabled_levels:
+            await self.l1_cache.set_many(found)
+        if l3_hits and CacheLevel.L2_REDIS in self._enabled_levels:
+            self._schedule_write_back(self.l2_cache.set_many(l3_hits))
+        
+        return found
+    
+    def _schedule_write_back(self, coro) -> None:
+        """后台执行回写，保留任务引用直到完成"""
+        task = asyncio.create_task(coro)
+        self._write_back_tasks.add(task)
+        task.add_done_callback(self._write_back_tasks.discard)
+    
     async def set(
         self,
         key: str,
@@ -682,6 +961,35 @@ class MultiLevelCache:
             logger.error(f"多级缓存设置失败: {e}")
             return False
     
+    async def set_many(
+        self,
+        items: Dict[str, Any],
+        ttl: Optional[int] = None,
+        levels: Optional[List[CacheLevel]] = None
+    ) -> bool:
+        """批量设置，各级并行写入，每级一次批量操作"""
+        if not items:
+            return True
+        
+        try:
+            levels = levels or self._enabled_levels
+            level_caches = (
+                (CacheLevel.L1_MEMORY, self.l1_cache),
+                (CacheLevel.L2_REDIS, self.l2_cache),
+                (CacheLevel.L3_PERSISTENT, self.l3_cache)
+            )
+            
+            results = await asyncio.gather(*(
+                cache.set_many(items, ttl)
+                for level, cache in level_caches
+                if level in levels and level in self._enabled_levels
+            ))
+            return all(results)
+            
+        except Exception as e:
+            logger.error(f"多级缓存批量设置失败: {e}")
+            return False
+    
     async def delete(self, key: str) -> bool:
         """删除缓存值"""
         try:
@@ -723,8 +1031,19 @@ class MultiLevelCache:
         except Exception as e:
             logger.error(f"多级缓存清空失败: {e}")
     
-    async def warmup(self, keys: List[str], data_loader = None) -> None:
-        """缓存预热"""
+    async def warmup(
+        self,
+        keys: List[str],
+        data_loader = None,
+        batch_size: int = 100,
+        concurrency: int = 4
+    ) -> None:
+        """
+        缓存预热
+        
+        按batch_size分批，最多concurrency批并行：每批一次get_many检查已有数据，
+        缺失的键并发调用data_loader加载后一次set_many写入。
+        """
         try:
             if not data_loader:
                 logger.warning("缓存预热需要提供数据加载器")
@@ -732,27 +1051,40 @@ class MultiLevelCache:
             
             logger.info(f"开始缓存预热，键数量: {len(keys)}")
             
-            for key in keys:
-                # 检查是否已存在
-                value = await self.get(key)
-                if value is None:
-                    # 加载数据
-                    try:
-                        if asyncio.iscoroutinefunction(data_loader):
-                            value = await data_loader(key)
-                        else:
-                            value = data_loader(key)
-                        
-                        if value is not None:
-                            await self.set(key, value)
-                    except Exception as e:
-                        logger.error(f"预热键 {key} 失败: {e}")
-            
-            logger.info("缓存预热完成")
+            semaphore = asyncio.Semaphore(concurrency)
+            
+            async def warm_batch(batch: List[str]) -> int:
+                async with semaphore:
+                    cached = await self.get_many(batch)
+                    missing = [key for key in batch if key not in cached]
+                    if not missing:
+                        return 0
+                    
+                    values = await asyncio.gather(*(self._load_for_warmup(data_loader, key) for key in missing))
+                    loaded = {key: value for key, value in zip(missing, values) if value is not None}
+                    if loaded:
+                        await self.set_many(loaded)
+                    return len(loaded)
+            
+            counts = await asyncio.gather(*(
+                warm_batch(keys[i:i + batch_size]) for i in range(0, len(keys), batch_size)
+            ))
+            
+            logger.info(f"缓存预热完成，加载 {sum(counts)} 个键")
             
         except Exception as e:
             logger.error(f"缓存预热失败: {e}")
     
+    async def _load_for_warmup(self, data_loader, key: str) -> Optional[Any]:
+        """调用数据加载器，单个键失败不影响整批"""
+        try:
+            if asyncio.iscoroutinefunction(data_loader):
+                return await data_loader(key)
+            return data_loader(key)
+        except Exception as e:
+            logger.error(f"预热键 {key} 失败: {e}")
+            return None
+    
     async def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
         try:
@@ -788,7 +1120,12 @@ class MultiLevelCache:
     async def shutdown(self) -> None:
         """关闭缓存系统"""
         try:
+            # 等待未完成的回写
+            if self._write_back_tasks:
+                await asyncio.gather(*self._write_back_tasks, return_exceptions=True)
+            
             await self.l2_cache.disconnect()
+            await self.l3_cache.close()
             logger.info("多级缓存系统已关闭")
             
         except Exception as e:
@@ -0,0 +1,431 @@
+"""
+Segment Log Store
+=================
+
+L3持久化缓存使用的追加写日志存储：
+- 所有写入追加到当前段文件，段达到上限后滚动，避免每个键一个文件
+- 内存索引保存 key -> (段号, 偏移, 长度, 过期时间)，读取为一次pread
+- 大值通过mmap读取，避免额外拷贝
+- 删除/覆盖写入墓碑或新记录，压缩时把垃圾比例高的已封存段中的存活记录
+  （以及仍需遮蔽更旧记录的墓碑）搬到当前段，旧段在没有读者引用后才关闭删除
+
+本模块的方法都是阻塞调用，由L3PersistentCache放到线程池中执行。
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 记录头：crc32, 键长度, 值长度, 过期时间(time.time()，0为不过期), 标志
+_HEADER = struct.Struct("<IIIdB")
+_FLAG_TOMBSTONE = 1
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".log"
+
+
+class IndexEntry(NamedTuple):
+    """索引项"""
+    segment_id: int
+    offset: int  # 值在段文件中的偏移
+    length: int
+    expire_at: float  # 0表示不过期
+
+
+class _Segment:
+    """
+    单个段文件
+
+    读取不加写锁，读者通过acquire/release持有引用；段被压缩或清空后先退役，
+    最后一个读者释放后才关闭文件描述符，避免描述符被复用后读到其他文件。
+    """
+
+    def __init__(self, segment_id: int, path: str):
+        self.segment_id = segment_id
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.size = os.fstat(self.fd).st_size
+        self.dead_bytes = 0
+        self._mmap: Optional[mmap.mmap] = None
+
+        self._ref_lock = threading.Lock()
+        self._refs = 0
+        self._retired = False
+        self._remove_on_close = False
+
+    def append(self, data: bytes) -> int:
+        """追加写入，返回写入前的偏移"""
+        offset = self.size
+        os.pwrite(self.fd, data, offset)
+        self.size += len(data)
+        return offset
+
+    def read(self, offset: int, length: int, use_mmap: bool) -> bytes:
+        if use_mmap:
+            mapped = self._mmap
+            if mapped is None or len(mapped) < offset + length:
+                # 段仍在增长时按当前长度重新映射，旧映射可能仍被其他读线程引用，交给GC释放
+                mapped = mmap.mmap(self.fd, self.size, access=mmap.ACCESS_READ)
+                self._mmap = mapped
+            return mapped[offset:offset + length]
+        return os.pread(self.fd, length, offset)
+
+    def truncate(self, size: int) -> None:
+        os.ftruncate(self.fd, size)
+        self.size = size
+
+    def acquire(self) -> bool:
+        """读者持有引用，段已退役时返回False"""
+        with self._ref_lock:
+            if self._retired:
+                return False
+            self._refs += 1
+            return True
+
+    def release(self) -> None:
+        with self._ref_lock:
+            self._refs -= 1
+            if not (self._retired and self._refs == 0):
+                return
+        self._close()
+
+    def retire(self, remove: bool) -> None:
+        """退役：不再接受新读者，现有读者全部释放后关闭（并删除文件）"""
+        with self._ref_lock:
+            if self._retired:
+                return
+            self._retired = True
+            self._remove_on_close = remove
+            if self._refs:
+                return
+        self._close()
+
+    def _close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        os.close(self.fd)
+        if self._remove_on_close:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class SegmentLogStore:
+    """
+    追加写段日志存储
+
+    Args:
+        directory: 存储目录
+        segment_size: 段文件滚动阈值(字节)
+        mmap_threshold: 不小于该长度的值使用mmap读取
+        max_entries: 键数量上限，超出时淘汰最早写入的键
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 64 * 1024 * 1024,
+        mmap_threshold: int = 64 * 1024,
+        max_entries: Optional[int] = None
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.mmap_threshold = mmap_threshold
+        self.max_entries = max_entries
+
+        # dict保持写入顺序，覆盖写入时移到末尾，淘汰从头部开始
+        self._index: Dict[str, IndexEntry] = {}
+        self._segments: Dict[int, _Segment] = {}
+        self._active: Optional[_Segment] = None
+        self._live_bytes = 0
+        self._write_lock = threading.Lock()
+        self.evicted = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def live_bytes(self) -> int:
+        return self._live_bytes
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    # ==================== 启动恢复 ====================
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.directory, f"{_SEGMENT_PREFIX}{segment_id:08d}{_SEGMENT_SUFFIX}")
+
+    def _recover(self) -> None:
+        """扫描段文件重建索引，截断最后一个段末尾写了一半的记录"""
+        segment_ids = sorted(
+            int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)
+        )
+
+        for segment_id in segment_ids:
+            segment = _Segment(segment_id, self._segment_path(segment_id))
+            self._segments[segment_id] = segment
+            valid_size = self._load_segment(segment)
+            if valid_size < segment.size:
+                logger.warning(f"L3段文件尾部损坏，已截断: {segment.path}, {segment.size} -> {valid_size}")
+                segment.truncate(valid_size)
+
+        if segment_ids:
+            self._active = self._segments[segment_ids[-1]]
+        else:
+            self._roll_segment()
+
+        if self._index:
+            logger.info(f"L3缓存索引已恢复: {len(self._index)}个键, {len(self._segments)}个段")
+
+    @staticmethod
+    def _read_segment_file(segment: _Segment) -> bytes:
+        with open(segment.path, "rb") as f:
+            return f.read()
+
+    def _iter_records(self, segment: _Segment, data: Optional[bytes] = None
+                      ) -> Iterator[Tuple[int, str, int, int, float, int]]:
+        """逐条读取段记录 (记录偏移, 键, 值偏移, 值长度, 过期时间, 标志)，遇到损坏记录停止"""
+        if data is None:
+            data = self._read_segment_file(segment)
+
+        offset = 0
+        header_size = _HEADER.size
+        while offset + header_size <= len(data):
+            crc, key_length, value_length, expire_at, flags = _HEADER.unpack_from(data, offset)
+            body_start = offset + header_size
+            body_end = body_start + key_length + value_length
+            if body_end > len(data):
+                break
+            if zlib.crc32(data[offset + 4:body_end]) != crc:
+                break
+            key = data[body_start:body_start + key_length].decode("utf-8")
+            yield offset, key, body_start + key_length, value_length, expire_at, flags
+            offset = body_end
+
+    def _load_segment(self, segment: _Segment) -> int:
+        """将段内记录应用到索引，返回有效长度"""
+        valid_size = 0
+        now = time.time()
+        for offset, key, value_offset, value_length, expire_at, flags in self._iter_records(segment):
+            self._drop(key)
+            if flags & _FLAG_TOMBSTONE or (expire_at and expire_at <= now):
+                segment.dead_bytes += value_offset + value_length - offset
+            else:
+                self._index[key] = IndexEntry(segment.segment_id, value_offset, value_length, expire_at)
+                self._live_bytes += value_length
+            valid_size = value_offset + value_length
+        return valid_size
+
+    # ==================== 读写 ====================
+
+    def _roll_segment(self) -> None:
+        next_id = max(self._segments, default=0) + 1
+        segment = _Segment(next_id, self._segment_path(next_id))
+        self._segments[next_id] = segment
+        self._active = segment
+
+    def _drop(self, key: str) -> Optional[IndexEntry]:
+        """从索引移除键，原记录计入所在段的垃圾字节"""
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._live_bytes -= entry.length
+            segment = self._segments.get(entry.segment_id)
+            if segment is not None:
+                segment.dead_bytes += _HEADER.size + len(key.encode("utf-8")) + entry.length
+        return entry
+
+    def _append(self, key: str, value: bytes, expire_at: float, flags: int = 0) -> IndexEntry:
+        """追加一条记录（调用方持有写锁）"""
+        key_bytes = key.encode("utf-8")
+        body = key_bytes + value
+        header_tail = _HEADER.pack(0, len(key_bytes), len(value), expire_at, flags)[4:]
+        crc = zlib.crc32(header_tail + body)
+        record = struct.pack("<I", crc) + header_tail + body
+
+        if self._active.size + len(record) > self.segment_size and self._active.size > 0:
+            self._roll_segment()
+
+        offset = self._active.append(record)
+        return IndexEntry(self._active.segment_id, offset + _HEADER.size + len(key_bytes), len(value), expire_at)
+
+    def put(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """写入键值"""
+        expire_at = time.time() + ttl if ttl else 0.0
+        with self._write_lock:
+            entry = self._append(key, value, expire_at)
+            self._drop(key)
+            self._index[key] = entry
+            self._live_bytes += entry.length
+            self._enforce_capacity()
+
+    def put_many(self, items: Dict[str, bytes], ttl: Optional[float] = None) -> None:
+        """批量写入，整批只加一次写锁"""
+        expire_at = time.time() + ttl if ttl else 0.0
+        with self._write_lock:
+            for key, value in items.items():
+                entry = self._append(key, value, expire_at)
+                self._drop(key)
+                self._index[key] = entry
+                self._live_bytes += entry.length
+            self._enforce_capacity()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取键值，不存在或已过期返回None"""
+        for _ in range(2):
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+
+            if entry.expire_at and entry.expire_at <= time.time():
+                self.delete(key)
+                return None
+
+            segment = self._segments.get(entry.segment_id)
+            if segment is not None and segment.acquire():
+                try:
+                    return segment.read(entry.offset, entry.length, entry.length >= self.mmap_threshold)
+                finally:
+                    segment.release()
+            # 所在段已被压缩退役，索引已指向新位置，重读一次
+        return None
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """批量读取，只返回命中的键"""
+        result = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                result[key] = value
+        return result
+
+    def delete(self, key: str) -> bool:
+        """删除键（写入墓碑，重启后不会复活）"""
+        with self._write_lock:
+            if key not in self._index:
+                return False
+            self._drop(key)
+            self._append_tombstone(key)
+            return True
+
+    def _append_tombstone(self, key: str) -> None:
+        """追加墓碑记录，墓碑本身即为垃圾字节"""
+        self._append(key, b"", 0.0, _FLAG_TOMBSTONE)
+        self._active.dead_bytes += _HEADER.size + len(key.encode("utf-8"))
+
+    def _enforce_capacity(self) -> int:
+        """超出键数量上限时淘汰最早写入的键，返回淘汰数"""
+        if not self.max_entries:
+            return 0
+        evicted = 0
+        while len(self._index) > self.max_entries:
+            key = next(iter(self._index))
+            self._drop(key)
+            self._append_tombstone(key)
+            evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    # ==================== 压缩 ====================
+
+    def purge_expired(self) -> int:
+        """从索引中移除已过期的键"""
+        now = time.time()
+        with self._write_lock:
+            expired = [key for key, entry in self._index.items() if entry.expire_at and entry.expire_at <= now]
+            for key in expired:
+                self._drop(key)
+        return len(expired)
+
+    def compact(self, min_dead_ratio: float = 0.5) -> int:
+        """
+        压缩垃圾比例超过阈值的已封存段
+
+        每个入选段的存活记录重写到当前段；段内不再存活、且可能遮蔽更旧段中记录的键
+        补写墓碑，防止丢弃后重启时旧值复活。已封存段不再写入，扫描在写锁外进行。
+
+        Returns:
+            回收的字节数
+        """
+        self.purge_expired()
+
+        with self._write_lock:
+            victims = [
+                segment for segment_id, segment in sorted(self._segments.items())
+                if segment is not self._active and segment.size
+                and segment.dead_bytes / segment.size >= min_dead_ratio
+            ]
+        if not victims:
+            return 0
+
+        victim_ids = {segment.segment_id for segment in victims}
+        scanned = [(segment, self._read_segment_file(segment)) for segment in victims]
+
+        with self._write_lock:
+            oldest_survivor = min(
+                segment_id for segment_id in self._segments if segment_id not in victim_ids
+            )
+            # 不存活的键 -> 出现过的最新受压缩段号
+            shadowed: Dict[str, int] = {}
+
+            for segment, data in scanned:
+                for _, key, value_offset, value_length, _, flags in self._iter_records(segment, data):
+                    entry = self._index.get(key)
+                    if entry is None:
+                        shadowed[key] = segment.segment_id
+                    elif entry.segment_id == segment.segment_id and entry.offset == value_offset \
+                            and not flags & _FLAG_TOMBSTONE:
+                        value = data[value_offset:value_offset + value_length]
+                        self._index[key] = self._append(key, value, entry.expire_at)
+
+            # 受压缩段都比剩余段旧时，丢弃的记录不会再被重启恢复读到
+            for key, segment_id in shadowed.items():
+                if segment_id > oldest_survivor and key not in self._index:
+                    self._append_tombstone(key)
+
+            for segment_id in victim_ids:
+                del self._segments[segment_id]
+
+        reclaimed = 0
+        for segment in victims:
+            reclaimed += segment.size
+            segment.retire(remove=True)
+
+        if reclaimed:
+            logger.info(f"L3缓存压缩完成，回收 {reclaimed} 字节，当前段数: {len(self._segments)}")
+        return reclaimed
+
+    # ==================== 管理 ====================
+
+    def clear(self) -> None:
+        """删除所有段并重置索引"""
+        with self._write_lock:
+            for segment in self._segments.values():
+                segment.retire(remove=True)
+            self._segments.clear()
+            self._index.clear()
+            self._live_bytes = 0
+            self._roll_segment()
+
+    def close(self) -> None:
+        """关闭所有段文件"""
+        with self._write_lock:
+            for segment in self._segments.values():
+                segment.retire(remove=False)
+            self._segments.clear()
+            self._active = None
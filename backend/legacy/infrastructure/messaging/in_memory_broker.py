@@ -0,0 +1,388 @@
+"""
+In-Memory Kafka Broker
+======================
+
+进程内的Kafka替身，用于在没有Kafka集群时测试KafkaProducerService / KafkaConsumerService。
+
+只实现服务用到的kafka-python接口子集：
+- InMemoryProducer: send() 返回带 add_callback / add_errback / get 的future，
+  按分区累积记录，达到batch_size字节或linger_ms到期时整批写入，flush() 立即写入
+- InMemoryConsumer: poll() 返回 {TopicPartition: [ConsumerRecord]}，commit() 写入消费组偏移，
+  pause()/resume() 暂停和恢复分区拉取
+- subscribe(listener=...) 在下一次poll()内分配分区并回调 on_partitions_assigned；
+  rebalance() 模拟再均衡，下一次poll()内先回调 on_partitions_revoked 回收全部分区，再分配新分区
+- 同一消费组的消费者共享已提交偏移，新分配的分区从已提交偏移或auto_offset_reset处开始
+
+用法：
+    broker = InMemoryKafkaBroker()
+    producer = KafkaProducerService([], producer_factory=broker.create_producer)
+    consumer = KafkaConsumerService([], "group", ["topic"], consumer_factory=broker.create_consumer)
+"""
+
+import threading
+import time
+import zlib
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+TopicPartition = namedtuple("TopicPartition", ["topic", "partition"])
+RecordMetadata = namedtuple("RecordMetadata", ["topic", "partition", "offset", "timestamp"])
+ConsumerRecord = namedtuple(
+    "ConsumerRecord", ["topic", "partition", "offset", "timestamp", "key", "value", "headers"]
+)
+
+
+class InMemoryFuture:
+    """发送结果，接口与kafka-python的FutureRecordMetadata一致"""
+
+    def __init__(self):
+        self.is_done = False
+        self.value: Any = None
+        self.exception: Optional[BaseException] = None
+        self._callbacks: List[Tuple[Callable, bool]] = []
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def succeeded(self) -> bool:
+        return self.is_done and self.exception is None
+
+    def failed(self) -> bool:
+        return self.is_done and self.exception is not None
+
+    def add_callback(self, callback: Callable, *args) -> "InMemoryFuture":
+        return self._add(lambda value: callback(*args, value), errback=False)
+
+    def add_errback(self, callback: Callable, *args) -> "InMemoryFuture":
+        return self._add(lambda error: callback(*args, error), errback=True)
+
+    def _add(self, callback: Callable, errback: bool) -> "InMemoryFuture":
+        with self._lock:
+            if not self.is_done:
+                self._callbacks.append((callback, errback))
+                return self
+        if errback == (self.exception is not None):
+            callback(self.exception if errback else self.value)
+        return self
+
+    def _complete(self, value: Any = None, exception: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.value, self.exception = value, exception
+            self.is_done = True
+            callbacks, self._callbacks = self._callbacks, []
+        self._event.set()
+        for callback, errback in callbacks:
+            if errback == (exception is not None):
+                callback(exception if errback else value)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        if not self._event.wait(timeout):
+            raise TimeoutError("等待发送结果超时")
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+class InMemoryKafkaBroker:
+    """
+    进程内Broker
+
+    Args:
+        default_partitions: 自动创建主题时的分区数
+    """
+
+    def __init__(self, default_partitions: int = 3):
+        self.default_partitions = default_partitions
+        self._lock = threading.Condition()
+        self._logs: Dict[str, List[List[ConsumerRecord]]] = {}
+        self._committed: Dict[Tuple[str, TopicPartition], int] = {}
+        # 每次整批写入的记录数，便于检查生产者的批量行为
+        self.batches: List[int] = []
+        # 写入失败注入：返回异常时该批记录失败
+        self.fail_writes: Optional[Callable[[TopicPartition, int], Optional[Exception]]] = None
+
+    def create_topic(self, topic: str, num_partitions: Optional[int] = None) -> None:
+        with self._lock:
+            if topic not in self._logs:
+                self._logs[topic] = [[] for _ in range(num_partitions or self.default_partitions)]
+
+    def partitions_for(self, topic: str) -> int:
+        self.create_topic(topic)
+        return len(self._logs[topic])
+
+    def create_producer(self, **config) -> "InMemoryProducer":
+        return InMemoryProducer(self, **config)
+
+    def create_consumer(self, *topics: str, **config) -> "InMemoryConsumer":
+        return InMemoryConsumer(self, topics, **config)
+
+    def records(self, topic: str, partition: Optional[int] = None) -> List[ConsumerRecord]:
+        """主题（或单个分区）中的全部记录"""
+        with self._lock:
+            logs = self._logs.get(topic, [])
+            if partition is not None:
+                return list(logs[partition]) if partition < len(logs) else []
+            return [record for log in logs for record in log]
+
+    def committed(self, group_id: str, tp: TopicPartition) -> Optional[int]:
+        with self._lock:
+            return self._committed.get((group_id, tp))
+
+    def _append(self, tp: TopicPartition, entries: List[Tuple[Any, Any, Any, InMemoryFuture]]) -> None:
+        self.create_topic(tp.topic)
+        error = self.fail_writes(tp, len(entries)) if self.fail_writes else None
+        results = []
+        with self._lock:
+            if error is None:
+                log = self._logs[tp.topic][tp.partition]
+                timestamp = int(time.time() * 1000)
+                for key, value, headers, future in entries:
+                    offset = len(log)
+                    log.append(ConsumerRecord(tp.topic, tp.partition, offset, timestamp, key, value, headers))
+                    results.append((future, RecordMetadata(tp.topic, tp.partition, offset, timestamp)))
+                self.batches.append(len(entries))
+                self._lock.notify_all()
+        if error is not None:
+            for _, _, _, future in entries:
+                future._complete(exception=error)
+        for future, metadata in results:
+            future._complete(metadata)
+
+    def _fetch(self, tp: TopicPartition, position: int, limit: int) -> List[ConsumerRecord]:
+        log = self._logs[tp.topic][tp.partition]
+        return log[position:position + limit]
+
+
+class InMemoryProducer:
+    """KafkaProducer替身"""
+
+    def __init__(
+        self,
+        broker: InMemoryKafkaBroker,
+        batch_size: int = 16384,
+        linger_ms: int = 0,
+        key_serializer: Optional[Callable] = None,
+        value_serializer: Optional[Callable] = None,
+        **config
+    ):
+        self.broker = broker
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+        self.key_serializer = key_serializer
+        self.value_serializer = value_serializer
+        self.config = config
+        self._lock = threading.Lock()
+        # 分区 -> (首条记录时间, 累计字节, 记录)
+        self._buffers: Dict[TopicPartition, Tuple[float, int, list]] = {}
+        self._round_robin = 0
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._sender = threading.Thread(target=self._linger_loop, daemon=True)
+        self._sender.start()
+
+    def send(self, topic: str, value: Any = None, key: Any = None, headers: Any = None,
+             partition: Optional[int] = None, timestamp_ms: Optional[int] = None) -> InMemoryFuture:
+        if self._closed:
+            raise RuntimeError("生产者已关闭")
+        if self.key_serializer and key is not None:
+            key = self.key_serializer(key)
+        if self.value_serializer:
+            value = self.value_serializer(value)
+        num_partitions = self.broker.partitions_for(topic)
+        if partition is None:
+            if key is not None:
+                partition = zlib.crc32(key if isinstance(key, bytes) else str(key).encode()) % num_partitions
+            else:
+                self._round_robin += 1
+                partition = self._round_robin % num_partitions
+        tp = TopicPartition(topic, partition)
+        future = InMemoryFuture()
+        size = len(value) if isinstance(value, (bytes, str)) else 1
+
+        full = None
+        with self._lock:
+            created, buffered, entries = self._buffers.get(tp, (time.monotonic(), 0, []))
+            entries.append((key, value, headers, future))
+            buffered += size
+            if buffered >= self.batch_size or self.linger_ms <= 0:
+                self._buffers.pop(tp, None)
+                full = entries
+            else:
+                self._buffers[tp] = (created, buffered, entries)
+                self._wakeup.set()
+        if full:
+            self.broker._append(tp, full)
+        return future
+
+    def _drain(self, expired_before: Optional[float] = None) -> None:
+        with self._lock:
+            ready = [
+                tp for tp, (created, _, _) in self._buffers.items()
+                if expired_before is None or created <= expired_before
+            ]
+            batches = [(tp, self._buffers.pop(tp)[2]) for tp in ready]
+        for tp, entries in batches:
+            self.broker._append(tp, entries)
+
+    def _linger_loop(self) -> None:
+        """最早的一批等待满linger_ms后写入"""
+        linger = self.linger_ms / 1000.0
+        while not self._closed:
+            with self._lock:
+                oldest = min((created for created, _, _ in self._buffers.values()), default=None)
+            if oldest is None:
+                self._wakeup.wait(0.1)
+                self._wakeup.clear()
+                continue
+            delay = oldest + linger - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._drain(time.monotonic() - linger)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        self._drain()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self.flush()
+        self._closed = True
+        self._wakeup.set()
+
+
+class InMemoryConsumer:
+    """KafkaConsumer替身（订阅时独占所订阅主题的全部分区，rebalance()可改变分配）"""
+
+    def __init__(
+        self,
+        broker: InMemoryKafkaBroker,
+        topics: Tuple[str, ...],
+        group_id: Optional[str] = None,
+        auto_offset_reset: str = "latest",
+        enable_auto_commit: bool = True,
+        max_poll_records: int = 500,
+        key_deserializer: Optional[Callable] = None,
+        value_deserializer: Optional[Callable] = None,
+        **config
+    ):
+        self.broker = broker
+        self.group_id = group_id
+        self.auto_offset_reset = auto_offset_reset
+        self.enable_auto_commit = enable_auto_commit
+        self.max_poll_records = max_poll_records
+        self.key_deserializer = key_deserializer
+        self.value_deserializer = value_deserializer
+        self.config = config
+        self._positions: Dict[TopicPartition, int] = {}
+        self._paused: Set[TopicPartition] = set()
+        self._listener: Any = None
+        # 待在下一次poll()中生效的分配
+        self._pending_assignment: Optional[List[TopicPartition]] = None
+        self._closed = False
+        for tp in self._partitions_of(topics):
+            self._positions[tp] = self._initial_position(tp)
+
+    def _partitions_of(self, topics: Iterable[str]) -> List[TopicPartition]:
+        return [
+            TopicPartition(topic, partition)
+            for topic in topics
+            for partition in range(self.broker.partitions_for(topic))
+        ]
+
+    def _initial_position(self, tp: TopicPartition) -> int:
+        committed = self.broker.committed(self.group_id, tp) if self.group_id else None
+        if committed is not None:
+            return committed
+        if self.auto_offset_reset == "earliest":
+            return 0
+        return len(self.broker.records(tp.topic, tp.partition))
+
+    def subscribe(self, topics: Iterable[str] = (), pattern: Any = None, listener: Any = None) -> None:
+        """订阅主题，分区在下一次poll()中分配"""
+        self._listener = listener
+        self.rebalance(self._partitions_of(topics))
+
+    def rebalance(self, partitions: Iterable[TopicPartition]) -> None:
+        """模拟再均衡：下一次poll()时回收当前全部分区，改为分配partitions（可从其他线程调用）"""
+        with self.broker._lock:
+            self._pending_assignment = [TopicPartition(*tp) for tp in partitions]
+            self.broker._lock.notify_all()
+
+    def _apply_assignment(self) -> None:
+        with self.broker._lock:
+            assignment, self._pending_assignment = self._pending_assignment, None
+        if self._positions and self._listener is not None:
+            self._listener.on_partitions_revoked(set(self._positions))
+        self._positions = {tp: self._initial_position(tp) for tp in assignment}
+        self._paused = set()
+        if self._listener is not None:
+            self._listener.on_partitions_assigned(set(assignment))
+
+    def assignment(self):
+        return set(self._positions)
+
+    def pause(self, *partitions: TopicPartition) -> None:
+        self._paused.update(tp for tp in partitions if tp in self._positions)
+
+    def resume(self, *partitions: TopicPartition) -> None:
+        self._paused.difference_update(partitions)
+
+    def paused(self):
+        return set(self._paused)
+
+    def position(self, tp: TopicPartition) -> int:
+        return self._positions[tp]
+
+    def poll(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        if self._closed:
+            raise RuntimeError("消费者已关闭")
+        if self._pending_assignment is not None:
+            self._apply_assignment()
+        limit = max_records or self.max_poll_records
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        broker = self.broker
+        with broker._lock:
+            while True:
+                result = {}
+                for tp, position in self._positions.items():
+                    if limit <= 0:
+                        break
+                    if tp in self._paused:
+                        continue
+                    records = broker._fetch(tp, position, limit)
+                    if records:
+                        result[tp] = records
+                        limit -= len(records)
+                if result or self._closed or self._pending_assignment is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return {}
+                broker._lock.wait(remaining)
+
+        for tp, records in result.items():
+            self._positions[tp] = records[-1].offset + 1
+            result[tp] = [self._deserialize(record) for record in records]
+        if self.enable_auto_commit and self.group_id:
+            self.commit({tp: self._positions[tp] for tp in result})
+        return result
+
+    def _deserialize(self, record: ConsumerRecord) -> ConsumerRecord:
+        key, value = record.key, record.value
+        if self.key_deserializer and key is not None:
+            key = self.key_deserializer(key)
+        if self.value_deserializer:
+            value = self.value_deserializer(value)
+        return record._replace(key=key, value=value)
+
+    def commit(self, offsets: Optional[Dict[TopicPartition, Any]] = None) -> None:
+        """offsets的值可以是偏移量或带offset属性的OffsetAndMetadata"""
+        if offsets is None:
+            offsets = dict(self._positions)
+        if not self.group_id:
+            return
+        with self.broker._lock:
+            for tp, offset in offsets.items():
+                self.broker._committed[(self.group_id, TopicPartition(*tp))] = getattr(offset, "offset", offset)
+
+    def close(self, autocommit: bool = True) -> None:
+        self._closed = True
+        with self.broker._lock:
+            self.broker._lock.notify_all()
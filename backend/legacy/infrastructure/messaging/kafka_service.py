@@ -15,15 +15,19 @@ from datetime import datetime
 from dataclasses import dataclass, field
 from enum import Enum
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import queue
+from collections import deque, namedtuple
 
 try:
-    from kafka import KafkaProducer, KafkaConsumer, KafkaAdminClient
+    from kafka import KafkaProducer, KafkaConsumer, KafkaAdminClient, ConsumerRebalanceListener
     from kafka.admin import ConfigResource, ConfigResourceType, NewTopic
     from kafka.errors import KafkaError, TopicAlreadyExistsError
+    from kafka.structs import OffsetAndMetadata
     KAFKA_AVAILABLE = True
 except ImportError:
     KAFKA_AVAILABLE = False
+    OffsetAndMetadata = namedtuple("OffsetAndMetadata", ["offset", "metadata"])
+    ConsumerRebalanceListener = object
 
 logger = logging.getLogger(__name__)
 
@@ -120,8 +124,11 @@ class ConsumerStats:
     messages_consumed: int = 0
     messages_processed: int = 0
     messages_failed: int = 0
+    messages_retried: int = 0
     last_consume_time: Optional[datetime] = None
     lag: int = 0
+    in_flight: int = 0  # 已分发未提交的消息数
+    paused_partitions: int = 0  # 因工作队列满而暂停拉取的分区数
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -129,13 +136,22 @@ class ConsumerStats:
             "messages_consumed": self.messages_consumed,
             "messages_processed": self.messages_processed,
             "messages_failed": self.messages_failed,
+            "messages_retried": self.messages_retried,
             "last_consume_time": self.last_consume_time.isoformat() if self.last_consume_time else None,
-            "lag": self.lag
+            "lag": self.lag,
+            "in_flight": self.in_flight,
+            "paused_partitions": self.paused_partitions
         }
 
 
 class KafkaProducerService:
-    """Kafka生产者服务"""
+    """
+    Kafka生产者服务
+    
+    记录由客户端按分区累积，达到batch_size字节或linger_ms到期后整批压缩发送；
+    send_async() 只入队并返回，投递结果通过回调通知，send_message() / send_batch()
+    在事件循环中等待结果而不阻塞线程。
+    """
     
     def __init__(
         self,
@@ -145,7 +161,11 @@ class KafkaProducerService:
         batch_size: int = 16384,
         linger_ms: int = 5,
         retries: int = 3,
-        acks: str = "1"
+        acks: str = "1",
+        max_in_flight_requests: int = 5,
+        buffer_memory: int = 33554432,
+        delivery_callback: Optional[Callable[[str, Optional[Exception], Any], None]] = None,
+        producer_factory: Optional[Callable[..., Any]] = None
     ):
         self.bootstrap_servers = bootstrap_servers
         self.client_id = client_id
@@ -154,29 +174,39 @@ class KafkaProducerService:
         self.linger_ms = linger_ms
         self.retries = retries
         self.acks = acks
+        self.max_in_flight_requests = max_in_flight_requests
+        self.buffer_memory = buffer_memory
+        # 全局投递回调 (主题, 异常或None, RecordMetadata或None)，在客户端发送线程中调用
+        self.delivery_callback = delivery_callback
+        # 替换KafkaProducer的工厂（如进程内Broker），参数与KafkaProducer相同
+        self.producer_factory = producer_factory
         
         self._producer: Optional[KafkaProducer] = None
         self._stats = ProducerStats()
+        self._stats_lock = threading.Lock()
         self._is_running = False
         
-        if not KAFKA_AVAILABLE:
+        if not KAFKA_AVAILABLE and producer_factory is None:
             logger.warning("Kafka未安装，生产者服务将被禁用")
     
     async def start(self) -> bool:
         """启动生产者"""
-        if not KAFKA_AVAILABLE:
+        if not KAFKA_AVAILABLE and self.producer_factory is None:
             return False
         
         try:
-            self._producer = KafkaProducer(
+            factory = self.producer_factory or KafkaProducer
+            compression = self.compression_type.value
+            self._producer = factory(
                 bootstrap_servers=self.bootstrap_servers,
                 client_id=self.client_id,
-                compression_type=self.compression_type.value,
+                compression_type=None if compression == CompressionType.NONE.value else compression,
                 batch_size=self.batch_size,
                 linger_ms=self.linger_ms,
                 retries=self.retries,
-                acks=self.acks,
-                value_serializer=lambda x: json.dumps(x, default=str).encode('utf-8'),
+                acks=self._acks_value(),
+                max_in_flight_requests_per_connection=self.max_in_flight_requests,
+                buffer_memory=self.buffer_memory,
                 key_serializer=lambda x: x.encode('utf-8') if x else None
             )
             
@@ -188,10 +218,18 @@ class KafkaProducerService:
             logger.error(f"Kafka生产者启动失败: {e}")
             return False
     
+    def _acks_value(self) -> Union[int, str]:
+        """kafka-python要求acks为 0 / 1 / -1 / 'all'"""
+        try:
+            return int(self.acks)
+        except (TypeError, ValueError):
+            return self.acks
+    
     async def stop(self) -> None:
-        """停止生产者"""
+        """停止生产者（先发送已累积的记录）"""
         try:
             if self._producer:
+                self._producer.flush(timeout=10)
                 self._producer.close(timeout=10)
                 self._producer = None
             
@@ -201,53 +239,108 @@ class KafkaProducerService:
         except Exception as e:
             logger.error(f"Kafka生产者停止失败: {e}")
     
-    async def send_message(
+    @staticmethod
+    def _unpack(message: Union[Message, Dict[str, Any]]) -> Tuple[Any, Any, Any, Optional[int]]:
+        """取出 (key, value, headers, partition)"""
+        if isinstance(message, Message):
+            return message.key, message.value, message.headers, message.partition
+        return message.get("key"), message.get("value"), message.get("headers"), message.get("partition")
+    
+    def send_async(
         self,
         topic: str,
         message: Union[Message, Dict[str, Any]],
         partition: Optional[int] = None,
-        timeout: int = 30
-    ) -> bool:
-        """发送消息"""
+        on_delivery: Optional[Callable[[Optional[Exception], Any], None]] = None
+    ):
+        """
+        把消息放入发送缓冲区后立即返回
+        
+        Args:
+            on_delivery: 投递回调 (异常或None, RecordMetadata或None)，在客户端发送线程中调用
+            
+        Returns:
+            客户端的发送future
+            
+        Raises:
+            RuntimeError: 生产者未启动
+        """
         if not self._producer or not self._is_running:
-            logger.error("生产者未启动")
-            return False
+            raise RuntimeError("生产者未启动")
         
+        key, value, headers, message_partition = self._unpack(message)
+        # 只序列化一次，字节数直接计入统计
+        payload = json.dumps(value, default=str).encode('utf-8')
         try:
-            # 处理消息格式
-            if isinstance(message, Message):
-                key = message.key
-                value = message.value
-                headers = message.headers
-                partition = partition or message.partition
-            else:
-                key = message.get("key")
-                value = message.get("value")
-                headers = message.get("headers")
-            
-            # 发送消息
             future = self._producer.send(
                 topic=topic,
                 key=key,
-                value=value,
-                partition=partition,
-                headers=headers
+                value=payload,
+                partition=partition if partition is not None else message_partition,
+                headers=[(k, str(v).encode('utf-8')) for k, v in headers.items()] if headers else None
             )
-            
-            # 等待发送完成
-            record_metadata = future.get(timeout=timeout)
-            
-            # 更新统计
+        except Exception:
+            # 缓冲区满、元数据超时等同步错误
+            with self._stats_lock:
+                self._stats.messages_failed += 1
+            raise
+        size = len(payload)
+        future.add_callback(self._on_success, topic, size, on_delivery)
+        future.add_errback(self._on_failure, topic, on_delivery)
+        return future
+    
+    def _on_success(self, topic: str, size: int, on_delivery, metadata) -> None:
+        with self._stats_lock:
             self._stats.messages_sent += 1
-            self._stats.bytes_sent += len(json.dumps(value, default=str).encode('utf-8'))
+            self._stats.bytes_sent += size
             self._stats.last_send_time = datetime.now()
+        self._notify(topic, on_delivery, None, metadata)
+    
+    def _on_failure(self, topic: str, on_delivery, error) -> None:
+        with self._stats_lock:
+            self._stats.messages_failed += 1
+        logger.error(f"消息发送失败: {topic}, {error}")
+        self._notify(topic, on_delivery, error, None)
+    
+    def _notify(self, topic: str, on_delivery, error, metadata) -> None:
+        try:
+            if on_delivery:
+                on_delivery(error, metadata)
+            if self.delivery_callback:
+                self.delivery_callback(topic, error, metadata)
+        except Exception as e:
+            logger.error(f"投递回调执行失败: {e}")
+    
+    async def send_message(
+        self,
+        topic: str,
+        message: Union[Message, Dict[str, Any]],
+        partition: Optional[int] = None,
+        timeout: int = 30
+    ) -> bool:
+        """发送消息并等待投递结果"""
+        loop = asyncio.get_running_loop()
+        delivered = loop.create_future()
+        
+        def on_delivery(error, metadata):
+            loop.call_soon_threadsafe(_resolve, error, metadata)
+        
+        def _resolve(error, metadata):
+            if not delivered.done():
+                delivered.set_result((error, metadata))
+        
+        try:
+            self.send_async(topic, message, partition=partition, on_delivery=on_delivery)
+            error, record_metadata = await asyncio.wait_for(delivered, timeout)
+            if error is not None:
+                return False
             
             logger.debug(f"消息发送成功: {topic}:{record_metadata.partition}:{record_metadata.offset}")
             return True
             
         except Exception as e:
+            # 投递失败已在回调中计数
             logger.error(f"消息发送失败: {e}")
-            self._stats.messages_failed += 1
             return False
     
     async def send_batch(
@@ -256,64 +349,36 @@ class KafkaProducerService:
         messages: List[Union[Message, Dict[str, Any]]],
         timeout: int = 60
     ) -> Tuple[int, int]:
-        """批量发送消息"""
+        """批量发送消息：全部入队后flush一次，不等待linger"""
         if not self._producer or not self._is_running:
             logger.error("生产者未启动")
             return 0, len(messages)
         
-        success_count = 0
+        futures = []
         failed_count = 0
+        for message in messages:
+            try:
+                futures.append(self.send_async(topic, message))
+            except Exception as e:
+                logger.error(f"批量发送单条消息失败: {e}")
+                failed_count += 1
         
         try:
-            futures = []
-            
-            # 发送所有消息
-            for message in messages:
-                try:
-                    if isinstance(message, Message):
-                        key = message.key
-                        value = message.value
-                        headers = message.headers
-                        partition = message.partition
-                    else:
-                        key = message.get("key")
-                        value = message.get("value")
-                        headers = message.get("headers")
-                        partition = message.get("partition")
-                    
-                    future = self._producer.send(
-                        topic=topic,
-                        key=key,
-                        value=value,
-                        partition=partition,
-                        headers=headers
-                    )
-                    futures.append(future)
-                    
-                except Exception as e:
-                    logger.error(f"批量发送单条消息失败: {e}")
-                    failed_count += 1
-            
-            # 等待所有消息发送完成
-            for future in futures:
-                try:
-                    future.get(timeout=timeout)
-                    success_count += 1
-                except Exception as e:
-                    logger.error(f"批量发送等待失败: {e}")
-                    failed_count += 1
-            
-            # 更新统计
-            self._stats.messages_sent += success_count
-            self._stats.messages_failed += failed_count
-            self._stats.last_send_time = datetime.now()
-            
-            logger.info(f"批量发送完成: 成功 {success_count}, 失败 {failed_count}")
-            return success_count, failed_count
-            
+            # flush会阻塞到缓冲区发送完成，放到线程池中执行
+            await asyncio.get_running_loop().run_in_executor(None, self._producer.flush, timeout)
         except Exception as e:
-            logger.error(f"批量发送失败: {e}")
-            return success_count, len(messages) - success_count
+            logger.error(f"批量发送等待失败: {e}")
+        
+        success_count = sum(1 for future in futures if future.succeeded())
+        failed_count += len(futures) - success_count
+        
+        logger.info(f"批量发送完成: 成功 {success_count}, 失败 {failed_count}")
+        return success_count, failed_count
+    
+    async def flush(self, timeout: Optional[float] = None) -> None:
+        """立即发送所有已累积的记录"""
+        if self._producer:
+            await asyncio.get_running_loop().run_in_executor(None, self._producer.flush, timeout)
     
     def get_stats(self) -> ProducerStats:
         """获取统计信息"""
@@ -324,8 +389,56 @@ class KafkaProducerService:
         self._stats = ProducerStats()
 
 
+class _PartitionOffsets:
+    """单分区的在途偏移：已分发的偏移按顺序排队，队首连续完成后推进可提交位置"""
+    
+    __slots__ = ("pending", "done", "committable", "committed")
+    
+    def __init__(self):
+        self.pending: deque = deque()
+        self.done = set()
+        self.committable: Optional[int] = None  # 下一条待消费的偏移
+        self.committed: Optional[int] = None
+    
+    def complete(self, offset: int) -> None:
+        self.done.add(offset)
+        pending, done = self.pending, self.done
+        while pending and pending[0] in done:
+            finished = pending.popleft()
+            done.discard(finished)
+            self.committable = finished + 1
+
+
+class _RebalanceListener(ConsumerRebalanceListener):
+    """把再均衡回调转给KafkaConsumerService（在拉取线程的poll()内调用）"""
+    
+    def __init__(self, service: "KafkaConsumerService"):
+        self.service = service
+    
+    def on_partitions_revoked(self, revoked):
+        self.service._on_partitions_revoked(revoked)
+    
+    def on_partitions_assigned(self, assigned):
+        logger.info(f"分配分区: {sorted((tp.topic, tp.partition) for tp in assigned)}")
+
+
 class KafkaConsumerService:
-    """Kafka消费者服务"""
+    """
+    Kafka消费者服务
+    
+    拉取线程把消息分发到固定数量的工作线程，每个工作线程一个有界队列：
+    - ordering="partition" 时同一分区的消息进入同一个工作线程，保持分区内顺序
+    - ordering="key" 时按消息key分配，同一key保持顺序，同一分区的不同key可并行
+    - 队列满时该分区后续消息留在积压中并pause该分区，拉取线程继续poll以维持心跳，
+      积压全部分发后resume
+    - 分区被回收时丢弃其积压，等待已分发的消息处理完（至多revoke_timeout秒）、提交偏移，
+      再清除该分区的跟踪状态
+    - 处理器失败时按retry_backoff_ms递增间隔重试max_retries次，仍失败则交给
+      dead_letter_handler(message, error)（未设置时只记录错误），随后视为完成并照常提交偏移；
+      停止期间不再重试，该消息不标记完成，偏移停在它之前，重启后重新消费
+    
+    关闭自动提交时，偏移只在该偏移之前的消息全部处理完成后才提交。
+    """
     
     def __init__(
         self,
@@ -334,10 +447,18 @@ class KafkaConsumerService:
         topics: List[str],
         client_id: str = "redfire_consumer",
         auto_offset_reset: str = "latest",
-        enable_auto_commit: bool = True,
+        enable_auto_commit: bool = False,
         auto_commit_interval_ms: int = 1000,
         max_poll_records: int = 500,
-        max_poll_interval_ms: int = 300000
+        max_poll_interval_ms: int = 300000,
+        num_workers: int = 10,
+        worker_queue_size: int = 1000,
+        ordering: str = "partition",
+        max_retries: int = 3,
+        retry_backoff_ms: int = 100,
+        dead_letter_handler: Optional[Callable[[Message, Exception], Any]] = None,
+        revoke_timeout: float = 10.0,
+        consumer_factory: Optional[Callable[..., Any]] = None
     ):
         self.bootstrap_servers = bootstrap_servers
         self.group_id = group_id
@@ -348,25 +469,42 @@ class KafkaConsumerService:
         self.auto_commit_interval_ms = auto_commit_interval_ms
         self.max_poll_records = max_poll_records
         self.max_poll_interval_ms = max_poll_interval_ms
+        self.num_workers = max(1, num_workers)
+        self.worker_queue_size = worker_queue_size
+        self.ordering = ordering
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff_ms = retry_backoff_ms
+        self.dead_letter_handler = dead_letter_handler
+        self.revoke_timeout = revoke_timeout
+        # 替换KafkaConsumer的工厂（如进程内Broker），参数与KafkaConsumer相同
+        self.consumer_factory = consumer_factory
         
         self._consumer: Optional[KafkaConsumer] = None
         self._stats = ConsumerStats()
+        self._stats_lock = threading.Lock()
         self._message_handlers: Dict[str, Callable] = {}
         self._is_running = False
         self._consume_thread: Optional[threading.Thread] = None
-        self._executor = ThreadPoolExecutor(max_workers=10)
+        self._workers: List[threading.Thread] = []
+        self._worker_queues: List[queue.Queue] = []
+        self._offsets: Dict[Any, _PartitionOffsets] = {}
+        self._offsets_lock = threading.Lock()
+        self._offsets_changed = threading.Condition(self._offsets_lock)
+        # 分区 -> 未能放入工作队列的 (处理器, 消息, 偏移跟踪)，只在拉取线程访问
+        self._backlog: Dict[Any, deque] = {}
+        self._last_commit = 0.0
         
-        if not KAFKA_AVAILABLE:
+        if not KAFKA_AVAILABLE and consumer_factory is None:
             logger.warning("Kafka未安装，消费者服务将被禁用")
     
     async def start(self) -> bool:
         """启动消费者"""
-        if not KAFKA_AVAILABLE:
+        if not KAFKA_AVAILABLE and self.consumer_factory is None:
             return False
         
         try:
-            self._consumer = KafkaConsumer(
-                *self.topics,
+            factory = self.consumer_factory or KafkaConsumer
+            self._consumer = factory(
                 bootstrap_servers=self.bootstrap_servers,
                 group_id=self.group_id,
                 client_id=self.client_id,
@@ -378,34 +516,55 @@ class KafkaConsumerService:
                 value_deserializer=lambda x: json.loads(x.decode('utf-8')),
                 key_deserializer=lambda x: x.decode('utf-8') if x else None
             )
+            self._consumer.subscribe(topics=self.topics, listener=_RebalanceListener(self))
             
             self._is_running = True
+            self._offsets.clear()
+            self._backlog.clear()
+            
+            # 启动工作线程
+            self._worker_queues = [queue.Queue(maxsize=self.worker_queue_size) for _ in range(self.num_workers)]
+            self._workers = [
+                threading.Thread(target=self._worker_loop, args=(work_queue,), daemon=True,
+                                 name=f"{self.client_id}_worker_{i}")
+                for i, work_queue in enumerate(self._worker_queues)
+            ]
+            for worker in self._workers:
+                worker.start()
             
             # 启动消费线程
             self._consume_thread = threading.Thread(target=self._consume_loop, daemon=True)
             self._consume_thread.start()
             
-            logger.info(f"Kafka消费者启动成功: 主题 {self.topics}, 组 {self.group_id}")
+            logger.info(f"Kafka消费者启动成功: 主题 {self.topics}, 组 {self.group_id}, 工作线程 {self.num_workers}")
             return True
             
         except Exception as e:
             logger.error(f"Kafka消费者启动失败: {e}")
             return False
     
-    async def stop(self) -> None:
-        """停止消费者"""
+    async def stop(self, timeout: float = 10) -> None:
+        """停止消费者：停止拉取，处理完已分发的消息并提交偏移后关闭"""
         try:
             self._is_running = False
+            loop = asyncio.get_running_loop()
+            
+            if self._consume_thread and self._consume_thread.is_alive():
+                await loop.run_in_executor(None, self._consume_thread.join, timeout)
             
+            for work_queue in self._worker_queues:
+                work_queue.put(None)
+            for worker in self._workers:
+                await loop.run_in_executor(None, worker.join, timeout)
+            self._workers = []
+            self._worker_queues = []
+            
+            self._backlog.clear()
             if self._consumer:
+                self._commit_completed(force=True)
                 self._consumer.close()
                 self._consumer = None
             
-            if self._consume_thread and self._consume_thread.is_alive():
-                self._consume_thread.join(timeout=10)
-            
-            self._executor.shutdown(wait=True, timeout=10)
-            
             logger.info("Kafka消费者已停止")
             
         except Exception as e:
@@ -421,46 +580,55 @@ class KafkaConsumerService:
         logger.info(f"已注册主题处理器: {topic}")
     
     def _consume_loop(self) -> None:
-        """消费循环"""
+        """消费循环：分发积压、拉取、分发、提交已完成的偏移（消费者对象只在本线程使用）"""
         logger.info("开始消费消息")
+        # 拉取等待不超过提交间隔，空闲时已完成的偏移也能及时提交
+        poll_timeout_ms = max(100, min(1000, self.auto_commit_interval_ms))
         
         while self._is_running and self._consumer:
             try:
-                # 拉取消息
-                message_batch = self._consumer.poll(timeout_ms=1000)
+                if self._backlog:
+                    self._drain_backlog()
                 
-                if not message_batch:
-                    continue
+                # 有积压时短等待，尽快重试分发
+                message_batch = self._consumer.poll(timeout_ms=10 if self._backlog else poll_timeout_ms)
                 
-                # 处理消息
                 for topic_partition, records in message_batch.items():
                     topic = topic_partition.topic
+                    handler = self._message_handlers.get(topic)
+                    if handler is None:
+                        logger.warning(f"未找到主题处理器: {topic}")
                     
                     for record in records:
+                        tracker = self._track(topic_partition, record.offset)
                         try:
                             # 创建消息对象
                             message = Message(
                                 key=record.key,
                                 value=record.value,
-                                headers=dict(record.headers) if record.headers else None,
+                                headers=self._decode_headers(record.headers),
                                 partition=record.partition,
                                 offset=record.offset,
                                 timestamp=datetime.fromtimestamp(record.timestamp / 1000) if record.timestamp else None
                             )
                             
                             # 更新统计
-                            self._stats.messages_consumed += 1
-                            self._stats.last_consume_time = datetime.now()
+                            with self._stats_lock:
+                                self._stats.messages_consumed += 1
+                                self._stats.last_consume_time = datetime.now()
                             
-                            # 异步处理消息
-                            if topic in self._message_handlers:
-                                self._executor.submit(self._handle_message, topic, message)
+                            if handler is None:
+                                self._complete(tracker, record.offset)
                             else:
-                                logger.warning(f"未找到主题处理器: {topic}")
+                                self._dispatch(topic_partition, tracker, handler, message)
                             
                         except Exception as e:
                             logger.error(f"处理消息失败: {e}")
-                            self._stats.messages_failed += 1
+                            with self._stats_lock:
+                                self._stats.messages_failed += 1
+                            self._complete(tracker, record.offset)
+                
+                self._commit_completed()
                 
             except Exception as e:
                 logger.error(f"消费循环失败: {e}")
@@ -468,27 +636,203 @@ class KafkaConsumerService:
         
         logger.info("消费循环结束")
     
-    def _handle_message(self, topic: str, message: Message) -> None:
-        """处理单条消息"""
+    @staticmethod
+    def _decode_headers(headers) -> Optional[Dict[str, str]]:
+        if not headers:
+            return None
+        return {
+            key: value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+            for key, value in headers
+        }
+    
+    def _worker_index(self, topic_partition, message: Message) -> int:
+        if self.ordering == "key" and message.key is not None:
+            return hash(message.key) % self.num_workers
+        return hash((topic_partition.topic, topic_partition.partition)) % self.num_workers
+    
+    def _dispatch(self, topic_partition, tracker: _PartitionOffsets, handler: Callable, message: Message) -> None:
+        """放入对应工作线程的队列；队列满或该分区已有积压时进入积压并暂停该分区"""
+        backlog = self._backlog.get(topic_partition)
+        if backlog is None:
+            work_queue = self._worker_queues[self._worker_index(topic_partition, message)]
+            try:
+                work_queue.put_nowait((tracker, handler, message))
+                return
+            except queue.Full:
+                backlog = self._backlog[topic_partition] = deque()
+                self._consumer.pause(topic_partition)
+        backlog.append((handler, message, tracker))
+    
+    def _drain_backlog(self) -> None:
+        """按顺序把积压放入工作队列，分区积压清空后恢复拉取"""
+        for topic_partition in list(self._backlog):
+            backlog = self._backlog[topic_partition]
+            while backlog:
+                handler, message, tracker = backlog[0]
+                work_queue = self._worker_queues[self._worker_index(topic_partition, message)]
+                try:
+                    work_queue.put_nowait((tracker, handler, message))
+                except queue.Full:
+                    break
+                backlog.popleft()
+            if not backlog:
+                del self._backlog[topic_partition]
+                self._consumer.resume(topic_partition)
+    
+    def _worker_loop(self, work_queue: queue.Queue) -> None:
+        """工作线程：按队列顺序处理消息，失败时重试，异步处理器复用本线程的事件循环"""
+        loop: Optional[asyncio.AbstractEventLoop] = None
         try:
-            handler = self._message_handlers.get(topic)
-            if handler:
-                if asyncio.iscoroutinefunction(handler):
-                    # 异步处理器需要在新的事件循环中运行
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
+            while True:
+                item = work_queue.get()
+                if item is None:
+                    break
+                tracker, handler, message = item
+                error: Optional[Exception] = None
+                for attempt in range(self.max_retries + 1):
+                    if attempt:
+                        if not self._is_running:
+                            break
+                        with self._stats_lock:
+                            self._stats.messages_retried += 1
+                        time.sleep(self.retry_backoff_ms * attempt / 1000.0)
                     try:
-                        loop.run_until_complete(handler(message))
-                    finally:
-                        loop.close()
+                        if asyncio.iscoroutinefunction(handler):
+                            if loop is None:
+                                loop = asyncio.new_event_loop()
+                            loop.run_until_complete(handler(message))
+                        else:
+                            handler(message)
+                        error = None
+                        break
+                    except Exception as e:
+                        error = e
+                        logger.error(f"消息处理器执行失败 (分区 {message.partition} 偏移 {message.offset}, 第{attempt + 1}次): {e}")
                 else:
-                    handler(message)
+                    # 重试用尽
+                    self._give_up(message, error)
+                    self._complete(tracker, message.offset)
+                    continue
                 
-                self._stats.messages_processed += 1
-            
-        except Exception as e:
-            logger.error(f"消息处理器执行失败: {e}")
+                if error is None:
+                    with self._stats_lock:
+                        self._stats.messages_processed += 1
+                    self._complete(tracker, message.offset)
+        finally:
+            if loop is not None:
+                loop.close()
+    
+    def _give_up(self, message: Message, error: Exception) -> None:
+        """重试用尽：计入失败并交给死信处理器"""
+        with self._stats_lock:
             self._stats.messages_failed += 1
+        if self.dead_letter_handler is None:
+            logger.error(f"消息处理失败，已跳过: 分区 {message.partition} 偏移 {message.offset}")
+            return
+        try:
+            self.dead_letter_handler(message, error)
+        except Exception as e:
+            logger.error(f"死信处理器执行失败: {e}")
+    
+    # ==================== 偏移管理 ====================
+    
+    def _track(self, topic_partition, offset: int) -> _PartitionOffsets:
+        with self._offsets_lock:
+            offsets = self._offsets.get(topic_partition)
+            if offsets is None:
+                offsets = self._offsets[topic_partition] = _PartitionOffsets()
+            offsets.pending.append(offset)
+            return offsets
+    
+    def _complete(self, tracker: _PartitionOffsets, offset: int) -> None:
+        # 跟踪对象随消息传递，分区被回收后迟到的完成只作用于已丢弃的对象
+        with self._offsets_changed:
+            tracker.complete(offset)
+            self._offsets_changed.notify_all()
+    
+    def _on_partitions_revoked(self, revoked) -> None:
+        """分区回收：丢弃积压，等待已分发的消息处理完，提交后清除跟踪（在poll()内调用）"""
+        revoked = set(revoked)
+        # 积压中的消息未处理，由新的分区所有者重新消费
+        stop_at = {}
+        for topic_partition in revoked:
+            backlog = self._backlog.pop(topic_partition, None)
+            if backlog:
+                stop_at[topic_partition] = backlog[0][1].offset
+        
+        deadline = time.monotonic() + self.revoke_timeout
+        with self._offsets_changed:
+            while True:
+                waiting = [
+                    topic_partition for topic_partition in revoked
+                    if topic_partition in self._offsets
+                    and self._offsets[topic_partition].pending
+                    and self._offsets[topic_partition].pending[0] < stop_at.get(topic_partition, float("inf"))
+                ]
+                remaining = deadline - time.monotonic()
+                if not waiting or remaining <= 0:
+                    break
+                self._offsets_changed.wait(remaining)
+            if waiting:
+                logger.warning(f"回收分区时仍有消息未处理完: {waiting}")
+            ready = {
+                topic_partition: offsets.committable
+                for topic_partition, offsets in (
+                    (tp, self._offsets.pop(tp)) for tp in revoked if tp in self._offsets
+                )
+                if offsets.committable is not None and offsets.committable != offsets.committed
+            }
+        
+        if ready and not self.enable_auto_commit:
+            try:
+                self._consumer.commit({
+                    topic_partition: self._offset_and_metadata(offset)
+                    for topic_partition, offset in ready.items()
+                })
+            except Exception as e:
+                logger.error(f"回收分区时提交偏移失败: {e}")
+        logger.info(f"回收分区: {sorted((tp.topic, tp.partition) for tp in revoked)}")
+    
+    def _commit_completed(self, force: bool = False) -> None:
+        """提交各分区连续处理完成的位置，默认按auto_commit_interval_ms节流"""
+        if self.enable_auto_commit or not self._consumer:
+            return
+        now = time.monotonic()
+        if not force and (now - self._last_commit) * 1000 < self.auto_commit_interval_ms:
+            return
+        self._last_commit = now
+        
+        with self._offsets_lock:
+            ready = {
+                topic_partition: offsets.committable
+                for topic_partition, offsets in self._offsets.items()
+                if offsets.committable is not None and offsets.committable != offsets.committed
+            }
+            in_flight = sum(len(offsets.pending) for offsets in self._offsets.values())
+        with self._stats_lock:
+            self._stats.in_flight = in_flight
+            self._stats.paused_partitions = len(self._backlog)
+        if not ready:
+            return
+        
+        try:
+            self._consumer.commit({
+                topic_partition: self._offset_and_metadata(offset)
+                for topic_partition, offset in ready.items()
+            })
+            with self._offsets_lock:
+                for topic_partition, offset in ready.items():
+                    if topic_partition in self._offsets:
+                        self._offsets[topic_partition].committed = offset
+        except Exception as e:
+            logger.error(f"提交偏移失败: {e}")
+    
+    @staticmethod
+    def _offset_and_metadata(offset: int):
+        # kafka-python 2.1起OffsetAndMetadata增加了leader_epoch字段
+        if len(OffsetAndMetadata._fields) > 2:
+            return OffsetAndMetadata(offset, None, -1)
+        return OffsetAndMetadata(offset, None)
     
     def get_stats(self) -> ConsumerStats:
         """获取统计信息"""
@@ -685,14 +1029,18 @@ class KafkaMessageService:
     def __init__(
         self,
         bootstrap_servers: List[str] = ["localhost:9092"],
-        client_id_prefix: str = "redfire"
+        client_id_prefix: str = "redfire",
+        producer_factory: Optional[Callable[..., Any]] = None,
+        consumer_factory: Optional[Callable[..., Any]] = None
     ):
         self.bootstrap_servers = bootstrap_servers
         self.client_id_prefix = client_id_prefix
+        self.consumer_factory = consumer_factory
         
         self.producer_service = KafkaProducerService(
             bootstrap_servers=bootstrap_servers,
-            client_id=f"{client_id_prefix}_producer"
+            client_id=f"{client_id_prefix}_producer",
+            producer_factory=producer_factory
         )
         
         self.topic_manager = KafkaTopicManager(bootstrap_servers)
@@ -750,6 +1098,8 @@ class KafkaMessageService:
     ) -> Optional[KafkaConsumerService]:
         """创建消费者"""
         try:
+            if self.consumer_factory is not None:
+                kwargs.setdefault("consumer_factory", self.consumer_factory)
             consumer_service = KafkaConsumerService(
                 bootstrap_servers=self.bootstrap_servers,
                 group_id=group_id,
@@ -0,0 +1,512 @@
+"""
+紧凑行情/订单表示
+
+供StrategyEngine高频行情路径使用，减少每个tick的对象分配和Decimal运算：
+- 价格以整数定点存储，精度按品种在SymbolTable中设置（默认PRICE_SCALE = 1e4），
+  缺失的买卖价为NO_PRICE；超出精度的价格在转换时抛出ValueError，不会被静默舍入
+- CompactTick: 带__slots__的单条行情，无实例字典、无indicators字典
+- TickBatch: numpy结构化数组保存一批行情，列和切片都是零拷贝视图
+- TickView: 批内单行的只读视图，按需读取字段
+- CompactOrder: 带__slots__的订单，价格和数量为定点整数
+
+MarketData / OrderInfo 与紧凑表示之间的转换只在策略边界进行：
+策略设置 accepts_compact_ticks = True 时直接收到CompactTick / TickView，
+否则引擎每条行情转换一次MarketData，供所有订阅策略共享。
+"""
+
+import math
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from .strategy_base import MarketData, OrderInfo, OrderSide, OrderType
+
+# 默认价格定点精度：1个单位 = 0.0001
+PRICE_SCALE = 10000
+# 数量定点精度：1个单位 = 0.000001
+QUANTITY_SCALE = 1000000
+# 缺失价格（买卖价为空）
+NO_PRICE = -(1 << 63)
+# 定点数的绝对值上限（不含），保证能存入int64且不与NO_PRICE冲突
+_FIXED_LIMIT = (1 << 63) - 1
+
+PRICE_FIELDS = ("open_px", "high_px", "low_px", "close_px", "bid_px", "ask_px")
+SIZE_FIELDS = ("volume", "amount", "bid_size", "ask_size")
+
+TICK_DTYPE = np.dtype(
+    [("symbol_id", np.int32), ("timestamp", np.float64)]
+    + [(name, np.int64) for name in PRICE_FIELDS]
+    + [(name, np.float64) for name in SIZE_FIELDS]
+)
+
+Number = Union[int, float, Decimal]
+
+
+def to_fixed(value: Optional[Number], scale: int = PRICE_SCALE) -> int:
+    """
+    数值转定点整数，None转NO_PRICE
+
+    Raises:
+        ValueError: 数值的小数位超出1/scale的精度（float只容许二进制表示误差），
+            或换算后超出int64范围
+    """
+    if value is None:
+        return NO_PRICE
+    if isinstance(value, int):
+        raw = value * scale
+    elif isinstance(value, Decimal):
+        scaled = value * scale
+        if not scaled.is_finite():
+            raise ValueError(f"{value} 不是有限数值")
+        raw = scaled.to_integral_value(ROUND_HALF_EVEN)
+        if raw != scaled:
+            raise ValueError(f"{value} 超出定点精度 1/{scale}")
+        raw = int(raw)
+    else:
+        scaled = value * scale
+        if not math.isfinite(scaled):
+            raise ValueError(f"{value} 不是有限数值")
+        raw = round(scaled)
+        if abs(scaled - raw) > 1e-6 + abs(scaled) * 1e-15:
+            raise ValueError(f"{value} 超出定点精度 1/{scale}")
+    if not abs(raw) < _FIXED_LIMIT:
+        raise ValueError(f"{value} 按精度 1/{scale} 换算后超出定点范围")
+    return raw
+
+
+def from_fixed(raw: int, scale: int = PRICE_SCALE) -> Optional[float]:
+    """定点整数转float，NO_PRICE转None"""
+    if raw == NO_PRICE:
+        return None
+    return raw / scale
+
+
+def fixed_to_decimal(raw: int, scale: int = PRICE_SCALE) -> Optional[Decimal]:
+    """定点整数转Decimal（无舍入误差），NO_PRICE转None"""
+    if raw == NO_PRICE:
+        return None
+    return Decimal(raw) / scale
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _size(value: Optional[float]) -> float:
+    return math.nan if value is None else float(value)
+
+
+class SymbolTable:
+    """
+    品种名与整数ID的双向映射及各品种的价格精度，TickBatch中只保存ID
+
+    品种首次出现时使用default_scale；最小变动价位更细的品种需在写入行情前set_scale()。
+    """
+
+    def __init__(self, default_scale: int = PRICE_SCALE):
+        self.default_scale = default_scale
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.scales: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def id_of(self, symbol: str) -> int:
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.ids[symbol] = len(self.names)
+            self.names.append(symbol)
+            self.scales.append(self.default_scale)
+        return symbol_id
+
+    def name_of(self, symbol_id: int) -> str:
+        return self.names[symbol_id]
+
+    def scale_of(self, symbol: str) -> int:
+        symbol_id = self.ids.get(symbol)
+        return self.default_scale if symbol_id is None else self.scales[symbol_id]
+
+    def set_scale(self, symbol: str, scale: int) -> None:
+        """
+        设置品种的价格精度
+
+        已写入的定点价格按原精度存储，改变精度后无法正确读取，因此只允许在首次使用前设置
+        或重复设置相同的值。
+        """
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is not None and self.scales[symbol_id] != scale:
+            raise ValueError(f"品种 {symbol} 已按精度 1/{self.scales[symbol_id]} 使用")
+        self.scales[self.id_of(symbol)] = scale
+
+
+# 默认共享的品种表，不同来源的批次使用同一套ID
+DEFAULT_SYMBOLS = SymbolTable()
+
+
+class _TickFields:
+    """CompactTick / TickView 共用的浮点价格访问和转换，scale为该行情的价格精度"""
+
+    __slots__ = ()
+
+    @property
+    def open(self) -> float:
+        return self.open_px / self.scale
+
+    @property
+    def high(self) -> float:
+        return self.high_px / self.scale
+
+    @property
+    def low(self) -> float:
+        return self.low_px / self.scale
+
+    @property
+    def close(self) -> float:
+        return self.close_px / self.scale
+
+    @property
+    def bid(self) -> Optional[float]:
+        return from_fixed(self.bid_px, self.scale)
+
+    @property
+    def ask(self) -> Optional[float]:
+        return from_fixed(self.ask_px, self.scale)
+
+    @property
+    def is_tick(self) -> bool:
+        """带买卖价的为Tick，否则为K线"""
+        return self.bid_px != NO_PRICE
+
+    def to_market_data(self) -> MarketData:
+        return MarketData(
+            symbol=self.symbol,
+            timestamp=datetime.fromtimestamp(self.timestamp),
+            open=self.open,
+            high=self.high,
+            low=self.low,
+            close=self.close,
+            volume=self.volume,
+            amount=_optional(self.amount),
+            bid=self.bid,
+            ask=self.ask,
+            bid_size=_optional(self.bid_size),
+            ask_size=_optional(self.ask_size)
+        )
+
+
+class CompactTick(_TickFields):
+    """
+    单条紧凑行情
+
+    *_px 为按scale换算的定点价格，timestamp为Unix秒；amount / bid_size / ask_size 缺失时为nan。
+    """
+
+    __slots__ = ("symbol", "timestamp", "scale") + PRICE_FIELDS + SIZE_FIELDS
+
+    def __init__(self, symbol: str, timestamp: float, close_px: int, volume: float = 0.0,
+                 open_px: Optional[int] = None, high_px: Optional[int] = None,
+                 low_px: Optional[int] = None, bid_px: int = NO_PRICE, ask_px: int = NO_PRICE,
+                 amount: float = math.nan, bid_size: float = math.nan, ask_size: float = math.nan,
+                 scale: int = PRICE_SCALE):
+        self.symbol = symbol
+        self.scale = scale
+        self.timestamp = timestamp
+        self.close_px = close_px
+        self.open_px = close_px if open_px is None else open_px
+        self.high_px = close_px if high_px is None else high_px
+        self.low_px = close_px if low_px is None else low_px
+        self.bid_px = bid_px
+        self.ask_px = ask_px
+        self.volume = volume
+        self.amount = amount
+        self.bid_size = bid_size
+        self.ask_size = ask_size
+
+    def __repr__(self) -> str:
+        return f"CompactTick({self.symbol}, {self.timestamp}, close={self.close}, bid={self.bid}, ask={self.ask})"
+
+    @classmethod
+    def from_market_data(cls, data: MarketData, symbols: Optional["SymbolTable"] = None) -> "CompactTick":
+        """按品种表中该品种的精度转换，默认DEFAULT_SYMBOLS"""
+        scale = (DEFAULT_SYMBOLS if symbols is None else symbols).scale_of(data.symbol)
+        close_px = to_fixed(data.close, scale)
+        return cls(
+            data.symbol,
+            data.timestamp.timestamp(),
+            close_px,
+            float(data.volume or 0.0),
+            open_px=to_fixed(data.open, scale),
+            high_px=to_fixed(data.high, scale),
+            low_px=to_fixed(data.low, scale),
+            bid_px=to_fixed(data.bid, scale),
+            ask_px=to_fixed(data.ask, scale),
+            amount=_size(data.amount),
+            bid_size=_size(data.bid_size),
+            ask_size=_size(data.ask_size),
+            scale=scale
+        )
+
+
+_FIELD_POSITIONS = {name: position for position, name in enumerate(TICK_DTYPE.names)}
+
+
+def _column_property(name: str) -> property:
+    position = _FIELD_POSITIONS[name]
+
+    def getter(self):
+        return self._load()[position]
+    return property(getter)
+
+
+class TickView(_TickFields):
+    """
+    TickBatch中单行的零拷贝视图
+
+    视图引用批次内存，首次读取字段时把该行取为元组，之后的读取不再访问numpy；
+    批次交给引擎后不应再修改，需要长期保存时用to_tick()复制。
+    """
+
+    __slots__ = ("_data", "_index", "_symbols", "_row")
+
+    def __init__(self, data: np.ndarray, index: int, symbols: SymbolTable):
+        self._data = data
+        self._index = index
+        self._symbols = symbols
+        self._row: Optional[tuple] = None
+
+    def _load(self) -> tuple:
+        row = self._row
+        if row is None:
+            row = self._row = self._data[self._index].item()
+        return row
+
+    def __repr__(self) -> str:
+        return f"TickView({self.symbol}, {self.timestamp}, close={self.close}, bid={self.bid}, ask={self.ask})"
+
+    @property
+    def symbol(self) -> str:
+        return self._symbols.names[self._load()[0]]
+
+    @property
+    def scale(self) -> int:
+        return self._symbols.scales[self._load()[0]]
+
+    def to_tick(self) -> CompactTick:
+        (symbol_id, timestamp, open_px, high_px, low_px, close_px, bid_px, ask_px,
+         volume, amount, bid_size, ask_size) = self._load()
+        return CompactTick(self._symbols.names[symbol_id], timestamp, close_px, volume,
+                           open_px=open_px, high_px=high_px, low_px=low_px,
+                           bid_px=bid_px, ask_px=ask_px, amount=amount,
+                           bid_size=bid_size, ask_size=ask_size,
+                           scale=self._symbols.scales[symbol_id])
+
+
+for _name in ("timestamp",) + PRICE_FIELDS + SIZE_FIELDS:
+    setattr(TickView, _name, _column_property(_name))
+del _name
+
+
+class TickBatch:
+    """
+    一批行情，底层为TICK_DTYPE的numpy结构化数组
+
+    Args:
+        capacity: 初始容量，写满后按2倍扩容
+        symbols: 品种表，默认DEFAULT_SYMBOLS
+
+    批次可以clear()后复用；切片返回共享内存的只读批次。
+    """
+
+    def __init__(self, capacity: int = 1024, symbols: Optional[SymbolTable] = None,
+                 data: Optional[np.ndarray] = None):
+        self.symbols = DEFAULT_SYMBOLS if symbols is None else symbols
+        if data is not None:
+            self._data = data
+            self._size = len(data)
+            self.readonly = True
+        else:
+            self._data = np.zeros(max(1, capacity), dtype=TICK_DTYPE)
+            self._size = 0
+            self.readonly = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        data, symbols = self._data, self.symbols
+        for index in range(self._size):
+            yield TickView(data, index, symbols)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return TickBatch(symbols=self.symbols, data=self._data[:self._size][item])
+        if item < 0:
+            item += self._size
+        if not 0 <= item < self._size:
+            raise IndexError("TickBatch索引越界")
+        return TickView(self._data, item, self.symbols)
+
+    @property
+    def data(self) -> np.ndarray:
+        """有效行的结构化数组视图"""
+        return self._data[:self._size]
+
+    def column(self, name: str) -> np.ndarray:
+        """单列的零拷贝视图（价格列为定点整数）"""
+        return self._data[name][:self._size]
+
+    def prices(self, name: str = "close_px") -> np.ndarray:
+        """价格列按各行品种的精度转换为float数组（会复制），缺失价格为nan"""
+        column = self.column(name)
+        scales = np.asarray(self.symbols.scales, dtype=np.float64)
+        result = column / scales[self.column("symbol_id")]
+        result[column == NO_PRICE] = np.nan
+        return result
+
+    def _write_row(self, row: tuple) -> None:
+        """写入下一行，写入成功后才计入长度，失败时不留下半写的行"""
+        if self.readonly:
+            raise ValueError("TickBatch切片为只读视图")
+        if self._size == len(self._data):
+            grown = np.zeros(len(self._data) * 2, dtype=TICK_DTYPE)
+            grown[:self._size] = self._data
+            self._data = grown
+        self._data[self._size] = row
+        self._size += 1
+
+    def append(self, symbol: str, timestamp: float, close: Number, volume: float = 0.0,
+               bid: Optional[Number] = None, ask: Optional[Number] = None,
+               bid_size: Optional[float] = None, ask_size: Optional[float] = None,
+               open: Optional[Number] = None, high: Optional[Number] = None,
+               low: Optional[Number] = None, amount: Optional[float] = None) -> None:
+        """追加一条行情，价格为浮点或Decimal，写入时按品种精度转为定点"""
+        symbols = self.symbols
+        symbol_id = symbols.id_of(symbol)
+        scale = symbols.scales[symbol_id]
+        close_px = to_fixed(close, scale)
+        row = (
+            symbol_id, timestamp,
+            close_px if open is None else to_fixed(open, scale),
+            close_px if high is None else to_fixed(high, scale),
+            close_px if low is None else to_fixed(low, scale),
+            close_px, to_fixed(bid, scale), to_fixed(ask, scale),
+            volume, _size(amount), _size(bid_size), _size(ask_size)
+        )
+        self._write_row(row)
+
+    def append_tick(self, tick: CompactTick) -> None:
+        symbol_id = self.symbols.id_of(tick.symbol)
+        if self.symbols.scales[symbol_id] != tick.scale:
+            raise ValueError(f"行情精度 1/{tick.scale} 与品种表中 {tick.symbol} 的精度不一致")
+        self._write_row((
+            symbol_id, tick.timestamp,
+            tick.open_px, tick.high_px, tick.low_px, tick.close_px, tick.bid_px, tick.ask_px,
+            tick.volume, tick.amount, tick.bid_size, tick.ask_size
+        ))
+
+    def append_market_data(self, data: MarketData) -> None:
+        self.append(
+            data.symbol, data.timestamp.timestamp(), data.close, float(data.volume or 0.0),
+            bid=data.bid, ask=data.ask, bid_size=data.bid_size, ask_size=data.ask_size,
+            open=data.open, high=data.high, low=data.low, amount=data.amount
+        )
+
+    def clear(self) -> None:
+        """清空以复用缓冲区"""
+        if self.readonly:
+            raise ValueError("TickBatch切片为只读视图")
+        self._size = 0
+
+    def last_by_symbol(self) -> Dict[str, TickView]:
+        """每个品种在批内的最后一条行情"""
+        ids = self.column("symbol_id")
+        if not self._size:
+            return {}
+        unique_ids, reversed_index = np.unique(ids[::-1], return_index=True)
+        last = self._size - 1 - reversed_index
+        return {
+            self.symbols.names[symbol_id]: TickView(self._data, index, self.symbols)
+            for symbol_id, index in zip(unique_ids.tolist(), last.tolist())
+        }
+
+    @classmethod
+    def from_market_data(cls, items: Iterable[MarketData],
+                         symbols: Optional[SymbolTable] = None) -> "TickBatch":
+        items = list(items)
+        batch = cls(len(items), symbols)
+        for data in items:
+            batch.append_market_data(data)
+        return batch
+
+
+class CompactOrder:
+    """
+    紧凑订单，价格按price_scale、数量按QUANTITY_SCALE存为定点整数
+
+    与OrderInfo互相转换，用于需要大量缓存或比较订单的热路径。
+    """
+
+    __slots__ = (
+        "order_id", "symbol", "side", "order_type", "quantity", "price_px",
+        "stop_price_px", "filled_quantity", "status", "timestamp", "strategy_id", "price_scale"
+    )
+
+    def __init__(self, order_id: str, symbol: str, side: OrderSide, order_type: OrderType,
+                 quantity: int, price_px: int = NO_PRICE, stop_price_px: int = NO_PRICE,
+                 filled_quantity: int = 0, status: str = "pending",
+                 timestamp: float = 0.0, strategy_id: str = "", price_scale: int = PRICE_SCALE):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.side = side
+        self.order_type = order_type
+        self.quantity = quantity
+        self.price_px = price_px
+        self.stop_price_px = stop_price_px
+        self.filled_quantity = filled_quantity
+        self.status = status
+        self.timestamp = timestamp
+        self.strategy_id = strategy_id
+        self.price_scale = price_scale
+
+    @property
+    def remaining(self) -> int:
+        return self.quantity - self.filled_quantity
+
+    @classmethod
+    def from_order_info(cls, order: OrderInfo, symbols: Optional[SymbolTable] = None) -> "CompactOrder":
+        """按品种表中该品种的精度转换，默认DEFAULT_SYMBOLS"""
+        scale = (DEFAULT_SYMBOLS if symbols is None else symbols).scale_of(order.symbol)
+        return cls(
+            order.order_id, order.symbol, order.side, order.order_type,
+            to_fixed(order.quantity, QUANTITY_SCALE),
+            price_px=to_fixed(order.price, scale),
+            stop_price_px=to_fixed(order.stop_price, scale),
+            filled_quantity=to_fixed(order.filled_quantity, QUANTITY_SCALE),
+            status=order.status,
+            timestamp=order.timestamp.timestamp(),
+            strategy_id=order.strategy_id,
+            price_scale=scale
+        )
+
+    def to_order_info(self) -> OrderInfo:
+        return OrderInfo(
+            order_id=self.order_id,
+            symbol=self.symbol,
+            side=self.side,
+            order_type=self.order_type,
+            quantity=fixed_to_decimal(self.quantity, QUANTITY_SCALE),
+            price=fixed_to_decimal(self.price_px, self.price_scale),
+            stop_price=fixed_to_decimal(self.stop_price_px, self.price_scale),
+            status=self.status,
+            timestamp=datetime.fromtimestamp(self.timestamp),
+            filled_quantity=fixed_to_decimal(self.filled_quantity, QUANTITY_SCALE),
+            strategy_id=self.strategy_id
+        )
+
+
+def as_market_data(data: Any) -> MarketData:
+    """MarketData原样返回，紧凑行情转换为MarketData"""
+    return data if isinstance(data, MarketData) else data.to_market_data()
@@ -18,12 +18,17 @@ from datetime import datetime, timedelta
 from dataclasses import dataclass, field
 from enum import Enum
 from decimal import Decimal
+import time
 import uuid
 
 from .strategy_base import (
     BaseStrategy, StrategyConfig, MarketData, OrderInfo, TradeInfo, 
-    PositionInfo, OrderSide, OrderType, PositionSide
+    PositionInfo, OrderSide, OrderType
 )
+from .risk_state import IncrementalRiskState, StrategyBook, SymbolBook
+from .stress_engine import StressEngine, StressParams, ScenarioGrid, PositionSnapshot, StressReport
+from shared.metrics.histogram import LatencyHistogram
+from shared.risk.ewma_covariance import EwmaCovarianceEstimator
 
 
 class RiskLevel(Enum):
@@ -108,11 +113,21 @@ class RiskConfig:
     var_confidence_level: float = 0.95   # VaR置信度
     var_holding_period: int = 1          # VaR持有期（天）
     var_history_days: int = 252          # VaR历史数据天数
+    ewma_decay: float = 0.94             # EWMA协方差衰减系数
+    covariance_capacity: int = 1024      # 协方差矩阵预分配品种数
     
     # 监控频率
     monitoring_interval: int = 60        # 监控间隔（秒）
     stress_test_interval: int = 3600     # 压力测试间隔（秒）
     
+    # 压力测试
+    stress_workers: int = 0              # 情景计算进程数，0为不启动子进程
+    stress_replay_horizon: int = 1       # 历史回放的收益率期数
+    stress_max_replays: int = 250        # 历史回放情景数上限
+    stress_loss_threshold: float = 0.2   # 策略最差情景损失比例告警阈值
+    default_volatility: float = 0.02     # 缺少价格历史时的单期波动率
+    default_half_spread: float = 0.0005  # 缺少买卖价时的半价差
+    
     # 告警配置
     enable_email_alerts: bool = True
     enable_sms_alerts: bool = False
@@ -161,6 +176,33 @@ class RiskManager:
         self._correlation_matrix: Optional[pd.DataFrame] = None
         self._beta_cache: Dict[str, float] = {}
         
+        # 在线EWMA协方差（行情到达时增量更新，VaR/相关性只读快照）
+        self._covariance = EwmaCovarianceEstimator(
+            decay=self.config.ewma_decay,
+            capacity=self.config.covariance_capacity
+        )
+        
+        # 增量风险状态（成交/行情时更新，预交易检查只读）
+        self._risk_state = IncrementalRiskState()
+        # 检查耗时以微秒记录，覆盖10ns ~ 1s
+        self._pre_trade_checks: List[Tuple[str, Callable, LatencyHistogram]] = [
+            ("position", self._check_position_limit, LatencyHistogram(1e-2, 1e6)),
+            ("exposure", self._check_exposure_limit, LatencyHistogram(1e-2, 1e6)),
+            ("leverage", self._check_leverage_limit, LatencyHistogram(1e-2, 1e6)),
+            ("liquidity", self._check_liquidity_limit, LatencyHistogram(1e-2, 1e6)),
+        ]
+        self._pre_trade_latency = LatencyHistogram(1e-2, 1e6)
+        self._pre_trade_rejects: Dict[str, int] = {name: 0 for name, _, _ in self._pre_trade_checks}
+        self._pre_trade_rejects["unregistered"] = 0
+        
+        # 压力测试
+        self._stress_engine = StressEngine(
+            max_workers=self.config.stress_workers,
+            params=StressParams(confidence_level=self.config.var_confidence_level)
+        )
+        self._stress_grid = ScenarioGrid.build()
+        self._stress_report: Optional[StressReport] = None
+        
         # 监控任务
         self._monitoring_task: Optional[asyncio.Task] = None
         self._stress_test_task: Optional[asyncio.Task] = None
@@ -244,6 +286,7 @@ class RiskManager:
             
             self._strategies[strategy_id] = strategy
             self._strategy_limits[strategy_id] = []
+            self._risk_state.add_strategy(strategy)
             
             # 为策略创建默认风险限额
             self._create_strategy_limits(strategy)
@@ -263,6 +306,7 @@ class RiskManager:
                 return False
             
             del self._strategies[strategy_id]
+            self._risk_state.remove_strategy(strategy_id)
             if strategy_id in self._strategy_limits:
                 del self._strategy_limits[strategy_id]
             
@@ -337,6 +381,8 @@ class RiskManager:
                 self._monitoring_task.cancel()
             if self._stress_test_task:
                 self._stress_test_task.cancel()
+            # 等待进程池退出会阻塞，放到线程中执行
+            await asyncio.to_thread(self._stress_engine.shutdown)
             
             self.logger.info("风险监控停止")
             return True
@@ -374,13 +420,12 @@ class RiskManager:
     async def _update_risk_metrics(self):
         """更新风险指标"""
         try:
-            # 计算总敞口
-            total_exposure = self._calculate_total_exposure()
-            self._current_risks["total_exposure"] = total_exposure
+            # 按策略当前持仓与权益校正增量状态（成交可能未经过on_order_filled）
+            self._risk_state.rebuild(self._strategies.values())
             
-            # 计算杠杆比率
-            leverage = self._calculate_leverage()
-            self._current_risks["leverage"] = leverage
+            # 总敞口与杠杆比率
+            self._current_risks["total_exposure"] = self._risk_state.total_exposure
+            self._current_risks["leverage"] = self._risk_state.leverage
             
             # 计算现金比例
             cash_ratio = self._calculate_cash_ratio()
@@ -397,50 +442,6 @@ class RiskManager:
         except Exception as e:
             self.logger.error(f"更新风险指标失败: {e}")
     
-    def _calculate_total_exposure(self) -> float:
-        """计算总敞口"""
-        try:
-            total_exposure = 0.0
-            total_capital = 0.0
-            
-            for strategy in self._strategies.values():
-                strategy_capital = float(strategy.config.initial_capital)
-                total_capital += strategy_capital
-                
-                for position in strategy.get_all_positions().values():
-                    position_value = float(position.market_value)
-                    total_exposure += abs(position_value)
-            
-            if total_capital > 0:
-                return total_exposure / total_capital
-            return 0.0
-            
-        except Exception as e:
-            self.logger.error(f"计算总敞口失败: {e}")
-            return 0.0
-    
-    def _calculate_leverage(self) -> float:
-        """计算杠杆比率"""
-        try:
-            total_position_value = 0.0
-            total_equity = 0.0
-            
-            for strategy in self._strategies.values():
-                equity = float(strategy.account_balance)
-                total_equity += equity
-                
-                for position in strategy.get_all_positions().values():
-                    position_value = float(position.market_value)
-                    total_position_value += abs(position_value)
-            
-            if total_equity > 0:
-                return total_position_value / total_equity
-            return 0.0
-            
-        except Exception as e:
-            self.logger.error(f"计算杠杆比率失败: {e}")
-            return 0.0
-    
     def _calculate_cash_ratio(self) -> float:
         """计算现金比例"""
         try:
@@ -735,10 +736,32 @@ class RiskManager:
                 # 缓存结果
                 self._var_cache[strategy_id] = (datetime.now(), var_value)
                 self._current_risks[f"{strategy_id}_var"] = abs(var_value)
+            
+            # 持仓参数VaR：读取协方差快照中持仓品种的子矩阵
+            self._calculate_position_var()
                 
         except Exception as e:
             self.logger.error(f"计算VaR失败: {e}")
     
+    def _calculate_position_var(self):
+        """基于EWMA协方差的持仓VaR（占权益比例），每个策略O(k²)，k为其持仓品种数"""
+        z_score = self._stress_engine.params.z_score
+        state = self._risk_state
+        total_symbols = [symbol for symbol, symbol_book in state.symbols.items() if symbol_book.abs_quantity]
+        
+        for strategy_id, book in state.strategies.items():
+            if not book.positions or book.equity <= 0:
+                continue
+            symbols = list(book.positions)
+            exposures = np.array([size * state.symbols[symbol].mark for symbol, size in book.positions.items()])
+            pnl_std = self._covariance.portfolio_std(symbols, exposures)
+            self._current_risks[f"{strategy_id}_position_var"] = z_score * pnl_std / book.equity
+        
+        if total_symbols and state.total_equity > 0:
+            exposures = np.array([state.symbols[symbol].net_notional for symbol in total_symbols])
+            pnl_std = self._covariance.portfolio_std(total_symbols, exposures)
+            self._current_risks["portfolio_var"] = z_score * pnl_std / state.total_equity
+    
     def _get_strategy_returns(self, strategy: BaseStrategy) -> List[float]:
         """获取策略历史收益率"""
         try:
@@ -818,82 +841,124 @@ class RiskManager:
     async def _run_stress_scenarios(self):
         """运行压力测试情景"""
         try:
-            # 市场下跌情景
-            await self._test_market_shock(-0.1)  # 10%下跌
-            await self._test_market_shock(-0.2)  # 20%下跌
+            report = await self.run_stress_test()
+            if report is None:
+                return
             
-            # 波动率冲击
-            await self._test_volatility_shock(2.0)  # 波动率翻倍
+            # 检查策略是否能承受最差情景
+            for strategy_id, worst in report.strategy_worst_case().items():
+                if worst["loss_ratio"] > self.config.stress_loss_threshold:
+                    self.logger.warning(
+                        f"策略 {strategy_id} 在压力测试中损失 {worst['loss_ratio']:.2%}: {worst['scenario']}"
+                    )
             
-            # 流动性危机
-            await self._test_liquidity_crisis()
+            # 流动性危机：现金比例过低
+            for strategy_id, strategy in self._strategies.items():
+                balance = float(strategy.account_balance)
+                cash_ratio = float(strategy.available_balance) / balance if balance > 0 else 0.0
+                if cash_ratio < 0.1:
+                    self.logger.warning(f"策略 {strategy_id} 流动性不足: 现金比例 {cash_ratio:.2%}")
             
         except Exception as e:
             self.logger.error(f"运行压力测试失败: {e}")
     
-    async def _test_market_shock(self, shock_magnitude: float):
-        """测试市场冲击情景"""
-        try:
-            self.logger.info(f"压力测试: 市场冲击 {shock_magnitude:.1%}")
-            
-            total_impact = 0.0
-            
-            for strategy in self._strategies.values():
-                strategy_impact = 0.0
-                
-                for position in strategy.get_all_positions().values():
-                    position_value = float(position.market_value)
-                    
-                    if position.side == PositionSide.LONG:
-                        impact = position_value * shock_magnitude
-                    else:
-                        impact = -position_value * shock_magnitude
-                    
-                    strategy_impact += impact
-                
-                total_impact += strategy_impact
-                
-                # 检查策略是否能承受冲击
-                strategy_capital = float(strategy.account_balance)
-                impact_ratio = abs(strategy_impact) / strategy_capital if strategy_capital > 0 else 0
-                
-                if impact_ratio > 0.2:  # 超过20%损失
-                    self.logger.warning(f"策略 {strategy.strategy_id} 在压力测试中损失 {impact_ratio:.2%}")
-            
-        except Exception as e:
-            self.logger.error(f"市场冲击测试失败: {e}")
-    
-    async def _test_volatility_shock(self, volatility_multiplier: float):
-        """测试波动率冲击"""
+    async def run_stress_test(self, grid: Optional[ScenarioGrid] = None) -> Optional[StressReport]:
+        """对当前全部持仓运行情景网格与历史回放压力测试"""
         try:
-            self.logger.info(f"压力测试: 波动率冲击 {volatility_multiplier}x")
+            snapshot = self._build_stress_snapshot()
+            report = await self._stress_engine.run(
+                snapshot,
+                grid or self._stress_grid,
+                replay_horizon=self.config.stress_replay_horizon,
+                max_replays=self.config.stress_max_replays
+            )
+            self._stress_report = report
+            self.logger.info(f"压力测试完成: {len(report.scenario_names)}个情景, 耗时 {report.elapsed_ms:.1f}ms")
+            return report
             
-            # 计算各策略在高波动率环境下的风险
-            for strategy in self._strategies.values():
-                if strategy.strategy_id in self._var_cache:
-                    current_var = self._var_cache[strategy.strategy_id][1]
-                    stressed_var = current_var * volatility_multiplier
-                    
-                    # 检查是否超过风险承受能力
-                    if abs(stressed_var) > 0.05:  # 超过5%的VaR
-                        self.logger.warning(f"策略 {strategy.strategy_id} 在波动率冲击下VaR: {stressed_var:.2%}")
-                        
         except Exception as e:
-            self.logger.error(f"波动率冲击测试失败: {e}")
+            self.logger.error(f"压力测试失败: {e}")
+            return None
+    
+    def _build_stress_snapshot(self) -> PositionSnapshot:
+        """由增量风险状态生成列式持仓快照"""
+        state = self._risk_state
+        strategy_ids = list(state.strategies)
+        symbols = [symbol for symbol, symbol_book in state.symbols.items() if symbol_book.abs_quantity]
+        symbol_pos = {symbol: m for m, symbol in enumerate(symbols)}
+        
+        strategy_index, symbol_index, quantity = [], [], []
+        for k, book in enumerate(state.strategies.values()):
+            for symbol, size in book.positions.items():
+                strategy_index.append(k)
+                symbol_index.append(symbol_pos[symbol])
+                quantity.append(size)
+        
+        symbol_books = [state.symbols[symbol] for symbol in symbols]
+        half_spread = np.full(len(symbols), self.config.default_half_spread)
+        for m, symbol in enumerate(symbols):
+            data = self._market_data.get(symbol)
+            if data is not None and data.bid and data.ask and data.ask > data.bid:
+                half_spread[m] = (data.ask - data.bid) / (data.ask + data.bid)
+        
+        history, volatility = self._stress_price_history(symbols)
+        
+        cash = np.array([
+            float(self._strategies[strategy_id].available_balance) if strategy_id in self._strategies else 0.0
+            for strategy_id in strategy_ids
+        ])
+        return PositionSnapshot(
+            strategy_ids=strategy_ids,
+            symbols=symbols,
+            strategy_index=np.array(strategy_index, dtype=np.int64),
+            symbol_index=np.array(symbol_index, dtype=np.int64),
+            quantity=np.array(quantity, dtype=float),
+            mark=np.array([symbol_book.mark for symbol_book in symbol_books], dtype=float),
+            volume=np.array([symbol_book.volume for symbol_book in symbol_books], dtype=float),
+            volatility=volatility,
+            half_spread=half_spread,
+            equity=np.array([book.equity for book in state.strategies.values()], dtype=float),
+            cash=cash,
+            history=history
+        )
+    
+    def _stress_price_history(self, symbols: List[str]) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """按尾部对齐的价格矩阵 (T, M) 与各品种单期波动率"""
+        volatility = np.full(len(symbols), self.config.default_volatility)
+        length = min(
+            max((len(self._price_history.get(symbol, ())) for symbol in symbols), default=0),
+            self.config.stress_max_replays + self.config.stress_replay_horizon
+        )
+        if length < 2:
+            ready = self._covariance.period_counts(symbols) >= self._covariance.min_periods
+            if ready.any():
+                volatility[ready] = self._covariance.volatility(symbols)[ready]
+            return None, volatility
+        
+        history = np.full((length, len(symbols)), np.nan)
+        for m, symbol in enumerate(symbols):
+            prices = self._price_history.get(symbol)
+            if prices:
+                tail = prices[-length:]
+                history[length - len(tail):, m] = tail
+        
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_returns = np.diff(np.log(history), axis=0)
+        log_returns[~np.isfinite(log_returns)] = np.nan
+        counts = np.count_nonzero(~np.isnan(log_returns), axis=0)
+        valid = counts >= 3
+        if valid.any():
+            volatility[valid] = np.nanstd(log_returns[:, valid], axis=0, ddof=1)
+        
+        # 协方差估计已有足够周期的品种使用EWMA波动率
+        ready = self._covariance.period_counts(symbols) >= self._covariance.min_periods
+        if ready.any():
+            volatility[ready] = self._covariance.volatility(symbols)[ready]
+        return history, volatility
     
-    async def _test_liquidity_crisis(self):
-        """测试流动性危机"""
-        try:
-            self.logger.info("压力测试: 流动性危机")
-            
-            for strategy in self._strategies.values():
-                cash_ratio = float(strategy.available_balance) / float(strategy.account_balance)
-                
-                if cash_ratio < 0.1:  # 现金比例过低
-                    self.logger.warning(f"策略 {strategy.strategy_id} 流动性不足: 现金比例 {cash_ratio:.2%}")
-                    
-        except Exception as e:
-            self.logger.error(f"流动性危机测试失败: {e}")
+    def get_stress_report(self) -> Optional[StressReport]:
+        """获取最近一次压力测试结果"""
+        return self._stress_report
     
     # ==================== 事件处理 ====================
     
@@ -997,6 +1062,12 @@ class RiskManager:
         """获取相关性矩阵"""
         return self._correlation_matrix.copy() if self._correlation_matrix is not None else None
     
+    def get_asset_correlation(self, symbols: Optional[List[str]] = None) -> pd.DataFrame:
+        """获取品种EWMA相关系数矩阵快照，默认为当前持仓品种"""
+        if symbols is None:
+            symbols = [symbol for symbol, symbol_book in self._risk_state.symbols.items() if symbol_book.abs_quantity]
+        return pd.DataFrame(self._covariance.correlation(symbols), index=symbols, columns=symbols)
+    
     def get_beta_values(self) -> Dict[str, float]:
         """获取Beta值"""
         return self._beta_cache.copy()
@@ -1036,7 +1107,10 @@ class RiskManager:
                     for event in self._active_events.values()
                 ],
                 "var_values": self.get_var_values(),
-                "beta_values": self.get_beta_values()
+                "beta_values": self.get_beta_values(),
+                "symbol_exposures": self._risk_state.symbol_exposures(),
+                "stress_test": self._stress_report.to_dict() if self._stress_report is not None else None,
+                "pre_trade": self.get_pre_trade_stats()
             }
             
             return report
@@ -1049,6 +1123,8 @@ class RiskManager:
         """更新市场数据"""
         try:
             self._market_data[data.symbol] = data
+            self._risk_state.mark(data.symbol, data.close, data.volume)
+            self._covariance.observe(data.symbol, data.close, data.timestamp)
             
             # 更新价格历史
             if data.symbol not in self._price_history:
@@ -1063,97 +1139,114 @@ class RiskManager:
         except Exception as e:
             self.logger.error(f"更新市场数据失败: {e}")
     
+    async def on_order_filled(self, order: OrderInfo, trade: TradeInfo):
+        """成交回调：增量更新风险状态（可注册为引擎的order_filled监听器）"""
+        try:
+            quantity = float(trade.quantity)
+            if trade.side == OrderSide.SELL:
+                quantity = -quantity
+            self._risk_state.apply_fill(trade.strategy_id or order.strategy_id, trade.symbol,
+                                        quantity, float(trade.price))
+        except Exception as e:
+            self.logger.error(f"更新成交风险状态失败: {e}")
+    
     # ==================== 预交易风险检查 ====================
     
     async def check_order_risk(self, order: OrderInfo, strategy: BaseStrategy) -> Tuple[bool, str]:
         """检查订单风险"""
+        return self.check_order_risk_sync(order, strategy)
+    
+    def check_order_risk_sync(self, order: OrderInfo, strategy: BaseStrategy) -> Tuple[bool, str]:
+        """
+        同步预交易风险检查
+        
+        只读取增量风险状态，每项限额的检查都是O(1)，不随策略和持仓数量增长；
+        通过时不分配新对象，拒绝时才格式化原因。未通过add_strategy加入风险监控的策略直接拒绝。
+        """
+        clock = time.perf_counter_ns
+        start = clock()
         try:
-            # 检查仓位限制
-            position_check = await self._check_position_risk(order, strategy)
-            if not position_check[0]:
-                return position_check
-            
-            # 检查集中度风险
-            concentration_check = await self._check_concentration_risk(order, strategy)
-            if not concentration_check[0]:
-                return concentration_check
-            
-            # 检查流动性风险
-            liquidity_check = await self._check_liquidity_risk(order)
-            if not liquidity_check[0]:
-                return liquidity_check
+            state = self._risk_state
+            book = state.strategies.get(strategy.strategy_id)
+            if book is None:
+                self._pre_trade_rejects["unregistered"] += 1
+                return False, f"策略未加入风险监控: {strategy.strategy_id}"
+            symbol_book = state.symbols.get(order.symbol)
+            
+            quantity = float(order.quantity)
+            if order.price:
+                price = float(order.price)
+            else:
+                price = symbol_book.mark if symbol_book is not None else 0.0
+            held = book.positions.get(order.symbol, 0.0)
+            new_size = held + quantity if order.side == OrderSide.BUY else held - quantity
+            
+            for name, check, latency in self._pre_trade_checks:
+                check_start = clock()
+                reason = check(order, book, symbol_book, quantity, price, held, new_size)
+                latency.record((clock() - check_start) / 1000.0)
+                if reason is not None:
+                    self._pre_trade_rejects[name] += 1
+                    return False, reason
             
             return True, "风险检查通过"
             
         except Exception as e:
             self.logger.error(f"订单风险检查失败: {e}")
             return False, f"风险检查异常: {e}"
-    
-    async def _check_position_risk(self, order: OrderInfo, strategy: BaseStrategy) -> Tuple[bool, str]:
-        """检查仓位风险"""
-        try:
-            # 计算新订单后的总仓位
-            current_position = strategy.get_position(order.symbol)
-            current_size = float(current_position.quantity) if current_position else 0.0
-            
-            if order.side == OrderSide.BUY:
-                new_size = current_size + float(order.quantity)
-            else:
-                new_size = current_size - float(order.quantity)
-            
-            # 检查单个品种仓位限制
-            position_value = abs(new_size) * float(order.price or 0)
-            capital = float(strategy.account_balance)
-            
-            if capital > 0:
-                position_ratio = position_value / capital
-                if position_ratio > self.config.max_single_position:
-                    return False, f"单个品种仓位超限: {position_ratio:.2%} > {self.config.max_single_position:.2%}"
-            
-            return True, "仓位风险检查通过"
-            
-        except Exception as e:
-            self.logger.error(f"仓位风险检查失败: {e}")
-            return False, f"仓位风险检查异常: {e}"
-    
-    async def _check_concentration_risk(self, order: OrderInfo, strategy: BaseStrategy) -> Tuple[bool, str]:
-        """检查集中度风险"""
-        try:
-            # 检查总敞口
-            total_exposure = self._calculate_total_exposure()
+        finally:
+            self._pre_trade_latency.record((clock() - start) / 1000.0)
+    
+    def _check_position_limit(self, order: OrderInfo, book: StrategyBook, symbol_book: Optional[SymbolBook],
+                              quantity: float, price: float, held: float, new_size: float) -> Optional[str]:
+        """单个品种仓位：下单后持仓价值 / 策略权益"""
+        if book.equity > 0:
+            position_ratio = abs(new_size) * price / book.equity
+            if position_ratio > self.config.max_single_position:
+                return f"单个品种仓位超限: {position_ratio:.2%} > {self.config.max_single_position:.2%}"
+        return None
+    
+    def _check_exposure_limit(self, order: OrderInfo, book: StrategyBook, symbol_book: Optional[SymbolBook],
+                              quantity: float, price: float, held: float, new_size: float) -> Optional[str]:
+        """总敞口：下单后的总名义价值 / 总资本，减仓订单不受限"""
+        state = self._risk_state
+        notional_delta = (abs(new_size) - abs(held)) * price
+        if notional_delta > 0 and state.total_capital > 0:
+            total_exposure = (state.total_gross + notional_delta) / state.total_capital
             if total_exposure > self.config.max_total_exposure:
-                return False, f"总敞口超限: {total_exposure:.2%} > {self.config.max_total_exposure:.2%}"
-            
-            return True, "集中度风险检查通过"
-            
-        except Exception as e:
-            self.logger.error(f"集中度风险检查失败: {e}")
-            return False, f"集中度风险检查异常: {e}"
-    
-    async def _check_liquidity_risk(self, order: OrderInfo) -> Tuple[bool, str]:
-        """检查流动性风险"""
-        try:
-            # 检查市场数据可用性
-            if order.symbol not in self._market_data:
-                return False, f"缺少市场数据: {order.symbol}"
-            
-            market_data = self._market_data[order.symbol]
-            
-            # 检查成交量
-            if market_data.volume <= 0:
-                return False, f"缺少成交量数据: {order.symbol}"
-            
-            # 检查订单大小与成交量的比例
-            order_value = float(order.quantity) * market_data.close
-            volume_value = market_data.volume * market_data.close
-            
-            if volume_value > 0:
-                size_ratio = order_value / volume_value
-                if size_ratio > self.config.max_position_size_ratio:
-                    return False, f"订单过大: {size_ratio:.2%} > {self.config.max_position_size_ratio:.2%}"
-            
-            return True, "流动性风险检查通过"
-            
-        except Exception as e:
-            self.logger.error(f"流动性风险检查失败: {e}")
-            return False, f"流动性风险检查异常: {e}"
+                return f"总敞口超限: {total_exposure:.2%} > {self.config.max_total_exposure:.2%}"
+        return None
+    
+    def _check_leverage_limit(self, order: OrderInfo, book: StrategyBook, symbol_book: Optional[SymbolBook],
+                              quantity: float, price: float, held: float, new_size: float) -> Optional[str]:
+        """杠杆：下单后的总名义价值 / 总权益，减仓订单不受限"""
+        state = self._risk_state
+        notional_delta = (abs(new_size) - abs(held)) * price
+        if notional_delta > 0 and state.total_equity > 0:
+            leverage = (state.total_gross + notional_delta) / state.total_equity
+            if leverage > self.config.max_leverage:
+                return f"杠杆超限: {leverage:.2f} > {self.config.max_leverage:.2f}"
+        return None
+    
+    def _check_liquidity_limit(self, order: OrderInfo, book: StrategyBook, symbol_book: Optional[SymbolBook],
+                               quantity: float, price: float, held: float, new_size: float) -> Optional[str]:
+        """流动性：订单数量占最新成交量的比例"""
+        if order.symbol not in self._market_data:
+            return f"缺少市场数据: {order.symbol}"
+        
+        if symbol_book.volume <= 0:
+            return f"缺少成交量数据: {order.symbol}"
+        
+        size_ratio = quantity / symbol_book.volume
+        if size_ratio > self.config.max_position_size_ratio:
+            return f"订单过大: {size_ratio:.2%} > {self.config.max_position_size_ratio:.2%}"
+        return None
+    
+    def get_pre_trade_stats(self) -> Dict[str, Any]:
+        """获取预交易检查的耗时（微秒）与拒单统计"""
+        latency = {name: stats.summary((0.5, 0.99)) for name, _, stats in self._pre_trade_checks}
+        latency["total"] = self._pre_trade_latency.summary((0.5, 0.99))
+        return {
+            "latency": latency,
+            "rejects": self._pre_trade_rejects.copy()
+        }
@@ -0,0 +1,180 @@
+"""
+增量风险状态
+
+供RiskManager预交易检查使用的运行时聚合：
+- 每个策略的资本、权益、各品种带符号持仓和总名义价值
+- 每个品种的标记价格、成交量、多空持仓合计和持有策略
+- 全局总名义价值、总资本、总权益
+
+成交和行情到达时按增量更新，预交易检查只读取这些聚合值，
+不随持仓数量增长。浮点累加的误差由监控循环定期调用rebuild()校正。
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from .strategy_base import BaseStrategy, PositionSide
+
+
+class StrategyBook:
+    """单个策略的聚合"""
+
+    __slots__ = ("strategy_id", "capital", "equity", "gross", "positions")
+
+    def __init__(self, strategy_id: str, capital: float, equity: float):
+        self.strategy_id = strategy_id
+        self.capital = capital
+        self.equity = equity
+        self.gross = 0.0  # sum(|持仓| * 标记价格)
+        self.positions: Dict[str, float] = {}  # 品种 -> 带符号持仓
+
+
+class SymbolBook:
+    """单个品种的聚合"""
+
+    __slots__ = ("mark", "volume", "abs_quantity", "net_quantity", "holders")
+
+    def __init__(self, mark: float = 0.0):
+        self.mark = mark
+        self.volume = 0.0
+        self.abs_quantity = 0.0  # 各策略 |持仓| 之和
+        self.net_quantity = 0.0
+        self.holders: Dict[str, StrategyBook] = {}
+
+    @property
+    def gross_notional(self) -> float:
+        return self.abs_quantity * self.mark
+
+    @property
+    def net_notional(self) -> float:
+        return self.net_quantity * self.mark
+
+
+class IncrementalRiskState:
+    """增量维护的组合风险聚合"""
+
+    def __init__(self):
+        self.strategies: Dict[str, StrategyBook] = {}
+        self.symbols: Dict[str, SymbolBook] = {}
+        self.total_gross = 0.0
+        self.total_capital = 0.0
+        self.total_equity = 0.0
+
+    # ==================== 策略 ====================
+
+    def add_strategy(self, strategy: BaseStrategy) -> StrategyBook:
+        """登记策略并按其当前持仓建立聚合"""
+        self.remove_strategy(strategy.strategy_id)
+        book = StrategyBook(strategy.strategy_id, float(strategy.config.initial_capital), float(strategy.account_balance))
+        self.strategies[strategy.strategy_id] = book
+        self.total_capital += book.capital
+        self.total_equity += book.equity
+
+        for symbol, position in strategy.get_all_positions().items():
+            quantity = float(position.quantity)
+            if position.side == PositionSide.SHORT:
+                quantity = -quantity
+            symbol_book = self._symbol(symbol)
+            if not symbol_book.mark and quantity:
+                # 没有行情时用持仓市值反推价格
+                symbol_book.mark = abs(float(position.market_value) / quantity)
+            self._set_position(book, symbol, symbol_book, quantity)
+        return book
+
+    def remove_strategy(self, strategy_id: str) -> None:
+        book = self.strategies.pop(strategy_id, None)
+        if book is None:
+            return
+        for symbol in list(book.positions):
+            self._set_position(book, symbol, self.symbols[symbol], 0.0)
+        self.total_capital -= book.capital
+        self.total_equity -= book.equity
+
+    def set_equity(self, strategy_id: str, equity: float) -> None:
+        book = self.strategies.get(strategy_id)
+        if book is not None:
+            self.total_equity += equity - book.equity
+            book.equity = equity
+
+    def rebuild(self, strategies: Iterable[BaseStrategy]) -> None:
+        """从策略对象重建全部聚合（保留行情）"""
+        self.strategies.clear()
+        self.total_gross = self.total_capital = self.total_equity = 0.0
+        for symbol_book in self.symbols.values():
+            symbol_book.abs_quantity = symbol_book.net_quantity = 0.0
+            symbol_book.holders.clear()
+        for strategy in strategies:
+            self.add_strategy(strategy)
+
+    # ==================== 成交与行情 ====================
+
+    def _symbol(self, symbol: str) -> SymbolBook:
+        symbol_book = self.symbols.get(symbol)
+        if symbol_book is None:
+            symbol_book = self.symbols[symbol] = SymbolBook()
+        return symbol_book
+
+    def _set_position(self, book: StrategyBook, symbol: str, symbol_book: SymbolBook, quantity: float) -> None:
+        old = book.positions.get(symbol, 0.0)
+        abs_delta = abs(quantity) - abs(old)
+        notional_delta = abs_delta * symbol_book.mark
+
+        symbol_book.abs_quantity += abs_delta
+        symbol_book.net_quantity += quantity - old
+        book.gross += notional_delta
+        self.total_gross += notional_delta
+
+        if quantity:
+            book.positions[symbol] = quantity
+            symbol_book.holders[book.strategy_id] = book
+        else:
+            book.positions.pop(symbol, None)
+            symbol_book.holders.pop(book.strategy_id, None)
+
+    def apply_fill(self, strategy_id: str, symbol: str, signed_quantity: float, price: float) -> None:
+        """成交后更新持仓聚合，买入为正、卖出为负"""
+        book = self.strategies.get(strategy_id)
+        if book is None:
+            return
+        symbol_book = self._symbol(symbol)
+        if not symbol_book.mark:
+            self.mark(symbol, price)
+        self._set_position(book, symbol, symbol_book, book.positions.get(symbol, 0.0) + signed_quantity)
+
+    def mark(self, symbol: str, price: float, volume: Optional[float] = None) -> None:
+        """更新标记价格，只重估持有该品种的策略"""
+        symbol_book = self._symbol(symbol)
+        if volume is not None:
+            symbol_book.volume = volume
+        price_delta = price - symbol_book.mark
+        if not price_delta:
+            return
+        symbol_book.mark = price
+        if symbol_book.abs_quantity:
+            self.total_gross += symbol_book.abs_quantity * price_delta
+            for book in symbol_book.holders.values():
+                book.gross += abs(book.positions[symbol]) * price_delta
+
+    # ==================== 查询 ====================
+
+    @property
+    def total_exposure(self) -> float:
+        """总名义价值 / 总资本"""
+        return self.total_gross / self.total_capital if self.total_capital > 0 else 0.0
+
+    @property
+    def leverage(self) -> float:
+        """总名义价值 / 总权益"""
+        return self.total_gross / self.total_equity if self.total_equity > 0 else 0.0
+
+    def symbol_exposures(self) -> List[Dict[str, float]]:
+        return [
+            {
+                "symbol": symbol,
+                "mark": symbol_book.mark,
+                "gross_notional": symbol_book.gross_notional,
+                "net_notional": symbol_book.net_notional
+            }
+            for symbol, symbol_book in self.symbols.items()
+            if symbol_book.abs_quantity
+        ]
+
@@ -190,6 +190,9 @@ class BaseStrategy(ABC):
     提供完整的策略生命周期管理和事件处理机制。
     """
     
+    # 为True时引擎直接推送紧凑行情(CompactTick / TickView)到on_compact_tick，不转换为MarketData
+    accepts_compact_ticks: bool = False
+    
     def __init__(self, config: StrategyConfig):
         """
         初始化策略
@@ -417,6 +420,14 @@ class BaseStrategy(ABC):
         """处理K线数据"""
         pass
     
+    async def on_compact_tick(self, tick):
+        """处理紧凑行情（可选重写），默认转换为MarketData后调用on_tick / on_bar"""
+        data = tick.to_market_data()
+        if tick.is_tick:
+            await self.on_tick(data)
+        else:
+            await self.on_bar(data)
+    
     async def on_pause(self):
         """策略暂停时调用（可选重写）"""
         pass
@@ -624,6 +635,22 @@ class BaseStrategy(ABC):
         except Exception as e:
             await self._handle_error(e)
     
+    async def _on_compact_tick(self, tick):
+        """处理紧凑行情(CompactTick / TickView)，仅在accepts_compact_ticks为True时由引擎调用"""
+        try:
+            if self._state != StrategyState.RUNNING:
+                return
+
+            # 紧凑行情提供symbol / close / bid / ask，可直接用于持仓盈亏和当前价格
+            self._market_data[tick.symbol] = tick
+            await self._update_position_pnl(tick)
+            await self._check_risk_controls()
+
+            await self.on_compact_tick(tick)
+
+        except Exception as e:
+            await self._handle_error(e)
+
     async def _on_trade_filled(self, trade: TradeInfo):
         """处理成交"""
         try:
@@ -14,12 +14,15 @@ from dataclasses import dataclass, field
 from enum import Enum
 import pandas as pd
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 
 from .strategy_base import (
     BaseStrategy, StrategyConfig, StrategyState, StrategyType,
     MarketData, OrderInfo, TradeInfo, PositionInfo, OrderSide, OrderType
 )
+from .compact_data import CompactTick, TickBatch, TickView, as_market_data
+from .strategy_inbox import BackpressurePolicy, StrategyInbox
 
 
 class EngineState(Enum):
@@ -53,6 +56,10 @@ class EngineConfig:
     order_queue_size: int = 1000
     data_queue_size: int = 10000
     
+    # 背压配置：引擎数据队列和策略收件箱写满时的处理方式，默认等待不丢数据
+    strategy_inbox_size: int = 1000
+    backpressure_policy: BackpressurePolicy = BackpressurePolicy.BLOCK
+    
     # 风险配置
     enable_risk_control: bool = True
     max_daily_loss: float = 0.05
@@ -85,7 +92,11 @@ class EngineStats:
     
     # 数据统计
     data_packets_processed: int = 0
-    data_processing_latency: float = 0.0  # 毫秒
+    data_processing_latency: float = 0.0  # 策略处理单条数据耗时，毫秒
+    data_dispatch_latency: float = 0.0    # 单条数据放入收件箱耗时，毫秒
+    data_packets_dropped: int = 0         # 引擎数据队列丢弃
+    inbox_conflated: int = 0              # 策略收件箱合并
+    inbox_dropped: int = 0                # 策略收件箱丢弃
     
     # 系统统计
     cpu_usage: float = 0.0
@@ -126,7 +137,12 @@ class StrategyEngine:
         # 数据管理
         self._data_queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.data_queue_size)
         self._data_subscribers: Dict[str, Set[str]] = {}  # symbol -> strategy_ids
-        self._data_cache: Dict[str, MarketData] = {}
+        # 分发索引：symbol -> [(运行中的策略, 收件箱)]，策略启停时重建
+        self._symbol_routes: Dict[str, List[tuple]] = {}
+        self._strategy_inboxes: Dict[str, StrategyInbox] = {}
+        self._inbox_settings: Dict[str, tuple] = {}  # strategy_id -> (容量, 背压策略)
+        self._retired_inbox_counts = [0, 0]  # 已停止策略收件箱的合并、丢弃数
+        self._data_cache: Dict[str, Union[MarketData, CompactTick]] = {}
         
         # 订单管理
         self._order_queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.order_queue_size)
@@ -232,8 +248,17 @@ class StrategyEngine:
     
     # ==================== 策略管理 ====================
     
-    async def add_strategy(self, strategy: BaseStrategy) -> bool:
-        """添加策略"""
+    async def add_strategy(self, strategy: BaseStrategy,
+                           backpressure: Optional[BackpressurePolicy] = None,
+                           inbox_size: Optional[int] = None) -> bool:
+        """
+        添加策略
+        
+        Args:
+            strategy: 策略实例
+            backpressure: 该策略收件箱的背压策略，默认使用引擎配置
+            inbox_size: 该策略收件箱容量，默认使用引擎配置
+        """
         try:
             strategy_id = strategy.strategy_id
             
@@ -248,6 +273,10 @@ class StrategyEngine:
             # 添加策略
             self._strategies[strategy_id] = strategy
             self._strategy_locks[strategy_id] = asyncio.Lock()
+            self._inbox_settings[strategy_id] = (
+                inbox_size or self.config.strategy_inbox_size,
+                backpressure or self.config.backpressure_policy
+            )
             
             # 订阅数据
             for symbol in strategy.config.symbols:
@@ -285,6 +314,7 @@ class StrategyEngine:
             del self._strategies[strategy_id]
             if strategy_id in self._strategy_locks:
                 del self._strategy_locks[strategy_id]
+            self._inbox_settings.pop(strategy_id, None)
             
             self._stats.total_strategies -= 1
             self.logger.info(f"策略移除成功: {strategy_id}")
@@ -311,10 +341,13 @@ class StrategyEngine:
             success = await strategy.start()
             
             if success:
-                # 创建策略任务
+                # 创建收件箱和常驻工作协程，并加入分发索引
+                inbox_size, policy = self._inbox_settings[strategy_id]
+                self._strategy_inboxes[strategy_id] = StrategyInbox(inbox_size, policy)
                 self._strategy_tasks[strategy_id] = asyncio.create_task(
                     self._run_strategy(strategy_id)
                 )
+                self._rebuild_routes(strategy.config.symbols)
                 
                 self._stats.running_strategies += 1
                 self._trigger_event("strategy_started", strategy)
@@ -339,10 +372,17 @@ class StrategyEngine:
                 self.logger.warning(f"策略未运行: {strategy_id}")
                 return True
             
-            # 停止策略任务
+            # 停止策略任务，移出分发索引
             if strategy_id in self._strategy_tasks:
                 self._strategy_tasks[strategy_id].cancel()
                 del self._strategy_tasks[strategy_id]
+            inbox = self._strategy_inboxes.pop(strategy_id, None)
+            if inbox is not None:
+                # 分发协程可能正等待该收件箱的空位，关闭以唤醒
+                inbox.close()
+                self._retired_inbox_counts[0] += inbox.conflated
+                self._retired_inbox_counts[1] += inbox.dropped
+            self._rebuild_routes(strategy.config.symbols)
             
             # 停止策略
             success = await strategy.stop()
@@ -376,14 +416,19 @@ class StrategyEngine:
         return stopped_count
     
     async def _run_strategy(self, strategy_id: str):
-        """运行策略任务"""
+        """策略工作循环：按到达顺序处理收件箱中的数据，直到策略停止时被取消"""
+        strategy = self._strategies.get(strategy_id)
+        inbox = self._strategy_inboxes.get(strategy_id)
         try:
-            strategy = self._strategies.get(strategy_id)
-            if not strategy:
+            if not strategy or inbox is None:
                 return
             
-            while strategy.is_running and self.is_running:
-                await asyncio.sleep(0.1)  # 策略主循环
+            while True:
+                data = await inbox.get()
+                start_time = time.perf_counter()
+                await self._send_data_to_strategy(strategy, data)
+                self._stats.data_processing_latency = (time.perf_counter() - start_time) * 1000
+                inbox.processed += 1
                 
         except asyncio.CancelledError:
             pass
@@ -392,10 +437,23 @@ class StrategyEngine:
             self._stats.error_strategies += 1
             self._trigger_event("strategy_error", strategy, e)
     
+    def _rebuild_routes(self, symbols: List[str]):
+        """重建这些品种的分发索引，只包含有收件箱（运行中）的策略"""
+        for symbol in symbols:
+            routes = [
+                (self._strategies[strategy_id], self._strategy_inboxes[strategy_id])
+                for strategy_id in sorted(self._data_subscribers.get(symbol, ()))
+                if strategy_id in self._strategy_inboxes
+            ]
+            if routes:
+                self._symbol_routes[symbol] = routes
+            else:
+                self._symbol_routes.pop(symbol, None)
+    
     # ==================== 数据管理 ====================
     
-    async def feed_data(self, data: MarketData):
-        """推送市场数据"""
+    async def feed_data(self, data: Union[MarketData, CompactTick]):
+        """推送市场数据（MarketData或CompactTick）"""
         try:
             if not self.is_running:
                 return
@@ -404,15 +462,44 @@ class StrategyEngine:
             self._data_cache[data.symbol] = data
             
             # 推送到队列
-            if not self._data_queue.full():
-                await self._data_queue.put(data)
-                self._stats.data_packets_processed += 1
-            else:
-                self.logger.warning("数据队列已满，丢弃数据")
+            await self._enqueue_data(data, 1)
                 
         except Exception as e:
             self.logger.error(f"推送数据失败: {e}")
     
+    async def feed_batch(self, batch: TickBatch):
+        """
+        批量推送行情，整批只占一个队列位置
+        
+        批次交给引擎后不应再修改或clear()，策略收到的TickView引用批次内存；
+        data_received事件的参数为整个批次。
+        """
+        try:
+            if not self.is_running or not len(batch):
+                return
+            
+            # 数据缓存：每个品种的最新行情
+            self._data_cache.update(batch.last_by_symbol())
+            
+            await self._enqueue_data(batch, len(batch))
+                
+        except Exception as e:
+            self.logger.error(f"批量推送数据失败: {e}")
+    
+    async def _enqueue_data(self, item: Union[MarketData, CompactTick, TickBatch], count: int):
+        """写入引擎数据队列：DROP_OLDEST时丢弃最旧的数据并计数，否则等待空位（合并只在策略收件箱中进行）"""
+        queue = self._data_queue
+        if self.config.backpressure_policy != BackpressurePolicy.DROP_OLDEST:
+            await queue.put(item)
+        else:
+            while queue.full():
+                dropped = queue.get_nowait()
+                if self._stats.data_packets_dropped % 1000 == 0:
+                    self.logger.warning(f"数据队列已满，丢弃最旧数据，累计丢弃: {self._stats.data_packets_dropped}")
+                self._stats.data_packets_dropped += len(dropped) if isinstance(dropped, TickBatch) else 1
+            queue.put_nowait(item)
+        self._stats.data_packets_processed += count
+    
     async def _process_data(self):
         """处理数据队列"""
         try:
@@ -421,29 +508,21 @@ class StrategyEngine:
                     # 获取数据
                     data = await asyncio.wait_for(self._data_queue.get(), timeout=1.0)
                     
-                    start_time = datetime.now()
+                    start_time = time.perf_counter()
                     
                     # 分发数据到订阅策略
-                    if data.symbol in self._data_subscribers:
-                        tasks = []
-                        for strategy_id in self._data_subscribers[data.symbol]:
-                            if strategy_id in self._strategies:
-                                strategy = self._strategies[strategy_id]
-                                if strategy.is_running:
-                                    task = asyncio.create_task(
-                                        self._send_data_to_strategy(strategy, data)
-                                    )
-                                    tasks.append(task)
-                        
-                        # 等待所有策略处理完成
-                        if tasks:
-                            await asyncio.gather(*tasks, return_exceptions=True)
+                    if isinstance(data, TickBatch):
+                        await self._dispatch_batch(data)
+                        count = len(data)
+                    else:
+                        await self._dispatch_data(data.symbol, data)
+                        count = 1
                     
-                    # 更新延迟统计
-                    latency = (datetime.now() - start_time).total_seconds() * 1000
-                    self._stats.data_processing_latency = latency
+                    # 更新分发延迟统计（批次按单条平均），策略处理耗时由工作协程统计
+                    self._stats.data_dispatch_latency = (time.perf_counter() - start_time) * 1000 / count
                     
-                    self._trigger_event("data_received", data)
+                    if self._event_callbacks["data_received"]:
+                        self._trigger_event("data_received", data)
                     
                 except asyncio.TimeoutError:
                     continue
@@ -453,12 +532,48 @@ class StrategyEngine:
         except asyncio.CancelledError:
             pass
     
-    async def _send_data_to_strategy(self, strategy: BaseStrategy, data: MarketData):
+    async def _dispatch_batch(self, batch: TickBatch):
+        """逐条分发批次中有订阅的行情，无订阅的行不创建对象"""
+        data, symbols = batch.data, batch.symbols
+        names = symbols.names
+        routes = self._symbol_routes
+        for index, symbol_id in enumerate(batch.column("symbol_id").tolist()):
+            symbol = names[symbol_id]
+            if symbol in routes:
+                await self._dispatch_data(symbol, TickView(data, index, symbols))
+    
+    async def _dispatch_data(self, symbol: str, data):
+        """
+        把一条行情放入订阅策略的收件箱，由各策略的工作协程并行处理
+        
+        紧凑行情只为不接受紧凑格式的策略转换一次MarketData。
+        """
+        routes = self._symbol_routes.get(symbol)
+        if not routes:
+            return
+        
+        compact = not isinstance(data, MarketData)
+        converted = None
+        for strategy, inbox in routes:
+            payload = data
+            if compact and not strategy.accepts_compact_ticks:
+                if converted is None:
+                    converted = data.to_market_data()
+                payload = converted
+            if inbox.blocking:
+                await inbox.put(payload)
+            else:
+                inbox.put_nowait(payload)
+    
+    async def _send_data_to_strategy(self, strategy: BaseStrategy, data: Union[MarketData, CompactTick]):
         """发送数据到策略"""
         try:
             # 使用锁防止并发问题
             async with self._strategy_locks[strategy.strategy_id]:
-                await strategy._on_market_data(data)
+                if isinstance(data, MarketData):
+                    await strategy._on_market_data(data)
+                else:
+                    await strategy._on_compact_tick(data)
                 
         except Exception as e:
             self.logger.error(f"策略数据处理异常 {strategy.strategy_id}: {e}")
@@ -618,6 +733,11 @@ class StrategyEngine:
             if self._stats.start_time:
                 self._stats.uptime = datetime.now() - self._stats.start_time
             
+            # 收件箱累计合并、丢弃数（含已停止策略）
+            inboxes = self._strategy_inboxes.values()
+            self._stats.inbox_conflated = self._retired_inbox_counts[0] + sum(i.conflated for i in inboxes)
+            self._stats.inbox_dropped = self._retired_inbox_counts[1] + sum(i.dropped for i in inboxes)
+            
             # 统计策略状态
             running_count = sum(1 for s in self._strategies.values() if s.is_running)
             self._stats.running_strategies = running_count
@@ -639,6 +759,11 @@ class StrategyEngine:
             if order_queue_size > self.config.order_queue_size * 0.8:
                 self.logger.warning(f"订单队列接近满载: {order_queue_size}")
             
+            # 检查策略收件箱积压
+            for strategy_id, inbox in self._strategy_inboxes.items():
+                if inbox.qsize() > inbox.capacity * 0.8:
+                    self.logger.warning(f"策略收件箱接近满载 {strategy_id}: {inbox.qsize()}/{inbox.capacity}")
+            
             # 检查策略状态
             for strategy_id, strategy in self._strategies.items():
                 if strategy.state == StrategyState.ERROR:
@@ -681,13 +806,18 @@ class StrategyEngine:
         """获取策略状态"""
         return {sid: strategy.state for sid, strategy in self._strategies.items()}
     
+    def get_inbox_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取运行中策略的收件箱统计"""
+        return {strategy_id: inbox.get_stats() for strategy_id, inbox in self._strategy_inboxes.items()}
+    
     def get_pending_orders(self) -> Dict[str, OrderInfo]:
         """获取待处理订单"""
         return self._pending_orders.copy()
     
     def get_market_data(self, symbol: str) -> Optional[MarketData]:
         """获取市场数据"""
-        return self._data_cache.get(symbol)
+        data = self._data_cache.get(symbol)
+        return None if data is None else as_market_data(data)
 
 
 class StrategyManager:
@@ -0,0 +1,134 @@
+"""
+策略收件箱
+
+StrategyEngine为每个运行中的策略维护一个有界收件箱，由该策略的常驻工作协程消费。
+收件箱写满时按背压策略处理，并计数以便观察数据损失：
+- BLOCK: 分发方等待空位，慢策略会拖慢上游，不丢数据（默认）
+- CONFLATE: 同一品种只保留最新一条未处理的Tick，满时挤掉最旧的Tick；K线逐条保留，不合并也不挤掉
+- DROP_OLDEST: 丢弃最旧的一条
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from enum import Enum
+from itertools import count
+from typing import Any, Dict, Hashable, Optional
+
+
+class BackpressurePolicy(Enum):
+    """收件箱背压策略"""
+    CONFLATE = "conflate"
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+
+
+def conflation_key(data: Any) -> Optional[Hashable]:
+    """合并键：Tick按品种合并，K线返回None不参与合并"""
+    return data.symbol if data.bid is not None else None
+
+
+class StrategyInbox(asyncio.Queue):
+    """
+    有界策略收件箱
+
+    Args:
+        maxsize: 容量
+        policy: 写满时的背压策略
+
+    非BLOCK策略下put_nowait永不抛出QueueFull，容量由_put自行维持。
+    策略停止时close()：丢弃未处理的数据，唤醒等待空位的分发方，之后的写入直接返回。
+    """
+
+    def __init__(self, maxsize: int = 1000, policy: BackpressurePolicy = BackpressurePolicy.BLOCK):
+        self.policy = policy
+        self.capacity = max(1, maxsize)
+        self.blocking = policy == BackpressurePolicy.BLOCK
+        self.closed = False
+
+        # 统计
+        self.received = 0
+        self.processed = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.high_watermark = 0
+
+        super().__init__(self.capacity if self.blocking else 0)
+
+    def _init(self, maxsize):
+        if self.policy == BackpressurePolicy.CONFLATE:
+            self._queue = OrderedDict()
+            self._bar_keys = count()
+        else:
+            self._queue = deque()
+
+    def _put(self, item):
+        self.received += 1
+        queue = self._queue
+        if self.policy == BackpressurePolicy.CONFLATE:
+            key = conflation_key(item)
+            if key is None:
+                # K线用唯一键排队
+                key = ("bar", next(self._bar_keys))
+            elif key in queue:
+                # 保留原排队位置，只替换为最新数据
+                queue[key] = item
+                self.conflated += 1
+                return
+            if len(queue) >= self.capacity and self._drop_oldest_tick():
+                self.dropped += 1
+            queue[key] = item
+        else:
+            if not self.blocking and len(queue) >= self.capacity:
+                queue.popleft()
+                self.dropped += 1
+            queue.append(item)
+        if len(queue) > self.high_watermark:
+            self.high_watermark = len(queue)
+
+    def _drop_oldest_tick(self) -> bool:
+        """挤掉最旧的Tick，队列中只有K线时不丢弃，允许暂时超出容量"""
+        for key in self._queue:
+            if not isinstance(key, tuple):
+                del self._queue[key]
+                return True
+        return False
+
+    def _get(self):
+        if self.policy == BackpressurePolicy.CONFLATE:
+            return self._queue.popitem(last=False)[1]
+        return self._queue.popleft()
+
+    async def put(self, item):
+        if self.closed:
+            return
+        if self.full():
+            self.blocked += 1
+        await super().put(item)
+
+    def put_nowait(self, item):
+        if self.closed:
+            return
+        super().put_nowait(item)
+
+    def close(self) -> None:
+        """关闭收件箱，被唤醒的put看到已关闭后不再写入"""
+        self.closed = True
+        self._queue.clear()
+        while self._putters:
+            putter = self._putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'policy': self.policy.value,
+            'capacity': self.capacity,
+            'size': self.qsize(),
+            'received': self.received,
+            'processed': self.processed,
+            'conflated': self.conflated,
+            'dropped': self.dropped,
+            'blocked': self.blocked,
+            'high_watermark': self.high_watermark
+        }
@@ -0,0 +1,326 @@
+"""
+情景网格压力测试引擎
+
+为RiskManager提供批量压力测试：
+- 持仓快照为列式数组（策略索引、品种索引、带符号数量），由增量风险状态直接生成
+- 价格、波动率、流动性冲击组成情景网格，与历史回放情景一起构成系数矩阵
+- 情景损益 = R @ W - H @ |W| - G @ I，其中W为品种×策略的名义价值矩阵，
+  I为平方根冲击成本的暴露项，整批情景一次矩阵运算
+- 情景可按行分片到进程池
+- 每个情景给出最差策略和最差品种归因
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StressParams:
+    """压力测试参数（传入子进程，只含基本类型）"""
+    confidence_level: float = 0.95   # 波动率冲击的尾部分位
+    impact_coefficient: float = 1.0  # 平方根冲击成本系数: cost = k * sigma * sqrt(Q / V)
+    top_symbols: int = 3             # 每个情景归因的最差品种数
+
+    @property
+    def z_score(self) -> float:
+        return NormalDist().inv_cdf(self.confidence_level)
+
+
+@dataclass
+class PositionSnapshot:
+    """列式持仓快照，P为持仓数、M为品种数、K为策略数"""
+    strategy_ids: List[str]
+    symbols: List[str]
+    strategy_index: np.ndarray   # (P,)
+    symbol_index: np.ndarray     # (P,)
+    quantity: np.ndarray         # (P,) 多头为正、空头为负
+    mark: np.ndarray             # (M,)
+    volume: np.ndarray           # (M,) 最新成交量
+    volatility: np.ndarray       # (M,) 单期收益率标准差
+    half_spread: np.ndarray      # (M,) 半价差比例
+    equity: np.ndarray           # (K,)
+    cash: np.ndarray             # (K,)
+    beta: Optional[np.ndarray] = None     # (M,) 价格冲击敏感度，默认全为1
+    history: Optional[np.ndarray] = None  # (T, M) 按尾部对齐的价格历史，缺失为NaN
+
+    @property
+    def exposures(self) -> Dict[str, np.ndarray]:
+        """按品种×策略汇总的暴露矩阵 (M, K)"""
+        n_symbols, n_strategies = len(self.symbols), len(self.strategy_ids)
+        cell = self.symbol_index * n_strategies + self.strategy_index
+        notional = self.quantity * self.mark[self.symbol_index]
+        gross = np.abs(notional)
+
+        def by_cell(weights: np.ndarray) -> np.ndarray:
+            return np.bincount(cell, weights, minlength=n_symbols * n_strategies).reshape(n_symbols, n_strategies)
+
+        return {
+            "net": by_cell(notional),
+            "gross": by_cell(gross),
+            "impact": by_cell(gross * np.sqrt(np.abs(self.quantity)))
+        }
+
+
+@dataclass
+class ScenarioGrid:
+    """参数化情景网格，每个数组长度为情景数"""
+    names: List[str]
+    price_shock: np.ndarray       # 价格变动比例（乘以品种beta）
+    vol_multiplier: np.ndarray    # 波动率倍数，0表示不计波动率尾部损失
+    liquidity_factor: np.ndarray  # 可用成交量比例，0表示不计平仓成本
+    spread_multiplier: np.ndarray # 价差放大倍数
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def build(
+        cls,
+        price_shocks: Sequence[float] = tuple(np.round(np.linspace(-0.3, 0.3, 25), 4)),
+        vol_multipliers: Sequence[float] = (0.0, 1.0, 2.0, 3.0),
+        liquidity_factors: Sequence[float] = (0.0, 1.0, 0.2),
+        spread_multiplier: float = 3.0
+    ) -> "ScenarioGrid":
+        """价格×波动率×流动性的笛卡尔积"""
+        rows = list(itertools.product(price_shocks, vol_multipliers, liquidity_factors))
+        shock, vol, liquidity = (np.array(column, dtype=float) for column in zip(*rows))
+        names = [
+            f"价格{p:+.1%}/波动率x{v:g}/流动性{l:g}" if l else f"价格{p:+.1%}/波动率x{v:g}"
+            for p, v, l in rows
+        ]
+        spread = np.where(liquidity > 0, spread_multiplier, 0.0)
+        return cls(names, shock, vol, liquidity, spread)
+
+
+@dataclass
+class StressReport:
+    """压力测试结果，S为情景数"""
+    scenario_names: List[str]
+    strategy_ids: List[str]
+    total_pnl: np.ndarray          # (S,)
+    strategy_pnl: np.ndarray       # (S, K)
+    worst_symbols: List[List[tuple]]  # 每个情景 [(品种, 损益), ...]
+    strategy_equity: np.ndarray    # (K,)
+    elapsed_ms: float = 0.0
+
+    @property
+    def total_equity(self) -> float:
+        return float(self.strategy_equity.sum())
+
+    def strategy_worst_case(self) -> Dict[str, Dict[str, Any]]:
+        """各策略的最差情景及损失比例"""
+        if not len(self.scenario_names):
+            return {}
+        worst = self.strategy_pnl.argmin(axis=0)
+        equity = self.strategy_equity
+        result = {}
+        for k, strategy_id in enumerate(self.strategy_ids):
+            pnl = float(self.strategy_pnl[worst[k], k])
+            result[strategy_id] = {
+                "scenario": self.scenario_names[worst[k]],
+                "pnl": pnl,
+                "loss_ratio": -pnl / float(equity[k]) if equity[k] > 0 else 0.0
+            }
+        return result
+
+    def worst(self, n: int = 10) -> List[Dict[str, Any]]:
+        """损失最大的n个情景及归因"""
+        order = np.argsort(self.total_pnl)[:n]
+        result = []
+        for s in order:
+            k = int(self.strategy_pnl[s].argmin()) if len(self.strategy_ids) else -1
+            result.append({
+                "scenario": self.scenario_names[s],
+                "pnl": float(self.total_pnl[s]),
+                "pnl_ratio": float(self.total_pnl[s]) / self.total_equity if self.total_equity > 0 else 0.0,
+                "worst_strategy": self.strategy_ids[k] if k >= 0 else None,
+                "worst_strategy_pnl": float(self.strategy_pnl[s, k]) if k >= 0 else 0.0,
+                "worst_symbols": self.worst_symbols[s]
+            })
+        return result
+
+    def to_dict(self, n: int = 10) -> Dict[str, Any]:
+        return {
+            "scenario_count": len(self.scenario_names),
+            "elapsed_ms": self.elapsed_ms,
+            "worst_scenarios": self.worst(n)
+        }
+
+
+# ==================== 情景计算（可在子进程中执行） ====================
+
+def scenario_coefficients(
+    snapshot: PositionSnapshot,
+    grid: ScenarioGrid,
+    params: StressParams
+) -> Dict[str, np.ndarray]:
+    """
+    由快照和网格生成系数矩阵 (S, M)
+
+    R: 价格收益率；H: 每单位名义价值的损失（波动率尾部 + 半价差）；
+    G: 冲击成本系数，乘以 |名义价值| * sqrt(|数量|)
+    """
+    n_symbols = len(snapshot.symbols)
+    beta = snapshot.beta if snapshot.beta is not None else np.ones(n_symbols)
+    sigma = snapshot.volatility
+    liquid = grid.liquidity_factor > 0
+
+    R = grid.price_shock[:, None] * beta[None, :]
+    H = (grid.vol_multiplier[:, None] * params.z_score) * sigma[None, :]
+    H += grid.spread_multiplier[:, None] * snapshot.half_spread[None, :]
+
+    # 成交量缺失时按全部持仓即为当期成交量处理（参与率为1）
+    held = np.bincount(snapshot.symbol_index, np.abs(snapshot.quantity), minlength=n_symbols)
+    volume = np.where(snapshot.volume > 0, snapshot.volume, np.maximum(held, 1.0))
+    stressed_sigma = sigma[None, :] * np.maximum(grid.vol_multiplier, 1.0)[:, None]
+    available = volume[None, :] * np.where(liquid, grid.liquidity_factor, 1.0)[:, None]
+    G = np.where(liquid[:, None], params.impact_coefficient * stressed_sigma / np.sqrt(available), 0.0)
+    return {"R": R, "H": H, "G": G}
+
+
+def replay_returns(history: Optional[np.ndarray], horizon: int, max_replays: int) -> np.ndarray:
+    """历史回放情景：每个时点向前horizon期的收益率 (S, M)，缺失记为0"""
+    if history is None or max_replays <= 0 or len(history) <= horizon:
+        return np.empty((0, 0 if history is None else history.shape[1]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = history[horizon:] / history[:-horizon] - 1.0
+    returns = np.nan_to_num(returns[-max_replays:], nan=0.0, posinf=0.0, neginf=0.0)
+    return returns
+
+
+def evaluate_scenarios(
+    exposures: Dict[str, np.ndarray],
+    symbols: List[str],
+    R: np.ndarray,
+    H: np.ndarray,
+    G: np.ndarray,
+    top_symbols: int
+) -> Dict[str, Any]:
+    """
+    对一批情景计算损益与归因
+
+    Returns:
+        strategy_pnl (S, K), total_pnl (S,), worst_symbols
+    """
+    net, gross, impact = exposures["net"], exposures["gross"], exposures["impact"]
+    strategy_pnl = R @ net - H @ gross - G @ impact
+
+    # 品种归因只需要跨策略合计的暴露
+    symbol_pnl = R * net.sum(axis=1) - H * gross.sum(axis=1) - G * impact.sum(axis=1)
+    total_pnl = symbol_pnl.sum(axis=1)
+
+    n = min(top_symbols, symbol_pnl.shape[1])
+    worst_symbols: List[List[tuple]] = [[] for _ in range(len(R))]
+    if n:
+        idx = np.argpartition(symbol_pnl, n - 1, axis=1)[:, :n]
+        values = np.take_along_axis(symbol_pnl, idx, axis=1)
+        order = np.argsort(values, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+        worst_symbols = [
+            [(symbols[m], float(v)) for m, v in zip(row_idx, row_values) if v < 0]
+            for row_idx, row_values in zip(idx.tolist(), values.tolist())
+        ]
+
+    return {"strategy_pnl": strategy_pnl, "total_pnl": total_pnl, "worst_symbols": worst_symbols}
+
+
+class StressEngine:
+    """
+    情景网格压力测试引擎
+
+    Args:
+        max_workers: 进程数，0表示在线程中执行（不启动子进程），None为CPU核数
+        min_rows_per_shard: 每个分片的最少情景数，情景不多时不值得跨进程
+    """
+
+    def __init__(self, max_workers: Optional[int] = 0, min_rows_per_shard: int = 64,
+                 params: Optional[StressParams] = None):
+        self.max_workers = max_workers
+        self.min_rows_per_shard = max(1, min_rows_per_shard)
+        self.params = params or StressParams()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_workers == 0:
+            return None
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def run(
+        self,
+        snapshot: PositionSnapshot,
+        grid: ScenarioGrid,
+        replay_horizon: int = 1,
+        max_replays: int = 250
+    ) -> StressReport:
+        """运行网格情景与历史回放情景"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        coefficients = scenario_coefficients(snapshot, grid, self.params)
+        names = list(grid.names)
+        replay = replay_returns(snapshot.history, replay_horizon, max_replays)
+        if len(replay):
+            n = len(replay)
+            names += [f"历史回放 t-{n - i}" for i in range(n)]
+            zeros = np.zeros_like(replay)
+            coefficients = {
+                "R": np.vstack([coefficients["R"], replay]),
+                "H": np.vstack([coefficients["H"], zeros]),
+                "G": np.vstack([coefficients["G"], zeros])
+            }
+
+        exposures = snapshot.exposures
+        pool = self._get_pool()
+        n_rows = len(names)
+        n_shards = 1
+        if pool is not None:
+            workers = self.max_workers or os.cpu_count() or 1
+            n_shards = max(1, min(workers, math.ceil(n_rows / self.min_rows_per_shard)))
+        bounds = np.linspace(0, n_rows, n_shards + 1).astype(int)
+
+        futures = [
+            loop.run_in_executor(
+                pool, evaluate_scenarios, exposures, snapshot.symbols,
+                coefficients["R"][lo:hi], coefficients["H"][lo:hi], coefficients["G"][lo:hi],
+                self.params.top_symbols
+            )
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+        try:
+            parts = await asyncio.gather(*futures)
+        except BrokenProcessPool:
+            # 子进程崩溃后进程池不可再用，下次运行使用新的进程池
+            self._pool = None
+            raise
+
+        n_strategies = len(snapshot.strategy_ids)
+        return StressReport(
+            scenario_names=names,
+            strategy_ids=list(snapshot.strategy_ids),
+            total_pnl=np.concatenate([p["total_pnl"] for p in parts]) if parts else np.empty(0),
+            strategy_pnl=np.vstack([p["strategy_pnl"] for p in parts]) if parts else np.empty((0, n_strategies)),
+            worst_symbols=[row for p in parts for row in p["worst_symbols"]],
+            strategy_equity=snapshot.equity,
+            elapsed_ms=(loop.time() - start) * 1000
+        )
+
+    def shutdown(self) -> None:
+        """关闭进程池（先摘下，关闭期间新的run会另建进程池）"""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
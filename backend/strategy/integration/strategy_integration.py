@@ -52,6 +52,9 @@ class StrategySystem:
         self.risk_manager = RiskManager(risk_config)
         self.performance_analyzer = PerformanceAnalyzer(performance_config)
         
+        # 成交增量更新风险状态
+        self.engine.add_event_listener("order_filled", self.risk_manager.on_order_filled)
+        
         # 回测引擎（按需创建）
         self.backtest_engine: Optional[BacktestEngine] = None
         
@@ -5,7 +5,7 @@
 包含监控指标、告警规则、通知配置等详细设置
 """
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, field
 from enum import Enum
 
@@ -54,6 +54,9 @@ class AlertRuleConfig:
     cooldown_seconds: int = 300  # 冷却期
     repeat_interval_hours: int = 1  # 重复通知间隔
     is_enabled: bool = True
+    for_seconds: float = 0  # 条件持续满足多久后触发
+    resolve_condition: Optional[str] = None  # 恢复条件，默认为触发条件不再满足
+    resolve_seconds: float = 0  # 恢复条件持续满足多久后解决
 
 
 @dataclass
@@ -0,0 +1,13 @@
+"""
+共享指标统计结构
+"""
+
+from .histogram import (
+    DEFAULT_PERCENTILES, LatencyHistogram, RollingHistogram, RollingCounter,
+    percentile_label
+)
+
+__all__ = [
+    "DEFAULT_PERCENTILES", "LatencyHistogram", "RollingHistogram", "RollingCounter",
+    "percentile_label"
+]
@@ -0,0 +1,258 @@
+"""
+流式直方图与滚动时间窗口
+=====================
+
+固定内存的统计结构，网关MetricsCollector、DomesticGatewayMonitor流式指标
+和RiskManager预交易检查耗时共用：
+- LatencyHistogram: HDR风格的对数分桶直方图，O(1)记录，分位数读取为O(桶数)
+- RollingHistogram: 按时间槽轮转的直方图，用于窗口分位数
+- RollingCounter: 按时间槽轮转的计数器，保留期有界
+
+数值单位由调用方决定（通过min_value/max_value设定范围）。
+结构内部不加锁，调用方需保证在单个线程内使用。
+"""
+
+import math
+import time
+from array import array
+from typing import Dict, Iterable, Optional, Sequence
+
+
+DEFAULT_PERCENTILES = (0.5, 0.95, 0.99, 0.999)
+
+
+class LatencyHistogram:
+    """对数分桶延迟直方图（默认单位：秒）
+
+    桶边界按 ``min_value * growth**i`` 递增，相对误差不超过 ``growth - 1``。
+    默认覆盖 10µs ~ 10min，约460个桶。
+    """
+
+    __slots__ = (
+        "min_value", "max_value", "growth", "_inv_log_growth",
+        "_counts", "count", "total", "min", "max"
+    )
+
+    def __init__(self, min_value: float = 1e-5, max_value: float = 600.0,
+                 growth: float = 1.04):
+        if min_value <= 0 or max_value <= min_value or growth <= 1.0:
+            raise ValueError("直方图参数无效")
+
+        self.min_value = min_value
+        self.max_value = max_value
+        self.growth = growth
+        self._inv_log_growth = 1.0 / math.log(growth)
+
+        bucket_count = int(math.ceil(math.log(max_value / min_value) * self._inv_log_growth)) + 2
+        self._counts = array("Q", bytes(8 * bucket_count))
+
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    @property
+    def bucket_count(self) -> int:
+        """桶数量"""
+        return len(self._counts)
+
+    def _bucket_index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) * self._inv_log_growth) + 1
+        last = len(self._counts) - 1
+        return index if index < last else last
+
+    def _bucket_upper_bound(self, index: int) -> float:
+        return self.min_value * (self.growth ** index)
+
+    def record(self, value: float):
+        """记录一个样本"""
+        self._counts[self._bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        """平均值"""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """单个分位数（q取值0~1）"""
+        return self.percentiles((q,))[q]
+
+    def percentiles(self, qs: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[float, float]:
+        """一次扫描计算多个分位数"""
+        result = {q: 0.0 for q in qs}
+        if self.count == 0:
+            return result
+
+        targets = sorted((max(1, int(math.ceil(q * self.count))), q) for q in qs)
+        cumulative = 0
+        position = 0
+        for index, bucket in enumerate(self._counts):
+            if not bucket:
+                continue
+            cumulative += bucket
+            while position < len(targets) and cumulative >= targets[position][0]:
+                value = self._bucket_upper_bound(index)
+                result[targets[position][1]] = min(max(value, self.min), self.max)
+                position += 1
+            if position == len(targets):
+                break
+
+        return result
+
+    def merge(self, other: "LatencyHistogram"):
+        """合并另一个同参数直方图"""
+        if len(other._counts) != len(self._counts):
+            raise ValueError("直方图参数不一致，无法合并")
+
+        counts = self._counts
+        for index, bucket in enumerate(other._counts):
+            if bucket:
+                counts[index] += bucket
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy_empty(self) -> "LatencyHistogram":
+        """创建同参数的空直方图"""
+        return LatencyHistogram(self.min_value, self.max_value, self.growth)
+
+    def reset(self):
+        """清空"""
+        for index in range(len(self._counts)):
+            self._counts[index] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def summary(self, qs: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[str, float]:
+        """汇总统计"""
+        stats = {
+            "count": self.count,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "avg": self.mean,
+        }
+        for q, value in self.percentiles(qs).items():
+            stats[percentile_label(q)] = value
+        return stats
+
+
+class RollingHistogram:
+    """按时间槽轮转的直方图
+
+    共 ``slots`` 个槽，每槽 ``slot_seconds`` 秒；过期槽在下一次写入时原地重置，
+    内存固定为 slots × 桶数。
+    """
+
+    def __init__(self, slots: int = 60, slot_seconds: int = 60,
+                 template: Optional[LatencyHistogram] = None):
+        template = template or LatencyHistogram()
+        self.slot_seconds = slot_seconds
+        self._histograms = [template.copy_empty() for _ in range(slots)]
+        self._epochs = [-1] * slots
+
+    @property
+    def retention_seconds(self) -> int:
+        """最大保留时长"""
+        return self.slot_seconds * len(self._histograms)
+
+    def record(self, value: float, now: Optional[float] = None):
+        """记录样本到当前时间槽"""
+        epoch = int((now if now is not None else time.time()) // self.slot_seconds)
+        index = epoch % len(self._histograms)
+        histogram = self._histograms[index]
+        if self._epochs[index] != epoch:
+            histogram.reset()
+            self._epochs[index] = epoch
+        histogram.record(value)
+
+    def snapshot(self, window_seconds: Optional[int] = None,
+                 now: Optional[float] = None) -> LatencyHistogram:
+        """合并最近 ``window_seconds`` 内的时间槽"""
+        window_seconds = min(window_seconds or self.retention_seconds, self.retention_seconds)
+        current = int((now if now is not None else time.time()) // self.slot_seconds)
+        oldest = current - max(1, int(math.ceil(window_seconds / self.slot_seconds))) + 1
+
+        merged = self._histograms[0].copy_empty()
+        for epoch, histogram in zip(self._epochs, self._histograms):
+            if oldest <= epoch <= current and histogram.count:
+                merged.merge(histogram)
+        return merged
+
+    def reset(self):
+        """清空所有时间槽"""
+        for histogram in self._histograms:
+            histogram.reset()
+        self._epochs = [-1] * len(self._epochs)
+
+
+class RollingCounter:
+    """按时间槽轮转的多字段计数器"""
+
+    def __init__(self, slots: int, slot_seconds: int, fields: Iterable[str] = ("requests", "errors")):
+        self.slot_seconds = slot_seconds
+        self.fields = tuple(fields)
+        self._epochs = [-1] * slots
+        self._values = {name: array("Q", bytes(8 * slots)) for name in self.fields}
+
+    @property
+    def slots(self) -> int:
+        """时间槽数量"""
+        return len(self._epochs)
+
+    @property
+    def retention_seconds(self) -> float:
+        """最大保留时长"""
+        return self.slot_seconds * len(self._epochs)
+
+    def _slot(self, now: Optional[float]) -> int:
+        epoch = int((now if now is not None else time.time()) // self.slot_seconds)
+        index = epoch % len(self._epochs)
+        if self._epochs[index] != epoch:
+            for values in self._values.values():
+                values[index] = 0
+            self._epochs[index] = epoch
+        return index
+
+    def increment(self, name: str, amount: int = 1, now: Optional[float] = None):
+        """当前时间槽计数加一"""
+        self._values[name][self._slot(now)] += amount
+
+    def get(self, name: str, slots_back: int = 0, now: Optional[float] = None) -> int:
+        """读取当前（或往前第N个）时间槽的计数"""
+        epoch = int((now if now is not None else time.time()) // self.slot_seconds) - slots_back
+        index = epoch % len(self._epochs)
+        return self._values[name][index] if self._epochs[index] == epoch else 0
+
+    def sum(self, name: str, slots: int, now: Optional[float] = None) -> int:
+        """最近N个时间槽的计数之和"""
+        current = int((now if now is not None else time.time()) // self.slot_seconds)
+        oldest = current - slots + 1
+        values = self._values[name]
+        return sum(
+            values[index] for index, epoch in enumerate(self._epochs)
+            if oldest <= epoch <= current
+        )
+
+    def reset(self):
+        """清空"""
+        self._epochs = [-1] * len(self._epochs)
+        for values in self._values.values():
+            for index in range(len(values)):
+                values[index] = 0
+
+
+def percentile_label(q: float) -> str:
+    """0.95 -> p95, 0.999 -> p999"""
+    digits = f"{q * 100:g}".replace(".", "")
+    return f"p{digits}"
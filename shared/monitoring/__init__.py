@@ -6,6 +6,7 @@ RedFire统一监控系统
 核心组件：
 - PrometheusExporter: 指标收集和导出
 - HealthChecker: 服务健康检查
+- SystemSampler: 后台线程系统指标采样
 - AlertManager: 告警评估和通知
 - UnifiedMonitor: 统一监控服务
 - API端点: RESTful监控接口
@@ -36,6 +37,7 @@ app.include_router(monitoring_router)
 """
 
 from .prometheus_exporter import prometheus_exporter, get_prometheus_metrics
+from .system_sampler import system_sampler, SystemSnapshot
 from .health_check import health_checker, get_health_status, get_service_health
 from .alert_system import alert_manager, Alert, AlertStatus, NotificationResult
 from .unified_monitor import unified_monitor, get_monitoring_metrics, get_monitoring_status
@@ -48,6 +50,7 @@ __all__ = [
     # 核心组件
     "prometheus_exporter",
     "health_checker", 
+    "system_sampler",
     "alert_manager",
     "unified_monitor",
     
@@ -65,6 +68,7 @@ __all__ = [
     "Alert",
     "AlertStatus", 
     "NotificationResult",
+    "SystemSnapshot",
     
     # 版本信息
     "__version__",
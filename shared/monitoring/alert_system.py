@@ -23,6 +23,7 @@ from config.backend.monitor_config import (
     NOTIFICATION_CHANNELS_CONFIG,
     MonitorLevel
 )
+from .rule_compiler import CompiledRuleSet, compile_condition
 
 logger = logging.getLogger(__name__)
 
@@ -76,12 +77,14 @@ class AlertEvaluator:
     告警规则评估器
     
     基于monitor_config.py中的ALERT_RULES_CONFIG评估告警条件。
+    规则在初始化时编译并按指标建立索引，指标更新只评估依赖它的规则。
     """
     
-    def __init__(self):
+    def __init__(self, rules=None):
         self.active_alerts = {}
         self.alert_history = []
         self.last_evaluation = {}
+        self.rule_set = CompiledRuleSet(ALERT_RULES_CONFIG if rules is None else rules)
     
     def evaluate_condition(self, condition: str, value: float, **context) -> bool:
         """
@@ -96,39 +99,11 @@ class AlertEvaluator:
             bool: 是否满足告警条件
         """
         try:
-            # 构建评估环境
-            eval_context = {
-                'value': value,
-                **context
-            }
-            
-            # 安全的条件评估 (仅支持基本的数学比较)
-            allowed_ops = ['>', '<', '>=', '<=', '==', '!=', 'and', 'or']
-            
-            # 简单的条件解析和评估
-            # 这里可以使用更复杂的表达式解析器，但为了安全性使用简单实现
-            if 'value >' in condition:
-                threshold = float(condition.split('value >')[1].strip())
-                return value > threshold
-            elif 'value <' in condition:
-                threshold = float(condition.split('value <')[1].strip())
-                return value < threshold
-            elif 'value >=' in condition:
-                threshold = float(condition.split('value >=')[1].strip())
-                return value >= threshold
-            elif 'value <=' in condition:
-                threshold = float(condition.split('value <=')[1].strip())
-                return value <= threshold
-            elif 'value ==' in condition:
-                threshold = float(condition.split('value ==')[1].strip())
-                return value == threshold
-            elif 'value !=' in condition:
-                threshold = float(condition.split('value !=')[1].strip())
-                return value != threshold
-            else:
-                logger.warning(f"不支持的告警条件: {condition}")
-                return False
-                
+            # 表达式按字符串缓存编译结果，context中的变量按名称引用
+            return compile_condition(condition)(value, context)
+        except ValueError as e:
+            logger.warning(f"不支持的告警条件: {e}")
+            return False
         except Exception as e:
             logger.error(f"评估告警条件时出错: {condition}, 错误: {e}")
             return False
@@ -137,23 +112,37 @@ class AlertEvaluator:
         """
         评估单个告警规则
         
+        与evaluate_all_rules共用规则的触发状态，for_seconds与恢复滞回同样生效；
+        规则不在规则集中（或配置对象已更换）时先登记。
+        
         Args:
             rule_config: 告警规则配置
             metric_value: 指标值
-            **context: 额外上下文
+            **context: 额外上下文（条件中引用的其他指标）
             
         Returns:
-            Optional[Alert]: 如果触发告警则返回Alert对象
+            Optional[Alert]: 新触发或已解决的告警
         """
-        rule_id = rule_config.rule_id
-        
-        # 评估告警条件
-        is_triggered = self.evaluate_condition(
-            rule_config.condition, 
-            metric_value, 
-            **context
-        )
+        rule = self.rule_set.rules.get(rule_config.rule_id)
+        if rule is None or rule.config is not rule_config:
+            rule = self.rule_set.add_rule(rule_config)
+            if rule is None:
+                return None
         
+        values = dict(context)
+        values[rule.metric_name] = metric_value
+        rule.evaluate(values, self.rule_set.clock())
+        return self._apply_compiled_rule(rule, metric_value)
+    
+    def _apply_compiled_rule(self, rule, metric_value: float) -> Optional[Alert]:
+        """按编译规则的触发状态同步告警，未触发且无活跃告警时跳过"""
+        if not rule.active and rule.rule_id not in self.active_alerts:
+            return None
+        return self._apply_rule_state(rule.config, rule.active, metric_value)
+    
+    def _apply_rule_state(self, rule_config, is_triggered: bool, metric_value: float) -> Optional[Alert]:
+        """按规则当前是否触发创建、更新或解决告警"""
+        rule_id = rule_config.rule_id
         current_time = datetime.now()
         
         # 检查是否已有活跃告警
@@ -213,34 +202,27 @@ class AlertEvaluator:
     def _extract_threshold(self, condition: str) -> float:
         """从条件表达式中提取阈值"""
         try:
-            for op in ['>=', '<=', '>', '<', '==', '!=']:
-                if op in condition:
-                    parts = condition.split(op)
-                    if len(parts) == 2:
-                        return float(parts[1].strip())
-            return 0.0
-        except:
+            return compile_condition(condition).threshold
+        except ValueError:
             return 0.0
     
     def evaluate_all_rules(self, metrics: Dict[str, float]) -> List[Alert]:
         """
-        评估所有告警规则
+        评估依赖本批指标的告警规则
         
         Args:
             metrics: 指标数据字典
             
         Returns:
-            List[Alert]: 触发的告警列表
+            List[Alert]: 新触发或已解决的告警列表
         """
         triggered_alerts = []
+        values = self.rule_set.values
         
-        for rule_config in ALERT_RULES_CONFIG:
-            metric_name = rule_config.metric_name
-            
-            if metric_name in metrics:
-                alert = self.evaluate_rule(rule_config, metrics[metric_name])
-                if alert:
-                    triggered_alerts.append(alert)
+        for rule, _ in self.rule_set.update(metrics):
+            alert = self._apply_compiled_rule(rule, values.get(rule.metric_name))
+            if alert:
+                triggered_alerts.append(alert)
         
         return triggered_alerts
     
@@ -13,13 +13,13 @@ from datetime import datetime, timedelta
 from enum import Enum
 import logging
 import aiohttp
-import psutil
 
 from config.backend.monitor_config import (
     MONITORED_SERVICES_DETAILED,
     SYSTEM_METRICS_CONFIG,
     ALERT_RULES_CONFIG
 )
+from .system_sampler import system_sampler
 
 logger = logging.getLogger(__name__)
 
@@ -171,51 +171,15 @@ class HealthChecker:
             )
     
     async def collect_system_metrics(self) -> Dict[str, Any]:
-        """收集系统指标"""
+        """收集系统指标（读取后台采样器快照）"""
         try:
-            # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
+            snapshot = system_sampler.latest()
+            if snapshot is None:
+                return {'error': '系统指标尚未采样', 'timestamp': datetime.now().isoformat()}
             
-            # 内存信息
-            memory = psutil.virtual_memory()
-            
-            # 磁盘信息
-            disk_usage = {}
-            for partition in psutil.disk_partitions():
-                try:
-                    usage = psutil.disk_usage(partition.mountpoint)
-                    disk_usage[partition.mountpoint] = {
-                        'total': usage.total,
-                        'used': usage.used,
-                        'free': usage.free,
-                        'percent': (usage.used / usage.total) * 100
-                    }
-                except (PermissionError, FileNotFoundError):
-                    continue
-            
-            # 系统负载 (Linux)
-            load_avg = None
-            if hasattr(psutil, 'getloadavg'):
-                try:
-                    load_avg = psutil.getloadavg()
-                except:
-                    pass
-            
-            return {
-                'cpu': {
-                    'percent': cpu_percent,
-                    'count': psutil.cpu_count()
-                },
-                'memory': {
-                    'total': memory.total,
-                    'available': memory.available,
-                    'percent': memory.percent,
-                    'used': memory.used
-                },
-                'disk': disk_usage,
-                'load_average': load_avg,
-                'timestamp': datetime.now().isoformat()
-            }
+            metrics = snapshot.to_dict()
+            metrics['timestamp'] = datetime.fromtimestamp(snapshot.timestamp).isoformat()
+            return metrics
             
         except Exception as e:
             logger.error(f"收集系统指标时出错: {e}")
@@ -60,6 +60,8 @@ from config.backend.monitor_config import (
     ALERT_RULES_CONFIG
 )
 
+from .system_sampler import system_sampler
+
 logger = logging.getLogger(__name__)
 
 
@@ -83,6 +85,7 @@ class PrometheusExporter:
     def __init__(self):
         self.metrics_registry = {}
         self.last_collection_time = time.time()
+        self._last_network_totals: Dict[str, tuple] = {}
         self._setup_metrics()
         
     def _setup_metrics(self):
@@ -146,74 +149,78 @@ class PrometheusExporter:
         })
     
     async def collect_system_metrics(self) -> List[MetricValue]:
-        """收集系统指标"""
+        """
+        收集系统指标
+        
+        读取后台采样器的最新快照，不在事件循环中调用psutil。
+        """
         metrics = []
         
         try:
+            snapshot = system_sampler.latest()
+            if snapshot is None:
+                return metrics
+            
+            sampled_at = datetime.fromtimestamp(snapshot.timestamp)
+            
             # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
-            self.system_metrics['cpu_usage'].set(cpu_percent)
+            self.system_metrics['cpu_usage'].set(snapshot.cpu_percent)
             metrics.append(MetricValue(
                 name='cpu_usage',
-                value=cpu_percent,
+                value=snapshot.cpu_percent,
                 labels={},
-                timestamp=datetime.now(),
+                timestamp=sampled_at,
                 help_text='CPU使用率百分比'
             ))
             
             # 内存信息
-            memory = psutil.virtual_memory()
-            self.system_metrics['memory_usage'].set(memory.percent)
-            self.system_metrics['memory_available'].set(memory.available)
+            self.system_metrics['memory_usage'].set(snapshot.memory_percent)
+            self.system_metrics['memory_available'].set(snapshot.memory_available)
             
             metrics.extend([
-                MetricValue('memory_usage', memory.percent, {}, datetime.now(), '内存使用率百分比'),
-                MetricValue('memory_available', memory.available, {}, datetime.now(), '可用内存字节数'),
+                MetricValue('memory_usage', snapshot.memory_percent, {}, sampled_at, '内存使用率百分比'),
+                MetricValue('memory_available', snapshot.memory_available, {}, sampled_at, '可用内存字节数'),
             ])
             
             # 磁盘信息
-            for partition in psutil.disk_partitions():
-                try:
-                    usage = psutil.disk_usage(partition.mountpoint)
-                    mount_point = partition.mountpoint
-                    
-                    self.system_metrics['disk_usage'].labels(mount_point=mount_point).set(
-                        (usage.used / usage.total) * 100
-                    )
-                    self.system_metrics['disk_free'].labels(mount_point=mount_point).set(usage.free)
-                    
-                    metrics.extend([
-                        MetricValue('disk_usage', (usage.used / usage.total) * 100, 
-                                  {'mount_point': mount_point}, datetime.now(), '磁盘使用率百分比'),
-                        MetricValue('disk_free', usage.free, 
-                                  {'mount_point': mount_point}, datetime.now(), '磁盘可用空间字节数'),
-                    ])
-                except (PermissionError, FileNotFoundError):
-                    continue
+            for mount_point, usage in snapshot.disk.items():
+                self.system_metrics['disk_usage'].labels(mount_point=mount_point).set(usage['percent'])
+                self.system_metrics['disk_free'].labels(mount_point=mount_point).set(usage['free'])
+                
+                metrics.extend([
+                    MetricValue('disk_usage', usage['percent'], 
+                              {'mount_point': mount_point}, sampled_at, '磁盘使用率百分比'),
+                    MetricValue('disk_free', usage['free'], 
+                              {'mount_point': mount_point}, sampled_at, '磁盘可用空间字节数'),
+                ])
             
-            # 网络信息
-            network = psutil.net_io_counters(pernic=True)
-            for interface, stats in network.items():
-                if interface != 'lo':  # 跳过回环接口
+            # 网络信息（计数器按上次导出值增量累加）
+            for interface, stats in snapshot.network.items():
+                last_sent, last_recv = self._last_network_totals.get(interface, (0, 0))
+                if stats['bytes_sent'] >= last_sent:
                     self.system_metrics['network_bytes_sent'].labels(interface=interface).inc(
-                        stats.bytes_sent - getattr(self, f'_last_bytes_sent_{interface}', 0)
+                        stats['bytes_sent'] - last_sent
                     )
+                if stats['bytes_recv'] >= last_recv:
                     self.system_metrics['network_bytes_recv'].labels(interface=interface).inc(
-                        stats.bytes_recv - getattr(self, f'_last_bytes_recv_{interface}', 0)
+                        stats['bytes_recv'] - last_recv
                     )
-                    
-                    # 保存上次的值
-                    setattr(self, f'_last_bytes_sent_{interface}', stats.bytes_sent)
-                    setattr(self, f'_last_bytes_recv_{interface}', stats.bytes_recv)
+                self._last_network_totals[interface] = (stats['bytes_sent'], stats['bytes_recv'])
+                
+                metrics.extend([
+                    MetricValue('network_send_rate', stats['bytes_sent_per_sec'],
+                              {'interface': interface}, sampled_at, '网络发送速率(字节/秒)'),
+                    MetricValue('network_recv_rate', stats['bytes_recv_per_sec'],
+                              {'interface': interface}, sampled_at, '网络接收速率(字节/秒)'),
+                ])
             
             # 系统负载
-            if hasattr(psutil, 'getloadavg'):
-                load_avg = psutil.getloadavg()
+            if snapshot.load_average:
                 for i, period in enumerate(['1min', '5min', '15min']):
-                    self.system_metrics['load_average'].labels(period=period).set(load_avg[i])
+                    self.system_metrics['load_average'].labels(period=period).set(snapshot.load_average[i])
                     metrics.append(MetricValue(
-                        'load_average', load_avg[i], {'period': period}, 
-                        datetime.now(), f'{period}系统负载平均值'
+                        'load_average', snapshot.load_average[i], {'period': period}, 
+                        sampled_at, f'{period}系统负载平均值'
                     ))
             
         except Exception as e:
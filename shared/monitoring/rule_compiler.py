@@ -0,0 +1,289 @@
+"""
+告警规则编译器
+
+把ALERT_RULES_CONFIG中的条件表达式在加载时编译为函数，供AlertEvaluator使用：
+- 条件用ast解析，只允许比较、布尔、算术运算、数字/布尔常量和变量名，
+  校验后编译成 lambda value, metrics: ... 的字节码，不再逐次解析字符串
+- value 指规则自身的 metric_name，其他变量名按同名指标读取；true/false 视为布尔常量
+- 规则按引用的指标建立索引，指标更新时只评估依赖它的规则
+- 每条规则O(1)状态：for_seconds 持续满足才触发，resolve_condition / resolve_seconds 提供恢复滞回
+"""
+
+import ast
+import logging
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 状态变化
+FIRING = "firing"
+RESOLVED = "resolved"
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.Load,
+    ast.BoolOp, ast.And, ast.Or,
+    ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod,
+    ast.Compare, ast.Gt, ast.GtE, ast.Lt, ast.LtE, ast.Eq, ast.NotEq,
+    ast.Name, ast.Constant
+)
+
+_LITERALS = {
+    'true': True, 'false': False, 'True': True, 'False': False,
+    'null': None, 'None': None
+}
+
+
+class _NameRewriter(ast.NodeTransformer):
+    """常量名替换为常量，指标名替换为 metrics['名称']"""
+
+    def __init__(self):
+        self.names = set()
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id in _LITERALS:
+            return ast.copy_location(ast.Constant(_LITERALS[node.id]), node)
+        if node.id == 'value':
+            return node
+        self.names.add(node.id)
+        return ast.copy_location(
+            ast.Subscript(
+                value=ast.Name(id='metrics', ctx=ast.Load()),
+                slice=ast.Constant(node.id),
+                ctx=ast.Load()
+            ),
+            node
+        )
+
+
+class CompiledCondition:
+    """
+    编译后的条件
+
+    Attributes:
+        source: 原始表达式
+        names: 除value以外引用的指标名
+        threshold: 形如 "value > 85" 的单个比较中的常量阈值，否则为0.0
+    """
+
+    __slots__ = ('source', 'names', 'threshold', '_function')
+
+    def __init__(self, source: str, function: Callable[[Any, Dict[str, Any]], Any],
+                 names: FrozenSet[str], threshold: float):
+        self.source = source
+        self.names = names
+        self.threshold = threshold
+        self._function = function
+
+    def __call__(self, value: Any, metrics: Dict[str, Any]) -> bool:
+        return bool(self._function(value, metrics))
+
+
+@lru_cache(maxsize=4096)
+def compile_condition(source: str) -> CompiledCondition:
+    """
+    编译条件表达式，相同表达式只编译一次
+
+    Raises:
+        ValueError: 表达式语法错误或包含不允许的语法
+    """
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"告警条件语法错误: {source}: {e}")
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"告警条件包含不支持的语法 {type(node).__name__}: {source}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, bool, str, type(None))):
+            raise ValueError(f"告警条件包含不支持的常量: {source}")
+        if isinstance(node, ast.BinOp) and any(
+                isinstance(operand, ast.Constant) and isinstance(operand.value, str)
+                for operand in (node.left, node.right)):
+            raise ValueError(f"告警条件中字符串只能用于比较: {source}")
+
+    rewriter = _NameRewriter()
+    body = rewriter.visit(tree.body)
+    function_tree = ast.Expression(body=ast.Lambda(
+        args=ast.arguments(
+            posonlyargs=[], args=[ast.arg(arg='value'), ast.arg(arg='metrics')],
+            kwonlyargs=[], kw_defaults=[], defaults=[]
+        ),
+        body=body
+    ))
+    ast.fix_missing_locations(function_tree)
+    function = eval(compile(function_tree, f"<alert: {source}>", 'eval'), {'__builtins__': {}})
+    return CompiledCondition(source, function, frozenset(rewriter.names), _constant_threshold(tree.body))
+
+
+def _constant_threshold(node: ast.AST) -> float:
+    if isinstance(node, ast.Compare) and len(node.comparators) == 1:
+        comparator = node.comparators[0]
+        if isinstance(comparator, ast.UnaryOp) and isinstance(comparator.op, ast.USub) \
+                and isinstance(comparator.operand, ast.Constant):
+            comparator = ast.Constant(-comparator.operand.value)
+        if isinstance(comparator, ast.Constant) and isinstance(comparator.value, (int, float)) \
+                and not isinstance(comparator.value, bool):
+            return float(comparator.value)
+    return 0.0
+
+
+class CompiledRule:
+    """
+    编译后的告警规则及其触发状态
+
+    Args:
+        config: AlertRuleConfig，可选字段 for_seconds / resolve_condition / resolve_seconds
+    """
+
+    __slots__ = (
+        'config', 'rule_id', 'metric_name', 'condition', 'resolve_condition',
+        'for_seconds', 'resolve_seconds', 'dependencies',
+        'active', 'pending_since', 'clear_since', '_stamp'
+    )
+
+    def __init__(self, config):
+        self.config = config
+        self.rule_id = config.rule_id
+        self.metric_name = config.metric_name
+        self.condition = compile_condition(config.condition)
+        resolve_source = getattr(config, 'resolve_condition', None)
+        self.resolve_condition = compile_condition(resolve_source) if resolve_source else None
+        self.for_seconds = float(getattr(config, 'for_seconds', 0) or 0)
+        self.resolve_seconds = float(getattr(config, 'resolve_seconds', 0) or 0)
+
+        dependencies = {self.metric_name} | self.condition.names
+        if self.resolve_condition is not None:
+            dependencies |= self.resolve_condition.names
+        self.dependencies = frozenset(dependencies)
+
+        self.active = False
+        self.pending_since: Optional[float] = None  # 条件开始连续满足的时间
+        self.clear_since: Optional[float] = None    # 触发后开始连续满足恢复条件的时间
+        self._stamp = -1
+
+    @property
+    def threshold(self) -> float:
+        return self.condition.threshold
+
+    def _check(self, condition: CompiledCondition, values: Dict[str, Any]) -> bool:
+        try:
+            return condition(values.get(self.metric_name), values)
+        except Exception:
+            # 指标缺失、类型不匹配、除零等都视为不满足
+            return False
+
+    def evaluate(self, values: Dict[str, Any], now: float) -> Optional[str]:
+        """按最新指标值推进状态，返回 FIRING / RESOLVED / None"""
+        if not self.active:
+            if not self._check(self.condition, values):
+                self.pending_since = None
+                return None
+            if self.pending_since is None:
+                self.pending_since = now
+            if now - self.pending_since < self.for_seconds:
+                return None
+            self.active = True
+            self.pending_since = None
+            self.clear_since = None
+            return FIRING
+
+        if self.resolve_condition is not None:
+            clear = self._check(self.resolve_condition, values)
+        else:
+            clear = not self._check(self.condition, values)
+        if not clear:
+            self.clear_since = None
+            return None
+        if self.clear_since is None:
+            self.clear_since = now
+        if now - self.clear_since < self.resolve_seconds:
+            return None
+        self.active = False
+        self.clear_since = None
+        return RESOLVED
+
+    def reset(self) -> None:
+        self.active = False
+        self.pending_since = None
+        self.clear_since = None
+
+
+class CompiledRuleSet:
+    """
+    按指标索引的规则集合
+
+    Args:
+        rules: AlertRuleConfig列表，未启用或编译失败的规则被跳过
+        clock: 时间函数，默认time.monotonic
+    """
+
+    def __init__(self, rules: Iterable = (), clock: Optional[Callable[[], float]] = None):
+        self.clock = clock or time.monotonic
+        self.rules: Dict[str, CompiledRule] = {}
+        self.index: Dict[str, List[CompiledRule]] = {}
+        self.values: Dict[str, Any] = {}
+        self._sequence = 0
+        for config in rules:
+            self.add_rule(config)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def add_rule(self, config) -> Optional[CompiledRule]:
+        """编译并登记规则，同ID的旧规则被替换"""
+        self.remove_rule(config.rule_id)
+        if not getattr(config, 'is_enabled', True):
+            return None
+        try:
+            rule = CompiledRule(config)
+        except ValueError as e:
+            logger.error(f"编译告警规则失败 {config.rule_id}: {e}")
+            return None
+        self.rules[rule.rule_id] = rule
+        for name in rule.dependencies:
+            self.index.setdefault(name, []).append(rule)
+        return rule
+
+    def remove_rule(self, rule_id: str) -> None:
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return
+        for name in rule.dependencies:
+            dependents = self.index[name]
+            dependents.remove(rule)
+            if not dependents:
+                del self.index[name]
+
+    def rules_for(self, metric_name: str) -> List[CompiledRule]:
+        return self.index.get(metric_name, [])
+
+    def update(self, metrics: Dict[str, Any], now: Optional[float] = None) -> List[Tuple[CompiledRule, Optional[str]]]:
+        """
+        写入一批指标，评估依赖这些指标的规则（每条规则至多评估一次）
+
+        Returns:
+            [(规则, FIRING / RESOLVED / None)]，只包含本次评估过的规则
+        """
+        now = self.clock() if now is None else now
+        values = self.values
+        values.update(metrics)
+        self._sequence += 1
+        sequence = self._sequence
+        index = self.index
+        evaluated = []
+        for name in metrics:
+            dependents = index.get(name)
+            if not dependents:
+                continue
+            for rule in dependents:
+                if rule._stamp == sequence:
+                    continue
+                rule._stamp = sequence
+                evaluated.append((rule, rule.evaluate(values, now)))
+        return evaluated
+
+    def update_metric(self, metric_name: str, value: Any,
+                      now: Optional[float] = None) -> List[Tuple[CompiledRule, Optional[str]]]:
+        return self.update({metric_name: value}, now)
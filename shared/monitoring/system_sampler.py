@@ -0,0 +1,238 @@
+"""
+系统指标后台采样器
+
+在独立线程中按固定节拍调用psutil采集系统指标，写入双缓冲快照：
+- 采样线程写后台缓冲区，完成后切换前台索引
+- 由所属服务（UnifiedMonitor）在启动时start()、关闭时stop()
+- PrometheusExporter / HealthChecker 只读取前台快照，不阻塞事件循环，也不会启动采样器
+- 网络、磁盘IO等累计计数器按采样间隔计算速率
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SystemSnapshot:
+    """一次采样结果（不可变）"""
+    sequence: int
+    timestamp: float
+    interval: float  # 距上次采样的秒数
+    collection_ms: float  # 本次采样耗时
+    cpu_percent: float
+    cpu_count: int
+    memory_total: int
+    memory_available: int
+    memory_used: int
+    memory_percent: float
+    disk: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    disk_io: Dict[str, float] = field(default_factory=dict)
+    network: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    load_average: Optional[Tuple[float, float, float]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为HealthChecker使用的字典结构"""
+        return {
+            'cpu': {
+                'percent': self.cpu_percent,
+                'count': self.cpu_count
+            },
+            'memory': {
+                'total': self.memory_total,
+                'available': self.memory_available,
+                'percent': self.memory_percent,
+                'used': self.memory_used
+            },
+            'disk': self.disk,
+            'disk_io': self.disk_io,
+            'network': self.network,
+            'load_average': self.load_average,
+            'sample': {
+                'sequence': self.sequence,
+                'age_seconds': time.time() - self.timestamp,
+                'collection_ms': self.collection_ms
+            }
+        }
+
+
+class SystemSampler:
+    """
+    系统指标采样器
+
+    Args:
+        interval: 采样间隔(秒)
+        disk_interval: 分区容量采样间隔(秒)，分区遍历较慢，单独降频
+    """
+
+    def __init__(self, interval: float = 1.0, disk_interval: float = 30.0):
+        self.interval = interval
+        self.disk_interval = disk_interval
+
+        # 双缓冲：采样线程写 1 - _front，完成后切换 _front
+        self._buffers: list = [None, None]
+        self._front = 0
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._sequence = 0
+
+        # 采样线程私有状态
+        self._disk_cache: Dict[str, Dict[str, float]] = {}
+        self._last_disk_time = 0.0
+        self._last_net: Dict[str, Any] = {}
+        self._last_disk_io = None
+        self._last_sample_time: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        """采样线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动采样线程（幂等），首个快照也在采样线程中生成"""
+        with self._start_lock:
+            if self.running:
+                return
+
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="system-metrics-sampler", daemon=True
+            )
+            self._thread.start()
+            logger.info(f"系统指标采样器已启动，间隔: {self.interval}秒")
+
+    def stop(self, timeout: float = 2.0):
+        """停止采样线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info("系统指标采样器已停止")
+
+    def latest(self) -> Optional[SystemSnapshot]:
+        """读取最新快照（无锁、无阻塞），尚未采样时返回None"""
+        return self._buffers[self._front]
+
+    def _publish(self, snapshot: SystemSnapshot):
+        back = 1 - self._front
+        self._buffers[back] = snapshot
+        self._front = back
+
+    def _run(self):
+        # 预热cpu_percent并立即生成首个快照
+        psutil.cpu_percent(interval=None)
+        try:
+            self._publish(self._sample())
+        except Exception as e:
+            logger.error(f"系统指标采样出错: {e}")
+
+        next_run = time.monotonic() + self.interval
+        while not self._stop_event.wait(max(0.0, next_run - time.monotonic())):
+            try:
+                self._publish(self._sample())
+            except Exception as e:
+                logger.error(f"系统指标采样出错: {e}")
+            next_run += self.interval
+            # 落后过多时重新对齐，避免追赶式连续采样
+            if next_run < time.monotonic():
+                next_run = time.monotonic() + self.interval
+
+    @staticmethod
+    def _rate(current: float, previous: Optional[float], interval: float) -> float:
+        if previous is None or interval <= 0 or current < previous:
+            return 0.0
+        return (current - previous) / interval
+
+    def _sample(self) -> SystemSnapshot:
+        """采集一次（仅在采样线程中调用）"""
+        started = time.perf_counter()
+        now = time.time()
+        interval = now - self._last_sample_time if self._last_sample_time else 0.0
+
+        memory = psutil.virtual_memory()
+
+        # 分区容量：降频采样，复用上次结果
+        if now - self._last_disk_time >= self.disk_interval:
+            disk = {}
+            for partition in psutil.disk_partitions():
+                try:
+                    usage = psutil.disk_usage(partition.mountpoint)
+                    disk[partition.mountpoint] = {
+                        'total': usage.total,
+                        'used': usage.used,
+                        'free': usage.free,
+                        'percent': (usage.used / usage.total) * 100 if usage.total else 0.0
+                    }
+                except (PermissionError, FileNotFoundError, OSError):
+                    continue
+            self._disk_cache = disk
+            self._last_disk_time = now
+
+        # 磁盘IO速率
+        disk_io = {}
+        try:
+            counters = psutil.disk_io_counters()
+        except Exception:
+            counters = None
+        if counters is not None:
+            last = self._last_disk_io
+            disk_io = {
+                'read_bytes': counters.read_bytes,
+                'write_bytes': counters.write_bytes,
+                'read_bytes_per_sec': self._rate(counters.read_bytes, last.read_bytes if last else None, interval),
+                'write_bytes_per_sec': self._rate(counters.write_bytes, last.write_bytes if last else None, interval),
+            }
+            self._last_disk_io = counters
+
+        # 网络速率（跳过回环接口）
+        network = {}
+        for interface, stats in psutil.net_io_counters(pernic=True).items():
+            if interface == 'lo':
+                continue
+            last = self._last_net.get(interface)
+            network[interface] = {
+                'bytes_sent': stats.bytes_sent,
+                'bytes_recv': stats.bytes_recv,
+                'bytes_sent_per_sec': self._rate(stats.bytes_sent, last.bytes_sent if last else None, interval),
+                'bytes_recv_per_sec': self._rate(stats.bytes_recv, last.bytes_recv if last else None, interval),
+            }
+            self._last_net[interface] = stats
+
+        load_average = None
+        if hasattr(psutil, 'getloadavg'):
+            try:
+                load_average = tuple(psutil.getloadavg())
+            except OSError:
+                pass
+
+        self._sequence += 1
+        self._last_sample_time = now
+
+        return SystemSnapshot(
+            sequence=self._sequence,
+            timestamp=now,
+            interval=interval,
+            collection_ms=(time.perf_counter() - started) * 1000,
+            cpu_percent=psutil.cpu_percent(interval=None),
+            cpu_count=psutil.cpu_count() or 0,
+            memory_total=memory.total,
+            memory_available=memory.available,
+            memory_used=memory.used,
+            memory_percent=memory.percent,
+            disk=self._disk_cache,
+            disk_io=disk_io,
+            network=network,
+            load_average=load_average
+        )
+
+
+# 全局实例
+system_sampler = SystemSampler()
@@ -20,6 +20,7 @@ import logging
 from .prometheus_exporter import prometheus_exporter
 from .health_check import health_checker, HealthStatus
 from .alert_system import alert_manager
+from .system_sampler import system_sampler
 from config.backend.monitor_config import (
     MONITORED_SERVICES_DETAILED,
     SYSTEM_METRICS_CONFIG,
@@ -290,6 +291,9 @@ class UnifiedMonitor:
         self.running = True
         logger.info("启动RedFire统一监控服务")
         
+        # 系统指标在独立线程中采样，导出和健康检查只读快照
+        system_sampler.start()
+        
         # 启动各个监控组件
         tasks = []
         
@@ -374,6 +378,8 @@ class UnifiedMonitor:
         if self.monitoring_tasks:
             await asyncio.gather(*self.monitoring_tasks, return_exceptions=True)
         
+        system_sampler.stop()
+        
         # 停止DomesticGatewayMonitor
         if self.domestic_gateway_monitor:
             try:
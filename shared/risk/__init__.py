@@ -0,0 +1,7 @@
+"""
+共享风险计算组件
+"""
+
+from .ewma_covariance import EwmaCovarianceEstimator
+
+__all__ = ["EwmaCovarianceEstimator"]
@@ -0,0 +1,245 @@
+"""
+EWMA协方差估计
+
+在线指数加权协方差/相关性估计（RiskMetrics，零均值假设）：
+- 固定品种集合，协方差存放在预分配矩阵中，品种数超出容量时按倍数扩容
+- 价格逐笔到达时只记录最新价，时间戳推进时结算一个周期：
+  对本周期有变动的k个品种做秩1更新，代价O(k²)，即每个品种O(N)
+- 衰减通过全局比例因子延迟执行，未变动的元素不需要每周期乘以λ
+- 读取按需切出子矩阵并做偏差校正，VaR/集中度/相关性检查只读快照
+
+策略层RiskManager与交易服务AdvancedRiskService共用本模块。
+"""
+
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# 比例因子的倒数超过该值时把衰减实际乘进矩阵，避免溢出
+_RESCALE_LIMIT = 1e150
+
+
+class EwmaCovarianceEstimator:
+    """
+    EWMA协方差估计器
+
+    Args:
+        decay: 衰减系数λ，日频常用0.94
+        capacity: 初始预分配的品种数
+        min_periods: 品种至少经历的周期数，达到后估计才视为可用
+        sample_interval: 周期最短间隔（秒），0表示时间戳每次推进都结算一个周期
+    """
+
+    def __init__(
+        self,
+        decay: float = 0.94,
+        capacity: int = 256,
+        min_periods: int = 20,
+        sample_interval: float = 0.0
+    ):
+        self.decay = decay
+        self.min_periods = min_periods
+        self.sample_interval = sample_interval
+
+        self._index: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        capacity = max(1, capacity)
+        # 存储 cov / scale，scale = λ^t 延迟乘入
+        self._raw = np.zeros((capacity, capacity))
+        self._inv_scale = 1.0
+        self._last_price = np.zeros(capacity)
+        self._pending_price = np.zeros(capacity)
+        self._start_period = np.zeros(capacity, dtype=np.int64)
+        self._touched = np.zeros(capacity, dtype=bool)
+        self._touched_list: List[int] = []
+
+        self._periods = 0
+        self._period_time: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    @property
+    def periods(self) -> int:
+        return self._periods
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._symbols)
+
+    # ==================== 更新 ====================
+
+    def _register(self, symbol: str) -> int:
+        i = len(self._symbols)
+        capacity = self._raw.shape[0]
+        if i >= capacity:
+            self._grow(capacity * 2)
+        self._index[symbol] = i
+        self._symbols.append(symbol)
+        self._start_period[i] = self._periods
+        return i
+
+    def _grow(self, capacity: int) -> None:
+        n = len(self._symbols)
+        raw = np.zeros((capacity, capacity))
+        raw[:n, :n] = self._raw[:n, :n]
+        self._raw = raw
+        for name in ("_last_price", "_pending_price", "_start_period", "_touched"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+
+    def observe(self, symbol: str, price: float, timestamp: Optional[datetime] = None) -> None:
+        """记录一个价格，时间戳推进时先结算上一个周期"""
+        if timestamp is not None:
+            if self._period_time is None:
+                self._period_time = timestamp
+            elif timestamp > self._period_time and \
+                    (timestamp - self._period_time).total_seconds() >= self.sample_interval:
+                self.advance()
+                self._period_time = timestamp
+
+        if not price or price <= 0:
+            return
+        i = self._index.get(symbol)
+        if i is None:
+            i = self._register(symbol)
+        self._pending_price[i] = price
+        if not self._touched[i]:
+            self._touched[i] = True
+            self._touched_list.append(i)
+
+    def _next_period(self) -> None:
+        """周期数加一，衰减只体现在比例因子上"""
+        self._periods += 1
+        self._inv_scale /= self.decay
+        if self._inv_scale > _RESCALE_LIMIT:
+            n = len(self._symbols)
+            self._raw[:n, :n] /= self._inv_scale
+            self._inv_scale = 1.0
+
+    def advance(self) -> None:
+        """结算一个周期：本周期有新价格的品种做秩1更新"""
+        touched = self._touched_list
+        self._touched_list = []
+        self._next_period()
+
+        if not touched:
+            return
+        idx = np.fromiter(touched, dtype=np.int64, count=len(touched))
+        self._touched[idx] = False
+        prices = self._pending_price[idx]
+        previous = self._last_price[idx]
+        self._last_price[idx] = prices
+
+        # 首次出现的品种只记录价格，从下一周期开始计入
+        has_previous = previous > 0
+        self._start_period[idx[~has_previous]] = self._periods
+        idx = idx[has_previous]
+        if not len(idx):
+            return
+        returns = np.log(prices[has_previous] / previous[has_previous])
+        moved = returns != 0
+        if not moved.all():
+            idx, returns = idx[moved], returns[moved]
+            if not len(idx):
+                return
+
+        weighted = returns * ((1.0 - self.decay) * self._inv_scale)
+        n = len(self._symbols)
+        if len(idx) * 2 >= n and np.array_equal(idx, np.arange(idx[0], idx[0] + len(idx))):
+            # 连续的大块直接按切片更新，避免花式索引的拷贝
+            lo, hi = idx[0], idx[0] + len(idx)
+            self._raw[lo:hi, lo:hi] += np.multiply.outer(returns, weighted)
+        else:
+            block = np.ix_(idx, idx)
+            self._raw[block] += np.multiply.outer(returns, weighted)
+
+    def update_returns(self, symbols: Sequence[str], returns: np.ndarray) -> None:
+        """直接输入一个周期的收益率向量（同步截面数据）"""
+        idx = []
+        for symbol in symbols:
+            i = self._index.get(symbol)
+            if i is None:
+                i = self._register(symbol)
+            idx.append(i)
+        self._next_period()
+        idx = np.asarray(idx, dtype=np.int64)
+        returns = np.asarray(returns, dtype=float)
+        block = np.ix_(idx, idx)
+        self._raw[block] += np.multiply.outer(returns, returns * ((1.0 - self.decay) * self._inv_scale))
+
+    # ==================== 快照读取 ====================
+
+    def _indices(self, symbols: Optional[Sequence[str]]) -> np.ndarray:
+        if symbols is None:
+            return np.arange(len(self._symbols))
+        return np.fromiter((self._index.get(symbol, -1) for symbol in symbols), dtype=np.int64, count=len(symbols))
+
+    def _weights(self, idx: np.ndarray) -> np.ndarray:
+        """各品种已累计的权重 1 - λ^周期数，用于偏差校正"""
+        counts = self._periods - self._start_period[idx]
+        return 1.0 - np.power(self.decay, counts)
+
+    def covariance(self, symbols: Optional[Sequence[str]] = None) -> np.ndarray:
+        """协方差子矩阵 (k, k)，未知品种对应行列为0"""
+        idx = self._indices(symbols)
+        known = idx >= 0
+        k = len(idx)
+        result = np.zeros((k, k))
+        if not known.any():
+            return result
+        sub = idx[known]
+        cov = self._raw[np.ix_(sub, sub)] / self._inv_scale
+        weights = self._weights(sub)
+        pair_weight = np.minimum.outer(weights, weights)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = np.where(pair_weight > 0, cov / pair_weight, 0.0)
+        if known.all():
+            return cov
+        result[np.ix_(known, known)] = cov
+        return result
+
+    def volatility(self, symbols: Optional[Sequence[str]] = None) -> np.ndarray:
+        """单周期波动率 (k,)，O(k)"""
+        idx = self._indices(symbols)
+        result = np.zeros(len(idx))
+        known = idx >= 0
+        sub = idx[known]
+        variance = self._raw[sub, sub] / self._inv_scale
+        weights = self._weights(sub)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[known] = np.sqrt(np.where(weights > 0, variance / weights, 0.0))
+        return result
+
+    def correlation(self, symbols: Optional[Sequence[str]] = None) -> np.ndarray:
+        """相关系数子矩阵 (k, k)，波动率为0的品种与其他品种相关系数记为0"""
+        cov = self.covariance(symbols)
+        vol = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.multiply.outer(vol, vol)
+        corr[~np.isfinite(corr)] = 0.0
+        np.fill_diagonal(corr, 1.0)
+        return np.clip(corr, -1.0, 1.0)
+
+    def portfolio_std(self, symbols: Sequence[str], exposures: np.ndarray) -> float:
+        """组合单周期损益标准差 sqrt(wᵀΣw)，O(k²)"""
+        w = np.asarray(exposures, dtype=float)
+        cov = self.covariance(symbols)
+        return math.sqrt(max(float(w @ cov @ w), 0.0))
+
+    def period_counts(self, symbols: Sequence[str]) -> np.ndarray:
+        """各品种已累计的周期数，未知品种为0"""
+        idx = self._indices(symbols)
+        counts = np.zeros(len(idx), dtype=np.int64)
+        known = idx >= 0
+        counts[known] = self._periods - self._start_period[idx[known]]
+        return counts
+
+    def ready(self, symbols: Sequence[str]) -> bool:
+        """所有品种都已累计至少min_periods个周期"""
+        counts = self.period_counts(symbols)
+        return bool(len(counts)) and bool((counts >= self.min_periods).all())
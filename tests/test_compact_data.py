@@ -0,0 +1,181 @@
+"""
+紧凑行情/订单测试
+验证定点转换的精度和范围检查、按品种精度、批次视图以及与MarketData/OrderInfo的互相转换
+"""
+
+import math
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from backend.strategy.core.compact_data import (
+    NO_PRICE, CompactOrder, CompactTick, SymbolTable, TickBatch, to_fixed
+)
+from backend.strategy.core.strategy_base import MarketData, OrderInfo, OrderSide, OrderType
+
+
+def _market_data(symbol: str = "rb2410", **kwargs) -> MarketData:
+    fields = dict(
+        symbol=symbol, timestamp=datetime(2024, 5, 6, 9, 30, 1), open=3500.0, high=3510.5,
+        low=3495.0, close=3502.5, volume=120.0, amount=420300.0,
+        bid=3502.0, ask=3503.0, bid_size=10.0, ask_size=8.0
+    )
+    fields.update(kwargs)
+    return MarketData(**fields)
+
+
+class TestToFixed:
+    """定点转换测试"""
+
+    def test_exact_values(self):
+        """整数、Decimal和可精确表示的float按精度换算，None为NO_PRICE"""
+        assert to_fixed(3, 100) == 300
+        assert to_fixed(Decimal("1.2345")) == 12345
+        assert to_fixed(0.1) == 1000
+        assert to_fixed(3502.55, 100) == 350255
+        assert to_fixed(None) == NO_PRICE
+
+    def test_precision_loss_rejected(self):
+        """超出精度的小数位抛出ValueError，不静默舍入"""
+        with pytest.raises(ValueError):
+            to_fixed(Decimal("1.23456"))
+        with pytest.raises(ValueError):
+            to_fixed(0.123456)
+        with pytest.raises(ValueError):
+            to_fixed(1.005, 100)
+
+    @pytest.mark.parametrize("value", [1e15, -1e15, 10 ** 15, Decimal("1e15"), math.inf, math.nan])
+    def test_out_of_range_rejected(self, value):
+        """换算后超出int64或不是有限数值时抛出ValueError"""
+        with pytest.raises(ValueError):
+            to_fixed(value)
+
+    def test_range_limit(self):
+        """NO_PRICE保留给缺失价格，最大可表示值为2**63-2"""
+        assert to_fixed((1 << 63) - 2, 1) == (1 << 63) - 2
+        with pytest.raises(ValueError):
+            to_fixed(-(1 << 63), 1)
+
+
+class TestTickBatch:
+    """行情批次测试"""
+
+    def test_failed_append_leaves_no_row(self):
+        """转换失败的行情不计入批次，也不会以空行出现"""
+        batch = TickBatch(2, SymbolTable())
+        batch.append("A", 1.0, 10.0)
+        with pytest.raises(ValueError):
+            batch.append("X", 1.0, 1e15)
+        with pytest.raises(ValueError):
+            batch.append("A", 2.0, 10.00001)
+
+        assert len(batch) == 1
+        assert [view.symbol for view in batch] == ["A"]
+        assert list(batch.last_by_symbol()) == ["A"]
+
+    def test_per_symbol_scale(self):
+        """各品种按自己的精度存储和读取"""
+        symbols = SymbolTable()
+        symbols.set_scale("BTC", 100)
+        symbols.set_scale("EURUSD", 100000)
+        batch = TickBatch(4, symbols)
+        batch.append("BTC", 1.0, 65000.25, bid=65000.0, ask=65000.5)
+        batch.append("EURUSD", 1.0, 1.08765)
+
+        assert batch.column("close_px").tolist() == [6500025, 108765]
+        assert batch[0].scale == 100 and batch[1].scale == 100000
+        assert batch[1].close == 1.08765
+        np.testing.assert_array_equal(batch.prices(), [65000.25, 1.08765])
+        assert math.isnan(batch.prices("bid_px")[1])
+
+        with pytest.raises(ValueError):
+            batch.append("BTC", 2.0, 65000.255)
+        with pytest.raises(ValueError):
+            symbols.set_scale("BTC", 1000)
+        symbols.set_scale("BTC", 100)
+
+        tick = CompactTick("BTC", 3.0, 6500100, scale=10000)
+        with pytest.raises(ValueError):
+            batch.append_tick(tick)
+        assert len(batch) == 2
+
+    def test_slice_is_readonly_view(self):
+        """切片共享内存且只读，越界索引抛出IndexError"""
+        batch = TickBatch(1, SymbolTable())
+        for i in range(5):
+            batch.append("A" if i % 2 else "B", float(i), 100.0 + i)
+
+        tail = batch[2:]
+        assert len(tail) == 3
+        assert [view.close for view in tail] == [102.0, 103.0, 104.0]
+        assert np.shares_memory(tail.data, batch.data)
+        assert batch[-1].timestamp == 4.0
+        with pytest.raises(IndexError):
+            batch[5]
+        with pytest.raises(ValueError):
+            tail.append("A", 5.0, 105.0)
+        with pytest.raises(ValueError):
+            tail.clear()
+
+    def test_last_by_symbol(self):
+        """每个品种取批内最后一条"""
+        batch = TickBatch(4, SymbolTable())
+        assert batch.last_by_symbol() == {}
+        batch.append("A", 1.0, 10.0)
+        batch.append("B", 2.0, 20.0)
+        batch.append("A", 3.0, 11.0)
+        batch.append("C", 4.0, 30.0)
+        batch.append("B", 5.0, 21.0)
+
+        last = batch.last_by_symbol()
+        assert {symbol: view.timestamp for symbol, view in last.items()} == {"A": 3.0, "B": 5.0, "C": 4.0}
+        assert last["A"].close == 11.0
+
+        batch.clear()
+        assert len(batch) == 0 and batch.last_by_symbol() == {}
+
+
+class TestRoundTrip:
+    """与MarketData / OrderInfo的互相转换测试"""
+
+    def test_market_data_round_trip(self):
+        """MarketData经CompactTick和TickBatch转换后字段不变"""
+        symbols = SymbolTable(default_scale=100)
+        tick_data = _market_data()
+        bar_data = _market_data("cu2409", amount=None, bid=None, ask=None, bid_size=None, ask_size=None)
+
+        tick = CompactTick.from_market_data(tick_data, symbols)
+        assert tick.is_tick and tick.scale == 100
+        assert tick.to_market_data() == tick_data
+
+        batch = TickBatch.from_market_data([tick_data, bar_data], symbols)
+        assert [view.to_market_data() for view in batch] == [tick_data, bar_data]
+        assert not batch[1].is_tick
+        assert batch[1].to_tick().to_market_data() == bar_data
+
+    def test_order_info_round_trip(self):
+        """OrderInfo经CompactOrder转换后价格和数量无舍入误差"""
+        symbols = SymbolTable()
+        symbols.set_scale("EURUSD", 100000)
+        order = OrderInfo(
+            order_id="o1", symbol="EURUSD", side=OrderSide.SELL, order_type=OrderType.STOP_LIMIT,
+            quantity=Decimal("1.5"), price=Decimal("1.08765"), stop_price=Decimal("1.0881"),
+            timestamp=datetime(2024, 5, 6, 9, 30, 1), filled_quantity=Decimal("0.25"),
+            strategy_id="s1"
+        )
+
+        compact = CompactOrder.from_order_info(order, symbols)
+        assert compact.price_px == 108765
+        assert compact.remaining == 1250000
+
+        restored = compact.to_order_info()
+        assert restored == order
+        assert restored.price == Decimal("1.08765")
+
+        with pytest.raises(ValueError):
+            CompactOrder.from_order_info(OrderInfo(
+                order_id="o2", symbol="EURUSD", side=OrderSide.BUY, order_type=OrderType.LIMIT,
+                quantity=Decimal("1"), price=Decimal("1.087651")
+            ), symbols)
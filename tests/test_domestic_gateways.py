@@ -13,6 +13,7 @@ from typing import Dict, Any
 from backend.core.tradingEngine.adapters.domestic_gateways_adapter import (
     DomesticGatewaysAdapter, DomesticGatewayConfig, DomesticGatewayType, GatewayStatus
 )
+from backend.core.tradingEngine.adapters.order_router import RoutingPolicy, SmartOrderRouter
 from backend.core.tradingEngine.config.domestic_gateways_config import (
     DomesticGatewaysConfigManager, CtptestConfig, XtpConfig, OesConfig
 )
@@ -316,14 +317,38 @@ class TestDomesticGatewayMonitor:
         monitor.record_latency(gateway_name, 75.0)
         monitor.record_latency(gateway_name, 100.0)
         
-        assert len(monitor.latency_data[gateway_name]) == 3
-        
         # 计算延迟统计
         stats = monitor._calculate_latency_statistics(gateway_name)
+        assert stats['count'] == 3
         assert stats['avg'] > 0
         assert stats['max'] == 100.0
         assert stats['min'] == 50.0
-    
+
+    def test_streaming_metrics(self, monitor):
+        """测试分类延迟、吞吐量和可用率"""
+        gateway_name = "CTPTEST"
+
+        monitor.record_latency(gateway_name, 20.0, kind="cancel")
+        monitor.record_latency(gateway_name, 800.0, kind="fill")
+        for _ in range(30):
+            monitor.record_event(gateway_name, "quote")
+
+        # 成交/撤单延迟不计入报单延迟
+        assert monitor._calculate_latency_statistics(gateway_name)['count'] == 0
+        assert monitor._calculate_latency_statistics(gateway_name, "cancel")['max'] == 20.0
+
+        throughput = monitor._calculate_throughput_statistics(gateway_name)
+        assert throughput['quotes_per_second'] == 30 / monitor.throughput_window
+
+        uptime = monitor.streaming_metrics[gateway_name].uptime
+        uptime.on_connected(now=0.0)
+        uptime.heartbeat(now=10.0)
+        # 心跳超时30秒，40秒之后的时间计为不可用
+        assert uptime.availability(now=50.0) == 80.0
+        uptime.on_disconnected(now=50.0)
+        assert uptime.disconnection_count == 1
+        assert uptime.is_available(now=50.0) is False
+
     def test_order_result_recording(self, monitor):
         """测试订单结果记录"""
         gateway_name = "CTPTEST"
@@ -523,6 +548,121 @@ class TestGatewayImplementations:
         assert '多通道架构' in info['features']
 
 
+class TestSmartOrderRouting:
+    """订单索引与智能路由测试"""
+    
+    @pytest.fixture
+    def routed_adapter(self):
+        """接入三个模拟网关的适配器"""
+        adapter = DomesticGatewaysAdapter()
+        adapter.config = DomesticGatewayConfig()
+        for name in ("CTPTEST", "XTP", "OES"):
+            gateway = Mock()
+            gateway.submit_order = AsyncMock(side_effect=[f"{name}_{i}" for i in range(100)])
+            gateway.cancel_order = AsyncMock(return_value=True)
+            adapter.gateways[name] = gateway
+            adapter.gateway_status[name] = GatewayStatus(name=name, type=DomesticGatewayType.CTPTEST)
+            adapter.active_gateways.append(name)
+        return adapter
+    
+    def test_router_scoring(self):
+        """测试按延迟、拒单率和在途订单打分"""
+        router = SmartOrderRouter(alpha=0.5)
+        router.record_submit("A", 5.0, True)
+        router.record_submit("B", 2.0, True)
+        router.record_submit("C", 1.0, False)
+        
+        # C延迟最低但被拒，B延迟低于A
+        assert router.select(["A", "B", "C"]) == "B"
+        
+        # B在途订单增加后让位给A
+        for _ in range(3):
+            router.begin_submit("B")
+        assert router.select(["A", "B", "C"]) == "A"
+        
+        router.max_in_flight = 1
+        assert [name for name, _ in router.rank(["A", "B"])] == ["A"]
+    
+    def test_router_split(self):
+        """测试按成本拆单"""
+        router = SmartOrderRouter()
+        router.record_submit("A", 1.0, True)
+        router.record_submit("B", 3.0, True)
+        router.record_complete("A")
+        router.record_complete("B")
+        
+        allocation = dict(router.split(1050, ["A", "B"], lot_size=100))
+        assert sum(allocation.values()) == 1050
+        assert allocation["A"] > allocation["B"] > 0
+        assert router.split(150, ["A", "B"], lot_size=100) == [("A", 150)]
+    
+    @pytest.mark.asyncio
+    async def test_cancel_routed_by_index(self, routed_adapter):
+        """测试撤单按订单索引路由到报单网关"""
+        routed_adapter.router.record_submit("CTPTEST", 50.0, True)
+        routed_adapter.router.record_submit("XTP", 1.0, True)
+        routed_adapter.router.record_submit("OES", 20.0, True)
+        
+        order_id = await routed_adapter.submit_order({'symbol': '000001', 'volume': 100})
+        assert order_id == "XTP_0"
+        assert await routed_adapter._find_gateway_for_order(order_id) == "XTP"
+        
+        assert await routed_adapter.cancel_order(order_id) is True
+        routed_adapter.gateways["XTP"].cancel_order.assert_awaited_once_with(order_id)
+        routed_adapter.gateways["CTPTEST"].cancel_order.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_order_lifecycle_updates_router(self, routed_adapter):
+        """测试订单回报维护在途数量和拒单率"""
+        order_id = await routed_adapter.submit_order({'symbol': '000001', 'volume': 100}, "OES")
+        venue = routed_adapter.router.venue("OES")
+        assert venue.in_flight == 1
+        
+        await routed_adapter._on_order_update({'order_id': order_id, 'status': 'REJECTED'})
+        assert venue.in_flight == 0
+        assert venue.reject_rate > 0
+        assert routed_adapter.gateway_status["OES"].failed_orders == 1
+        # 已完成的订单仍可路由
+        assert await routed_adapter._find_gateway_for_order(order_id) == "OES"
+    
+    @pytest.mark.asyncio
+    async def test_split_order_submission(self, routed_adapter):
+        """测试拆单提交和按父订单撤单"""
+        routed_adapter.config.enable_order_splitting = True
+        parent_id = await routed_adapter.submit_order({'symbol': '000001', 'volume': 300})
+        
+        children = routed_adapter.order_index.children(parent_id)
+        assert len(children) == 3
+        volumes = [
+            call.args[0]['volume']
+            for gateway in routed_adapter.gateways.values()
+            for call in gateway.submit_order.await_args_list
+        ]
+        assert sorted(volumes) == [100, 100, 100]
+        
+        assert await routed_adapter.cancel_order(parent_id) is True
+        for gateway in routed_adapter.gateways.values():
+            gateway.cancel_order.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_split_order_partial_failure(self, routed_adapter):
+        """测试拆单部分子订单失败时撤销已报子订单并返回失败"""
+        routed_adapter.config.enable_order_splitting = True
+        routed_adapter.gateways["XTP"].submit_order = AsyncMock(return_value=None)
+
+        assert await routed_adapter.submit_order({'symbol': '000001', 'volume': 300}) is None
+
+        routed_adapter.gateways["CTPTEST"].cancel_order.assert_awaited_once_with("CTPTEST_0")
+        routed_adapter.gateways["OES"].cancel_order.assert_awaited_once_with("OES_0")
+        routed_adapter.gateways["XTP"].cancel_order.assert_not_awaited()
+        assert routed_adapter.gateway_status["XTP"].failed_orders == 1
+
+    def test_routing_policy_is_abstract(self):
+        """测试路由策略必须实现cost()"""
+        with pytest.raises(TypeError):
+            RoutingPolicy()
+
+
 @pytest.mark.integration
 class TestIntegrationScenarios:
     """集成测试场景"""
@@ -0,0 +1,307 @@
+"""
+Kafka生产者、消费者服务测试
+使用进程内Broker验证批量发送、投递回调、背压、分区回收、按键保序和处理失败时的偏移提交
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+
+import pytest
+
+from backend.legacy.infrastructure.messaging.in_memory_broker import InMemoryKafkaBroker, TopicPartition
+from backend.legacy.infrastructure.messaging.kafka_service import (
+    KafkaConsumerService, KafkaProducerService, Message
+)
+
+TOPIC = "orders"
+GROUP = "test-group"
+
+
+def _produce(broker: InMemoryKafkaBroker, count: int, partition: int = 0, start: int = 0) -> None:
+    producer = broker.create_producer(value_serializer=lambda value: json.dumps(value).encode("utf-8"))
+    for i in range(start, start + count):
+        producer.send(TOPIC, {"seq": i}, partition=partition)
+    producer.close()
+
+
+async def _wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待条件超时")
+        await asyncio.sleep(0.01)
+
+
+def _consumer_service(broker: InMemoryKafkaBroker, **kwargs) -> KafkaConsumerService:
+    options = dict(
+        auto_offset_reset="earliest",
+        auto_commit_interval_ms=0,
+        consumer_factory=broker.create_consumer
+    )
+    options.update(kwargs)
+    return KafkaConsumerService([], GROUP, [TOPIC], **options)
+
+
+def _producer_service(broker: InMemoryKafkaBroker, **kwargs) -> KafkaProducerService:
+    return KafkaProducerService([], producer_factory=broker.create_producer, **kwargs)
+
+
+@pytest.fixture
+def broker():
+    broker = InMemoryKafkaBroker(default_partitions=2)
+    broker.create_topic(TOPIC)
+    return broker
+
+
+class TestKafkaConsumerService:
+    """消费者服务测试"""
+
+    @pytest.mark.asyncio
+    async def test_full_worker_queue_pauses_partition(self, broker):
+        """工作队列满时暂停分区而不阻塞拉取，积压分发完后恢复且保持顺序"""
+        release = threading.Event()
+        seen = []
+
+        def handler(message):
+            release.wait(5)
+            seen.append(message.value["seq"])
+
+        service = _consumer_service(broker, num_workers=1, worker_queue_size=2)
+        service.register_handler(TOPIC, handler)
+        _produce(broker, 20)
+        assert await service.start()
+        tp = TopicPartition(TOPIC, 0)
+        try:
+            await _wait_for(lambda: tp in service._consumer.paused())
+            # 暂停期间拉取线程仍在运行
+            assert service._consume_thread.is_alive()
+
+            release.set()
+            await _wait_for(lambda: broker.committed(GROUP, tp) == 20)
+            assert seen == list(range(20))
+            assert not service._consumer.paused()
+        finally:
+            release.set()
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_revoked_partition_is_drained_and_committed(self, broker):
+        """分区回收时处理完已分发的消息、提交偏移并清除跟踪"""
+        seen = []
+        service = _consumer_service(broker)
+        service.register_handler(TOPIC, lambda message: seen.append((message.partition, message.value["seq"])))
+        _produce(broker, 5, partition=0)
+        _produce(broker, 3, partition=1)
+        assert await service.start()
+        try:
+            await _wait_for(lambda: len(seen) == 8)
+            service._consumer.rebalance([TopicPartition(TOPIC, 0)])
+            await _wait_for(lambda: service._consumer.assignment() == {TopicPartition(TOPIC, 0)})
+
+            assert broker.committed(GROUP, TopicPartition(TOPIC, 0)) == 5
+            assert broker.committed(GROUP, TopicPartition(TOPIC, 1)) == 3
+            assert TopicPartition(TOPIC, 1) not in service._offsets
+
+            # 重新分配的分区继续消费，已回收的分区不再拉取
+            _produce(broker, 2, partition=0, start=5)
+            _produce(broker, 2, partition=1, start=3)
+            await _wait_for(lambda: broker.committed(GROUP, TopicPartition(TOPIC, 0)) == 7)
+            assert [seq for partition, seq in seen if partition == 1] == [0, 1, 2]
+        finally:
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_message_is_retried_then_dead_lettered(self, broker):
+        """处理失败时重试，重试用尽后交给死信处理器并继续提交"""
+        attempts = {}
+        dead_letters = []
+
+        def handler(message):
+            seq = message.value["seq"]
+            attempts[seq] = attempts.get(seq, 0) + 1
+            if seq == 1 or (seq == 2 and attempts[seq] == 1):
+                raise ValueError(f"bad message {seq}")
+
+        service = _consumer_service(
+            broker, max_retries=2, retry_backoff_ms=1,
+            dead_letter_handler=lambda message, error: dead_letters.append((message.value["seq"], str(error)))
+        )
+        service.register_handler(TOPIC, handler)
+        _produce(broker, 4)
+        assert await service.start()
+        try:
+            await _wait_for(lambda: broker.committed(GROUP, TopicPartition(TOPIC, 0)) == 4)
+            assert attempts == {0: 1, 1: 3, 2: 2, 3: 1}
+            assert dead_letters == [(1, "bad message 1")]
+
+            stats = service.get_stats()
+            assert stats.messages_processed == 3
+            assert stats.messages_failed == 1
+            assert stats.messages_retried == 3
+        finally:
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_unfinished_retry_is_not_committed_on_stop(self, broker):
+        """停止时放弃重试的消息不提交，重启后重新消费"""
+        service = _consumer_service(broker, max_retries=100, retry_backoff_ms=20)
+        failing = threading.Event()
+
+        def handler(message):
+            if message.value["seq"] == 1:
+                failing.set()
+                raise ValueError("retry me")
+
+        service.register_handler(TOPIC, handler)
+        _produce(broker, 3)
+        assert await service.start()
+        await _wait_for(failing.is_set)
+        await service.stop()
+
+        assert broker.committed(GROUP, TopicPartition(TOPIC, 0)) == 1
+
+
+class TestKafkaProducerService:
+    """生产者服务测试"""
+
+    @pytest.mark.asyncio
+    async def test_linger_accumulates_batch(self, broker):
+        """linger_ms内的记录整批写入，不逐条发送"""
+        service = _producer_service(broker, linger_ms=100)
+        assert await service.start()
+        try:
+            futures = [service.send_async(TOPIC, {"value": {"seq": i}, "partition": 0}) for i in range(10)]
+            assert broker.records(TOPIC) == []
+
+            await _wait_for(lambda: all(future.is_done for future in futures))
+            assert broker.batches == [10]
+            assert [json.loads(record.value)["seq"] for record in broker.records(TOPIC, 0)] == list(range(10))
+        finally:
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_batch_size_triggers_send(self, broker):
+        """累计字节达到batch_size时不等linger立即写入"""
+        service = _producer_service(broker, linger_ms=10000, batch_size=30)
+        assert await service.start()
+        try:
+            # 每条负载10字节，第3条达到batch_size
+            for i in range(6):
+                service.send_async(TOPIC, {"value": {"seq": i}, "partition": 0})
+            assert broker.batches == [3, 3]
+        finally:
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_send_async_delivery_callbacks(self, broker):
+        """投递成功和失败都回调单条回调与全局回调，并计入统计"""
+        broker.fail_writes = lambda tp, count: ValueError("broker down") if tp.partition == 1 else None
+        global_results = []
+        service = _producer_service(
+            broker, linger_ms=0,
+            delivery_callback=lambda topic, error, metadata: global_results.append((topic, error is None))
+        )
+        assert await service.start()
+        try:
+            results = []
+
+            def on_delivery(error, metadata):
+                results.append((error, metadata))
+
+            service.send_async(TOPIC, Message(value={"seq": 0}, partition=0), on_delivery=on_delivery)
+            service.send_async(TOPIC, Message(value={"seq": 1}, partition=1), on_delivery=on_delivery)
+
+            (ok_error, metadata), (error, failed_metadata) = results
+            assert ok_error is None
+            assert (metadata.partition, metadata.offset) == (0, 0)
+            assert isinstance(error, ValueError) and failed_metadata is None
+            assert global_results == [(TOPIC, True), (TOPIC, False)]
+
+            stats = service.get_stats()
+            assert stats.messages_sent == 1
+            assert stats.messages_failed == 1
+            assert stats.bytes_sent == len(json.dumps({"seq": 0}))
+            assert await service.send_message(TOPIC, {"value": {"seq": 2}, "partition": 0}) is True
+            assert await service.send_message(TOPIC, {"value": {"seq": 3}, "partition": 1}) is False
+        finally:
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_send_batch_counts(self, broker):
+        """批量发送不等linger，按投递结果统计成功和失败数"""
+        broker.fail_writes = lambda tp, count: ValueError("broker down") if tp.partition == 1 else None
+        service = _producer_service(broker, linger_ms=10000)
+        assert await service.start()
+        try:
+            messages = [{"value": {"seq": i}, "partition": i % 2} for i in range(9)]
+            assert await service.send_batch(TOPIC, messages) == (5, 4)
+            assert len(broker.records(TOPIC, 0)) == 5
+        finally:
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_produced_messages_consumed_and_committed(self, broker):
+        """生产者发出的消息全部被消费，各分区提交到末尾"""
+        producer = _producer_service(broker, linger_ms=5)
+        consumer = _consumer_service(broker, num_workers=4)
+        seen = []
+        consumer.register_handler(TOPIC, lambda message: seen.append(message.value["seq"]))
+        assert await producer.start()
+        assert await consumer.start()
+        try:
+            delivered = []
+            for i in range(101):
+                producer.send_async(TOPIC, {"value": {"seq": i}},
+                                    on_delivery=lambda error, metadata: delivered.append(error is None))
+            await producer.flush()
+            assert delivered == [True] * 101
+
+            ends = {partition: len(broker.records(TOPIC, partition)) for partition in range(2)}
+            assert sum(ends.values()) == 101
+            await _wait_for(lambda: all(
+                broker.committed(GROUP, TopicPartition(TOPIC, partition)) == end
+                for partition, end in ends.items()
+            ))
+            assert sorted(seen) == list(range(101))
+        finally:
+            await consumer.stop()
+            await producer.stop()
+
+
+class TestKeyOrdering:
+    """按键保序测试"""
+
+    @pytest.mark.asyncio
+    async def test_key_ordering_preserves_per_key_order(self, broker):
+        """ordering="key"时同一分区的消息按键分散到多个工作线程，同一键内保持顺序"""
+        seen = {}
+        workers = set()
+        lock = threading.Lock()
+
+        def handler(message):
+            time.sleep(random.random() * 0.002)
+            with lock:
+                seen.setdefault(message.key, []).append(message.value["seq"])
+                workers.add(threading.current_thread().name)
+
+        producer = _producer_service(broker, linger_ms=0)
+        consumer = _consumer_service(broker, num_workers=4, ordering="key")
+        consumer.register_handler(TOPIC, handler)
+        assert await producer.start()
+        try:
+            for i in range(200):
+                producer.send_async(TOPIC, {"key": f"k{i % 16}", "value": {"seq": i}, "partition": 0})
+            assert await consumer.start()
+            await _wait_for(lambda: broker.committed(GROUP, TopicPartition(TOPIC, 0)) == 200)
+
+            assert len(seen) == 16
+            for key, sequence in seen.items():
+                assert sequence == sorted(sequence)
+                assert len(sequence) == 200 // 16 + (int(key[1:]) < 200 % 16)
+            assert len(workers) > 1
+        finally:
+            await consumer.stop()
+            await producer.stop()
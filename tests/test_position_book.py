@@ -0,0 +1,72 @@
+"""
+持仓簿测试
+验证列式盯市结果与Position实体的盈亏口径一致
+"""
+
+import pytest
+from decimal import Decimal
+
+from backend.legacy.domain.trading.entities.position_entity import Position
+from backend.legacy.domain.trading.enums import PositionStatus
+from backend.legacy.domain.trading.services.position_book import PositionBook
+
+
+def _position(symbol: str, long_volume: int, short_volume: int,
+              long_price: str, short_price: str, realized: str = "0") -> Position:
+    return Position(
+        symbol=symbol,
+        exchange="SHFE",
+        user_id="u1",
+        long_volume=long_volume,
+        short_volume=short_volume,
+        long_avg_price=Decimal(long_price),
+        short_avg_price=Decimal(short_price),
+        realized_pnl=Decimal(realized),
+        status=PositionStatus.ACTIVE
+    )
+
+
+class TestPositionBook:
+    """持仓簿盯市测试"""
+
+    @pytest.mark.parametrize("long_volume,short_volume", [(10, 0), (0, 7), (5, 5), (12, 4)])
+    def test_mark_matches_position_pnl(self, long_volume, short_volume):
+        """带合约乘数的持仓，盯市盈亏与Position.calculate_pnl一致"""
+        book = PositionBook(capacity=2)
+        position = _position("rb2410", long_volume, short_volume, "3500.5", "3512", realized="120")
+        book.upsert("rb2410.SHFE.u1", position, multiplier=10.0)
+
+        price = Decimal("3521.25")
+        assert book.mark({"rb2410": price}) == 1
+        book.sync("rb2410.SHFE.u1", position)
+
+        expected = _position("rb2410", long_volume, short_volume, "3500.5", "3512", realized="120")
+        expected.calculate_pnl(price)
+
+        assert position.unrealized_pnl == expected.unrealized_pnl
+        assert position.total_pnl == expected.total_pnl
+        assert book.total_unrealized_pnl() == float(expected.unrealized_pnl)
+
+    def test_upsert_after_mark_uses_last_price(self):
+        """已有行情时新写入的持仓立即按最新价重估"""
+        book = PositionBook(capacity=1)
+        position = _position("cu2409", 2, 0, "69000", "0")
+        book.upsert("cu2409.SHFE.u1", position, multiplier=5.0)
+        book.mark({"cu2409": 70000})
+
+        book.upsert("cu2409.SHFE.u2", _position("cu2409", 0, 1, "0", "70500"), multiplier=5.0)
+        book.sync("cu2409.SHFE.u1", position)
+
+        assert position.unrealized_pnl == Decimal("2000")
+        assert book.total_unrealized_pnl() == 2500.0
+
+    def test_exposure_uses_multiplier(self):
+        """敞口为名义价值，计入合约乘数"""
+        book = PositionBook()
+        book.upsert("rb2410.SHFE.u1", _position("rb2410", 3, 1, "3500", "3500"), multiplier=10.0)
+        book.mark({"rb2410": 3600})
+
+        summary = book.exposure_summary()
+        assert summary["gross_exposure"] == 4 * 3600 * 10.0
+        assert summary["net_exposure"] == 2 * 3600 * 10.0
+        assert summary["max_concentration"] == 1.0
@@ -0,0 +1,239 @@
+"""
+策略进程隔离测试
+验证共享内存广播环的掩码过滤和套圈丢失计数、SPSC队列的回绕和写满行为，
+以及策略子进程崩溃或内存超限后的重启
+"""
+
+import asyncio
+import random
+import textwrap
+import threading
+import time
+
+import pytest
+
+from backend.core.tradingEngine.strategies.processIsolation import SharedMemoryRing, SPSCQueue
+from backend.core.tradingEngine.strategies.strategyEngine import (
+    StrategyConfig, StrategyContainer, StrategyIsolationLevel, StrategyState
+)
+
+
+@pytest.fixture
+def ring():
+    ring = SharedMemoryRing(slots=8, slot_size=64)
+    yield ring
+    ring.close()
+
+
+@pytest.fixture
+def spsc():
+    queue = SPSCQueue(capacity=64)
+    yield queue
+    queue.close()
+
+
+def _drain(reader):
+    records = []
+    while True:
+        payload = reader.poll()
+        if payload is None:
+            return records
+        records.append(payload)
+
+
+class TestSharedMemoryRing:
+    """广播环测试"""
+
+    def test_mask_filtering(self, ring):
+        """读者只收到掩码包含自身位的记录"""
+        first, second = ring.reader(0), ring.reader(1)
+        ring.publish(0b01, b"a")
+        ring.publish(0b10, b"b")
+        ring.publish(0b11, b"c")
+
+        assert _drain(first) == [b"a", b"c"]
+        assert _drain(second) == [b"b", b"c"]
+        assert first.lost == second.lost == 0
+
+    def test_overrun_counts_lost_records(self, ring):
+        """落后超过一圈的读者跳到最早未被覆盖的记录，并计入丢失数"""
+        reader = ring.reader(0)
+        for i in range(20):
+            ring.publish(1, str(i).encode())
+
+        assert _drain(reader) == [str(i).encode() for i in range(12, 20)]
+        assert reader.lost == 12
+
+        ring.publish(1, b"next")
+        assert _drain(reader) == [b"next"]
+        assert reader.lost == 12
+
+    def test_reader_attached_by_name(self, ring):
+        """按名称附加的广播环读取同一块共享内存"""
+        attached = SharedMemoryRing(name=ring.name)
+        try:
+            reader = attached.reader(2, start=ring.sequence)
+            ring.publish(0b100, b"x")
+            assert _drain(reader) == [b"x"]
+        finally:
+            attached.close()
+
+    def test_oversized_record_rejected(self, ring):
+        """超过槽位容量的记录被拒绝且不占用序号"""
+        with pytest.raises(ValueError):
+            ring.publish(1, bytes(ring.max_payload + 1))
+        assert ring.sequence == 0
+        ring.publish(1, bytes(ring.max_payload))
+        assert ring.sequence == 1
+
+
+class TestSPSCQueue:
+    """单生产者单消费者队列测试"""
+
+    def test_wrap_around_preserves_records(self, spsc):
+        """记录放不下时回绕到开头，顺序和内容不变"""
+        for i in range(50):
+            payloads = [bytes([i]) * (i % 7 + 1), bytes([i + 1]) * (i % 5 + 10)]
+            for payload in payloads:
+                assert spsc.push(payload)
+            assert [spsc.pop(), spsc.pop()] == payloads
+            assert spsc.pop() is None
+        assert len(spsc) == 0
+
+    def test_full_queue_rejects_push(self, spsc):
+        """空间不足时push返回False，读出后可以继续写入"""
+        pushed = 0
+        while spsc.push(b"x" * 10):
+            pushed += 1
+        assert pushed == 64 // 14
+        assert spsc.pop() == b"x" * 10
+        assert spsc.push(b"y" * 10)
+
+        with pytest.raises(ValueError):
+            spsc.push(bytes(spsc.max_payload + 1))
+
+    def test_concurrent_producer_consumer(self):
+        """生产者和消费者线程并发读写，记录完整且有序"""
+        queue = SPSCQueue(capacity=1024)
+        rng = random.Random(7)
+        records = [rng.randbytes(rng.randint(0, 100)) for _ in range(20000)]
+        received = []
+
+        def consume():
+            while len(received) < len(records):
+                payload = queue.pop()
+                if payload is None:
+                    time.sleep(0)
+                else:
+                    received.append(payload)
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        try:
+            for payload in records:
+                while not queue.push(payload):
+                    time.sleep(0)
+            consumer.join(timeout=30)
+            assert received == records
+        finally:
+            queue.close()
+
+
+STRATEGY_SOURCE = textwrap.dedent('''
+    import os
+    from pathlib import Path
+
+    from backend.core.tradingEngine.strategies.strategyEngine import BaseStrategy
+
+
+    class CrashOnceStrategy(BaseStrategy):
+        """第一次收到tick时进程直接退出，重启后把tick原样作为订单发出"""
+
+        async def on_start(self):
+            pass
+
+        async def on_stop(self):
+            pass
+
+        async def on_tick(self, tick_data):
+            marker = Path(self.config.config_data["marker"])
+            if not marker.exists():
+                marker.touch()
+                os._exit(3)
+            self.send_order(tick_data)
+
+        async def on_bar(self, bar_data):
+            pass
+
+        async def on_order(self, order_data):
+            pass
+
+        async def on_trade(self, trade_data):
+            pass
+''')
+
+
+async def _wait_for(predicate, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待条件超时")
+        await asyncio.sleep(0.05)
+
+
+class TestProcessIsolatedContainer:
+    """进程隔离策略容器测试"""
+
+    @pytest.fixture
+    def config(self, tmp_path):
+        module = tmp_path / "crash_once_strategy.py"
+        module.write_text(STRATEGY_SOURCE, encoding="utf-8")
+        return StrategyConfig(
+            strategy_id="crash_once",
+            strategy_name="crash_once",
+            strategy_class="CrashOnceStrategy",
+            strategy_module=str(module),
+            isolation_level=StrategyIsolationLevel.PROCESS,
+            max_restart_count=2,
+            config_data={"marker": str(tmp_path / "crashed")}
+        )
+
+    @pytest.mark.asyncio
+    async def test_crashed_process_is_restarted(self, config):
+        """子进程崩溃后由资源监控重启，重启后的进程继续处理行情并回传订单"""
+        container = StrategyContainer(config)
+        container.monitor_interval = 0.1
+        orders = []
+        container.order_callback = lambda strategy_id, order: orders.append((strategy_id, order))
+        assert await container.load_strategy()
+        assert await container.start()
+        try:
+            first_pid = container.process.pid
+            await container.send_event("tick", 1)
+            await _wait_for(lambda: container.process is not None and container.process.pid != first_pid)
+            assert container.stats["restarts"] == 1
+            assert container.state == StrategyState.RUNNING
+
+            await container.send_event("tick", 2)
+            await _wait_for(lambda: orders)
+            assert orders == [("crash_once", 2)]
+        finally:
+            assert await container.stop()
+        assert container.process is None
+
+    @pytest.mark.asyncio
+    async def test_memory_limit_exhausts_restarts(self, config):
+        """内存超限的子进程被结束并重启，超过重启次数后容器进入ERROR"""
+        pytest.importorskip("psutil")
+        config.max_memory_mb = 1
+        config.max_restart_count = 1
+        container = StrategyContainer(config)
+        container.monitor_interval = 0.1
+        assert await container.load_strategy()
+        assert await container.start()
+        try:
+            await _wait_for(lambda: container.state == StrategyState.ERROR)
+            assert container.stats["restarts"] == 1
+            assert container.process is None
+        finally:
+            container.stop_event.set()
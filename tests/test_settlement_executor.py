@@ -0,0 +1,68 @@
+"""
+结算执行器测试
+验证列式分片计算在无持仓、无成交等边界情况下的结果
+"""
+
+from decimal import Decimal
+
+from backend.legacy.domain.trading.entities.account_entity import Account
+from backend.legacy.domain.trading.entities.position_entity import Position
+from backend.legacy.domain.trading.entities.trade_entity import Trade
+from backend.legacy.domain.trading.enums import Direction, Offset, PositionStatus
+from backend.legacy.domain.trading.services.settlement_executor import (
+    SettlementParams, ShardBuilder, settle_shard
+)
+
+
+def _builder() -> ShardBuilder:
+    return ShardBuilder(
+        product_of=lambda symbol: symbol[:2],
+        commission_rate_of=lambda symbol: 0.0003,
+        margin_ratio_of=lambda symbol: 0.1
+    )
+
+
+def _account(user_id: str, balance: str = "100000") -> Account:
+    return Account(user_id=user_id, balance=Decimal(balance), available=Decimal(balance))
+
+
+class TestSettleShard:
+    """分片结算测试"""
+
+    def test_shard_without_positions(self):
+        """分片内没有任何持仓时所有用户正常结算"""
+        builder = _builder()
+        trade = Trade(symbol="rb2410", direction=Direction.LONG, offset=Offset.CLOSE,
+                      volume=1, price=Decimal("3500"))
+        builder.add_user("u1", [trade], [], _account("u1"))
+        builder.add_user("u2", [], [], _account("u2"))
+
+        results = settle_shard(builder.build(0), SettlementParams())
+
+        assert [result.user_id for result in results] == ["u1", "u2"]
+        assert not any(result.failed for result in results)
+        for result in results:
+            assert result.position_summary["total_positions"] == 0
+            assert result.position_summary["largest_position"] is None
+            assert result.risk_metrics["concentration_risk"] == 0.0
+        assert results[1].balance == 100000.0
+
+    def test_user_without_positions_next_to_holder(self):
+        """有持仓用户的最大持仓不受无持仓用户影响"""
+        builder = _builder()
+        builder.add_user("u1", [], [], _account("u1"))
+        positions = [
+            Position(symbol="rb2410", long_volume=2, long_avg_price=Decimal("3500"),
+                     status=PositionStatus.ACTIVE),
+            Position(symbol="cu2409", long_volume=1, long_avg_price=Decimal("70000"),
+                     status=PositionStatus.ACTIVE)
+        ]
+        builder.add_user("u2", [], positions, _account("u2"))
+
+        results = settle_shard(builder.build(0), SettlementParams())
+
+        assert not any(result.failed for result in results)
+        assert results[0].position_summary["largest_position"] is None
+        largest = results[1].position_summary["largest_position"]
+        assert largest == {"symbol": "cu2409", "market_value": 70000.0}
+        assert results[1].risk_metrics["concentration_risk"] == 70000.0 / 77000.0
@@ -0,0 +1,132 @@
+"""
+模拟撮合引擎测试
+验证订单簿的价格优先、时间优先撮合、IOC、撤单和部分成交，以及模拟网关的虚拟时钟
+"""
+
+import time
+
+import pytest
+
+from backend.core.tradingEngine.gateways.simGateway import SimGateway
+from backend.core.tradingEngine.gateways.simMatchingEngine import (
+    BUY, SELL, ORDER_IOC, ORDER_LIMIT, ORDER_MARKET, OrderBook
+)
+
+
+class TestOrderBook:
+    """订单簿撮合测试"""
+
+    def test_price_time_priority(self):
+        """先按价格优先，同价位按挂单先后成交，成交价为被动方价格"""
+        book = OrderBook("X")
+        book.submitOrder("s1", SELL, ORDER_LIMIT, 101, 5)
+        book.submitOrder("s2", SELL, ORDER_LIMIT, 100, 5)
+        book.submitOrder("s3", SELL, ORDER_LIMIT, 100, 5)
+
+        assert book.submitOrder("b1", BUY, ORDER_LIMIT, 101, 12) == 0
+        assert book.takeFills() == [
+            ("b1", "s2", 100, 5),
+            ("b1", "s3", 100, 5),
+            ("b1", "s1", 101, 2)
+        ]
+        assert book.bestAsk() == 101
+        assert book.depth()["asks"] == [(101, 3)]
+
+    def test_partial_fill_rests_remainder(self):
+        """限价单部分成交后剩余数量挂入订单簿"""
+        book = OrderBook("X")
+        book.submitOrder("s1", SELL, ORDER_LIMIT, 100, 3)
+
+        assert book.submitOrder("b1", BUY, ORDER_LIMIT, 100, 10) == 7
+        assert book.takeFills() == [("b1", "s1", 100, 3)]
+        assert book.bestBid() == 100
+        assert book.bestAsk() is None
+        assert book.remaining["b1"] == 7
+
+        # 被动方部分成交后保留排队位置
+        book.submitOrder("b2", BUY, ORDER_LIMIT, 100, 4)
+        assert book.submitOrder("s2", SELL, ORDER_LIMIT, 100, 5) == 0
+        assert book.takeFills() == [("s2", "b1", 100, 5)]
+        assert book.remaining["b1"] == 2
+        assert book.queueAhead("b2") == 2
+
+    def test_ioc_does_not_rest(self):
+        """IOC只成交能立即成交的部分，剩余作废"""
+        book = OrderBook("X")
+        book.submitOrder("s1", SELL, ORDER_LIMIT, 100, 2)
+        book.submitOrder("s2", SELL, ORDER_LIMIT, 102, 2)
+
+        assert book.submitOrder("b1", BUY, ORDER_IOC, 101, 5) == 3
+        assert book.takeFills() == [("b1", "s1", 100, 2)]
+        assert "b1" not in book.orders
+        assert book.bestBid() is None
+        assert book.bestAsk() == 102
+
+    def test_market_order_sweeps_levels(self):
+        """市价单不受价格限制，对手盘不足时剩余作废"""
+        book = OrderBook("X")
+        book.submitOrder("s1", SELL, ORDER_LIMIT, 100, 1)
+        book.submitOrder("s2", SELL, ORDER_LIMIT, 150, 1)
+
+        assert book.submitOrder("b1", BUY, ORDER_MARKET, 0, 3) == 1
+        assert [fill[2] for fill in book.takeFills()] == [100, 150]
+        assert book.bestBid() is None
+
+    def test_cancel_removes_order_and_level(self):
+        """撤单返回撤销数量，撤销的订单不再参与撮合"""
+        book = OrderBook("X")
+        book.submitOrder("b1", BUY, ORDER_LIMIT, 99, 5)
+        book.submitOrder("b2", BUY, ORDER_LIMIT, 99, 5)
+        book.submitOrder("b3", BUY, ORDER_LIMIT, 98, 5)
+
+        assert book.cancelOrder("b1") == 5
+        assert book.cancelOrder("b1") == 0
+        assert book.depth()["bids"] == [(99, 5), (98, 5)]
+
+        book.submitOrder("s1", SELL, ORDER_LIMIT, 98, 7)
+        assert book.takeFills() == [("s1", "b2", 99, 5), ("s1", "b3", 98, 2)]
+
+        assert book.cancelOrder("b3") == 3
+        assert book.bestBid() is None
+        assert not book.keys[0]
+
+
+class TestSimGatewayClock:
+    """模拟网关时钟切换测试"""
+
+    @pytest.fixture
+    def gateway(self):
+        gateway = SimGateway()
+        assert gateway.connect()
+        yield gateway
+        gateway.disconnect()
+
+    def test_virtual_clock_stops_dispatcher(self, gateway):
+        """连接后切换到虚拟时间，回放事件只由processEvents推进"""
+        assert gateway._dispatcher is not None
+        assert gateway.setVirtualClock(True)
+        assert gateway._dispatcher is None
+
+        records = [
+            {"symbol": "X", "timestamp": 0.0, "bid_price": 100.0, "ask_price": 101.0},
+            {"symbol": "X", "timestamp": 100.0, "bid_price": 102.0, "ask_price": 103.0}
+        ]
+        assert gateway.replayL2(records) == 2
+        time.sleep(0.05)
+        assert len(gateway.scheduler) == 2
+
+        assert gateway.processEvents(50.0) == 1
+        assert gateway.scheduler.now() == 50.0
+        assert len(gateway.scheduler) == 1
+
+    def test_switching_back_restarts_dispatcher(self, gateway):
+        """切回真实时间时重新启动调度线程"""
+        assert gateway.setVirtualClock(True)
+        assert gateway.setVirtualClock(False)
+        assert gateway._dispatcher is not None and gateway._dispatcher.is_alive()
+
+        gateway.replayL2([{"symbol": "X", "timestamp": 0.0, "bid_price": 100.0, "ask_price": 101.0}])
+        deadline = time.monotonic() + 2.0
+        while len(gateway.scheduler) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(gateway.scheduler) == 0
@@ -0,0 +1,156 @@
+"""
+策略收件箱测试
+验证三种背压策略的写满行为，以及收件箱写满时停止策略不会卡住引擎的分发协程
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from backend.strategy.core.strategy_base import BaseStrategy, MarketData, StrategyConfig, StrategyType
+from backend.strategy.core.strategy_engine import EngineConfig, StrategyEngine
+from backend.strategy.core.strategy_inbox import BackpressurePolicy, StrategyInbox
+
+
+def _tick(symbol: str, price: float) -> MarketData:
+    return MarketData(symbol=symbol, timestamp=datetime(2024, 5, 6, 9, 30), open=price, high=price,
+                      low=price, close=price, volume=1.0, bid=price, ask=price)
+
+
+def _bar(symbol: str, price: float) -> MarketData:
+    return MarketData(symbol=symbol, timestamp=datetime(2024, 5, 6, 9, 30), open=price, high=price,
+                      low=price, close=price, volume=1.0)
+
+
+def _drain(inbox: StrategyInbox) -> list:
+    items = [inbox.get_nowait() for _ in range(inbox.qsize())]
+    return [(item.symbol, item.close) for item in items]
+
+
+class TestBackpressurePolicies:
+    """背压策略测试"""
+
+    def test_conflate_merges_ticks_per_symbol(self):
+        """同一品种的Tick保留原排队位置并替换为最新值，K线不合并"""
+        inbox = StrategyInbox(10, BackpressurePolicy.CONFLATE)
+        inbox.put_nowait(_tick("A", 1.0))
+        inbox.put_nowait(_bar("A", 2.0))
+        inbox.put_nowait(_tick("B", 3.0))
+        inbox.put_nowait(_tick("A", 4.0))
+        inbox.put_nowait(_bar("A", 5.0))
+
+        assert _drain(inbox) == [("A", 4.0), ("A", 2.0), ("B", 3.0), ("A", 5.0)]
+        assert inbox.conflated == 1 and inbox.dropped == 0
+
+    def test_conflate_evicts_oldest_tick_only(self):
+        """写满时挤掉最旧的Tick；只剩K线时不丢弃，允许暂时超出容量"""
+        inbox = StrategyInbox(2, BackpressurePolicy.CONFLATE)
+        inbox.put_nowait(_tick("A", 1.0))
+        inbox.put_nowait(_bar("A", 2.0))
+        inbox.put_nowait(_tick("B", 3.0))
+        assert _drain(inbox) == [("A", 2.0), ("B", 3.0)]
+        assert inbox.dropped == 1
+
+        for i in range(3):
+            inbox.put_nowait(_bar("A", float(i)))
+        assert inbox.qsize() == 3
+        assert inbox.dropped == 1
+
+    def test_drop_oldest(self):
+        """写满时丢弃最旧的一条并计数"""
+        inbox = StrategyInbox(3, BackpressurePolicy.DROP_OLDEST)
+        for i in range(5):
+            inbox.put_nowait(_tick("A", float(i)))
+
+        assert _drain(inbox) == [("A", 2.0), ("A", 3.0), ("A", 4.0)]
+        assert inbox.dropped == 2 and inbox.high_watermark == 3
+
+    @pytest.mark.asyncio
+    async def test_block_waits_and_close_releases(self):
+        """写满时put等待空位；close()唤醒等待方，之后的写入直接返回"""
+        inbox = StrategyInbox(1)
+        assert inbox.policy == BackpressurePolicy.BLOCK
+        await inbox.put(_tick("A", 1.0))
+
+        putter = asyncio.create_task(inbox.put(_tick("A", 2.0)))
+        await asyncio.sleep(0.01)
+        assert not putter.done() and inbox.blocked == 1
+
+        inbox.close()
+        await asyncio.wait_for(putter, timeout=1.0)
+        assert inbox.qsize() == 0
+
+        await inbox.put(_tick("A", 3.0))
+        inbox.put_nowait(_tick("A", 4.0))
+        assert inbox.qsize() == 0
+
+
+class RecordingStrategy(BaseStrategy):
+    """记录收到的Tick，gate未放行时卡在on_tick中"""
+
+    def __init__(self, config: StrategyConfig, gate: asyncio.Event):
+        super().__init__(config)
+        self.gate = gate
+        self.ticks = []
+
+    async def on_start(self):
+        pass
+
+    async def on_stop(self):
+        pass
+
+    async def on_tick(self, data: MarketData):
+        await self.gate.wait()
+        self.ticks.append((data.symbol, data.close))
+
+    async def on_bar(self, data: MarketData):
+        pass
+
+
+async def _wait_for(predicate, timeout: float = 5.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("等待条件超时")
+        await asyncio.sleep(0.01)
+
+
+class TestEngineInboxShutdown:
+    """引擎收件箱关闭测试"""
+
+    @pytest.mark.asyncio
+    async def test_stop_strategy_with_full_inbox(self):
+        """BLOCK策略下慢策略收件箱写满后停止该策略，分发协程继续为其他策略分发"""
+        engine = StrategyEngine(EngineConfig(strategy_inbox_size=2, data_queue_size=4))
+        stuck, released = asyncio.Event(), asyncio.Event()
+        released.set()
+        slow = RecordingStrategy(StrategyConfig(
+            strategy_id="slow", strategy_name="slow", strategy_type=StrategyType.CUSTOM, symbols=["A"]
+        ), stuck)
+        fast = RecordingStrategy(StrategyConfig(
+            strategy_id="fast", strategy_name="fast", strategy_type=StrategyType.CUSTOM, symbols=["A", "B"]
+        ), released)
+
+        assert await engine.start()
+        try:
+            for strategy in (slow, fast):
+                assert await engine.add_strategy(strategy)
+                assert await engine.start_strategy(strategy.strategy_id)
+
+            for i in range(6):
+                await engine.feed_data(_tick("A", float(i)))
+            await _wait_for(lambda: engine.get_inbox_stats()["slow"]["blocked"] > 0)
+            slow_inbox = engine._strategy_inboxes["slow"]
+
+            assert await asyncio.wait_for(engine.stop_strategy("slow"), timeout=1.0)
+            assert slow_inbox.closed and slow_inbox.qsize() == 0
+
+            await asyncio.wait_for(engine.feed_data(_tick("B", 100.0)), timeout=1.0)
+            await _wait_for(lambda: ("B", 100.0) in fast.ticks)
+            assert fast.ticks == [("A", float(i)) for i in range(6)] + [("B", 100.0)]
+            assert slow.ticks == []
+            assert engine._data_queue.empty()
+        finally:
+            await engine.stop()